@@ -0,0 +1,301 @@
+"""
+Coroutine versions of the `Client` and `ServiceHandler` request methods, mixed into those classes when running on Python
+3.5 or newer. This module requires Python 3.5 or newer.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+
+import attr
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.transport.exceptions import (
+    ConnectionError,
+    InvalidMessageError,
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageSendTimeout,
+    MessageTooLarge,
+)
+from pysoa.common.types import (
+    ActionRequest,
+    JobRequest,
+    JobResponse,
+    UnicodeKeysDict,
+)
+
+
+__all__ = (
+    'AsyncClientMixin',
+    'AsyncServiceHandlerMixin',
+)
+
+
+_TRANSPORT_ERRORS = (
+    ConnectionError,
+    InvalidMessageError,
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageSendTimeout,
+    MessageTooLarge,
+)
+
+
+class AsyncServiceHandlerMixin(object):
+    """
+    Coroutine methods for `ServiceHandler`. If the transport provides `send_request_message_async` and
+    `receive_response_message_async` (such as `AsyncRedisClientTransport`), these never block the event loop. Otherwise,
+    they fall back to the transport's blocking methods, but only if the transport never actually blocks (its `may_block`
+    is `False`, as with the local and stub transports); with any other transport, they raise `TypeError`.
+    """
+
+    _unclaimed_async_responses = None
+
+    async def send_request_async(self, job_request, message_expiry_in_seconds=None):
+        """
+        The coroutine equivalent of `send_request`. The request middleware is applied as usual, but because middleware
+        is not asynchronous, the message is actually sent after the middleware stack has returned, so middleware will
+        not see transport errors.
+
+        :param job_request: The job request object to send
+        :type job_request: JobRequest
+        :param message_expiry_in_seconds: How soon the message will expire if not received by a server (defaults to
+                                          sixty seconds unless the settings are otherwise)
+        :type message_expiry_in_seconds: int
+
+        :return: The request ID
+        :rtype: int
+
+        :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge, TypeError
+        """
+        self._check_transport_async('send_request_message_async')
+
+        request_id = self._get_next_request_id()
+
+        messages = []
+
+        def base_send_request(_request_id, meta, _job_request, _message_expiry_in_seconds=None):
+            if isinstance(_job_request, JobRequest):
+                _job_request = attr.asdict(_job_request, dict_factory=UnicodeKeysDict)
+            messages.append((_request_id, meta, _job_request, _message_expiry_in_seconds))
+
+        wrapper = self._make_middleware_stack(
+            [m.request for m in self.middleware],
+            base_send_request,
+        )
+        try:
+            with self.metrics.timer('client.send.including_middleware', resolution=TimerResolution.MICROSECONDS):
+                wrapper(request_id, {}, job_request, message_expiry_in_seconds)
+                with self.metrics.timer('client.send.excluding_middleware', resolution=TimerResolution.MICROSECONDS):
+                    for message in messages:
+                        if hasattr(self.transport, 'send_request_message_async'):
+                            await self.transport.send_request_message_async(*message)
+                        else:
+                            self.transport.send_request_message(*message)
+            return request_id
+        finally:
+            self.metrics.commit()
+
+    async def get_response_async(self, request_id, receive_timeout_in_seconds=None):
+        """
+        Wait for and return the response to the request with the given ID, which must have been sent with
+        `send_request_async`. The response middleware is applied as usual, after the response has been received.
+
+        :param request_id: The request ID returned from `send_request_async`
+        :type request_id: int
+        :param receive_timeout_in_seconds: How long to wait for the response before raising `MessageReceiveTimeout`
+                                           (defaults to five seconds unless the settings are otherwise)
+        :type receive_timeout_in_seconds: int
+
+        :return: The job response
+        :rtype: JobResponse
+
+        :raise: ConnectionError, MessageReceiveError, MessageReceiveTimeout, InvalidMessage, TypeError
+        """
+        self._check_transport_async('receive_response_message_async')
+
+        try:
+            with self.metrics.timer('client.receive.including_middleware', resolution=TimerResolution.MICROSECONDS):
+                with self.metrics.timer('client.receive.excluding_middleware', resolution=TimerResolution.MICROSECONDS):
+                    if hasattr(self.transport, 'receive_response_message_async'):
+                        _, meta, message = await self.transport.receive_response_message_async(
+                            request_id,
+                            receive_timeout_in_seconds,
+                        )
+                    else:
+                        _, meta, message = self._receive_response_message_blocking(
+                            request_id,
+                            receive_timeout_in_seconds,
+                        )
+                    response = JobResponse(**message)
+
+                wrapper = self._make_middleware_stack(
+                    [m.response for m in self.middleware],
+                    lambda _receive_timeout_in_seconds: (request_id, response),
+                )
+                return wrapper(receive_timeout_in_seconds)[1]
+        finally:
+            self.metrics.commit()
+
+    def _check_transport_async(self, method_name):
+        if not hasattr(self.transport, method_name) and self.transport.may_block:
+            raise TypeError(
+                'The transport for service {} has no {}() and may block, so it cannot be used without blocking the '
+                'event loop; configure an asyncio-capable transport, such as AsyncRedisClientTransport'.format(
+                    self.transport.service_name,
+                    method_name,
+                ),
+            )
+
+    def _receive_response_message_blocking(self, request_id, receive_timeout_in_seconds=None):
+        # Responses to other requests may arrive first, so keep them until something asks for them
+        if self._unclaimed_async_responses is None:
+            self._unclaimed_async_responses = {}
+
+        while request_id not in self._unclaimed_async_responses:
+            response = self.transport.receive_response_message(receive_timeout_in_seconds)
+            if response[2] is None:
+                raise MessageReceiveError('No response is pending for request with ID {}'.format(request_id))
+            self._unclaimed_async_responses[response[0]] = response
+
+        return self._unclaimed_async_responses.pop(request_id)
+
+
+class AsyncClientMixin(object):
+    """
+    Coroutine versions of the blocking `Client` request methods. They accept the same arguments as their blocking
+    counterparts and raise the same errors, except that they do not support expansions. Calls to different services,
+    and parallel calls to the same service, all wait for their responses concurrently, so long as the services are
+    configured with an asyncio-capable transport such as `AsyncRedisClientTransport`.
+    """
+
+    async def call_action_async(self, service_name, action, body=None, **kwargs):
+        """
+        The coroutine equivalent of `call_action`.
+
+        :return: The action response
+        :rtype: ActionResponse
+
+        :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge,
+                MessageReceiveError, MessageReceiveTimeout, InvalidMessage, JobError, CallActionError
+        """
+        action_request = ActionRequest(
+            action=action,
+            body=body or {},
+        )
+        response = await self.call_actions_async(service_name, [action_request], **kwargs)
+        return response.actions[0]
+
+    async def call_actions_async(
+        self,
+        service_name,
+        actions,
+        raise_job_errors=True,
+        raise_action_errors=True,
+        timeout=None,
+        **kwargs
+    ):
+        """
+        The coroutine equivalent of `call_actions`.
+
+        :return: The job response
+        :rtype: JobResponse
+
+        :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge,
+                MessageReceiveError, MessageReceiveTimeout, InvalidMessage, JobError, CallActionError
+        """
+        self._check_async_kwargs('call_actions_async', kwargs)
+
+        response = await self._call_job_async(service_name, actions, timeout, **kwargs)
+
+        self._raise_response_errors(response, raise_job_errors, raise_action_errors)
+        return response
+
+    async def call_actions_parallel_async(self, service_name, actions, **kwargs):
+        """
+        The coroutine equivalent of `call_actions_parallel`, except that it returns a list instead of a generator.
+
+        :return: A list of action responses
+        :rtype: list[ActionResponse]
+
+        :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge,
+                MessageReceiveError, MessageReceiveTimeout, InvalidMessage, JobError, CallActionError
+        """
+        if 'raise_job_errors' in kwargs:
+            raise TypeError("call_actions_parallel_async() got a prohibited keyword argument 'raise_job_errors")
+        if 'catch_transport_errors' in kwargs:
+            raise TypeError("call_actions_parallel_async() got a prohibited keyword argument 'catch_transport_errors")
+
+        job_responses = await self.call_jobs_parallel_async(
+            jobs=({'service_name': service_name, 'actions': [action]} for action in actions),
+            **kwargs
+        )
+
+        return [job.actions[0] for job in job_responses]
+
+    async def call_jobs_parallel_async(
+        self,
+        jobs,
+        raise_job_errors=True,
+        raise_action_errors=True,
+        catch_transport_errors=False,
+        timeout=None,
+        **kwargs
+    ):
+        """
+        The coroutine equivalent of `call_jobs_parallel`. All the jobs are sent and their responses awaited
+        concurrently.
+
+        :return: The job responses
+        :rtype: list[union(JobResponse, Exception)]
+
+        :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge,
+                MessageReceiveError, MessageReceiveTimeout, InvalidMessage, JobError, CallActionError
+        """
+        self._check_async_kwargs('call_jobs_parallel_async', kwargs)
+
+        results = await asyncio.gather(
+            *(self._call_job_async(job['service_name'], job['actions'], timeout, **kwargs) for job in jobs),
+            return_exceptions=True
+        )
+
+        responses = []
+        for result in results:
+            if isinstance(result, Exception):
+                if not (catch_transport_errors and isinstance(result, _TRANSPORT_ERRORS)):
+                    raise result
+            else:
+                self._raise_response_errors(result, raise_job_errors, raise_action_errors)
+            responses.append(result)
+
+        return responses
+
+    # Private methods used to support all of the above methods
+
+    async def _call_job_async(self, service_name, actions, timeout=None, **kwargs):
+        kwargs.pop('suppress_response', None)  # If this kwarg is used, this method would always result in a timeout
+        if timeout:
+            kwargs['message_expiry_in_seconds'] = timeout
+
+        handler = self._get_handler(service_name)
+        job_request = self._make_job_request(actions, **kwargs)
+        request_id = await handler.send_request_async(job_request, kwargs.get('message_expiry_in_seconds'))
+        return await handler.get_response_async(request_id, timeout)
+
+    def _raise_response_errors(self, response, raise_job_errors, raise_action_errors):
+        if raise_job_errors and response.errors:
+            raise self.JobError(response.errors)
+        if raise_action_errors:
+            error_actions = [action for action in response.actions if action.errors]
+            if error_actions:
+                raise self.CallActionError(error_actions)
+
+    @staticmethod
+    def _check_async_kwargs(method_name, kwargs):
+        if 'expansions' in kwargs:
+            raise TypeError("{}() got a prohibited keyword argument 'expansions'".format(method_name))
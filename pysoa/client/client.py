@@ -6,6 +6,7 @@ from __future__ import (
 import collections
 import random
 import sys
+import threading
 import uuid
 
 import attr
@@ -22,9 +23,6 @@ from pysoa.common.transport.exceptions import (
     InvalidMessageError,
     MessageReceiveError,
     MessageReceiveTimeout,
-    MessageSendError,
-    MessageSendTimeout,
-    MessageTooLarge,
 )
 from pysoa.common.types import (
     ActionRequest,
@@ -34,13 +32,23 @@ from pysoa.common.types import (
 )
 
 
+if sys.version_info >= (3, 5):
+    from pysoa.client.async_client import (
+        AsyncClientMixin,
+        AsyncServiceHandlerMixin,
+    )
+else:
+    AsyncClientMixin = object
+    AsyncServiceHandlerMixin = object
+
+
 __all__ = (
     'Client',
     'ServiceHandler',
 )
 
 
-class ServiceHandler(object):
+class ServiceHandler(AsyncServiceHandlerMixin):
     """Does the low-level work of communicating with an individual service through its configured transport."""
 
     def __init__(self, service_name, settings):
@@ -66,6 +74,7 @@ class ServiceHandler(object):
         # Make sure the request counter starts at a random location to avoid clashing with other clients
         # sharing the same connection
         self.request_counter = random.randint(1, 1000000)
+        self._request_counter_lock = threading.Lock()
 
     @staticmethod
     def _make_middleware_stack(middleware, base):
@@ -78,6 +87,13 @@ class ServiceHandler(object):
             base = ware(base)
         return base
 
+    def _get_next_request_id(self):
+        # Threads sharing a client must never get the same request ID, or their responses could be mixed up
+        with self._request_counter_lock:
+            request_id = self.request_counter
+            self.request_counter += 1
+        return request_id
+
     def _base_send_request(self, request_id, meta, job_request, message_expiry_in_seconds=None):
         with self.metrics.timer('client.send.excluding_middleware', resolution=TimerResolution.MICROSECONDS):
             if isinstance(job_request, JobRequest):
@@ -102,8 +118,7 @@ class ServiceHandler(object):
 
         :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge
         """
-        request_id = self.request_counter
-        self.request_counter += 1
+        request_id = self._get_next_request_id()
         meta = {}
         wrapper = self._make_middleware_stack(
             [m.request for m in self.middleware],
@@ -116,6 +131,62 @@ class ServiceHandler(object):
         finally:
             self.metrics.commit()
 
+    def send_requests(self, job_requests, message_expiry_in_seconds=None):
+        """
+        Send multiple JobRequests in bulk, and return a list of request IDs and/or errors.
+
+        Each job request is passed through the request middleware individually, exactly as with `send_request`, but
+        instead of sending each one as soon as it emerges from the middleware, the handler collects them and then sends
+        them all together with the transport's `send_request_messages`, which transports such as the Redis Gateway
+        transport implement with far fewer round trips. As a result, middleware will not see transport errors raised
+        from within the call to the next level down; instead, transport errors are returned in place of the request
+        ID for each job request that could not be sent, so that one failure does not prevent the other requests from
+        being sent.
+
+        :param job_requests: The job request objects to send
+        :type job_requests: iterable[JobRequest]
+        :param message_expiry_in_seconds: How soon the messages will expire if not received by a server (defaults to
+                                          sixty seconds unless the settings are otherwise)
+        :type message_expiry_in_seconds: int
+
+        :return: A list with one item for each job request, in the same order, which is the request ID if the request
+                 was sent or the transport error (`ConnectionError`, `InvalidMessageError`, `MessageSendError`,
+                 `MessageSendTimeout`, or `MessageTooLarge`) that prevented it from being sent
+        :rtype: list[union(int, Exception)]
+
+        :raise: InvalidField
+        """
+        messages = []
+
+        def base_send_request(request_id, meta, job_request, _message_expiry_in_seconds=None):
+            if isinstance(job_request, JobRequest):
+                job_request = attr.asdict(job_request, dict_factory=UnicodeKeysDict)
+            messages.append((request_id, meta, job_request, _message_expiry_in_seconds))
+
+        wrapper = self._make_middleware_stack(
+            [m.request for m in self.middleware],
+            base_send_request,
+        )
+        try:
+            request_ids = []
+            with self.metrics.timer('client.send_bulk.including_middleware', resolution=TimerResolution.MICROSECONDS):
+                for job_request in job_requests:
+                    request_id = self._get_next_request_id()
+                    wrapper(request_id, {}, job_request, message_expiry_in_seconds)
+                    request_ids.append(request_id)
+
+                with self.metrics.timer(
+                    'client.send_bulk.excluding_middleware',
+                    resolution=TimerResolution.MICROSECONDS,
+                ):
+                    errors = self.transport.send_request_messages(messages) if messages else []
+
+            # Middleware may have chosen not to send some requests, so match the errors up by request ID
+            errors_by_request_id = {message[0]: error for message, error in zip(messages, errors)}
+            return [errors_by_request_id.get(request_id) or request_id for request_id in request_ids]
+        finally:
+            self.metrics.commit()
+
     def _get_response(self, receive_timeout_in_seconds=None):
         with self.metrics.timer('client.receive.excluding_middleware', resolution=TimerResolution.MICROSECONDS):
             request_id, meta, message = self.transport.receive_response_message(receive_timeout_in_seconds)
@@ -154,10 +225,12 @@ class ServiceHandler(object):
             self.metrics.commit()
 
 
-class Client(object):
+class Client(AsyncClientMixin):
     """
     The `Client` provides a simple interface for calling actions on services and supports both sequential and
-    parallel action invocation.
+    parallel action invocation. On Python 3.5 and newer, it also provides coroutine versions of the blocking call
+    methods (`call_action_async`, `call_actions_async`, `call_actions_parallel_async`, and `call_jobs_parallel_async`)
+    for use from asyncio code.
     """
 
     settings_class = PolymorphicClientSettings
@@ -380,6 +453,10 @@ class Client(object):
         :type context: dict
         :param control_extra: A dictionary of extra values to include in the control header
         :type control_extra: dict
+        :param priority: The priority of the request, which transports that support priority lanes (such as the Redis
+                         Gateway transport) use to choose the lane to which the request is sent, from 0 (the highest
+                         priority, and the default) up; this is included in the control header
+        :type priority: int
 
         :return: The action response
         :rtype: ActionResponse
@@ -433,6 +510,14 @@ class Client(object):
         :type context: dict
         :param control_extra: A dictionary of extra values to include in the control header
         :type control_extra: dict
+        :param priority: The priority of the request, which transports that support priority lanes (such as the Redis
+                         Gateway transport) use to choose the lane to which the request is sent, from 0 (the highest
+                         priority, and the default) up; this is included in the control header
+        :type priority: int
+        :param parallel: Whether the service should run the actions concurrently instead of in sequence, if it has
+                         parallel actions enabled (the action responses are still in the order of the actions); this is
+                         included in the control header
+        :type parallel: bool
 
         :return: The job response
         :rtype: JobResponse
@@ -484,6 +569,10 @@ class Client(object):
         :type context: dict
         :param control_extra: A dictionary of extra values to include in the control header
         :type control_extra: dict
+        :param priority: The priority of the request, which transports that support priority lanes (such as the Redis
+                         Gateway transport) use to choose the lane to which the request is sent, from 0 (the highest
+                         priority, and the default) up; this is included in the control header
+        :type priority: int
 
         :return: A generator of action responses
         :rtype: Generator[ActionResponse]
@@ -530,7 +619,10 @@ class Client(object):
                                        the transport, cause the entire process to terminate, potentially losing
                                        responses. If this argument is set to `True`, those errors are, instead, caught,
                                        and they are returned in place of their corresponding responses in the returned
-                                       list of job responses.
+                                       list of job responses. Because the jobs are sent in bulk, when one of them fails
+                                       to send, the others have already been sent; before the first send error is
+                                       raised, their responses are received (for up to `timeout`) and discarded, so
+                                       that they are not mistaken for the responses to later calls.
         :type catch_transport_errors: bool
         :param timeout: If provided, this will override the default transport timeout values to; requests will expire
                         after this number of seconds plus some buffer defined by the transport, and the client will not
@@ -546,6 +638,14 @@ class Client(object):
         :type context: dict
         :param control_extra: A dictionary of extra values to include in the control header
         :type control_extra: dict
+        :param priority: The priority of the request, which transports that support priority lanes (such as the Redis
+                         Gateway transport) use to choose the lane to which the request is sent, from 0 (the highest
+                         priority, and the default) up; this is included in the control header
+        :type priority: int
+        :param parallel: Whether the service should run the actions concurrently instead of in sequence, if it has
+                         parallel actions enabled (the action responses are still in the order of the actions); this is
+                         included in the control header
+        :type parallel: bool
 
         :return: The job response
         :rtype: list[union(JobResponse, Exception)]
@@ -706,20 +806,37 @@ class Client(object):
         error_key = 0
         transport_errors = {}
 
+        # Send the jobs for each service in bulk, so that the transport can send them in as few round trips as possible
+        jobs = list(jobs)
+        service_jobs = collections.OrderedDict()
+        for job in jobs:
+            service_jobs.setdefault(job['service_name'], []).append(job['actions'])
+
+        service_sent_request_ids = {}
+        for service_name, service_actions in six.iteritems(service_jobs):
+            service_sent_request_ids[service_name] = collections.deque(
+                self.send_requests(service_name, service_actions, **kwargs),
+            )
+
         response_reassembly_keys = []
         service_request_ids = {}
+        send_error = None
         for job in jobs:
-            try:
-                sent_request_id = self.send_request(job['service_name'], job['actions'], **kwargs)
-                service_request_ids.setdefault(job['service_name'], set()).add(sent_request_id)
-            except (ConnectionError, InvalidMessageError, MessageSendError, MessageSendTimeout, MessageTooLarge) as e:
-                if not catch_transport_errors:
-                    raise
+            sent_request_id = service_sent_request_ids[job['service_name']].popleft()
+            if isinstance(sent_request_id, Exception):
+                transport_error = sent_request_id
+                send_error = send_error or transport_error
                 sent_request_id = error_key = error_key - 1
-                transport_errors[(job['service_name'], sent_request_id)] = e
+                transport_errors[(job['service_name'], sent_request_id)] = transport_error
+            else:
+                service_request_ids.setdefault(job['service_name'], set()).add(sent_request_id)
 
             response_reassembly_keys.append((job['service_name'], sent_request_id))
 
+        if send_error and not catch_transport_errors:
+            self._discard_responses(service_request_ids, timeout)
+            raise send_error
+
         def get_response(_timeout):
             service_responses = {}
             for service_name, request_ids in six.iteritems(service_request_ids):
@@ -793,6 +910,8 @@ class Client(object):
         control_extra=None,
         message_expiry_in_seconds=None,
         suppress_response=False,
+        priority=None,
+        parallel=False,
     ):
         """
         Build and send a JobRequest, and return a request ID.
@@ -814,6 +933,14 @@ class Client(object):
         :type context: dict
         :param control_extra: A dictionary of extra values to include in the control header
         :type control_extra: dict
+        :param priority: The priority of the request, which transports that support priority lanes (such as the Redis
+                         Gateway transport) use to choose the lane to which the request is sent, from 0 (the highest
+                         priority, and the default) up; this is included in the control header
+        :type priority: int
+        :param parallel: Whether the service should run the actions concurrently instead of in sequence, if it has
+                         parallel actions enabled (the action responses are still in the order of the actions); this is
+                         included in the control header
+        :type parallel: bool
         :param message_expiry_in_seconds: How soon the message will expire if not received by a server (defaults to
                                           sixty seconds unless the settings are otherwise)
         :type message_expiry_in_seconds: int
@@ -828,24 +955,53 @@ class Client(object):
         :raise: ConnectionError, InvalidField, MessageSendError, MessageSendTimeout, MessageTooLarge
         """
 
-        control_extra = control_extra.copy() if control_extra else {}
-        if message_expiry_in_seconds and 'timeout' not in control_extra:
-            control_extra['timeout'] = message_expiry_in_seconds
-
         handler = self._get_handler(service_name)
-        control = self._make_control_header(
+        job_request = self._make_job_request(
+            actions,
+            switches=switches,
+            correlation_id=correlation_id,
             continue_on_error=continue_on_error,
+            context=context,
             control_extra=control_extra,
+            message_expiry_in_seconds=message_expiry_in_seconds,
             suppress_response=suppress_response,
+            priority=priority,
+            parallel=parallel,
         )
-        context = self._make_context_header(
-            switches=switches,
-            correlation_id=correlation_id,
-            context_extra=context,
-        )
-        job_request = JobRequest(actions=actions, control=control, context=context or {})
         return handler.send_request(job_request, message_expiry_in_seconds)
 
+    def send_requests(self, service_name, actions_list, message_expiry_in_seconds=None, **kwargs):
+        """
+        Build and send multiple JobRequests to one service in bulk, one for each list of actions in `actions_list`, and
+        return a list of request IDs and/or transport errors. Transports that support it (such as the Redis Gateway
+        transport) send all the requests in as few round trips as possible.
+
+        This accepts all the same keyword arguments as `send_request`, and they apply to every job request. Unlike
+        `send_request`, one request failing to send does not prevent the others from being sent and does not raise
+        an error. Instead, the error is returned in place of the request ID for each request that could not be sent.
+
+        :param service_name: The name of the service to which to send the requests
+        :type service_name: union[str, unicode]
+        :param actions_list: A list of lists of `ActionRequest` objects, one list for each job request
+        :type actions_list: iterable[list]
+        :param message_expiry_in_seconds: How soon the messages will expire if not received by a server (defaults to
+                                          sixty seconds unless the settings are otherwise)
+        :type message_expiry_in_seconds: int
+
+        :return: A list with one item for each list of actions, in the same order, which is the request ID if the
+                 request was sent or the transport error (`ConnectionError`, `InvalidMessageError`,
+                 `MessageSendError`, `MessageSendTimeout`, or `MessageTooLarge`) that prevented it from being sent
+        :rtype: list[union(int, Exception)]
+
+        :raise: InvalidField
+        """
+        handler = self._get_handler(service_name)
+        job_requests = [
+            self._make_job_request(actions, message_expiry_in_seconds=message_expiry_in_seconds, **kwargs)
+            for actions in actions_list
+        ]
+        return handler.send_requests(job_requests, message_expiry_in_seconds)
+
     def get_all_responses(self, service_name, receive_timeout_in_seconds=None):
         """
         Receive all available responses from the service as a generator.
@@ -868,6 +1024,49 @@ class Client(object):
 
     # Private methods used to support all of the above methods
 
+    def _make_job_request(
+        self,
+        actions,
+        switches=None,
+        correlation_id=None,
+        continue_on_error=False,
+        context=None,
+        control_extra=None,
+        message_expiry_in_seconds=None,
+        suppress_response=False,
+        priority=None,
+        parallel=False,
+    ):
+        control_extra = control_extra.copy() if control_extra else {}
+        if message_expiry_in_seconds and 'timeout' not in control_extra:
+            control_extra['timeout'] = message_expiry_in_seconds
+        if priority is not None:
+            control_extra['priority'] = priority
+        if parallel:
+            control_extra['parallel'] = True
+
+        control = self._make_control_header(
+            continue_on_error=continue_on_error,
+            control_extra=control_extra,
+            suppress_response=suppress_response,
+        )
+        context = self._make_context_header(
+            switches=switches,
+            correlation_id=correlation_id,
+            context_extra=context,
+        )
+        return JobRequest(actions=actions, control=control, context=context or {})
+
+    def _discard_responses(self, service_request_ids, timeout=None):
+        # Receive the responses to requests whose caller will not get them, so that they are not mistaken for the
+        # responses to later requests; errors receiving them are irrelevant to the caller
+        for service_name in service_request_ids:
+            try:
+                for _ in self.get_all_responses(service_name, receive_timeout_in_seconds=timeout):
+                    pass
+            except (ConnectionError, InvalidMessageError, MessageReceiveError, MessageReceiveTimeout):
+                pass
+
     def _perform_expansion(self, actions, expansions, **kwargs):
         # Perform expansions
         if expansions and hasattr(self, 'expansion_converter'):
@@ -11,6 +11,12 @@ import threading
 import six
 
 
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+
 class PySOALogContextFilter(logging.Filter):
     def __init__(self):
         super(PySOALogContextFilter, self).__init__('')
@@ -26,25 +32,43 @@ class PySOALogContextFilter(logging.Filter):
         record.service_name = self._service_name or 'unknown'
         return True
 
-    _logging_context = threading.local()
+    if contextvars:
+        # Each thread, and each asyncio task (such as each job of a server with `async_jobs` enabled), has its own
+        # context, and the stack is immutable, so that tasks do not change the stack of the task that created them
+        _logging_context_stack = contextvars.ContextVar('pysoa_logging_context_stack', default=())
+    else:
+        _logging_context = threading.local()
 
     _service_name = None
 
+    @classmethod
+    def _get_logging_context_stack(cls):
+        if contextvars:
+            return cls._logging_context_stack.get()
+        return getattr(cls._logging_context, 'context_stack', ())
+
+    @classmethod
+    def _set_logging_context_stack(cls, context_stack):
+        if contextvars:
+            cls._logging_context_stack.set(context_stack)
+        else:
+            cls._logging_context.context_stack = context_stack
+
     @classmethod
     def set_logging_request_context(cls, **context):
-        if not getattr(cls._logging_context, 'context_stack', None):
-            cls._logging_context.context_stack = []
-        cls._logging_context.context_stack.append(context)
+        cls._set_logging_context_stack(cls._get_logging_context_stack() + (context, ))
 
     @classmethod
     def clear_logging_request_context(cls):
-        if getattr(cls._logging_context, 'context_stack', None):
-            cls._logging_context.context_stack.pop()
+        context_stack = cls._get_logging_context_stack()
+        if context_stack:
+            cls._set_logging_context_stack(context_stack[:-1])
 
     @classmethod
     def get_logging_request_context(cls):
-        if getattr(cls._logging_context, 'context_stack', None):
-            return cls._logging_context.context_stack[-1]
+        context_stack = cls._get_logging_context_stack()
+        if context_stack:
+            return context_stack[-1]
         return None
 
     @classmethod
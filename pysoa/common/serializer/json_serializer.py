@@ -34,7 +34,7 @@ class JSONSerializer(BaseSerializer):
 
     def blob_to_dict(self, blob):
         try:
-            if six.PY3 and isinstance(blob, six.binary_type):
+            if (six.PY3 and isinstance(blob, six.binary_type)) or isinstance(blob, bytearray):
                 blob = blob.decode('utf-8')
             return json.loads(blob)
         except (ValueError, UnicodeDecodeError) as e:
@@ -23,6 +23,13 @@ import threading
 import six
 
 from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.transport.exceptions import (
+    ConnectionError,
+    InvalidMessageError,
+    MessageSendError,
+    MessageSendTimeout,
+    MessageTooLarge,
+)
 
 
 def get_hex_thread_id():
@@ -43,6 +50,17 @@ class ClientTransport(object):
         self.service_name = service_name
         self.metrics = metrics
 
+    @property
+    def may_block(self):
+        """
+        Whether `send_request_message` or `receive_response_message` may wait on I/O or on other threads. The coroutine
+        methods of `Client` refuse to call the blocking methods of a transport that may block, because they would block
+        the event loop. The default implementation returns `True`.
+
+        :rtype: bool
+        """
+        return True
+
     @abc.abstractmethod
     def send_request_message(self, request_id, meta, body, message_expiry_in_seconds=None):
         """
@@ -62,6 +80,32 @@ class ClientTransport(object):
         """
         raise NotImplementedError()
 
+    def send_request_messages(self, messages):
+        """
+        Send multiple request messages at once. Transports that can send messages in bulk more efficiently than one at
+        a time should override this; the default implementation simply calls `send_request_message` for each message.
+
+        One message failing to send must not prevent the others from being sent. Instead of raising transport errors,
+        this returns a list with one entry for each message, in the same order as the messages, which is `None` if the
+        message was sent or the error that prevented it from being sent.
+
+        :param messages: The messages to send, each a tuple of the same arguments accepted by `send_request_message`,
+                         in the same order: `(request_id, meta, body, message_expiry_in_seconds)`
+        :type messages: iterable[tuple(int, dict, dict, int)]
+
+        :return: The list of errors, with `None` in place of each message that was sent successfully
+        :rtype: list[union(ConnectionError, InvalidMessageError, MessageSendError, MessageSendTimeout, MessageTooLarge,
+                NoneType)]
+        """
+        errors = []
+        for request_id, meta, body, message_expiry_in_seconds in messages:
+            try:
+                self.send_request_message(request_id, meta, body, message_expiry_in_seconds)
+                errors.append(None)
+            except (ConnectionError, InvalidMessageError, MessageSendError, MessageSendTimeout, MessageTooLarge) as e:
+                errors.append(e)
+        return errors
+
     @abc.abstractmethod
     def receive_response_message(self, receive_timeout_in_seconds=None):
         """
@@ -105,6 +149,48 @@ class ServerTransport(object):
         """
         raise NotImplementedError()
 
+    def receive_queued_request_messages(self, maximum_messages):
+        """
+        Receive up to `maximum_messages` request messages that are already waiting to be received, without blocking, so
+        that the server can handle several jobs together. Returns an empty list if no request message is waiting. The
+        default implementation always returns an empty list, which transports that cannot receive without blocking, or
+        that must hand requests to the server one at a time, should keep.
+
+        :param maximum_messages: The maximum number of request messages to receive
+        :type maximum_messages: int
+
+        :return: A list of tuples of the request ID, meta dict, and message dict, in that order
+        :rtype: list[tuple]
+
+        :raise: ConnectionError, MessageReceiveError
+        """
+        return []
+
+    def get_request_queue_depth(self):
+        """
+        Returns the number of request messages waiting to be received from the queues that this transport receives from,
+        which a supervisor of forked server processes uses to decide when to fork more of them. The default
+        implementation returns `None`, which transports that cannot tell should keep.
+
+        :return: The number of request messages waiting, or `None` if unknown
+        :rtype: int
+
+        :raise: ConnectionError, MessageReceiveError
+        """
+        return None
+
+    @property
+    def can_handle_requests_concurrently(self):
+        """
+        Whether the server may receive more requests while requests it received earlier are still being handled (as
+        it does with `async_jobs`). Transports that acknowledge each request only once the next one is received must
+        return `False`, because a request would then be acknowledged before it had been handled. The default
+        implementation returns `True`.
+
+        :rtype: bool
+        """
+        return True
+
     @abc.abstractmethod
     def send_response_message(self, request_id, meta, body):
         """
@@ -121,3 +207,12 @@ class ServerTransport(object):
         :raise: ConnectionError, MessageSendError, MessageSendTimeout, MessageTooLarge
         """
         raise NotImplementedError()
+
+    def close(self):
+        """
+        Called by the server once, when it is shutting down, after it has received its last request and sent its last
+        response. Transports that hold resources, or that have received messages they have not yet handed to the
+        server, should release or return them here. The default implementation does nothing.
+
+        :raise: ConnectionError, MessageSendError
+        """
@@ -4,6 +4,9 @@ from __future__ import (
 )
 
 from collections import deque
+import logging
+import threading
+import time
 
 from conformity import fields
 import six
@@ -16,12 +19,66 @@ from pysoa.common.transport.base import (
     ClientTransport,
     ServerTransport,
 )
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+)
+
+
+def resolve_local_server(service_name, server_class, server_settings):
+    """
+    Resolve the server class and settings with which a local transport runs a service.
+
+    :param service_name: The service name, which must match the server's
+    :type service_name: union[str, unicode]
+    :param server_class: The server class, or the path to it
+    :type server_class: union[class, str, unicode]
+    :param server_settings: The server settings dict, or the path to it
+    :type server_settings: union[dict, str, unicode]
+
+    :return: A tuple of the server class and its settings object, set to use the `LocalServerTransport` stub
+    :rtype: tuple(class, ServerSettings)
+    """
+    # If the server is specified as a path, resolve it to a class
+    if isinstance(server_class, six.string_types):
+        try:
+            server_class = resolve_python_path(server_class)
+        except (ImportError, AttributeError) as e:
+            raise type(e)('Could not resolve server class path {}: {}'.format(server_class, e))
+
+    # Make sure the client and the server match names
+    if server_class.service_name != service_name:
+        raise Exception('Server {} service name "{}" does not match "{}"'.format(
+            server_class,
+            server_class.service_name,
+            service_name,
+        ))
+
+    # See if the server settings is actually a string to the path for settings
+    if isinstance(server_settings, six.string_types):
+        try:
+            settings_dict = resolve_python_path(server_settings)
+        except (ImportError, AttributeError) as e:
+            raise type(e)('Could not resolve settings path {}: {}'.format(server_settings, e))
+    else:
+        settings_dict = server_settings
+
+    # Patch settings_dict to use LocalServerTransport
+    settings_dict['transport'] = {
+        'path': 'pysoa.common.transport.local:LocalServerTransport',
+    }
+
+    return server_class, server_class.settings_class(settings_dict)
 
 
 class LocalClientTransport(ClientTransport):
-    """A transport that incorporates a server for running a service and client in a single thread."""
+    """
+    A transport that incorporates a server for running a service and client in a single thread or, with
+    `worker_threads`, that incorporates that many servers, each handling requests in its own thread, so that the
+    requests sent by `call_actions_parallel` and friends are handled concurrently.
+    """
 
-    def __init__(self, service_name, metrics, server_class, server_settings):
+    def __init__(self, service_name, metrics, server_class, server_settings, worker_threads=0):
         """
         :param service_name: The service name
         :type service_name: union[str, unicode]
@@ -31,37 +88,13 @@ class LocalClientTransport(ClientTransport):
         :type server_class: class
         :param server_settings: The server settings that will be passed to the server class on instantiation
         :type server_settings: dict
+        :param worker_threads: If greater than zero, the number of servers that handle requests, each in its own
+                               thread, instead of handling each request in the sending thread before sending returns
+        :type worker_threads: int
         """
         super(LocalClientTransport, self).__init__(service_name, metrics)
 
-        # If the server is specified as a path, resolve it to a class
-        if isinstance(server_class, six.string_types):
-            try:
-                server_class = resolve_python_path(server_class)
-            except (ImportError, AttributeError) as e:
-                raise type(e)('Could not resolve server class path {}: {}'.format(server_class, e))
-
-        # Make sure the client and the server match names
-        if server_class.service_name != service_name:
-            raise Exception('Server {} service name "{}" does not match "{}"'.format(
-                server_class,
-                server_class.service_name,
-                service_name,
-            ))
-
-        # See if the server settings is actually a string to the path for settings
-        if isinstance(server_settings, six.string_types):
-            try:
-                settings_dict = resolve_python_path(server_settings)
-            except (ImportError, AttributeError) as e:
-                raise type(e)('Could not resolve settings path {}: {}'.format(server_settings, e))
-        else:
-            settings_dict = server_settings
-
-        # Patch settings_dict to use LocalServerTransport
-        settings_dict['transport'] = {
-            'path': 'pysoa.common.transport.local:LocalServerTransport',
-        }
+        server_class, self.server_settings = resolve_local_server(service_name, server_class, server_settings)
 
         # Set an empty queued request; we'll use this later
         self._current_request = None
@@ -69,18 +102,50 @@ class LocalClientTransport(ClientTransport):
         # Set up a deque for responses for just this client
         self.response_messages = deque()
 
-        # Create and setup Server instance
-        self.server_settings = server_class.settings_class(settings_dict)
-        self.server = server_class(self.server_settings)
-        self.server.transport = self
-        self.server.setup()
+        if worker_threads > 0:
+            self.server = None
+            self._worker_pool = _LocalServerWorkerPool(service_name, server_class, self.server_settings, worker_threads)
+            self._thread_state = threading.local()
+        else:
+            # Create and setup Server instance
+            self._worker_pool = None
+            self.server = server_class(self.server_settings)
+            self.server.transport = self
+            self.server.setup()
+
+    @property
+    def requests_outstanding(self):
+        """
+        Indicates the number of requests sent by the calling thread whose responses it has not yet received (without
+        worker threads, those responses are already waiting in the deque). With worker threads, a receive timeout
+        abandons all of them.
+        """
+        if self._worker_pool:
+            return len(self._get_thread_state().request_ids)
+        return len(self.response_messages)
+
+    @property
+    def may_block(self):
+        """
+        Without worker threads, requests are handled in the sending thread and their responses are already waiting when
+        they are received, so the transport never blocks.
+        """
+        return bool(self._worker_pool)
 
     def send_request_message(self, request_id, meta, body, _=None):
         """
         Receives a request from the client and handles and dispatches in in-thread. `message_expiry_in_seconds` is not
         supported. Messages do not expire, as the server handles the request immediately in the same thread before
         this method returns. This method blocks until the server has completed handling the request.
+
+        With worker threads, this instead queues the request for the next free server and returns immediately.
         """
+        if self._worker_pool:
+            state = self._get_thread_state()
+            self._worker_pool.submit((request_id, meta, body), state.responses)
+            state.request_ids.add(request_id)
+            return
+
         self._current_request = (request_id, meta, body)
         try:
             self.server.handle_next_request()
@@ -106,16 +171,154 @@ class LocalClientTransport(ClientTransport):
         """
         self.response_messages.append((request_id, meta, body))
 
-    def receive_response_message(self, _=None):
+    def receive_response_message(self, receive_timeout_in_seconds=None):
         """
         Receives a message from the deque. `receive_timeout_in_seconds` is not supported. Receive does not time out,
         because by the time the thread calls this method, a response is already available in the deque, or something
         happened and a response will never be available. This method does not wait and returns immediately.
+
+        With worker threads, this instead waits for the next of the calling thread's requests to be handled, for up to
+        `receive_timeout_in_seconds` if it is set, or else for as long as it takes. If it times out, the thread
+        abandons all of its outstanding requests, and their responses are discarded when they arrive.
         """
+        if self._worker_pool:
+            return self._receive_completed_response(receive_timeout_in_seconds)
+
         if self.response_messages:
             return self.response_messages.popleft()
         return None, None, None
 
+    def close(self):
+        """
+        Stops the worker threads, if any, once they have handled the requests already sent.
+        """
+        if self._worker_pool:
+            self._worker_pool.shutdown()
+
+    def _receive_completed_response(self, receive_timeout_in_seconds):
+        state = self._get_thread_state()
+        if not state.request_ids:
+            # This tells Client.get_all_responses to stop waiting for more.
+            return None, None, None
+
+        deadline = None if receive_timeout_in_seconds is None else time.time() + receive_timeout_in_seconds
+        while True:
+            try:
+                response = state.responses.get(timeout=None if deadline is None else max(deadline - time.time(), 0))
+            except six.moves.queue.Empty:
+                state.request_ids.clear()
+                raise MessageReceiveTimeout('No response received from local service {}'.format(self.service_name))
+
+            # A response to a request that an earlier receive timed out waiting for is discarded
+            if response[0] in state.request_ids:
+                break
+
+        state.request_ids.remove(response[0])
+        if isinstance(response[2], Exception):
+            raise MessageReceiveError(
+                'Local service {} failed to handle a request'.format(self.service_name),
+                six.text_type(response[2]),
+            )
+        return response
+
+    def _get_thread_state(self):
+        state = self._thread_state
+        if not hasattr(state, 'responses'):
+            state.responses = six.moves.queue.Queue()
+            state.request_ids = set()
+        return state
+
+
+class _LocalServerWorkerPool(object):
+    """
+    A number of servers, each handling requests in its own daemon thread, which take the requests from one queue in the
+    order they were sent and put each response on the queue of the thread that sent the request. The threads start
+    when the first request is submitted.
+    """
+
+    def __init__(self, service_name, server_class, server_settings, worker_threads):
+        self.service_name = service_name
+        self._requests = six.moves.queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self.servers = []
+        for _ in range(worker_threads):
+            server = server_class(server_settings)
+            server.transport = _LocalWorkerServerTransport(service_name, server.metrics)
+            server.setup()
+            self.servers.append(server)
+
+    def submit(self, request, responses):
+        if not self._threads:
+            self._start()
+        self._requests.put((request, responses))
+
+    def shutdown(self):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._requests.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i, server in enumerate(self.servers):
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(server, ),
+                    name='pysoa-local-{}-{}'.format(self.service_name, i),
+                )
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self, server):
+        while True:
+            work = self._requests.get()
+            if work is None:
+                return
+
+            request, responses = work
+            server.transport.current_request = request
+            server.transport.current_responses = responses
+            try:
+                server.handle_next_request()
+            except Exception as e:
+                # The server handles errors in actions and middleware itself, so this is something worse, but the
+                # thread waiting for the response must still hear about it
+                logging.getLogger('pysoa.server').exception('Error handling a request for local service')
+                responses.put((request[0], None, e))
+            finally:
+                server.transport.current_request = None
+                server.transport.current_responses = None
+
+
+class _LocalWorkerServerTransport(ServerTransport):
+    """
+    The server transport of each of the servers in a `_LocalServerWorkerPool`, which hands the server the request its
+    thread took from the pool's queue, and puts the response on the queue of the thread that sent the request.
+    """
+
+    def __init__(self, service_name, metrics):
+        super(_LocalWorkerServerTransport, self).__init__(service_name, metrics)
+        self.current_request = None
+        self.current_responses = None
+
+    def receive_request_message(self):
+        if self.current_request is None:
+            raise RuntimeError('Local server tried to receive message more than once')
+        try:
+            return self.current_request
+        finally:
+            self.current_request = None
+
+    def send_response_message(self, request_id, meta, body):
+        self.current_responses.put((request_id, meta, body))
+
 
 class LocalServerTransport(ServerTransport):
     """
@@ -143,25 +346,34 @@ class LocalClientTransportSchema(BasicClassSchema):
         'path': fields.UnicodeString(
             description='The path to the local client transport, in the format `module.name:ClassName`',
         ),
-        'kwargs': fields.Dictionary({
-            # server class can be an import path or a class object
-            'server_class': fields.Any(
-                fields.UnicodeString(
-                    description='The path to the `Server` class, in the format `module.name:ClassName`',
+        'kwargs': fields.Dictionary(
+            {
+                # server class can be an import path or a class object
+                'server_class': fields.Any(
+                    fields.UnicodeString(
+                        description='The path to the `Server` class, in the format `module.name:ClassName`',
+                    ),
+                    fields.ObjectInstance(
+                        six.class_types,
+                        description='A reference to the `Server`-extending class/type',
+                    ),
+                    description='The path to the `Server` class to use locally (as a library), or a reference to the '
+                                '`Server`-extending class/type itself',
                 ),
-                fields.ObjectInstance(
-                    six.class_types,
-                    description='A reference to the `Server`-extending class/type',
+                # No deeper validation because the Server will perform its own validation
+                'server_settings': fields.SchemalessDictionary(
+                    key_type=fields.UnicodeString(),
+                    description='The settings to use when instantiating the `server_class`'
                 ),
-                description='The path to the `Server` class to use locally (as a library), or a reference to the '
-                            '`Server`-extending class/type itself',
-            ),
-            # No deeper validation because the Server will perform its own validation
-            'server_settings': fields.SchemalessDictionary(
-                key_type=fields.UnicodeString(),
-                description='The settings to use when instantiating the `server_class`'
-            ),
-        }),
+                'worker_threads': fields.Integer(
+                    gte=0,
+                    description='If greater than zero, the number of `server_class` instances that handle requests, '
+                                'each in its own thread, so that requests sent in parallel are handled concurrently; '
+                                'otherwise, each request is handled in the sending thread (defaults to 0)',
+                ),
+            },
+            optional_keys=('worker_threads', ),
+        ),
     }
 
     optional_keys = ()
@@ -0,0 +1,123 @@
+"""
+Measures the throughput of a CPU-bound action run through the local process pool transport with increasing numbers of
+worker processes, against the (single-threaded) local transport, to show how throughput scales with the cores
+available. Run it with:
+
+    python -m pysoa.common.transport.process_pool.benchmark --requests 400 --iterations 200000 --processes 1 2 4 8
+"""
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import argparse
+import multiprocessing
+import timeit
+
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.transport.local import LocalClientTransport
+from pysoa.common.transport.process_pool.client import LocalProcessPoolClientTransport
+from pysoa.server.action.base import Action
+from pysoa.server.server import Server
+
+
+__all__ = (
+    'benchmark_transport',
+    'main',
+)
+
+
+class ScoreAction(Action):
+    def run(self, request):
+        total = 0
+        for i in range(request.body['iterations']):
+            total += i * i % 7
+        return {'score': total}
+
+
+class BenchmarkServer(Server):
+    service_name = 'process_pool_benchmark'
+    action_class_map = {
+        'score': ScoreAction,
+    }
+
+
+def benchmark_transport(client_transport, requests, iterations):
+    """
+    Measure one transport, sending all the requests at once and then receiving all the responses.
+
+    :param client_transport: The client transport for the `BenchmarkServer` service
+    :type client_transport: ClientTransport
+    :param requests: How many requests to send
+    :type requests: int
+    :param iterations: How many loop iterations each request's action performs
+    :type iterations: int
+
+    :return: The throughput in requests per second
+    :rtype: float
+    """
+    job = {
+        'control': {'continue_on_error': False},
+        'context': {'switches': [], 'correlation_id': 'benchmark'},
+        'actions': [{'action': 'score', 'body': {'iterations': iterations}}],
+    }
+
+    # Warm up the workers before measuring
+    client_transport.send_request_message(0, {}, dict(job))
+    client_transport.receive_response_message(60)
+
+    started = timeit.default_timer()
+    for request_id in range(1, requests + 1):
+        client_transport.send_request_message(request_id, {}, dict(job))
+    for _ in range(requests):
+        client_transport.receive_response_message(60)
+    return requests / (timeit.default_timer() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the local process pool transport against the local transport.',
+    )
+    parser.add_argument('--requests', type=int, default=200, help='The number of requests to send')
+    parser.add_argument('--iterations', type=int, default=100000, help='The loop iterations in each request')
+    parser.add_argument(
+        '--processes',
+        type=int,
+        nargs='+',
+        default=sorted({1, 2, 4, multiprocessing.cpu_count()}),
+        help='The numbers of worker processes to measure',
+    )
+    args = parser.parse_args(argv)
+
+    print('{} requests of {} iterations each, on {} CPUs; throughput in requests per second'.format(
+        args.requests,
+        args.iterations,
+        multiprocessing.cpu_count(),
+    ))
+
+    baseline = benchmark_transport(
+        LocalClientTransport(BenchmarkServer.service_name, NoOpMetricsRecorder(), BenchmarkServer, {}),
+        args.requests,
+        args.iterations,
+    )
+    print('\nlocal: {:.0f}'.format(baseline))
+
+    for processes in args.processes:
+        transport = LocalProcessPoolClientTransport(
+            BenchmarkServer.service_name,
+            NoOpMetricsRecorder(),
+            BenchmarkServer,
+            {},
+            processes=processes,
+            send_timeout_in_seconds=60,
+        )
+        try:
+            throughput = benchmark_transport(transport, args.requests, args.iterations)
+        finally:
+            transport.close()
+        print('process_pool with {} processes: {:.0f} ({:.1f}x)'.format(processes, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
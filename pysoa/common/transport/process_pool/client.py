@@ -0,0 +1,535 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import errno
+import itertools
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import threading
+import time
+
+from conformity import fields
+import six
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.serializer.base import Serializer as BaseSerializer
+from pysoa.common.settings import BasicClassSchema
+from pysoa.common.transport.base import ClientTransport
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageSendTimeout,
+)
+from pysoa.common.transport.local import resolve_local_server
+from pysoa.common.transport.process_pool.worker import (
+    ProcessPoolTransportCore,
+    run_worker,
+)
+from pysoa.common.transport.tcp.core import (
+    ConnectionClosed,
+    FramedConnection,
+)
+
+
+class _WorkerProcess(object):
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.connection = None
+        # The queues of the threads waiting for the responses to the requests sent to this worker, by request token
+        self.in_flight = {}
+        self.send_lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.restart_at = 0
+
+    @property
+    def alive(self):
+        return self.connection is not None
+
+
+class LocalProcessPoolClientTransport(ClientTransport):
+    """
+    A transport that runs a service in a pool of child processes, each running a server built from `server_class` and
+    `server_settings`, so that CPU-bound actions can use more than one core. Sending a request serializes it and writes
+    it to the worker process with the fewest requests in flight (waiting, if every worker has as many as it is allowed,
+    for one to finish a request), and returns immediately. A dispatcher thread reads the responses from all the workers
+    and hands each to the thread that sent its request, which receives it from its own queue.
+
+    A worker that crashes is restarted, with an exponential back-off if it keeps crashing, and the threads waiting for
+    the responses to the requests it had in flight receive a `MessageReceiveError`. The workers exit when the transport
+    is closed, or when the parent process exits.
+
+    The dispatcher thread starts all the workers, and forks each one without holding any lock of the transport, so
+    that a worker cannot inherit a lock that it would wait on forever. For the same reason, threads that send requests
+    must not hold locks that the server code run by the workers needs while the pool is starting or restarting a
+    worker.
+    """
+
+    MAXIMUM_RESTART_DELAY_IN_SECONDS = 5.0
+    # How often the dispatcher checks whether stopped workers have exited, while any has not
+    REAP_INTERVAL_IN_SECONDS = 0.1
+
+    def __init__(
+        self,
+        service_name,
+        metrics,
+        server_class,
+        server_settings,
+        processes=None,
+        maximum_in_flight_requests_per_process=4,
+        send_timeout_in_seconds=5,
+        **kwargs
+    ):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        local process pool transport settings schema.
+
+        :param service_name: The service name
+        :type service_name: union[str, unicode]
+        :param metrics: The metrics recorder
+        :type metrics: MetricsRecorder
+        :param server_class: The server class, or the path to it, which the workers run
+        :type server_class: union[class, str, unicode]
+        :param server_settings: The server settings, or the path to them
+        :type server_settings: union[dict, str, unicode]
+        :param processes: The number of worker processes (defaults to the number of CPUs)
+        :type processes: int
+        :param maximum_in_flight_requests_per_process: How many requests may be sent to each worker before it has
+                                                       responded to them
+        :type maximum_in_flight_requests_per_process: int
+        :param send_timeout_in_seconds: How long sending may wait for a worker to have room for a request
+        :type send_timeout_in_seconds: float
+        """
+        super(LocalProcessPoolClientTransport, self).__init__(service_name, metrics)
+
+        # The workers create their servers, but the settings are validated here, before any worker starts
+        self.server_class, self.server_settings = resolve_local_server(service_name, server_class, server_settings)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.maximum_in_flight_requests_per_process = maximum_in_flight_requests_per_process
+        self.send_timeout_in_seconds = send_timeout_in_seconds
+
+        self._core_kwargs = dict(kwargs, service_name=service_name)
+        self.core = ProcessPoolTransportCore(metrics=metrics, metrics_prefix='client', **self._core_kwargs)
+
+        self._thread_state = threading.local()
+        self._request_tokens = itertools.count(1)
+        self._reset()
+
+    @property
+    def requests_outstanding(self):
+        """
+        Indicates the number of requests sent by the calling thread whose responses it has not yet received. If this
+        value is less than 1, calling `receive_response_message` will result in a return value of `(None, None, None)`
+        instead of raising a `MessageReceiveTimeout`.
+        """
+        return self._get_thread_state().requests_outstanding
+
+    def send_request_message(self, request_id, meta, body, message_expiry_in_seconds=None):
+        """
+        Sends the request to a worker process. `message_expiry_in_seconds` is not supported: the request is only sent
+        once a worker has room for it, so it does not wait in a queue.
+        """
+        with self.metrics.timer('client.transport.process_pool.send', resolution=TimerResolution.MICROSECONDS):
+            state = self._get_thread_state()
+            token = next(self._request_tokens)
+            meta['reply_to'] = token
+            payload = self.core.serialize_message(request_id, meta, body)
+
+            worker = self._acquire_worker(token, state.responses)
+            try:
+                with worker.send_lock:
+                    connection = worker.connection
+                    if connection is None:
+                        raise ConnectionClosed('Worker {} exited'.format(worker.index))
+                    connection.send_frames([payload], self.send_timeout_in_seconds)
+            except ConnectionClosed as e:
+                # The dispatcher will notice the worker exiting, and restart it
+                with self._condition:
+                    worker.in_flight.pop(token, None)
+                    self._condition.notify()
+                self.core._get_counter('send.error.worker_exited').increment()
+                raise MessageSendError(
+                    'Worker process for service {} exited'.format(self.service_name),
+                    six.text_type(e),
+                )
+
+            state.requests_outstanding += 1
+
+    def receive_response_message(self, receive_timeout_in_seconds=None):
+        state = self._get_thread_state()
+        if state.requests_outstanding < 1:
+            # This tells Client.get_all_responses to stop waiting for more.
+            return None, None, None
+
+        with self.metrics.timer('client.transport.process_pool.receive', resolution=TimerResolution.MICROSECONDS):
+            try:
+                response = state.responses.get(
+                    timeout=receive_timeout_in_seconds or self.core.receive_timeout_in_seconds,
+                )
+            except six.moves.queue.Empty:
+                self.core._get_counter('receive.error.timeout').increment()
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+            state.requests_outstanding -= 1
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    def close(self):
+        """
+        Stops the dispatcher thread and closes the connections to the workers, which exit once they have finished the
+        request they are handling. Threads still waiting for responses receive a `MessageReceiveError`.
+        """
+        with self._condition:
+            if self._closed or self._pid != os.getpid():
+                return
+            self._closed = True
+            dispatcher, self._dispatcher = self._dispatcher, None
+        self._wake_dispatcher()
+        if dispatcher:
+            dispatcher.join()
+
+        with self._condition:
+            for worker in self._workers:
+                self._stop_worker(worker, 'the transport was closed')
+            pids, self._exited_pids = self._exited_pids, []
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+        # Without holding the condition, so that sending threads, which fail now that the transport is closed, do not
+        # wait for the workers to finish the requests they are handling
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._workers = [_WorkerProcess(i) for i in range(self.processes)]
+        self._dispatcher = None
+        self._closed = False
+        self._wake_read, self._wake_write = os.pipe()
+        # The workers that have been stopped but whose processes have not yet been waited for
+        self._exited_pids = []
+
+    def _acquire_worker(self, token, responses):
+        with self.core._get_timer('send.wait_for_worker'), self._condition:
+            if self._pid != os.getpid():
+                # This process was forked from the one that started the workers, which belong to that process alone
+                self._reset()
+            if self._closed:
+                raise MessageSendError('The transport for service {} is closed'.format(self.service_name))
+            if not self._dispatcher:
+                self._start()
+
+            deadline = time.time() + self.send_timeout_in_seconds
+            while True:
+                available = [
+                    worker for worker in self._workers
+                    if worker.alive and len(worker.in_flight) < self.maximum_in_flight_requests_per_process
+                ]
+                if available:
+                    worker = min(available, key=lambda w: len(w.in_flight))
+                    worker.in_flight[token] = responses
+                    return worker
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.core._get_counter('send.error.pool_busy').increment()
+                    raise MessageSendTimeout('No worker process for service {} had room for the request'.format(
+                        self.service_name,
+                    ))
+                self._condition.wait(remaining)
+
+    def _start(self):
+        # The dispatcher starts the workers, and sending threads wait for them to be started
+        self._dispatcher = threading.Thread(
+            target=self._dispatch,
+            name='pysoa-process-pool-{}'.format(self.service_name),
+        )
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def _start_worker(self, worker, inherited_connections):
+        """
+        Forks a worker process, and returns its process ID and the connection to it. Must be called without the
+        condition held, so that the worker does not inherit it held, and, with the condition not held, the worker does
+        not have its connection set yet, so the connections to the other workers that the worker inherits and must
+        close are passed.
+        """
+        parent_socket, child_socket = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                # Close the parent's ends of the connections to the other workers, so that they notice when the parent
+                # closes them
+                parent_socket.close()
+                for connection in inherited_connections:
+                    connection.close()
+                os.close(self._wake_read)
+                os.close(self._wake_write)
+
+                run_worker(
+                    self.server_class,
+                    self.server_settings,
+                    FramedConnection(child_socket, ('parent', os.getppid()), self.core.maximum_message_size_in_bytes),
+                    self._core_kwargs,
+                    self.send_timeout_in_seconds,
+                )
+            except BaseException:
+                logging.getLogger('pysoa.server').exception('Worker process for service {} failed'.format(
+                    self.service_name,
+                ))
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        child_socket.close()
+        self.core._get_counter('worker.started').increment()
+        return pid, FramedConnection(
+            parent_socket,
+            ('worker', pid),
+            self.core.maximum_message_size_in_bytes,
+            connection_id=worker.index,
+        )
+
+    def _stop_worker(self, worker, reason):
+        # Must be called with the condition held; the process is waited for later, without the condition held
+        if worker.connection:
+            worker.connection.close()
+            worker.connection = None
+        if worker.pid:
+            self._exited_pids.append(worker.pid)
+            worker.pid = None
+
+        failed, worker.in_flight = worker.in_flight, {}
+        for responses in six.itervalues(failed):
+            responses.put(MessageReceiveError(
+                'Worker process for service {} exited before responding, because {}'.format(self.service_name, reason),
+            ))
+        self._condition.notify_all()
+
+    def _reap_workers(self):
+        """
+        Waits, without blocking, for the processes of stopped workers that have exited, so that they do not linger as
+        zombies, and returns whether any has not yet exited.
+        """
+        with self._condition:
+            pids, self._exited_pids = self._exited_pids, []
+
+        running = []
+        for pid in pids:
+            try:
+                if not os.waitpid(pid, os.WNOHANG)[0]:
+                    running.append(pid)
+            except OSError:
+                pass
+
+        if running:
+            with self._condition:
+                self._exited_pids.extend(running)
+        return bool(running)
+
+    def _worker_crashed(self, worker):
+        with self._condition:
+            self.core._get_counter('worker.crashed').increment()
+            if worker.in_flight:
+                self.core._get_counter('receive.error.worker_crashed').increment(len(worker.in_flight))
+            if worker.pid:
+                # The worker closed its connection, so it is exiting, but if it is somehow stuck, make sure of it
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            self._stop_worker(worker, 'it crashed')
+            self._back_off_restart(worker)
+
+    def _back_off_restart(self, worker):
+        # Must be called with the condition held
+        worker.consecutive_failures += 1
+        worker.restart_at = time.time() + min(
+            self.MAXIMUM_RESTART_DELAY_IN_SECONDS,
+            0.1 * 2 ** (worker.consecutive_failures - 1),
+        )
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                for worker in self._workers:
+                    if worker.alive and worker.connection.closed:
+                        # A sending thread found the connection broken
+                        self._worker_crashed(worker)
+                now = time.time()
+                starting = [worker for worker in self._workers if not worker.alive and worker.restart_at <= now]
+                inherited_connections = [worker.connection for worker in self._workers if worker.alive]
+
+            # Only this thread starts workers, so the workers being started cannot be started by another thread in the
+            # meantime
+            started = []
+            for worker in starting:
+                try:
+                    pid, connection = self._start_worker(worker, inherited_connections)
+                except OSError:
+                    # Probably out of processes or memory for now, so try again later
+                    self.core._get_counter('worker.start_error').increment()
+                    with self._condition:
+                        self._back_off_restart(worker)
+                    continue
+                inherited_connections.append(connection)
+                started.append((worker, pid, connection))
+            if started:
+                # All at once, so that the first requests are spread across all the workers started together
+                with self._condition:
+                    for worker, pid, connection in started:
+                        worker.pid = pid
+                        worker.connection = connection
+                    self._condition.notify_all()
+
+            exiting = self._reap_workers()
+
+            with self._condition:
+                connections = [worker.connection for worker in self._workers if worker.alive]
+                restarts = [worker.restart_at for worker in self._workers if not worker.alive]
+
+            if exiting:
+                restarts.append(time.time() + self.REAP_INTERVAL_IN_SECONDS)
+            timeout = max(0.0, min(restarts) - time.time()) if restarts else None
+            try:
+                readable, _, _ = select.select(connections + [self._wake_read], [], [], timeout)
+            except ValueError:
+                # A sending thread closed a worker's connection after it failed, which the next pass handles
+                continue
+            except (select.error, OSError) as e:
+                # Python 2 does not retry when a signal interrupts the call
+                if not e.args or e.args[0] not in (errno.EINTR, errno.EBADF):
+                    raise
+                continue
+
+            for connection in readable:
+                if connection is self._wake_read:
+                    os.read(self._wake_read, 1024)
+                    continue
+                self._read_responses(self._workers[connection.connection_id])
+
+    def _read_responses(self, worker):
+        connection = worker.connection
+        if connection is None:
+            return
+        try:
+            payloads = connection.read_available_frames()
+        except ConnectionClosed:
+            self._worker_crashed(worker)
+            return
+
+        for payload in payloads:
+            try:
+                request_id, meta, body = self.core.deserialize_message(payload)
+            except Exception:
+                # The thread waiting for this response will time out
+                self.core._get_counter('receive.error.invalid_message').increment()
+                continue
+
+            with self._condition:
+                responses = worker.in_flight.pop(meta.get('reply_to'), None)
+                worker.consecutive_failures = 0
+                self._condition.notify()
+            if responses is not None:
+                responses.put((request_id, meta, body))
+
+    def _wake_dispatcher(self):
+        try:
+            os.write(self._wake_write, b'\x00')
+        except OSError:
+            pass
+
+    def _get_thread_state(self):
+        state = self._thread_state
+        if getattr(state, 'pid', None) != os.getpid():
+            state.pid = os.getpid()
+            state.responses = six.moves.queue.Queue()
+            state.requests_outstanding = 0
+        return state
+
+
+class LocalProcessPoolClientTransportSchema(BasicClassSchema):
+    contents = {
+        'path': fields.UnicodeString(
+            description='The path to the local process pool client transport, in the format `module.name:ClassName`',
+        ),
+        'kwargs': fields.Dictionary(
+            {
+                'server_class': fields.Any(
+                    fields.UnicodeString(
+                        description='The path to the `Server` class, in the format `module.name:ClassName`',
+                    ),
+                    fields.ObjectInstance(
+                        six.class_types,
+                        description='A reference to the `Server`-extending class/type',
+                    ),
+                    description='The path to the `Server` class that the worker processes run, or a reference to the '
+                                '`Server`-extending class/type itself',
+                ),
+                # No deeper validation because the Server will perform its own validation
+                'server_settings': fields.SchemalessDictionary(
+                    key_type=fields.UnicodeString(),
+                    description='The settings to use when instantiating the `server_class`'
+                ),
+                'processes': fields.Integer(
+                    gt=0,
+                    description='The number of worker processes (defaults to the number of CPUs)',
+                ),
+                'maximum_in_flight_requests_per_process': fields.Integer(
+                    gt=0,
+                    description='How many requests may be sent to each worker process before it has responded to them '
+                                '(defaults to 4)',
+                ),
+                'maximum_message_size_in_bytes': fields.Integer(
+                    gt=0,
+                    description='The maximum message size, in bytes, that is permitted to be transmitted between the '
+                                'client and the worker processes (defaults to 10MB)',
+                ),
+                'receive_timeout_in_seconds': fields.Integer(
+                    description='How long to block waiting on a response to be received (defaults to 5 seconds)',
+                ),
+                'send_timeout_in_seconds': fields.Any(
+                    fields.Integer(gt=0),
+                    fields.Float(gt=0),
+                    description='How long sending may wait for a worker process to have room for a request (defaults '
+                                'to 5 seconds)',
+                ),
+                'serializer_config': BasicClassSchema(
+                    object_type=BaseSerializer,
+                    description='The configuration for the serializer this transport should use',
+                ),
+            },
+            optional_keys=[
+                'processes',
+                'maximum_in_flight_requests_per_process',
+                'maximum_message_size_in_bytes',
+                'receive_timeout_in_seconds',
+                'send_timeout_in_seconds',
+                'serializer_config',
+            ],
+        ),
+    }
+
+    optional_keys = ()
+
+    description = 'The settings for the local process pool client transport'
+
+
+LocalProcessPoolClientTransport.settings_schema = LocalProcessPoolClientTransportSchema(
+    LocalProcessPoolClientTransport,
+)
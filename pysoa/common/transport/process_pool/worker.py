@@ -0,0 +1,108 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import signal
+
+import attr
+
+from pysoa.common.transport.base import ServerTransport
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.transport.tcp.core import (
+    ConnectionClosed,
+    TCPTransportCore,
+)
+
+
+@attr.s()
+class ProcessPoolTransportCore(TCPTransportCore):
+    """
+    Serializes the messages exchanged between a `LocalProcessPoolClientTransport` and its worker processes, with the
+    TCP transport's framing and message format. As with the `LocalClientTransport`, messages do not expire: a request
+    is only sent once a worker has room for it, and the client's receive timeout bounds how long it waits for the
+    response.
+    """
+
+    METRICS_TRANSPORT_NAME = 'process_pool'
+
+    def deserialize_message(self, serialized_message):
+        with self._get_timer('receive.deserialize'):
+            message = self.serializer.blob_to_dict(serialized_message)
+
+        return message.get('request_id'), message.get('meta') or {}, message.get('body')
+
+
+class WorkerServerTransport(ServerTransport):
+    """
+    The server transport of the server in each worker process, which receives requests from, and sends responses to,
+    the parent process over the worker's end of a socket pair.
+    """
+
+    def __init__(self, service_name, metrics, connection, core, send_timeout_in_seconds):
+        """
+        :param connection: The worker's end of the socket pair
+        :type connection: FramedConnection
+        :param core: The transport core with which to serialize messages
+        :type core: ProcessPoolTransportCore
+        :param send_timeout_in_seconds: How long to wait for the parent to accept a response
+        :type send_timeout_in_seconds: float
+        """
+        super(WorkerServerTransport, self).__init__(service_name, metrics)
+        self.connection = connection
+        self.core = core
+        self.send_timeout_in_seconds = send_timeout_in_seconds
+
+    def receive_request_message(self):
+        """
+        :raise: ConnectionClosed when the parent closes the pool (or exits), which ends the worker
+        """
+        payload = self.connection.read_frame(self.core.receive_timeout_in_seconds)
+        if payload is None:
+            raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+        return self.core.deserialize_message(payload)
+
+    def send_response_message(self, request_id, meta, body):
+        self.connection.send_frames([self.core.serialize_message(request_id, meta, body)], self.send_timeout_in_seconds)
+
+
+def run_worker(server_class, server_settings, connection, core_kwargs, send_timeout_in_seconds):
+    """
+    Run a server in a worker process until the parent process closes its end of the connection. This is called in the
+    forked child, and returns when the worker should exit.
+
+    :param server_class: The server class
+    :type server_class: class
+    :param server_settings: The server settings object
+    :type server_settings: ServerSettings
+    :param connection: The worker's end of the socket pair
+    :type connection: FramedConnection
+    :param core_kwargs: The keyword arguments with which to create the worker's transport core
+    :type core_kwargs: dict
+    :param send_timeout_in_seconds: How long to wait for the parent to accept a response
+    :type send_timeout_in_seconds: float
+    """
+    # An interrupt from the terminal goes to the whole process group, but the workers should exit with the parent, once
+    # it closes the pool, rather than in the middle of a request
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server = server_class(server_settings)
+    server.transport = WorkerServerTransport(
+        server.service_name,
+        server.metrics,
+        connection,
+        ProcessPoolTransportCore(metrics=server.metrics, metrics_prefix='server', **core_kwargs),
+        send_timeout_in_seconds,
+    )
+    server.setup()
+
+    try:
+        while True:
+            try:
+                server.handle_next_request()
+            except ConnectionClosed:
+                return
+            finally:
+                server.metrics.commit()
+    finally:
+        connection.close()
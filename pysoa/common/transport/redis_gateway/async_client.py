@@ -0,0 +1,304 @@
+"""
+The asyncio-native Redis Gateway client transport. This module requires Python 3.5 or newer.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+
+import redis
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.transport.base import get_hex_thread_id
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveError,
+    MessageReceiveTimeout,
+)
+from pysoa.common.transport.redis_gateway.backend.async_standard import AsyncStandardRedisClient
+from pysoa.common.transport.redis_gateway.backend.base import SendMessageToQueueCommand
+from pysoa.common.transport.redis_gateway.backend.streams import SendMessageToStreamCommand
+from pysoa.common.transport.redis_gateway.client import RedisClientTransport
+from pysoa.common.transport.redis_gateway.constants import (
+    REDIS_BACKEND_TYPE_SENTINEL,
+    REDIS_BACKEND_TYPE_STREAMS,
+    REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES,
+)
+from pysoa.common.transport.redis_gateway.settings import RedisTransportSchema
+
+
+class AsyncRedisClientTransport(RedisClientTransport):
+    """
+    A Redis Gateway client transport that, in addition to the blocking methods of `RedisClientTransport`, provides
+    coroutine methods for sending requests and receiving responses without blocking the event loop. The coroutine
+    methods share serialization, message size limits, metrics, and consistent-hash routing with the blocking methods
+    (through `RedisTransportCore`), so they interoperate with any Redis Gateway server.
+
+    All requests sent with `send_request_message_async` share one reply queue per thread. A single background task
+    per transport pops responses from that queue and routes each one, by request ID, to the coroutine awaiting it in
+    `receive_response_message_async`, so one event loop can have hundreds of requests outstanding at once. Only the
+    standard and Redis Streams backend types are supported by the coroutine methods, and a transport must only be used
+    with one event loop. Because they would make blocking Redis calls on the event loop, sending chunked requests
+    (`chunk_size_in_bytes`) and the power-of-two-choices request queue strategy are not supported either; chunked
+    responses are supported.
+    """
+
+    RECEIVE_POLL_TIMEOUT_IN_SECONDS = 1
+
+    def __init__(self, service_name, metrics, **kwargs):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        Redis transport settings schema.
+
+        :param service_name: The name of the service to which this transport will send requests (and from which it will
+                             receive responses)
+        :type service_name: union[str, unicode]
+        :param metrics: The optional metrics recorder
+        :type metrics: MetricsRecorder
+        """
+        super(AsyncRedisClientTransport, self).__init__(service_name, metrics, **kwargs)
+
+        if self.core.backend_type == REDIS_BACKEND_TYPE_SENTINEL:
+            raise ValueError('The asyncio Redis client transport does not support the Sentinel backend type')
+        if self.core.chunk_size_in_bytes:
+            raise ValueError('The asyncio Redis client transport does not support chunk_size_in_bytes')
+        strategy = self.core.backend_layer_kwargs.get('request_queue_strategy')
+        if strategy == REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES:
+            raise ValueError('The asyncio Redis client transport does not support the power-of-two-choices strategy')
+
+        self._async_backend_layer = AsyncStandardRedisClient(
+            hosts=self.core.backend_layer_kwargs.get('hosts'),
+            connection_kwargs=self.core.backend_layer_kwargs.get('connection_kwargs'),
+        )
+        self._response_futures = {}
+        self._response_receiver = None
+        self._response_connection = None
+
+    @property
+    def async_requests_outstanding(self):
+        """
+        Indicates the number of requests sent with `send_request_message_async` whose responses have not yet been
+        received with `receive_response_message_async`.
+        """
+        return len(self._response_futures)
+
+    async def send_request_message_async(self, request_id, meta, body, message_expiry_in_seconds=None):
+        """
+        The coroutine equivalent of `send_request_message`. Once this returns, the response can be awaited with
+        `receive_response_message_async`.
+
+        :param request_id: The request ID
+        :type request_id: int
+        :param meta: Meta information about the message
+        :type meta: dict
+        :param body: The message body
+        :type body: dict
+        :param message_expiry_in_seconds: How soon the message should expire if not retrieved by a server
+        :type message_expiry_in_seconds: int
+
+        :raise: ConnectionError, MessageSendError, MessageSendTimeout, MessageTooLarge
+        """
+        meta['reply_to'] = self._get_async_receive_queue_name()
+        self.core.advertise_compression(meta)
+        send_queue_name = self._get_send_queue_name(meta, body)
+
+        with self.metrics.timer('client.transport.redis_gateway.send', resolution=TimerResolution.MICROSECONDS):
+            queue_key, serialized_message, redis_expiry = self.core.prepare_message(
+                send_queue_name,
+                request_id,
+                meta,
+                body,
+                message_expiry_in_seconds,
+                compress=self._server_accepts_compression,
+            )
+
+            # Register interest in the response before sending, because the response could be popped by the receiver
+            # task before this coroutine resumes after the send
+            self._response_futures[request_id] = asyncio.get_event_loop().create_future()
+            try:
+                await self._send_serialized_message(send_queue_name, queue_key, serialized_message, redis_expiry)
+            except Exception:
+                self._response_futures.pop(request_id, None)
+                raise
+
+        if not self._response_receiver or self._response_receiver.done():
+            self._response_receiver = asyncio.ensure_future(self._receive_responses())
+
+    async def receive_response_message_async(self, request_id, receive_timeout_in_seconds=None):
+        """
+        The coroutine equivalent of `receive_response_message`, except that it waits for the response to one specific
+        request sent with `send_request_message_async`, instead of the first available response.
+
+        :param request_id: The ID of the request whose response to wait for
+        :type request_id: int
+        :param receive_timeout_in_seconds: How long to wait for the response before raising `MessageReceiveTimeout`
+                                           (defaults to the `receive_timeout_in_seconds` setting)
+        :type receive_timeout_in_seconds: int
+
+        :return: A tuple of the request ID, meta dict, and message dict
+        :rtype: tuple
+
+        :raise: ConnectionError, InvalidMessageError, MessageReceiveError, MessageReceiveTimeout
+        """
+        future = self._response_futures.get(request_id)
+        if future is None:
+            raise InvalidMessageError('No outstanding request with ID {}'.format(request_id))
+
+        with self.metrics.timer('client.transport.redis_gateway.receive', resolution=TimerResolution.MICROSECONDS):
+            try:
+                return await asyncio.wait_for(
+                    future,
+                    receive_timeout_in_seconds or self.core.receive_timeout_in_seconds,
+                )
+            except asyncio.TimeoutError:
+                self.metrics.counter('client.transport.redis_gateway.receive.error.timeout').increment()
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.core.service_name))
+            finally:
+                # Whether it arrived or not, stop waiting for this response; if it arrives late, it will be discarded
+                self._response_futures.pop(request_id, None)
+
+    def close_async(self):
+        """
+        Stop receiving responses, fail any outstanding `receive_response_message_async` calls, and close all the
+        connections used by the coroutine methods.
+        """
+        if self._response_receiver:
+            self._response_receiver.cancel()
+            self._response_receiver = None
+        if self._response_connection:
+            self._response_connection.close()
+            self._response_connection = None
+        self._async_backend_layer.close()
+        self._fail_response_futures(
+            MessageReceiveError('Transport closed for service {}'.format(self.core.service_name)),
+        )
+
+    async def _send_serialized_message(self, queue_name, queue_key, serialized_message, redis_expiry):
+        if self.core.backend_type == REDIS_BACKEND_TYPE_STREAMS:
+            command_class = SendMessageToStreamCommand
+        else:
+            command_class = SendMessageToQueueCommand
+
+        # Try at least once, up to queue_full_retries times, then error
+        for i in range(-1, self.core.queue_full_retries):
+            if i >= 0:
+                await asyncio.sleep(self.core.get_queue_full_back_off(i))
+            try:
+                with self.metrics.timer(
+                    'client.transport.redis_gateway.send.send_message_to_redis_queue',
+                    resolution=TimerResolution.MICROSECONDS,
+                ):
+                    await self._async_backend_layer.run_script(
+                        self.core.backend_layer.get_connection_index(queue_key),
+                        command_class,
+                        keys=[queue_key],
+                        args=[redis_expiry, self.core.queue_capacity, serialized_message],
+                    )
+                return
+            except redis.exceptions.ResponseError as e:
+                # The Lua script handles capacity checking and sends the "full" error back
+                if e.args[0] == 'queue full':
+                    continue
+                raise self.core.make_send_error(e)
+            except Exception as e:
+                raise self.core.make_send_error(e)
+
+        raise self.core.make_queue_full_error(queue_name)
+
+    def _get_async_receive_queue_name(self):
+        return '{receive_queue_name}{thread_id}'.format(
+            receive_queue_name=self._receive_queue_name,
+            thread_id=get_hex_thread_id(),
+        )
+
+    async def _receive_responses(self):
+        queue_key = self.core.QUEUE_NAME_PREFIX + self._get_async_receive_queue_name()
+        try:
+            # Keep going until nothing is awaiting a response, polling with a short timeout so that the loop notices
+            while self._response_futures:
+                if not self._response_connection or self._response_connection.closed:
+                    # BLPOP blocks the connection, so it gets its own instead of the shared one
+                    self._response_connection = await self._async_backend_layer.open_connection(
+                        self.core.backend_layer.get_connection_index(queue_key),
+                    )
+
+                with self.metrics.timer(
+                    'client.transport.redis_gateway.receive.pop_from_redis_queue',
+                    resolution=TimerResolution.MICROSECONDS,
+                ):
+                    result = await self._response_connection.execute(
+                        'BLPOP',
+                        queue_key,
+                        self.RECEIVE_POLL_TIMEOUT_IN_SECONDS,
+                    )
+                if not result:
+                    continue
+
+                try:
+                    serialized_message = result[1]
+                    if serialized_message[:1] == self.core.CHUNK_MANIFEST_MARKER:
+                        serialized_message = await self._fetch_chunks(
+                            serialized_message,
+                            self._response_futures.__contains__,
+                        )
+                    response = self.core.deserialize_message(
+                        serialized_message,
+                        accept_request_id=self._response_futures.__contains__,
+                    )
+                except (InvalidMessageError, MessageReceiveTimeout):
+                    # Expired, invalid, or unwanted responses are counted by the core and then discarded
+                    continue
+
+                future = self._response_futures.get(response[0])
+                if future is None:
+                    self.metrics.counter('client.transport.redis_gateway.receive.error.unknown_request_id').increment()
+                elif not future.done():
+                    self._note_server_compression(response[1])
+                    future.set_result(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.metrics.counter('client.transport.redis_gateway.receive.error.unknown').increment()
+            self._fail_response_futures(MessageReceiveError(
+                'Error receiving responses for service {}'.format(self.core.service_name),
+                type(e).__name__,
+                *e.args
+            ))
+
+    async def _fetch_chunks(self, serialized_manifest, accept_request_id):
+        """
+        The coroutine equivalent of `RedisTransportCore._fetch_chunks`, which fetches the chunks of each batch
+        concurrently on the shared connection to the server holding them.
+        """
+        chunk_key, chunk_keys, message = self.core.read_chunk_manifest(serialized_manifest, accept_request_id)
+        index = self.core.backend_layer.get_connection_index(chunk_key)
+        offset = 0
+
+        with self.metrics.timer(
+            'client.transport.redis_gateway.receive.fetch_chunks',
+            resolution=TimerResolution.MICROSECONDS,
+        ):
+            for start in range(0, len(chunk_keys), self.core.CHUNK_FETCH_BATCH_SIZE):
+                chunks = await asyncio.gather(*(
+                    self._async_backend_layer.execute(index, 'GET', key)
+                    for key in chunk_keys[start:start + self.core.CHUNK_FETCH_BATCH_SIZE]
+                ))
+                offset = self.core.copy_chunks(message, offset, chunks)
+            await self._async_backend_layer.execute(index, 'DEL', *chunk_keys)
+
+        if offset != len(message):
+            self.metrics.counter('client.transport.redis_gateway.receive.error.missing_chunk').increment()
+            raise InvalidMessageError('Chunked message incomplete for service {}'.format(self.core.service_name))
+
+        return message
+
+    def _fail_response_futures(self, error):
+        for future in self._response_futures.values():
+            if not future.done():
+                future.set_exception(error)
+        self._response_futures.clear()
+
+
+AsyncRedisClientTransport.settings_schema = RedisTransportSchema(AsyncRedisClientTransport)
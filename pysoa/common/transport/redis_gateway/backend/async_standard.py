@@ -0,0 +1,315 @@
+"""
+An asyncio-native counterpart to the standard Redis backend, for use by the asyncio client transport. This module
+requires Python 3.5 or newer.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+import collections
+import hashlib
+
+import redis
+
+from pysoa.common.transport.redis_gateway.backend.base import CannotGetConnectionError
+
+
+# Replies to commands that fail start with one of these error codes, which map to the same exceptions the redis-py
+# client raises for them; other errors (including those raised by Lua scripts) are plain `ResponseError`s
+_ERROR_CLASSES = {
+    'ERR': redis.exceptions.ResponseError,
+    'LOADING': redis.exceptions.BusyLoadingError,
+    'NOSCRIPT': redis.exceptions.NoScriptError,
+    'READONLY': redis.exceptions.ReadOnlyError,
+}
+
+
+def pack_command(*args):
+    """
+    Encode a command in the Redis protocol, as an array of bulk strings.
+
+    :param args: The command name and its arguments, which may be bytes, strings, or numbers
+
+    :return: The encoded command
+    :rtype: bytes
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif isinstance(arg, float):
+            arg = repr(arg).encode('ascii')
+        elif isinstance(arg, int):
+            arg = str(arg).encode('ascii')
+        parts.append(b'$%d\r\n' % len(arg))
+        parts.append(arg)
+        parts.append(b'\r\n')
+    return b''.join(parts)
+
+
+def parse_error(message):
+    """
+    Convert the message of an error reply into the exception the redis-py client would raise for it.
+
+    :param message: The error message, without the leading `-`
+    :type message: str
+
+    :return: The exception
+    :rtype: redis.exceptions.RedisError
+    """
+    code, _, rest = message.partition(' ')
+    if code in _ERROR_CLASSES:
+        return _ERROR_CLASSES[code](rest)
+    return redis.exceptions.ResponseError(message)
+
+
+class AsyncRedisConnection(object):
+    """
+    A single connection to a Redis server, speaking the Redis protocol over asyncio streams. Commands are written to
+    the socket as soon as they are executed, without waiting for earlier commands to complete (pipelining), and replies
+    are matched up with their commands in order by a reader task. After each write, the command waits for the write
+    buffer to drain, so that a server that falls behind slows its callers down instead of the buffer growing without
+    limit. As a result, any number of coroutines can share one
+    connection and have commands in flight at the same time, except that a blocking command (such as `BLPOP`) delays
+    the replies to all commands executed after it, so blocking commands should get a connection of their own.
+    """
+
+    def __init__(self, reader, writer):
+        """
+        :param reader: The stream reader for the connection
+        :type reader: asyncio.StreamReader
+        :param writer: The stream writer for the connection
+        :type writer: asyncio.StreamWriter
+        """
+        self._reader = reader
+        self._writer = writer
+        self._pending = collections.deque()
+        # Older versions of asyncio only allow one coroutine at a time to wait for a stream writer to drain
+        self._drain_lock = asyncio.Lock()
+        self.closed = False
+        self._reader_task = asyncio.ensure_future(self._read_replies())
+
+    @classmethod
+    async def open(cls, host, port, db=None, password=None, connect_timeout=None):
+        """
+        Open and return a new connection to a Redis server, authenticating and selecting the database if necessary.
+
+        :param host: The Redis host name or IP address
+        :type host: union[str, unicode]
+        :param port: The Redis port
+        :type port: int
+        :param db: The Redis database number
+        :type db: int
+        :param password: The Redis password
+        :type password: union[str, unicode]
+        :param connect_timeout: How long to wait for the connection to be established
+        :type connect_timeout: float
+
+        :return: The open connection
+        :rtype: AsyncRedisConnection
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+        connection = cls(reader, writer)
+        if password:
+            await connection.execute('AUTH', password)
+        if db:
+            await connection.execute('SELECT', db)
+        return connection
+
+    async def execute(self, *args):
+        """
+        Send a command to Redis and return its reply. The command is written as soon as the coroutine starts, before it
+        waits for the write buffer to drain and then for the reply.
+
+        :param args: The command name and its arguments
+
+        :return: The command's reply
+
+        :raise: redis.exceptions.RedisError
+        """
+        if self.closed:
+            raise redis.exceptions.ConnectionError('Connection to Redis is closed')
+
+        future = asyncio.get_event_loop().create_future()
+        self._writer.write(pack_command(*args))
+        self._pending.append(future)
+
+        try:
+            async with self._drain_lock:
+                await self._writer.drain()
+        except OSError as e:
+            raise redis.exceptions.ConnectionError('Error writing to Redis: {!r}'.format(e))
+
+        return await future
+
+    def close(self):
+        """
+        Close the connection, failing any commands still waiting on replies.
+        """
+        self._fail(redis.exceptions.ConnectionError('Connection to Redis is closed'))
+        self._reader_task.cancel()
+
+    async def _read_replies(self):
+        try:
+            while True:
+                reply = await self._read_reply()
+                future = self._pending.popleft()
+                # The future is cancelled if whatever was awaiting it timed out, so the reply is simply discarded
+                if not future.done():
+                    if isinstance(reply, redis.exceptions.RedisError):
+                        future.set_exception(reply)
+                    else:
+                        future.set_result(reply)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(redis.exceptions.ConnectionError('Error reading from Redis: {!r}'.format(e)))
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise redis.exceptions.ConnectionError('Connection closed by Redis server')
+
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b'+':
+            return rest
+        if prefix == b'-':
+            return parse_error(rest.decode('utf-8', 'replace'))
+        if prefix == b':':
+            return int(rest)
+        if prefix == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if prefix == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            replies = []
+            for _ in range(length):
+                replies.append(await self._read_reply())
+            return replies
+        raise redis.exceptions.InvalidResponse('Protocol error, got {!r} as reply type byte'.format(prefix))
+
+    def _fail(self, error):
+        self.closed = True
+        self._writer.close()
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+
+class AsyncStandardRedisClient(object):
+    """
+    The asyncio counterpart to `StandardRedisClient`. It keeps one shared, pipelined connection to each server in the
+    ring for non-blocking commands, and opens dedicated connections on request for blocking commands. It does not make
+    routing decisions; callers use the standard backend's `get_connection_index` for that, so that both backends agree
+    on which server holds which queue.
+    """
+
+    def __init__(self, hosts=None, connection_kwargs=None):
+        """
+        :param hosts: The list of `(host, port)` tuples in the ring, in the same order as the standard backend's
+        :type hosts: list[tuple(union[str, unicode], int)]
+        :param connection_kwargs: The Redis connection keyword arguments (`db`, `password`, and
+                                  `socket_connect_timeout` are supported)
+        :type connection_kwargs: dict
+        """
+        self._hosts = list(hosts or [('localhost', 6379)])
+        connection_kwargs = connection_kwargs or {}
+        self._db = connection_kwargs.get('db')
+        self._password = connection_kwargs.get('password')
+        self._connect_timeout = connection_kwargs.get('socket_connect_timeout')
+        self._connections = {}
+        self._script_hashes = {}
+
+    async def open_connection(self, index):
+        """
+        Open a new, dedicated connection to the server at the given ring index. The caller is responsible for closing
+        it.
+
+        :param index: The server ring index
+        :type index: int
+
+        :return: The open connection
+        :rtype: AsyncRedisConnection
+
+        :raise: CannotGetConnectionError
+        """
+        if not 0 <= index < len(self._hosts):
+            raise ValueError(
+                'There are only {count} hosts, but you asked for connection {index}.'.format(
+                    count=len(self._hosts),
+                    index=index,
+                )
+            )
+
+        host, port = self._hosts[index]
+        try:
+            return await AsyncRedisConnection.open(host, port, self._db, self._password, self._connect_timeout)
+        except (OSError, asyncio.TimeoutError, redis.exceptions.RedisError) as e:
+            raise CannotGetConnectionError('{} ({}:{})'.format(e, host, port))
+
+    async def execute(self, index, *args):
+        """
+        Execute a non-blocking command on the shared connection to the server at the given ring index, opening the
+        connection first if necessary.
+
+        :param index: The server ring index
+        :type index: int
+        :param args: The command name and its arguments
+
+        :return: The command's reply
+
+        :raise: CannotGetConnectionError, redis.exceptions.RedisError
+        """
+        connecting = self._connections.get(index)
+        if connecting is None or (
+            connecting.done() and (connecting.cancelled() or connecting.exception() or connecting.result().closed)
+        ):
+            # Store the connection attempt itself, so that concurrent callers share it instead of each connecting
+            connecting = self._connections[index] = asyncio.ensure_future(self.open_connection(index))
+        connection = await connecting
+        return await connection.execute(*args)
+
+    async def run_script(self, index, command_class, keys, args):
+        """
+        Run one of the backend's Lua scripts on the shared connection to the server at the given ring index, using
+        `EVALSHA` and falling back to `EVAL` when the server does not yet have the script cached.
+
+        :param index: The server ring index
+        :type index: int
+        :param command_class: The `LuaRedisCommand` subclass whose script to run
+        :type command_class: type
+        :param keys: The keys passed to the script
+        :type keys: list
+        :param args: The arguments passed to the script
+        :type args: list
+
+        :return: The script's reply
+
+        :raise: CannotGetConnectionError, redis.exceptions.RedisError
+        """
+        script = command_class._script.strip()
+        if command_class not in self._script_hashes:
+            self._script_hashes[command_class] = hashlib.sha1(script.encode('utf-8')).hexdigest()
+
+        try:
+            return await self.execute(index, 'EVALSHA', self._script_hashes[command_class], len(keys), *(keys + args))
+        except redis.exceptions.NoScriptError:
+            return await self.execute(index, 'EVAL', script, len(keys), *(keys + args))
+
+    def close(self):
+        """
+        Close all the shared connections.
+        """
+        for connecting in self._connections.values():
+            if connecting.done() and not connecting.cancelled() and not connecting.exception():
+                connecting.result().close()
+            else:
+                connecting.cancel()
+        self._connections = {}
@@ -4,12 +4,20 @@ from __future__ import (
 )
 
 import abc
-import binascii
 import itertools
 import random
 
 import six
 
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.transport.redis_gateway.backend.load import PowerOfTwoChoicesBalancer
+from pysoa.common.transport.redis_gateway.backend.ring import CRC32BucketRing
+from pysoa.common.transport.redis_gateway.constants import (
+    REDIS_REQUEST_QUEUE_STRATEGIES,
+    REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES,
+    REDIS_REQUEST_QUEUE_STRATEGY_ROUND_ROBIN,
+)
+
 
 class CannotGetConnectionError(Exception):
     pass
@@ -36,16 +44,61 @@ class SendMessageToQueueCommand(LuaRedisCommand):
     # ARGV[1] = expiry
     # ARGV[2] = queue capacity
     # ARGV[3] = message
+    # Returns the depth of the queue with the message added
     _script = """
 if redis.call('llen', KEYS[1]) >= tonumber(ARGV[2]) then
     return redis.error_reply("queue full")
 end
-redis.call('rpush', KEYS[1], ARGV[3])
+local depth = redis.call('rpush', KEYS[1], ARGV[3])
 redis.call('expire', KEYS[1], ARGV[1])
+return depth
 """
 
     def __call__(self, queue_key, message, expiry, capacity, connection):
-        self._call(keys=[queue_key], args=[expiry, capacity, message], connection=connection)
+        return self._call(keys=[queue_key], args=[expiry, capacity, message], connection=connection)
+
+
+class PopMessagesFromQueueCommand(LuaRedisCommand):
+    # KEYS[1] = queue key
+    # ARGV[1] = maximum number of messages to pop
+    _script = """
+local messages = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #messages > 0 then
+    redis.call('ltrim', KEYS[1], #messages, -1)
+end
+return messages
+"""
+
+    def __call__(self, queue_key, count, connection):
+        return self._call(keys=[queue_key], args=[count], connection=connection)
+
+
+class SendMessageAndPopMessagesCommand(LuaRedisCommand):
+    # KEYS[1] = queue key to which to send
+    # KEYS[2] = queue key from which to pop
+    # ARGV[1] = expiry
+    # ARGV[2] = queue capacity
+    # ARGV[3] = message
+    # ARGV[4] = maximum number of messages to pop
+    _script = """
+if redis.call('llen', KEYS[1]) >= tonumber(ARGV[2]) then
+    return redis.error_reply("queue full")
+end
+redis.call('rpush', KEYS[1], ARGV[3])
+redis.call('expire', KEYS[1], ARGV[1])
+local messages = redis.call('lrange', KEYS[2], 0, tonumber(ARGV[4]) - 1)
+if #messages > 0 then
+    redis.call('ltrim', KEYS[2], #messages, -1)
+end
+return messages
+"""
+
+    def __call__(self, queue_key, message, expiry, capacity, pop_queue_key, count, connection):
+        return self._call(
+            keys=[queue_key, pop_queue_key],
+            args=[expiry, capacity, message, count],
+            connection=connection,
+        )
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -53,11 +106,49 @@ class BaseRedisClient(object):
     DEFAULT_RECEIVE_TIMEOUT = 5
     RESPONSE_QUEUE_SPECIFIER = '!'
 
-    def __init__(self, ring_size):
+    def __init__(
+        self,
+        ring_size,
+        ring_strategy=None,
+        request_queue_strategy=None,
+        queue_depth_sample_interval_in_seconds=1.0,
+    ):
+        """
+        :param ring_size: The number of Redis servers in the ring
+        :type ring_size: int
+        :param ring_strategy: The strategy for deciding which server holds each response queue (defaults to the
+                              original CRC32 bucket strategy)
+        :type ring_strategy: RingStrategy
+        :param request_queue_strategy: One of the `REDIS_REQUEST_QUEUE_STRATEGIES`, for deciding to which server to
+                                       send each request (defaults to round robin)
+        :type request_queue_strategy: union[str, unicode]
+        :param queue_depth_sample_interval_in_seconds: How long the power-of-two-choices strategy trusts the depth of
+                                                       a request queue on a server reported by the last send to it
+        :type queue_depth_sample_interval_in_seconds: float
+        """
         self._ring_size = ring_size
         self._connection_index_generator = itertools.cycle(range(self._ring_size))  # may be overridden by subclasses
+        self._ring = ring_strategy or CRC32BucketRing([six.text_type(i) for i in range(self._ring_size)])
+
+        request_queue_strategy = request_queue_strategy or REDIS_REQUEST_QUEUE_STRATEGY_ROUND_ROBIN
+        if request_queue_strategy not in REDIS_REQUEST_QUEUE_STRATEGIES:
+            raise ValueError('request_queue_strategy must be one of {}, got {}'.format(
+                REDIS_REQUEST_QUEUE_STRATEGIES,
+                request_queue_strategy,
+            ))
+        self._balancer = None
+        if request_queue_strategy == REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES:
+            self._balancer = PowerOfTwoChoicesBalancer(
+                ring_size=self._ring_size,
+                queue_depth_sample_interval_in_seconds=queue_depth_sample_interval_in_seconds,
+            )
+
+        self.metrics_counter_getter = None
+        self.metrics_timer_getter = None
 
         self.send_message_to_queue = None
+        self.pop_messages_from_queue = None
+        self.send_message_and_pop_messages = None
         self._register_scripts()
 
     def get_connection(self, queue_key):
@@ -67,12 +158,60 @@ class BaseRedisClient(object):
         :param queue_key: The queue key for which to get the appropriate connection
         :return: the Redis connection.
         """
+        return self._get_connection(self.get_connection_index(queue_key))
+
+    def get_connection_by_index(self, index):
+        """
+        Get the Redis connection for the server at the given index in the ring.
+
+        :param index: The server's index in the ring, from 0 up to (but not including) `ring_size`
+        :type index: int
+        :return: the Redis connection.
+        """
+        return self._get_connection(index)
+
+    @property
+    def ring_size(self):
+        """
+        The number of Redis servers in the ring.
+        """
+        return self._ring_size
+
+    def get_connection_index(self, queue_key):
+        """
+        Get the index in the ring of the Redis server that should be used for the given queue key.
+
+        :param queue_key: The queue key for which to get the appropriate server index
+        :return: the Redis server ring index.
+        """
         if self.RESPONSE_QUEUE_SPECIFIER in queue_key:
             # It's a response queue, so use a consistent connection
-            return self._get_connection(self._get_consistent_hash_index(queue_key))
+            return self._get_consistent_hash_index(queue_key)
+        elif self._balancer:
+            # It's a request queue, so use the less loaded of two random connections
+            return self._balancer.choose_index(queue_key)
         else:
-            # It's a request queue, so use a random connection
-            return self._get_connection(next(self._connection_index_generator))
+            # It's a request queue, so use the next connection in turn
+            return next(self._connection_index_generator)
+
+    def record_send_outcome(self, index, seconds, error=False, queue_depths=None):
+        """
+        Record how long sending a message to the server at the given index in the ring took and whether it failed, for
+        use in deciding to which server to send future requests. This does nothing unless the power-of-two-choices
+        strategy is in use.
+
+        :param index: The index in the ring of the server to which the message was sent, as returned by
+                      `get_connection_index`
+        :type index: int
+        :param seconds: How long the send took
+        :type seconds: float
+        :param error: Whether the send failed (including because the queue was full)
+        :type error: bool
+        :param queue_depths: The depths of the queues to which the messages were sent, as reported by the send
+        :type queue_depths: dict
+        """
+        if self._balancer:
+            self._balancer.record_outcome(index, seconds, error, queue_depths)
 
     @abc.abstractmethod
     def _get_connection(self, index=None):
@@ -95,16 +234,24 @@ class BaseRedisClient(object):
 
     def _get_consistent_hash_index(self, value):
         """
-        Maps the value to a node value between 0 and 4095 using CRC, then down to one of the ring nodes.
+        Maps the value to one of the ring nodes using the ring strategy.
 
         :param value: The value for which to calculate a hash
         :return: The Redis server ring index from the calculated hash
         """
-        if isinstance(value, six.text_type):
-            value = value.encode('utf8')
-        big_value = binascii.crc32(value) & 0xfff
-        ring_divisor = 4096 / float(self._ring_size)
-        return int(big_value / ring_divisor)
+        return self._ring.get_index(value)
+
+    def request_topology_refresh(self):
+        """
+        Called when a server turns out not to be the master it was thought to be (or cannot be reached), in case the
+        backend caches which servers are masters. Must not block.
+        """
+
+    def _get_counter(self, name):
+        return self.metrics_counter_getter(name) if self.metrics_counter_getter else NoOpMetricsRecorder.no_op_counter
+
+    def _get_timer(self, name):
+        return self.metrics_timer_getter(name) if self.metrics_timer_getter else NoOpMetricsRecorder.no_op_timer
 
     def _register_scripts(self):
         """
@@ -112,3 +259,5 @@ class BaseRedisClient(object):
         """
         connection = self._get_connection()
         self.send_message_to_queue = SendMessageToQueueCommand(connection)
+        self.pop_messages_from_queue = PopMessagesFromQueueCommand(connection)
+        self.send_message_and_pop_messages = SendMessageAndPopMessagesCommand(connection)
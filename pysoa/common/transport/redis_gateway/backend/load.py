@@ -0,0 +1,102 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import random
+import time
+
+
+class PowerOfTwoChoicesBalancer(object):
+    """
+    Chooses the Redis server to which to send each request using the "power of two choices": it picks two servers at
+    random and sends to the less loaded of the two. A server's load is estimated from an exponentially-weighted moving
+    average (EWMA) of how long sends to it take and how often they fail, and from the depth of the request queue on it,
+    which the send script returns, so that choosing a server takes no round trips. A depth older than the sampling
+    interval is ignored, since the queue has probably drained since; the next request sent to that server reports its
+    depth again. Comparing just two random servers, instead of all of them, avoids every client stampeding to the same
+    least-loaded server, while still steering most requests away from a server that is slow, failing, or backed up.
+    """
+
+    # How much weight each new observation gets in the moving averages
+    EWMA_ALPHA = 0.3
+    # The latency assumed for a server before any sends to it have been observed
+    INITIAL_LATENCY_IN_SECONDS = 0.001
+    # How many seconds of latency a failure rate of 100% is worth when comparing servers
+    ERROR_PENALTY_IN_SECONDS = 1.0
+
+    def __init__(self, ring_size, queue_depth_sample_interval_in_seconds=1.0):
+        """
+        :param ring_size: The number of Redis servers in the ring
+        :type ring_size: int
+        :param queue_depth_sample_interval_in_seconds: How long the depth of a request queue on a server, as reported by
+                                                       the last send to it, is used
+        :type queue_depth_sample_interval_in_seconds: float
+        """
+        self._ring_size = ring_size
+        self._queue_depth_sample_interval_in_seconds = queue_depth_sample_interval_in_seconds
+
+        self.latencies = [self.INITIAL_LATENCY_IN_SECONDS] * ring_size
+        self.error_rates = [0.0] * ring_size
+        self._queue_depths = {}
+
+    def choose_index(self, queue_key):
+        """
+        Choose the server to which to send a message to the given request queue.
+
+        :param queue_key: The request queue key
+        :type queue_key: union[str, unicode]
+
+        :return: The chosen server ring index
+        :rtype: int
+        """
+        if self._ring_size < 2:
+            return 0
+
+        first, second = random.sample(range(self._ring_size), 2)
+        first_load = self.get_load(first, queue_key)
+        second_load = self.get_load(second, queue_key)
+        return first if first_load <= second_load else second
+
+    def get_load(self, index, queue_key):
+        """
+        Estimate how long a request sent to the given request queue on the given server would take to be handled,
+        relative to the other servers (lower is better).
+
+        :param index: The server ring index
+        :type index: int
+        :param queue_key: The request queue key
+        :type queue_key: union[str, unicode]
+
+        :return: The estimated load
+        :rtype: float
+        """
+        depth = self._get_queue_depth(index, queue_key)
+        return (self.latencies[index] + self.error_rates[index] * self.ERROR_PENALTY_IN_SECONDS) * (1 + depth)
+
+    def record_outcome(self, index, seconds, error=False, queue_depths=None):
+        """
+        Record how long a send to the given server took and whether it failed (including because the queue was full).
+
+        :param index: The server ring index
+        :type index: int
+        :param seconds: How long the send took
+        :type seconds: float
+        :param error: Whether the send failed
+        :type error: bool
+        :param queue_depths: The depths of the request queues to which the send added messages, by queue key, as
+                             reported by the send
+        :type queue_depths: dict
+        """
+        self.latencies[index] += self.EWMA_ALPHA * (seconds - self.latencies[index])
+        self.error_rates[index] += self.EWMA_ALPHA * ((1.0 if error else 0.0) - self.error_rates[index])
+        if queue_depths:
+            now = time.time()
+            for queue_key, depth in queue_depths.items():
+                self._queue_depths[(index, queue_key)] = depth, now
+
+    def _get_queue_depth(self, index, queue_key):
+        depth, sampled_at = self._queue_depths.get((index, queue_key), (0, None))
+        if sampled_at is None or time.time() - sampled_at >= self._queue_depth_sample_interval_in_seconds:
+            return 0
+        return depth
@@ -0,0 +1,174 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import abc
+import binascii
+import hashlib
+import math
+import struct
+
+import six
+
+from pysoa.common.transport.redis_gateway.constants import (
+    REDIS_RING_STRATEGIES,
+    REDIS_RING_STRATEGY_CRC32,
+    REDIS_RING_STRATEGY_JUMP,
+    REDIS_RING_STRATEGY_RENDEZVOUS,
+)
+
+
+def _to_bytes(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf8')
+    return value
+
+
+def _hash_64(value):
+    """
+    Hashes the value to an unsigned 64-bit integer using the first eight bytes of its MD5 digest, which (unlike the
+    built-in `hash`) is the same in every process.
+    """
+    return struct.unpack('>Q', hashlib.md5(_to_bytes(value)).digest()[:8])[0]
+
+
+@six.add_metaclass(abc.ABCMeta)
+class RingStrategy(object):
+    """
+    Decides which Redis server in the ring holds a given key (for keys that must always be on the same server, such as
+    response queues).
+    """
+
+    def __init__(self, node_names, weights=None):
+        """
+        :param node_names: The names that identify the servers in the ring, in ring index order (the host URLs for the
+                           standard backend and the service names for the Sentinel backend)
+        :type node_names: list[union[str, unicode]]
+        :param weights: The relative weight of each server, in the same order, if they should not all be equal
+        :type weights: list[union[int, float]]
+        """
+        if not node_names:
+            raise ValueError('The ring must have at least one server.')
+        if weights is not None:
+            if len(weights) != len(node_names):
+                raise ValueError(
+                    'There are {count} servers in the ring, but {weights} weights.'.format(
+                        count=len(node_names),
+                        weights=len(weights),
+                    )
+                )
+            if any(weight <= 0 for weight in weights):
+                raise ValueError('Server weights must be greater than 0.')
+
+        self.node_names = list(node_names)
+        self.weights = list(weights) if weights is not None else None
+
+    @abc.abstractmethod
+    def get_index(self, key):
+        """
+        Get the index in the ring of the server that holds the given key.
+
+        :param key: The key
+        :type key: union[str, unicode]
+
+        :return: The server ring index
+        :rtype: int
+        """
+        raise NotImplementedError()
+
+
+class CRC32BucketRing(RingStrategy):
+    """
+    The original strategy: maps the key to one of 4096 buckets using CRC32, and divides the buckets evenly across the
+    ring. It is fast, but changing the number of servers moves most keys, and it does not support weights.
+    """
+
+    def __init__(self, node_names, weights=None):
+        if weights is not None:
+            raise ValueError('The crc32 ring strategy does not support weights.')
+        super(CRC32BucketRing, self).__init__(node_names)
+        self._ring_divisor = 4096 / float(len(self.node_names))
+
+    def get_index(self, key):
+        big_value = binascii.crc32(_to_bytes(key)) & 0xfff
+        return int(big_value / self._ring_divisor)
+
+
+class WeightedRendezvousRing(RingStrategy):
+    """
+    Weighted rendezvous (highest random weight) hashing: every server scores the key, and the server with the highest
+    score holds it. Scores depend only on the key and the server's name and weight, so adding or removing a server
+    (anywhere in the ring) only moves the keys that it gains or loses, about 1/N of them, and each server holds a share
+    of the keys proportional to its weight. Finding a key's server takes time proportional to the number of servers.
+    """
+
+    def __init__(self, node_names, weights=None):
+        super(WeightedRendezvousRing, self).__init__(node_names, weights)
+        self._nodes = [
+            (_to_bytes(name) + b':', float(weight))
+            for name, weight in zip(self.node_names, self.weights or [1] * len(self.node_names))
+        ]
+
+    def get_index(self, key):
+        key = _to_bytes(key)
+        best_index = 0
+        best_score = None
+        for index, (prefix, weight) in enumerate(self._nodes):
+            # Map the hash into the open interval (0, 1) and use the logarithm method of weighting, which gives each
+            # server the key with probability weight / sum(weights)
+            uniform = (_hash_64(prefix + key) + 0.5) / 18446744073709551616.0
+            score = weight / -math.log(uniform)
+            if best_score is None or score > best_score:
+                best_index, best_score = index, score
+        return best_index
+
+
+class JumpHashRing(RingStrategy):
+    """
+    Jump consistent hashing (Lamping and Veach): fast and evenly balanced, using no memory. Adding a server to the end
+    of the ring, or removing the last one, moves only about 1/N of keys, but removing a server from the middle of the
+    ring moves many keys, and weights are not supported.
+    """
+
+    def __init__(self, node_names, weights=None):
+        if weights is not None:
+            raise ValueError('The jump ring strategy does not support weights.')
+        super(JumpHashRing, self).__init__(node_names)
+        self._ring_size = len(self.node_names)
+
+    def get_index(self, key):
+        key = _hash_64(key)
+        bucket, jump = -1, 0
+        while jump < self._ring_size:
+            bucket = jump
+            key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+            jump = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+        return bucket
+
+
+RING_STRATEGY_CLASSES = {
+    REDIS_RING_STRATEGY_CRC32: CRC32BucketRing,
+    REDIS_RING_STRATEGY_JUMP: JumpHashRing,
+    REDIS_RING_STRATEGY_RENDEZVOUS: WeightedRendezvousRing,
+}
+
+
+def make_ring_strategy(strategy, node_names, weights=None):
+    """
+    Create the ring strategy with the given name.
+
+    :param strategy: One of the `REDIS_RING_STRATEGIES`, or `None` for the default (crc32)
+    :type strategy: union[str, unicode]
+    :param node_names: The names that identify the servers in the ring, in ring index order
+    :type node_names: list[union[str, unicode]]
+    :param weights: The relative weight of each server, in the same order, if supported by the strategy
+    :type weights: list[union[int, float]]
+
+    :return: The ring strategy
+    :rtype: RingStrategy
+    """
+    strategy = strategy or REDIS_RING_STRATEGY_CRC32
+    if strategy not in RING_STRATEGY_CLASSES:
+        raise ValueError('ring_strategy must be one of {}, got {}'.format(REDIS_RING_STRATEGIES, strategy))
+    return RING_STRATEGY_CLASSES[strategy](node_names, weights)
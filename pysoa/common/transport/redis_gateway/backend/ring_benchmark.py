@@ -0,0 +1,138 @@
+"""
+Measures how evenly each ring strategy distributes response queues across Redis servers, how many response queues move
+when servers are added or removed, and how long each lookup takes, to help with sizing (and weighting) a Redis fleet.
+It does not connect to Redis. Run it with:
+
+    python -m pysoa.common.transport.redis_gateway.backend.ring_benchmark --servers 6 --weights 1 1 1 1 2 2
+"""
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import argparse
+import collections
+import timeit
+import uuid
+
+from pysoa.common.transport.redis_gateway.backend.ring import make_ring_strategy
+from pysoa.common.transport.redis_gateway.constants import (
+    REDIS_RING_STRATEGIES,
+    REDIS_RING_STRATEGY_RENDEZVOUS,
+)
+
+
+__all__ = (
+    'benchmark_ring_strategy',
+    'main',
+)
+
+
+def _make_keys(count):
+    # Shaped like real response queue keys: one per client transport (and, by default, per thread)
+    return [
+        'pysoa:service.benchmark.{client_id}!{thread_id}'.format(client_id=uuid.uuid4().hex, thread_id=i % 64)
+        for i in range(count)
+    ]
+
+
+def _moved_fraction(keys, before, after, before_names, after_names):
+    # Compare servers by name, not index, since removing a server shifts the indexes of the servers after it
+    moved = sum(
+        1 for key in keys if before_names[before.get_index(key)] != after_names[after.get_index(key)]
+    )
+    return moved / float(len(keys))
+
+
+def benchmark_ring_strategy(strategy, server_count, keys, weights=None):
+    """
+    Measure one ring strategy.
+
+    :param strategy: The ring strategy name
+    :type strategy: union[str, unicode]
+    :param server_count: The number of servers in the ring
+    :type server_count: int
+    :param keys: The response queue keys to distribute
+    :type keys: list[union[str, unicode]]
+    :param weights: The server weights, if any
+    :type weights: list[float]
+
+    :return: A dict with the `shares` of keys each server holds (relative to its fair share, so 1.0 is perfect), the
+             fraction of keys `moved` when a server is `added` to the end of the ring, or the `last` or `first` server
+             is removed, and the `lookup_microseconds` each lookup took on average
+    :rtype: dict
+    """
+    names = ['redis://redis-{}:6379/0'.format(i) for i in range(server_count + 1)]
+    ring = make_ring_strategy(strategy, names[:server_count], weights)
+
+    counts = collections.Counter(ring.get_index(key) for key in keys)
+    total_weight = float(sum(weights)) if weights else float(server_count)
+    shares = [
+        counts[i] / (len(keys) * (weights[i] if weights else 1.0) / total_weight)
+        for i in range(server_count)
+    ]
+
+    moved = {}
+    if not weights:
+        # Movement is only measured with equal weights, since there is no obvious weight to give an added server
+        added = make_ring_strategy(strategy, names)
+        moved['added'] = _moved_fraction(keys, ring, added, names, names)
+        if server_count > 1:
+            without_last = make_ring_strategy(strategy, names[:server_count - 1])
+            moved['last'] = _moved_fraction(keys, ring, without_last, names, names)
+            without_first = make_ring_strategy(strategy, names[1:server_count])
+            moved['first'] = _moved_fraction(keys, ring, without_first, names, names[1:])
+
+    start = timeit.default_timer()
+    for key in keys:
+        ring.get_index(key)
+    lookup_microseconds = (timeit.default_timer() - start) * 1000000 / len(keys)
+
+    return {'shares': shares, 'moved': moved, 'lookup_microseconds': lookup_microseconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Redis Gateway ring strategies.')
+    parser.add_argument('--servers', type=int, default=4, help='The number of Redis servers in the ring')
+    parser.add_argument('--keys', type=int, default=100000, help='The number of response queues to distribute')
+    parser.add_argument(
+        '--weights',
+        type=float,
+        nargs='+',
+        help='The relative weight of each server (only the rendezvous strategy supports weights)',
+    )
+    parser.add_argument('--strategies', nargs='+', choices=REDIS_RING_STRATEGIES, default=list(REDIS_RING_STRATEGIES))
+    args = parser.parse_args(argv)
+
+    if args.weights and len(args.weights) != args.servers:
+        parser.error('There must be one weight for each server.')
+
+    keys = _make_keys(args.keys)
+    print('{} response queues across {} servers{}'.format(
+        args.keys,
+        args.servers,
+        ' weighted {}'.format(args.weights) if args.weights else '',
+    ))
+    print('Share is relative to each server\'s fair share; moved is the fraction of queues moved when a server is '
+          'added, or the last or first server is removed.')
+
+    for strategy in args.strategies:
+        weights = args.weights if strategy == REDIS_RING_STRATEGY_RENDEZVOUS else None
+        if args.weights and not weights:
+            print('\n{}: skipped, weights not supported'.format(strategy))
+            continue
+
+        result = benchmark_ring_strategy(strategy, args.servers, keys, weights)
+        print('\n{}:'.format(strategy))
+        print('  share:  min {:.3f}, max {:.3f}'.format(min(result['shares']), max(result['shares'])))
+        if result['moved']:
+            print('  moved:  {}'.format(', '.join(
+                '{} {:.1%}'.format(change, result['moved'][change])
+                for change in ('added', 'last', 'first') if change in result['moved']
+            )))
+        print('  lookup: {:.2f} microseconds'.format(result['lookup_microseconds']))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,18 +4,20 @@ from __future__ import (
 )
 
 import itertools
+import os
 import random
+import threading
 import time
 
 import redis
 import redis.sentinel
 import six
 
-from pysoa.common.metrics import NoOpMetricsRecorder
 from pysoa.common.transport.redis_gateway.backend.base import (
     BaseRedisClient,
     CannotGetConnectionError,
 )
+from pysoa.common.transport.redis_gateway.backend.ring import make_ring_strategy
 
 
 class SentinelRedisClient(BaseRedisClient):
@@ -33,18 +35,49 @@ class SentinelRedisClient(BaseRedisClient):
 
     "services" is the list of Redis services monitored by the sentinel system that Redis keys will be distributed
      across. If services is empty, this will fetch all services from Sentinel at initialization.
+
+    "ring_strategy" and "ring_weights" select how response queues are distributed across the services (see
+    `make_ring_strategy`). Weights are in the same order as the services, so services must be listed to use them.
+
+    "request_queue_strategy" and "queue_depth_sample_interval_in_seconds" select how requests are distributed across
+    the services (see `BaseRedisClient`).
+
+    By default, each service's master is discovered when a connection to it is first needed (and again whenever a
+    connection must be re-established), and a master that cannot be found is retried in the request path. If
+    "sentinel_refresh_interval_in_seconds" is set, a background thread instead discovers all the masters up front, then
+    again whenever Sentinel publishes a `+switch-master` event, whenever a transport reports that a server it used is no
+    longer a master, and at least every refresh interval. Each discovery builds a new map of services to clients
+    connected directly to their masters and swaps it in atomically, so getting a connection never waits on Sentinel.
     """
 
+    # How long the refresher waits for `+switch-master` events at a time, before checking for refresh requests
+    REFRESHER_POLL_INTERVAL_IN_SECONDS = 1.0
+
     def __init__(
         self,
         hosts=None,
         connection_kwargs=None,
         sentinel_services=None,
         sentinel_failover_retries=0,
+        ring_strategy=None,
+        ring_weights=None,
+        request_queue_strategy=None,
+        queue_depth_sample_interval_in_seconds=1.0,
+        sentinel_refresh_interval_in_seconds=0,
     ):
         # Master client caching
         self._master_clients = {}
 
+        # Background master discovery
+        assert sentinel_refresh_interval_in_seconds >= 0
+        self._refresh_interval_in_seconds = sentinel_refresh_interval_in_seconds
+        self._master_addresses = {}
+        self._refresher_lock = threading.Lock()
+        self._refresher_pid = None
+        self._refresh_requested = threading.Event()
+        self._refresher_stopped = threading.Event()
+        self._switch_master_subscription = None
+
         # Master failover behavior
         assert sentinel_failover_retries >= 0
         self._sentinel_failover_retries = sentinel_failover_retries
@@ -54,16 +87,62 @@ class SentinelRedisClient(BaseRedisClient):
             self._validate_service_names(sentinel_services)
             self._services = sentinel_services
         else:
+            if ring_weights is not None:
+                raise ValueError('Sentinel services must be specified in order to specify ring weights.')
             self._services = self._get_service_names()
         self._ring_size = len(self._services)
         self._connection_index_generator = itertools.cycle(range(self._ring_size))
 
-        self.metrics_counter_getter = None
-
-        super(SentinelRedisClient, self).__init__(ring_size=len(self._services))
+        super(SentinelRedisClient, self).__init__(
+            ring_size=len(self._services),
+            ring_strategy=make_ring_strategy(ring_strategy, self._services, ring_weights),
+            request_queue_strategy=request_queue_strategy,
+            queue_depth_sample_interval_in_seconds=queue_depth_sample_interval_in_seconds,
+        )
 
     def reset_clients(self):
         self._master_clients = {}
+        self._master_addresses = {}
+        self.request_topology_refresh()
+
+    def request_topology_refresh(self):
+        if self._refresh_interval_in_seconds:
+            self._refresh_requested.set()
+
+    def refresh_masters(self):
+        """
+        Discover the current master of every service and atomically replace the cached master clients, keeping the
+        existing client for each master that has not changed (and for each master that could not be found right now).
+        """
+        addresses = dict(self._master_addresses)
+        with self._get_timer('backend.sentinel.discover_masters'):
+            for service_name in self._services:
+                try:
+                    addresses[service_name] = self._sentinel.discover_master(service_name)
+                except redis.sentinel.MasterNotFoundError:
+                    self._get_counter('backend.sentinel.discover_master_failed').increment()
+
+        master_clients = dict(self._master_clients)
+        for service_name, address in six.iteritems(addresses):
+            if address != self._master_addresses.get(service_name) or service_name not in master_clients:
+                if service_name in self._master_addresses:
+                    self._get_counter('backend.sentinel.master_changed').increment()
+                master_clients[service_name] = redis.StrictRedis(
+                    host=address[0],
+                    port=address[1],
+                    **self._sentinel.connection_kwargs
+                )
+
+        # Replace, rather than update, the maps, so that connection lookups never see them half-updated
+        self._master_addresses = addresses
+        self._master_clients = master_clients
+
+    def stop_refresher(self):
+        """
+        Stop the background master discovery thread, if it is running.
+        """
+        self._refresher_stopped.set()
+        self._refresh_requested.set()
 
     @staticmethod
     def _setup_hosts(hosts):
@@ -113,6 +192,68 @@ class SentinelRedisClient(BaseRedisClient):
             )
         return list(master_info.keys())
 
+    def _start_refresher_if_needed(self):
+        # Started lazily, and again in each forked child process, since threads do not survive forking
+        if self._refresher_pid == os.getpid():
+            return
+        with self._refresher_lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._switch_master_subscription = None
+            self._refresher_stopped.clear()
+            self._refresh_requested.clear()
+            self.refresh_masters()
+            refresher = threading.Thread(target=self._run_refresher, name='pysoa-sentinel-refresher')
+            refresher.daemon = True
+            refresher.start()
+            self._refresher_pid = os.getpid()
+
+    def _run_refresher(self):
+        while not self._refresher_stopped.is_set():
+            deadline = time.time() + self._refresh_interval_in_seconds
+            while not self._refresher_stopped.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                if self._refresh_requested.is_set():
+                    self._get_counter('backend.sentinel.refresh_requested').increment()
+                    break
+                if self._wait_for_switch_master(min(remaining, self.REFRESHER_POLL_INTERVAL_IN_SECONDS)):
+                    self._get_counter('backend.sentinel.switch_master_event').increment()
+                    break
+
+            if self._refresher_stopped.is_set():
+                break
+
+            self._refresh_requested.clear()
+            try:
+                self.refresh_masters()
+            except Exception:
+                # Probably no Sentinel could be reached; keep the current masters and try again later
+                self._get_counter('backend.sentinel.discover_masters_error').increment()
+
+    def _wait_for_switch_master(self, timeout):
+        if self._switch_master_subscription is None:
+            for sentinel in self._sentinel.sentinels:
+                try:
+                    subscription = sentinel.pubsub()
+                    subscription.subscribe('+switch-master')
+                    self._switch_master_subscription = subscription
+                    break
+                except (redis.ConnectionError, redis.TimeoutError):
+                    continue
+            else:
+                # No Sentinel accepted the subscription, so just poll
+                self._refresh_requested.wait(timeout)
+                return False
+
+        try:
+            message = self._switch_master_subscription.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self._switch_master_subscription = None
+            return False
+        return bool(message and message.get('type') == 'message')
+
     def _get_master_client_for(self, service_name):
         if service_name not in self._master_clients:
             self._get_counter('backend.sentinel.populate_master_client').increment()
@@ -132,6 +273,16 @@ class SentinelRedisClient(BaseRedisClient):
                 )
             )
 
+        if self._refresh_interval_in_seconds:
+            self._start_refresher_if_needed()
+            master_client = self._master_clients.get(self._services[index])
+            if master_client is None:
+                # Don't wait for the master to be discovered, because that would stall every caller
+                self._get_counter('backend.sentinel.master_not_cached').increment()
+                self.request_topology_refresh()
+                raise CannotGetConnectionError('Master for {} not yet discovered.'.format(self._services[index]))
+            return master_client
+
         for i in range(self._sentinel_failover_retries + 1):
             try:
                 return self._get_master_client_for(self._services[index])
@@ -144,6 +295,3 @@ class SentinelRedisClient(BaseRedisClient):
 
     def _get_random_index(self):
         return random.randint(0, len(self._services) - 1)
-
-    def _get_counter(self, name):
-        return self.metrics_counter_getter(name) if self.metrics_counter_getter else NoOpMetricsRecorder.no_op_counter
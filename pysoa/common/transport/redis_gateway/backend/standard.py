@@ -7,14 +7,28 @@ import redis
 import six
 
 from pysoa.common.transport.redis_gateway.backend.base import BaseRedisClient
+from pysoa.common.transport.redis_gateway.backend.ring import make_ring_strategy
 
 
 class StandardRedisClient(BaseRedisClient):
-    def __init__(self, hosts=None, connection_kwargs=None):
+    def __init__(
+        self,
+        hosts=None,
+        connection_kwargs=None,
+        ring_strategy=None,
+        ring_weights=None,
+        request_queue_strategy=None,
+        queue_depth_sample_interval_in_seconds=1.0,
+    ):
         self._hosts = self._setup_hosts(hosts)
         self._connection_list = [redis.Redis.from_url(host, **(connection_kwargs or {})) for host in self._hosts]
 
-        super(StandardRedisClient, self).__init__(ring_size=len(self._hosts))
+        super(StandardRedisClient, self).__init__(
+            ring_size=len(self._hosts),
+            ring_strategy=make_ring_strategy(ring_strategy, self._hosts, ring_weights),
+            request_queue_strategy=request_queue_strategy,
+            queue_depth_sample_interval_in_seconds=queue_depth_sample_interval_in_seconds,
+        )
 
     @staticmethod
     def _setup_hosts(hosts):
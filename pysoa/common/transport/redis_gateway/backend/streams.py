@@ -0,0 +1,254 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import socket
+import time
+import uuid
+
+import redis
+
+from pysoa.common.transport.redis_gateway.backend.base import (
+    LuaRedisCommand,
+    SendMessageToQueueCommand,
+)
+from pysoa.common.transport.redis_gateway.backend.standard import StandardRedisClient
+
+
+class SendMessageToStreamCommand(LuaRedisCommand):
+    # KEYS[1] = stream key
+    # ARGV[1] = expiry
+    # ARGV[2] = approximate maximum stream length
+    # ARGV[3] = message
+    _script = """
+redis.call('xadd', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'message', ARGV[3])
+redis.call('expire', KEYS[1], ARGV[1])
+"""
+
+    def __call__(self, queue_key, message, expiry, capacity, connection):
+        self._call(keys=[queue_key], args=[expiry, capacity, message], connection=connection)
+
+
+class ReclaimPendingMessagesCommand(LuaRedisCommand):
+    # KEYS[1] = stream key
+    # ARGV[1] = consumer group
+    # ARGV[2] = consumer claiming the messages
+    # ARGV[3] = minimum idle time in milliseconds
+    # ARGV[4] = maximum number of messages to claim
+    _script = """
+local pending = redis.call('xpending', KEYS[1], ARGV[1], '-', '+', ARGV[4])
+local ids = {}
+for _, entry in ipairs(pending) do
+    if entry[2] ~= ARGV[2] and tonumber(entry[3]) >= tonumber(ARGV[3]) then
+        table.insert(ids, entry[1])
+    end
+end
+if #ids == 0 then
+    return {}
+end
+return redis.call('xclaim', KEYS[1], ARGV[1], ARGV[2], ARGV[3], unpack(ids))
+"""
+
+    def __call__(self, queue_key, group, consumer, minimum_idle_milliseconds, count, connection):
+        return self._call(
+            keys=[queue_key],
+            args=[group, consumer, minimum_idle_milliseconds, count],
+            connection=connection,
+        )
+
+
+class SendMessageToStreamOrQueueCommand(object):
+    """
+    Sends messages to request queues as stream entries, and to response queues (which only ever have one reader, so
+    gain nothing from consumer groups) as list entries, just like the other backends.
+    """
+
+    def __init__(self, redis_connection):
+        self._send_to_stream = SendMessageToStreamCommand(redis_connection)
+        self._send_to_queue = SendMessageToQueueCommand(redis_connection)
+
+    def __call__(self, queue_key, message, expiry, capacity, connection):
+        if StreamsRedisClient.RESPONSE_QUEUE_SPECIFIER in queue_key:
+            self._send_to_queue(queue_key, message, expiry, capacity, connection)
+        else:
+            self._send_to_stream(queue_key, message, expiry, capacity, connection)
+
+
+class StreamsRedisClient(StandardRedisClient):
+    """
+    Variant of the standard Redis client that stores request queues in Redis Streams (Redis 5.0 or newer) instead of
+    lists. All servers for a service read requests as members of one consumer group, so a request remains pending, and
+    is not lost, until the server that read it acknowledges it. A request read by a server that dies before
+    acknowledging it is reclaimed by another server once it has been pending for `stream_visibility_timeout_in_seconds`.
+    Instead of rejecting new requests when a queue reaches its capacity, the stream is trimmed (approximately) to its
+    capacity, discarding the oldest requests.
+
+    Response queues are still lists, so clients work the same with this backend as with the standard backend.
+    """
+
+    CONSUMER_GROUP = 'pysoa'
+    DEFAULT_VISIBILITY_TIMEOUT_IN_SECONDS = 60
+
+    def __init__(self, stream_visibility_timeout_in_seconds=DEFAULT_VISIBILITY_TIMEOUT_IN_SECONDS, **kwargs):
+        """
+        In addition to the arguments accepted by `StandardRedisClient`:
+
+        :param stream_visibility_timeout_in_seconds: How long a request read by one server must remain unacknowledged
+                                                     before another server may reclaim it
+        :type stream_visibility_timeout_in_seconds: int
+        """
+        if stream_visibility_timeout_in_seconds <= 0:
+            raise ValueError('stream_visibility_timeout_in_seconds must be greater than 0')
+        self._visibility_timeout_in_milliseconds = int(stream_visibility_timeout_in_seconds * 1000)
+        self._reclaim_due = {}
+        self._consumer_name = None
+        self._consumer_pid = None
+
+        self.reclaim_pending_messages = None
+
+        super(StreamsRedisClient, self).__init__(**kwargs)
+
+    @property
+    def consumer_name(self):
+        """
+        The name of this process in the consumer groups, which is unique even after forking.
+        """
+        if self._consumer_pid != os.getpid():
+            self._consumer_pid = os.getpid()
+            self._consumer_name = '{host}.{pid}.{unique}'.format(
+                host=socket.gethostname(),
+                pid=self._consumer_pid,
+                unique=uuid.uuid4().hex[:8],
+            )
+            self._reclaim_due = {}
+        return self._consumer_name
+
+    def read_messages_from_stream(self, queue_key, count, timeout_in_seconds, acknowledge_ids, connection):
+        """
+        Read up to `count` messages from the stream, blocking for up to `timeout_in_seconds` if none are available. Any
+        messages that have been pending (unacknowledged by another server) longer than the visibility timeout are
+        reclaimed and returned first. The given messages are acknowledged in the same round trip.
+
+        :param queue_key: The stream key
+        :type queue_key: union[str, unicode]
+        :param count: The maximum number of messages to read
+        :type count: int
+        :param timeout_in_seconds: How long to block waiting for messages
+        :type timeout_in_seconds: int
+        :param acknowledge_ids: The IDs of previously-read messages that have been handled
+        :type acknowledge_ids: list[union[str, unicode, bytes]]
+        :param connection: The Redis connection
+
+        :return: A list of `(message ID, message)` tuples, which is empty if no messages were available
+        :rtype: list[tuple]
+        """
+        consumer = self.consumer_name
+
+        now = time.time()
+        if now >= self._reclaim_due.get(queue_key, 0):
+            # Check for abandoned messages every half visibility timeout, at most
+            self._reclaim_due[queue_key] = now + self._visibility_timeout_in_milliseconds / 2000.0
+            pipeline = connection.pipeline(transaction=False)
+            if acknowledge_ids:
+                pipeline.execute_command('XACK', queue_key, self.CONSUMER_GROUP, *acknowledge_ids)
+                acknowledge_ids = None
+            self.reclaim_pending_messages(
+                queue_key=queue_key,
+                group=self.CONSUMER_GROUP,
+                consumer=consumer,
+                minimum_idle_milliseconds=self._visibility_timeout_in_milliseconds,
+                count=count,
+                connection=pipeline,
+            )
+            reclaimed = self._parse_entries(queue_key, self._execute(pipeline)[-1], connection)
+            if reclaimed:
+                self._get_counter('backend.streams.reclaimed').increment(len(reclaimed))
+                return reclaimed
+
+        for attempt in range(2):
+            pipeline = connection.pipeline(transaction=False)
+            if acknowledge_ids:
+                pipeline.execute_command('XACK', queue_key, self.CONSUMER_GROUP, *acknowledge_ids)
+            pipeline.execute_command(
+                'XREADGROUP', 'GROUP', self.CONSUMER_GROUP, consumer,
+                'COUNT', count,
+                'BLOCK', max(int(timeout_in_seconds * 1000), 1),
+                'STREAMS', queue_key, '>',
+            )
+            result = pipeline.execute(raise_on_error=False)[-1]
+            if isinstance(result, redis.exceptions.ResponseError) and self._is_missing_group(result) and not attempt:
+                # The stream or its consumer group does not exist yet (or expired), so create it and try again
+                self._create_group(queue_key, connection)
+                acknowledge_ids = None
+                continue
+            if isinstance(result, Exception):
+                raise result
+            if not result:
+                return []
+            return self._parse_entries(queue_key, result[0][1], connection)
+        return []
+
+    def acknowledge_messages(self, queue_key, acknowledge_ids, connection):
+        """
+        Acknowledge that the given messages have been handled, so that they are no longer pending.
+
+        :param queue_key: The stream key
+        :type queue_key: union[str, unicode]
+        :param acknowledge_ids: The IDs of the messages
+        :type acknowledge_ids: list[union[str, unicode, bytes]]
+        :param connection: The Redis connection
+        """
+        if acknowledge_ids:
+            try:
+                connection.execute_command('XACK', queue_key, self.CONSUMER_GROUP, *acknowledge_ids)
+            except redis.exceptions.ResponseError as e:
+                # If the stream expired along with its consumer group, there is nothing to acknowledge
+                if not self._is_missing_group(e):
+                    raise
+
+    def _execute(self, pipeline):
+        results = pipeline.execute(raise_on_error=False)
+        for result in results:
+            if isinstance(result, redis.exceptions.ResponseError) and self._is_missing_group(result):
+                continue
+            if isinstance(result, Exception):
+                raise result
+        return [None if isinstance(result, Exception) else result for result in results]
+
+    def _parse_entries(self, queue_key, entries, connection):
+        messages = []
+        missing_ids = []
+        for entry in entries or []:
+            if not entry or not entry[1]:
+                # The message was trimmed from the stream while it was pending, so it can only be acknowledged
+                if entry:
+                    missing_ids.append(entry[0])
+                continue
+            fields = dict(zip(entry[1][::2], entry[1][1::2]))
+            messages.append((entry[0], fields.get(b'message', fields.get('message'))))
+        if missing_ids:
+            self._get_counter('backend.streams.trimmed_while_pending').increment(len(missing_ids))
+            self.acknowledge_messages(queue_key, missing_ids, connection)
+        return messages
+
+    def _create_group(self, queue_key, connection):
+        try:
+            # Start from the beginning of the stream, so that messages sent before the group existed are not skipped
+            connection.execute_command('XGROUP', 'CREATE', queue_key, self.CONSUMER_GROUP, '0', 'MKSTREAM')
+            self._get_counter('backend.streams.create_group').increment()
+        except redis.exceptions.ResponseError as e:
+            # Another server created it first
+            if 'BUSYGROUP' not in e.args[0]:
+                raise
+
+    @staticmethod
+    def _is_missing_group(error):
+        return error.args and 'NOGROUP' in error.args[0]
+
+    def _register_scripts(self):
+        super(StreamsRedisClient, self)._register_scripts()
+        connection = self._get_connection()
+        self.send_message_to_queue = SendMessageToStreamOrQueueCommand(connection)
+        self.reclaim_pending_messages = ReclaimPendingMessagesCommand(connection)
@@ -3,16 +3,27 @@ from __future__ import (
     unicode_literals,
 )
 
+import threading
+import time
 import uuid
 
+import six
+
 from pysoa.common.metrics import TimerResolution
 from pysoa.common.transport.base import (
     ClientTransport,
     get_hex_thread_id,
 )
-from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveError,
+    MessageReceiveTimeout,
+)
 from pysoa.common.transport.redis_gateway.backend.base import BaseRedisClient
-from pysoa.common.transport.redis_gateway.constants import DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT
+from pysoa.common.transport.redis_gateway.constants import (
+    DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT,
+    REDIS_BACKEND_TYPE_STREAMS,
+)
 from pysoa.common.transport.redis_gateway.core import RedisTransportCore
 from pysoa.common.transport.redis_gateway.settings import RedisTransportSchema
 from pysoa.common.transport.redis_gateway.utils import make_redis_queue_name
@@ -20,6 +31,9 @@ from pysoa.common.transport.redis_gateway.utils import make_redis_queue_name
 
 class RedisClientTransport(ClientTransport):
 
+    DISPATCHER_RECEIVE_TIMEOUT_IN_SECONDS = 1
+    DISPATCHER_ERROR_BACK_OFF_IN_SECONDS = 0.5
+
     def __init__(self, service_name, metrics, **kwargs):
         """
         In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
@@ -36,6 +50,18 @@ class RedisClientTransport(ClientTransport):
         if 'maximum_message_size_in_bytes' not in kwargs:
             kwargs['maximum_message_size_in_bytes'] = DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT
 
+        # These are server-only settings
+        kwargs.pop('pop_next_request_with_response', None)
+        kwargs.pop('priority_lane_starvation_guard', None)
+        kwargs.pop('receive_queues', None)
+
+        self._priority_lanes = kwargs.pop('priority_lanes', 1)
+        if self._priority_lanes > 1 and kwargs.get('backend_type') == REDIS_BACKEND_TYPE_STREAMS:
+            raise ValueError('priority_lanes cannot be used with the Redis Streams backend type')
+        self._action_queues = kwargs.pop('action_queues', {})
+        if self._action_queues and kwargs.get('backend_type') == REDIS_BACKEND_TYPE_STREAMS:
+            raise ValueError('action_queues cannot be used with the Redis Streams backend type')
+
         self.client_id = uuid.uuid4().hex
         self._send_queue_name = make_redis_queue_name(service_name)
         self._receive_queue_name = '{send_queue_name}.{client_id}{response_queue_specifier}'.format(
@@ -44,6 +70,18 @@ class RedisClientTransport(ClientTransport):
             response_queue_specifier=BaseRedisClient.RESPONSE_QUEUE_SPECIFIER,
         )
         self._requests_outstanding = 0
+        # Requests are only compressed once a response from the server has advertised that it accepts compression
+        self._server_accepts_compression = False
+
+        self._multiplex_response_queue = kwargs.pop('multiplex_response_queue', False)
+        if self._multiplex_response_queue:
+            # Responses for all threads share one reply queue, popped by one dispatcher thread, which hands each
+            # response to the response queue of the thread that sent the request.
+            self._thread_state = threading.local()
+            self._response_routes = {}
+            self._response_routes_condition = threading.Condition()
+            self._response_dispatcher = None
+
         self.core = RedisTransportCore(service_name=service_name, metrics=metrics, metrics_prefix='client', **kwargs)
 
     @property
@@ -52,20 +90,90 @@ class RedisClientTransport(ClientTransport):
         Indicates the number of requests currently outstanding, which still need to be received. If this value is less
         than 1, calling `receive_response_message` will result in a return value of `(None, None, None)` instead of
         raising a `MessageReceiveTimeout`.
+
+        When `multiplex_response_queue` is enabled, this counts only the requests sent by the calling thread, and a
+        receive timeout abandons all of them.
         """
+        if self._multiplex_response_queue:
+            return len(self._get_thread_state().request_ids)
         return self._requests_outstanding
 
     def send_request_message(self, request_id, meta, body, message_expiry_in_seconds=None):
-        self._requests_outstanding += 1
-        meta['reply_to'] = '{receive_queue_name}{thread_id}'.format(
-            receive_queue_name=self._receive_queue_name,
-            thread_id=get_hex_thread_id(),
-        )
+        meta['reply_to'] = self._get_reply_to()
+        self.core.advertise_compression(meta)
+        send_queue_name = self._get_send_queue_name(meta, body)
+
+        if not self._multiplex_response_queue:
+            self._requests_outstanding += 1
+            with self.metrics.timer('client.transport.redis_gateway.send', resolution=TimerResolution.MICROSECONDS):
+                self.core.send_message(
+                    send_queue_name,
+                    request_id,
+                    meta,
+                    body,
+                    message_expiry_in_seconds,
+                    compress=self._server_accepts_compression,
+                )
+            return
 
+        # Route the response before sending, because the dispatcher could pop it before the send returns
+        self._add_response_routes([request_id])
         with self.metrics.timer('client.transport.redis_gateway.send', resolution=TimerResolution.MICROSECONDS):
-            self.core.send_message(self._send_queue_name, request_id, meta, body, message_expiry_in_seconds)
+            try:
+                self.core.send_message(
+                    send_queue_name,
+                    request_id,
+                    meta,
+                    body,
+                    message_expiry_in_seconds,
+                    compress=self._server_accepts_compression,
+                )
+            except Exception:
+                self._remove_response_routes([request_id])
+                raise
+        self._get_thread_state().request_ids.add(request_id)
+
+    def send_request_messages(self, messages):
+        """
+        Sends all the messages using Redis pipelines, in as few round trips as possible. See
+        `ClientTransport.send_request_messages`.
+        """
+        reply_to = self._get_reply_to()
+
+        core_messages = []
+        for request_id, meta, body, message_expiry_in_seconds in messages:
+            meta['reply_to'] = reply_to
+            self.core.advertise_compression(meta)
+            core_messages.append((
+                self._get_send_queue_name(meta, body),
+                request_id,
+                meta,
+                body,
+                message_expiry_in_seconds,
+            ))
+
+        if self._multiplex_response_queue:
+            self._add_response_routes([message[0] for message in messages])
+
+        with self.metrics.timer('client.transport.redis_gateway.send_bulk', resolution=TimerResolution.MICROSECONDS):
+            try:
+                errors = self.core.send_messages(core_messages, compress=self._server_accepts_compression)
+            except Exception:
+                if self._multiplex_response_queue:
+                    self._remove_response_routes([message[0] for message in messages])
+                raise
+
+        if self._multiplex_response_queue:
+            self._remove_response_routes([message[0] for message, e in zip(messages, errors) if e is not None])
+            self._get_thread_state().request_ids.update(message[0] for message, e in zip(messages, errors) if e is None)
+        else:
+            self._requests_outstanding += len([e for e in errors if e is None])
+        return errors
 
     def receive_response_message(self, receive_timeout_in_seconds=None):
+        if self._multiplex_response_queue:
+            return self._receive_dispatched_response_message(receive_timeout_in_seconds)
+
         if self._requests_outstanding > 0:
             with self.metrics.timer('client.transport.redis_gateway.receive', resolution=TimerResolution.MICROSECONDS):
                 try:
@@ -80,10 +188,141 @@ class RedisClientTransport(ClientTransport):
                     self.metrics.counter('client.transport.redis_gateway.receive.error.timeout').increment()
                     raise
             self._requests_outstanding -= 1
+            self._note_server_compression(meta)
             return request_id, meta, response
         else:
             # This tells Client.get_all_responses to stop waiting for more.
             return None, None, None
 
+    def _note_server_compression(self, response_meta):
+        self._server_accepts_compression = bool(self.core.accepts_compression(response_meta))
+
+    def _get_send_queue_name(self, meta, body):
+        if (self._priority_lanes < 2 and not self._action_queues) or not isinstance(body, dict):
+            return self._send_queue_name
+
+        # A job goes to the action queue of the first of its actions that has one, if any
+        action_queue = None
+        if self._action_queues:
+            for action_request in body.get('actions') or []:
+                if isinstance(action_request, dict) and action_request.get('action') in self._action_queues:
+                    action_queue = self._action_queues[action_request['action']]
+                    break
+
+        lane = 0
+        if self._priority_lanes > 1:
+            # Requests without a valid priority go to the highest-priority lane, as they do to servers without lanes,
+            # and requests with a priority beyond the lowest-priority lane go to that lane
+            priority = (body.get('control') or {}).get('priority')
+            if isinstance(priority, six.integer_types) and not isinstance(priority, bool) and priority > 0:
+                lane = min(priority, self._priority_lanes - 1)
+
+            # The server measures how long requests wait in each lane from this
+            meta['__sent__'] = time.time()
+
+        return make_redis_queue_name(self.service_name, lane, action_queue)
+
+    def _get_reply_to(self):
+        if self._multiplex_response_queue:
+            return self._receive_queue_name
+        return '{receive_queue_name}{thread_id}'.format(
+            receive_queue_name=self._receive_queue_name,
+            thread_id=get_hex_thread_id(),
+        )
+
+    def _get_thread_state(self):
+        state = self._thread_state
+        if not hasattr(state, 'responses'):
+            state.responses = six.moves.queue.Queue()
+            state.request_ids = set()
+        return state
+
+    def _add_response_routes(self, request_ids):
+        responses = self._get_thread_state().responses
+        with self._response_routes_condition:
+            for request_id in request_ids:
+                self._response_routes[request_id] = responses
+
+            # The dispatcher is started lazily, and started again if it is gone (for example, after a fork)
+            if not self._response_dispatcher or not self._response_dispatcher.is_alive():
+                self._response_dispatcher = threading.Thread(
+                    target=self._dispatch_responses,
+                    name='pysoa-redis-response-dispatcher-{}'.format(self.client_id),
+                )
+                self._response_dispatcher.daemon = True
+                self._response_dispatcher.start()
+
+            self._response_routes_condition.notify()
+
+    def _remove_response_routes(self, request_ids):
+        with self._response_routes_condition:
+            for request_id in request_ids:
+                self._response_routes.pop(request_id, None)
+
+    def _receive_dispatched_response_message(self, receive_timeout_in_seconds=None):
+        state = self._get_thread_state()
+        if not state.request_ids:
+            # This tells Client.get_all_responses to stop waiting for more.
+            return None, None, None
+
+        timeout = receive_timeout_in_seconds or self.core.receive_timeout_in_seconds
+        deadline = time.time() + timeout
+        with self.metrics.timer('client.transport.redis_gateway.receive', resolution=TimerResolution.MICROSECONDS):
+            while True:
+                try:
+                    response = state.responses.get(timeout=max(deadline - time.time(), 0))
+                except six.moves.queue.Empty:
+                    # The thread abandons all of its outstanding requests, so that their routes do not keep the
+                    # dispatcher polling forever, and responses that arrive for them later are discarded.
+                    self._remove_response_routes(state.request_ids)
+                    state.request_ids.clear()
+                    self.metrics.counter('client.transport.redis_gateway.receive.error.timeout').increment()
+                    raise MessageReceiveTimeout('No message received for service {}'.format(self.core.service_name))
+
+                if response[0] in state.request_ids:
+                    break
+
+                # The dispatcher routed this response just before an earlier receive timed out and abandoned it
+                self.core.get_counter('receive.error.unknown_request_id').increment()
+
+        state.request_ids.remove(response[0])
+        return response
+
+    def _dispatch_responses(self):
+        """
+        The body of the dispatcher thread. It pops responses from the transport's one reply queue for as long as any
+        thread awaits a response, and waits without using Redis when none does. Responses to requests that no thread
+        awaits (because they were sent by a different process using the same transport settings, for example) are
+        counted and discarded.
+        """
+        while True:
+            with self._response_routes_condition:
+                while not self._response_routes:
+                    self._response_routes_condition.wait()
+
+            try:
+                request_id, meta, body = self.core.receive_message(
+                    self._receive_queue_name,
+                    self.DISPATCHER_RECEIVE_TIMEOUT_IN_SECONDS,
+                    accept_request_id=self._response_routes.__contains__,
+                )
+            except (InvalidMessageError, MessageReceiveTimeout):
+                # Nothing arrived yet, or the core counted and discarded an expired, invalid, or unwanted response
+                continue
+            except MessageReceiveError:
+                # The error was counted by the core; waiting threads keep waiting until Redis recovers or they time out
+                time.sleep(self.DISPATCHER_ERROR_BACK_OFF_IN_SECONDS)
+                continue
+
+            with self._response_routes_condition:
+                responses = self._response_routes.pop(request_id, None)
+
+            if responses is None:
+                # The route was removed (by a thread whose receive timed out) after the core accepted the response
+                self.core.get_counter('receive.error.unknown_request_id').increment()
+            else:
+                self._note_server_compression(meta)
+                responses.put((request_id, meta, body))
+
 
 RedisClientTransport.settings_schema = RedisTransportSchema(RedisClientTransport)
@@ -4,11 +4,37 @@ from __future__ import unicode_literals
 # Common Redis constants for discovery and transport classes
 REDIS_BACKEND_TYPE_STANDARD = 'redis.standard'
 REDIS_BACKEND_TYPE_SENTINEL = 'redis.sentinel'
+REDIS_BACKEND_TYPE_STREAMS = 'redis.streams'
 
 REDIS_BACKEND_TYPES = (
     REDIS_BACKEND_TYPE_STANDARD,
     REDIS_BACKEND_TYPE_SENTINEL,
+    REDIS_BACKEND_TYPE_STREAMS,
 )
 
+# Strategies for deciding which Redis server in the ring holds a response queue
+REDIS_RING_STRATEGY_CRC32 = 'crc32'
+REDIS_RING_STRATEGY_JUMP = 'jump'
+REDIS_RING_STRATEGY_RENDEZVOUS = 'rendezvous'
+
+REDIS_RING_STRATEGIES = (
+    REDIS_RING_STRATEGY_CRC32,
+    REDIS_RING_STRATEGY_JUMP,
+    REDIS_RING_STRATEGY_RENDEZVOUS,
+)
+
+# Strategies for deciding to which Redis server in the ring to send a request
+REDIS_REQUEST_QUEUE_STRATEGY_ROUND_ROBIN = 'round_robin'
+REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES = 'power_of_two_choices'
+
+REDIS_REQUEST_QUEUE_STRATEGIES = (
+    REDIS_REQUEST_QUEUE_STRATEGY_ROUND_ROBIN,
+    REDIS_REQUEST_QUEUE_STRATEGY_POWER_OF_TWO_CHOICES,
+)
+
+# The name by which the `action_queues` and `receive_queues` settings refer to the service's main request queue
+DEFAULT_ACTION_QUEUE = 'default'
+
 DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT = 1024 * 100
 DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER = 1024 * 250
+DEFAULT_MAXIMUM_CHUNKED_MESSAGE_BYTES = 1024 * 1024 * 10
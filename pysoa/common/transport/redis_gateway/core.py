@@ -3,10 +3,14 @@ from __future__ import (
     unicode_literals,
 )
 
+import collections
 from copy import deepcopy
 import logging
 import random
+import struct
 import time
+import uuid
+import zlib
 
 import attr
 import redis
@@ -29,9 +33,12 @@ from pysoa.common.transport.exceptions import (
 from pysoa.common.transport.redis_gateway.backend.base import CannotGetConnectionError
 from pysoa.common.transport.redis_gateway.backend.sentinel import SentinelRedisClient
 from pysoa.common.transport.redis_gateway.backend.standard import StandardRedisClient
+from pysoa.common.transport.redis_gateway.backend.streams import StreamsRedisClient
 from pysoa.common.transport.redis_gateway.constants import (
+    DEFAULT_MAXIMUM_CHUNKED_MESSAGE_BYTES,
     DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT,
     REDIS_BACKEND_TYPE_SENTINEL,
+    REDIS_BACKEND_TYPE_STREAMS,
     REDIS_BACKEND_TYPES,
 )
 from pysoa.utils import dict_to_hashable
@@ -45,6 +52,21 @@ def valid_backend_type(_, __, value):
         raise ValueError('backend_type must be one of {}, got {}'.format(REDIS_BACKEND_TYPES, value))
 
 
+def valid_chunk_size_in_bytes(_, __, value):
+    if value < 0:
+        raise ValueError('chunk_size_in_bytes must not be negative, got {}'.format(value))
+
+
+def valid_compress_messages_larger_than_bytes(_, __, value):
+    if value < 0:
+        raise ValueError('compress_messages_larger_than_bytes must not be negative, got {}'.format(value))
+
+
+def valid_receive_batch_size(_, __, value):
+    if value < 1:
+        raise ValueError('receive_batch_size must be at least 1, got {}'.format(value))
+
+
 @attr.s()
 class RedisTransportCore(object):
     """Handles communication with Redis."""
@@ -58,11 +80,29 @@ class RedisTransportCore(object):
     backend_type = attr.ib(validator=valid_backend_type)
 
     backend_layer_kwargs = attr.ib(
-        # Keyword args for the backend layer (Standard Redis and Sentinel Redis modes)
+        # Keyword args for the backend layer (Standard Redis, Sentinel Redis, and Redis Streams modes)
         default={},
         validator=attr.validators.instance_of(dict),
     )
 
+    chunk_size_in_bytes = attr.ib(
+        # Messages larger than `maximum_message_size_in_bytes` (but no larger than
+        # `maximum_chunked_message_size_in_bytes`) are split into chunks of this size, stored under expiring keys, and
+        # replaced in the queue with a small manifest; 0 disables chunking. Chunked messages are always accepted.
+        default=0,
+        converter=int,
+        validator=valid_chunk_size_in_bytes,
+    )
+
+    compress_messages_larger_than_bytes = attr.ib(
+        # Serialized messages larger than this are compressed when the transport tells `send_message` (and friends)
+        # that the receiver accepts compressed messages; 0 disables compression. Compressed messages are always
+        # accepted.
+        default=0,
+        converter=int,
+        validator=valid_compress_messages_larger_than_bytes,
+    )
+
     log_messages_larger_than_bytes = attr.ib(
         default=DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT,
         converter=int,
@@ -73,6 +113,11 @@ class RedisTransportCore(object):
         converter=int,
     )
 
+    maximum_chunked_message_size_in_bytes = attr.ib(
+        default=DEFAULT_MAXIMUM_CHUNKED_MESSAGE_BYTES,
+        converter=int,
+    )
+
     message_expiry_in_seconds = attr.ib(
         # How long after a message is sent before it's considered "expired" and not received by default, unless
         # overridden in the send_message argument `message_expiry_in_seconds`
@@ -102,6 +147,14 @@ class RedisTransportCore(object):
         converter=int,
     )
 
+    receive_batch_size = attr.ib(
+        # The maximum number of messages to pop from a queue in a single round trip; messages beyond the first are
+        # kept in an in-process buffer and handed out by subsequent calls to receive_message
+        default=1,
+        converter=int,
+        validator=valid_receive_batch_size,
+    )
+
     receive_timeout_in_seconds = attr.ib(
         # How long to block when waiting to receive a message by default, unless overridden in the receive_message
         # argument `receive_timeout_in_seconds`
@@ -121,10 +174,66 @@ class RedisTransportCore(object):
         validator=attr.validators.instance_of(six.text_type),
     )
 
+    use_message_envelope = attr.ib(
+        # Whether to send messages in the binary envelope, whose fixed-size header lets receivers drop expired (or
+        # unwanted) messages without deserializing them. Enveloped messages are always accepted.
+        default=False,
+        converter=bool,
+    )
+
     EXPONENTIAL_BACK_OFF_FACTOR = 4.0
     QUEUE_NAME_PREFIX = 'pysoa:'
     GLOBAL_QUEUE_SPECIFIER = '!'
 
+    # A compressed message is this marker byte followed by the zlib-compressed serialized message. No serializer
+    # produces a message starting with this byte (MessagePack maps start with 0x80 or higher and JSON objects with `{`),
+    # so receivers can always tell compressed messages apart.
+    COMPRESSED_MESSAGE_MARKER = b'\x01'
+    # Likewise, a chunk manifest is this marker byte followed by the serialized manifest dict
+    CHUNK_MANIFEST_MARKER = b'\x02'
+    # And an enveloped message is a fixed-size header, starting with this marker byte, followed by the (optionally
+    # compressed) serialized message at the offset given in the header
+    ENVELOPE_MARKER = b'\x03'
+    # Marker, envelope version, flags, request ID, expiry timestamp (0 for none), payload offset
+    ENVELOPE_HEADER = struct.Struct(str('!cBHqdI'))
+    ENVELOPE_VERSION = 1
+    ENVELOPE_FLAG_COMPRESSED = 0x0001
+    # How many chunks to get from Redis per round trip when reassembling a chunked message
+    CHUNK_FETCH_BATCH_SIZE = 16
+    COMPRESSION_CODEC = 'zlib'
+    # The meta key with which the sender of a message advertises the codec in which it accepts compressed messages
+    META_ACCEPTS_COMPRESSION = '__accepts_compression__'
+
+    @property
+    def compression_enabled(self):
+        return self.compress_messages_larger_than_bytes > 0
+
+    def accepts_compression(self, meta):
+        """
+        Indicates whether the sender of a message with the given meta information advertised that it accepts compressed
+        messages.
+
+        :param meta: The message meta information
+        :type meta: dict
+
+        :return: Whether compressed messages may be sent to the message's sender
+        :rtype: bool
+        """
+        return meta.get(self.META_ACCEPTS_COMPRESSION) == self.COMPRESSION_CODEC
+
+    def advertise_compression(self, meta):
+        """
+        Adds to (or, if compression is disabled, removes from) the given outgoing meta information the advertisement
+        that this transport accepts compressed messages, so that the receiver may compress the messages it sends back.
+
+        :param meta: The outgoing message meta information
+        :type meta: dict
+        """
+        if self.compression_enabled:
+            meta[self.META_ACCEPTS_COMPRESSION] = self.COMPRESSION_CODEC
+        else:
+            meta.pop(self.META_ACCEPTS_COMPRESSION, None)
+
     def __attrs_post_init__(self):
         # set the hosts property after all attrs are validated
         if self.backend_layer_kwargs.get('hosts'):
@@ -146,6 +255,14 @@ class RedisTransportCore(object):
 
         self._backend_layer = None
         self._serializer = None
+        self._receive_buffers = {}
+        # For request queues stored in Redis Streams, the ring index of the server from which the message most
+        # recently returned from `receive_message` was read and its ID (it is handled once the server asks for the next
+        # message), and the IDs of handled messages that have not yet been acknowledged, by queue key and then by the
+        # ring index of the server from which they were read (which is the only server on which they can be
+        # acknowledged)
+        self._stream_messages_in_progress = {}
+        self._stream_messages_to_acknowledge = {}
 
     # noinspection PyAttributeOutsideInit
     @property
@@ -157,13 +274,16 @@ class RedisTransportCore(object):
                     backend_layer_kwargs = deepcopy(self.backend_layer_kwargs)
                     if self.backend_type == REDIS_BACKEND_TYPE_SENTINEL:
                         self._backend_layer_cache[cache_key] = SentinelRedisClient(**backend_layer_kwargs)
+                    elif self.backend_type == REDIS_BACKEND_TYPE_STREAMS:
+                        self._backend_layer_cache[cache_key] = StreamsRedisClient(**backend_layer_kwargs)
                     else:
                         self._backend_layer_cache[cache_key] = StandardRedisClient(**backend_layer_kwargs)
 
             self._backend_layer = self._backend_layer_cache[cache_key]
 
         # Each time the backend layer is accessed, use _this_ transport's metrics recorder for the backend layer
-        self._backend_layer.metrics_counter_getter = lambda name: self._get_counter(name)
+        self._backend_layer.metrics_counter_getter = lambda name: self.get_counter(name)
+        self._backend_layer.metrics_timer_getter = lambda name: self._get_timer(name)
         return self._backend_layer
 
     # noinspection PyAttributeOutsideInit
@@ -174,7 +294,7 @@ class RedisTransportCore(object):
 
         return self._serializer
 
-    def send_message(self, queue_name, request_id, meta, body, message_expiry_in_seconds=None):
+    def send_message(self, queue_name, request_id, meta, body, message_expiry_in_seconds=None, compress=False):
         """
         Send a message to the specified queue in Redis.
 
@@ -188,6 +308,679 @@ class RedisTransportCore(object):
         :type body: dict
         :param message_expiry_in_seconds: The optional message expiry, which defaults to the setting with the same name
         :type message_expiry_in_seconds: int
+        :param compress: Whether the receiver accepts compressed messages, in which case the message is compressed if it
+                         is larger than `compress_messages_larger_than_bytes`
+        :type compress: bool
+
+        :raise: InvalidMessageError, MessageTooLarge, MessageSendError
+        """
+        queue_key, serialized_message, redis_expiry = self.prepare_message(
+            queue_name,
+            request_id,
+            meta,
+            body,
+            message_expiry_in_seconds,
+            compress,
+        )
+
+        self._send_serialized_message(queue_name, queue_key, serialized_message, redis_expiry)
+
+    def send_message_and_receive_next(
+        self,
+        queue_name,
+        request_id,
+        meta,
+        body,
+        receive_queue_name,
+        message_expiry_in_seconds=None,
+        compress=False,
+    ):
+        """
+        Send a message to the specified queue in Redis and, in the same round trip, pop up to `receive_batch_size`
+        messages from the receive queue without blocking. The popped messages are buffered in-process and returned by
+        subsequent calls to `receive_message` for the receive queue, which only blocks on Redis if nothing was popped.
+        Both operations happen in a single Lua script on the Redis connection for the send queue. Since request queues
+        are spread randomly across all the Redis servers, popping the next request from the same server to which the
+        response is sent is as good a choice as any. If messages are already buffered for the receive queue, this just
+        sends the message. With the Redis Streams backend type, which reads requests through a consumer group, this also
+        just sends the message.
+
+        :param queue_name: The name of the queue to which to send the message
+        :type queue_name: union(str, unicode)
+        :param request_id: The message's request ID
+        :type request_id: int
+        :param meta: The message meta information, if any (should be an empty dict if no metadata)
+        :type meta: dict
+        :param body: The message body (should be a dict)
+        :type body: dict
+        :param receive_queue_name: The name of the queue from which to receive the next messages
+        :type receive_queue_name: union(str, unicode)
+        :param message_expiry_in_seconds: The optional message expiry, which defaults to the setting with the same name
+        :type message_expiry_in_seconds: int
+        :param compress: Whether the receiver accepts compressed messages (see `send_message`)
+        :type compress: bool
+
+        :raise: InvalidMessageError, MessageTooLarge, MessageSendError
+        """
+        receive_queue_key = self.QUEUE_NAME_PREFIX + receive_queue_name
+        receive_buffer = self._receive_buffers.setdefault(receive_queue_key, collections.deque())
+        if receive_buffer or self._is_stream(receive_queue_key):
+            self.send_message(queue_name, request_id, meta, body, message_expiry_in_seconds, compress)
+            return
+
+        queue_key, serialized_message, redis_expiry = self.prepare_message(
+            queue_name,
+            request_id,
+            meta,
+            body,
+            message_expiry_in_seconds,
+            compress,
+        )
+
+        serialized_messages = self._send_serialized_message(
+            queue_name,
+            queue_key,
+            serialized_message,
+            redis_expiry,
+            receive_queue_key=receive_queue_key,
+        )
+
+        if serialized_messages:
+            self.get_counter('send.receive_next.hit').increment()
+            receive_buffer.extend(serialized_messages)
+        else:
+            self.get_counter('send.receive_next.miss').increment()
+
+    def send_messages(self, messages, compress=False):
+        """
+        Send multiple messages to Redis in bulk. The messages are grouped by the Redis connection each would be sent on,
+        and each group is sent in a single pipeline (one round trip). The queue capacity check is still performed for
+        each message individually, and only the messages that found their queue full are retried (again in bulk).
+
+        One message failing does not prevent the others from being sent. Instead of raising errors, this returns a list
+        with one entry for each message, in the same order as the messages, which is `None` if the message was sent or
+        the `InvalidMessageError`, `MessageTooLarge`, or `MessageSendError` that prevented it from being sent.
+
+        :param messages: The messages to send, each a tuple of the same arguments accepted by `send_message`, in the
+                         same order: `(queue_name, request_id, meta, body, message_expiry_in_seconds)`
+        :type messages: iterable[tuple(union(str, unicode), int, dict, dict, int)]
+        :param compress: Whether the receivers accept compressed messages (see `send_message`)
+        :type compress: bool
+
+        :return: The list of errors, with `None` in place of each message that was sent successfully
+        :rtype: list[union(Exception, NoneType)]
+        """
+        errors = []
+        pending = []
+        for index, (queue_name, request_id, meta, body, message_expiry_in_seconds) in enumerate(messages):
+            errors.append(None)
+            try:
+                pending.append((index, queue_name) + self.prepare_message(
+                    queue_name,
+                    request_id,
+                    meta,
+                    body,
+                    message_expiry_in_seconds,
+                    compress,
+                ))
+            except (InvalidMessageError, MessageSendError, MessageTooLarge) as e:
+                errors[index] = e
+
+        # Try at least once, up to queue_full_retries times, then error
+        for i in range(-1, self.queue_full_retries):
+            if not pending:
+                break
+            if i >= 0:
+                self._back_off_queue_full(i)
+
+            # Group the messages by server, keeping them in their original order within each group
+            groups = collections.OrderedDict()
+            for message in pending:
+                try:
+                    with self._get_timer('send.get_redis_connection'):
+                        index = self.backend_layer.get_connection_index(message[2])
+                        connection = self.backend_layer.get_connection_by_index(index)
+                except Exception as e:
+                    errors[message[0]] = self.make_send_error(e)
+                    continue
+                groups.setdefault(index, (connection, []))[1].append(message)
+
+            pending = []
+            for index, (connection, group) in six.iteritems(groups):
+                start = time.time()
+                try:
+                    with self._get_timer('send.send_messages_to_redis_queues'):
+                        pipeline = connection.pipeline(transaction=False)
+                        for _, _, queue_key, serialized_message, redis_expiry in group:
+                            self.backend_layer.send_message_to_queue(
+                                queue_key=queue_key,
+                                message=serialized_message,
+                                expiry=redis_expiry,
+                                capacity=self.queue_capacity,
+                                connection=pipeline,
+                            )
+                        results = pipeline.execute(raise_on_error=False)
+                except Exception as e:
+                    # The whole pipeline failed, so none of its messages were sent
+                    self._record_send_outcome(index, start, error=True)
+                    error = self.make_send_error(e)
+                    for message in group:
+                        errors[message[0]] = error
+                    continue
+
+                queue_depths = {}
+                for message, result in zip(group, results):
+                    if isinstance(result, redis.exceptions.ResponseError):
+                        if result.args[0] == 'queue full':
+                            queue_depths[message[2]] = self.queue_capacity
+                    elif isinstance(result, six.integer_types):
+                        queue_depths[message[2]] = result
+                self._record_send_outcome(
+                    index,
+                    start,
+                    error=any(isinstance(result, redis.exceptions.ResponseError) for result in results),
+                    queue_depths=queue_depths,
+                )
+                for message, result in zip(group, results):
+                    if isinstance(result, redis.exceptions.ResponseError):
+                        # The Lua script handles capacity checking and sends the "full" error back
+                        if result.args[0] == 'queue full':
+                            pending.append(message)
+                        else:
+                            errors[message[0]] = self.make_send_error(result)
+
+        for message in pending:
+            errors[message[0]] = self.make_queue_full_error(message[1])
+
+        return errors
+
+    def receive_message(self, queue_name, receive_timeout_in_seconds=None, accept_request_id=None):
+        """
+        Receive a message from the specified queue in Redis. If `receive_batch_size` is greater than 1, up to that many
+        messages are popped from Redis in a single round trip, and the extras are buffered in-process and returned by
+        subsequent calls to this method before Redis is consulted again. Messages buffered by
+        `send_message_and_receive_next` are likewise returned before Redis is consulted. Expiry is always checked at the
+        time a message is returned from this method, not at the time it is popped from Redis.
+
+        :param queue_name: The name of the queue to which to send the message
+        :type queue_name: union(str, unicode)
+        :param receive_timeout_in_seconds: The optional timeout, which defaults to the setting with the same name
+        :type receive_timeout_in_seconds: int
+        :param accept_request_id: An optional callable that is passed the request ID of the message and returns whether
+                                  it is wanted; an unwanted message is counted and discarded (without being
+                                  deserialized, if it was sent in the binary envelope), and `InvalidMessageError` is
+                                  raised
+        :type accept_request_id: callable
+
+        :return: A tuple of request ID, message meta-information dict, and message body dict
+        :rtype: tuple(int, dict, dict)
+
+        With the Redis Streams backend type, a message received from a request queue is acknowledged (in batches, in the
+        same round trip as the next read from Redis) once the next call to this method for the same queue shows that
+        it has been handled.
+
+        :raise: MessageReceiveError, MessageReceiveTimeout, InvalidMessageError
+        """
+        queue_key = self.QUEUE_NAME_PREFIX + queue_name
+
+        if self._is_stream(queue_key):
+            return self.deserialize_message(
+                self._receive_stream_message(queue_key, receive_timeout_in_seconds),
+                accept_request_id,
+            )
+
+        receive_buffer = self._receive_buffers.get(queue_key)
+        if receive_buffer:
+            self.get_counter('receive.buffer_hit').increment()
+            serialized_message = receive_buffer.popleft()
+        elif self.receive_batch_size > 1:
+            receive_buffer = self._receive_buffers.setdefault(queue_key, collections.deque())
+            receive_buffer.extend(self._pop_serialized_messages(
+                queue_key,
+                self.receive_batch_size,
+                receive_timeout_in_seconds,
+            ))
+            serialized_message = receive_buffer.popleft()
+        else:
+            serialized_message = self._pop_serialized_messages(queue_key, 1, receive_timeout_in_seconds)[0]
+
+        return self.deserialize_message(serialized_message, accept_request_id)
+
+    def receive_prioritized_message(self, queue_names, receive_timeout_in_seconds=None):
+        """
+        Receive a message from the first of the specified queues, in order, that has one, blocking until any of them
+        has one, with a single multi-key `BLPOP`. This does not use (or fill) the in-process buffer that
+        `receive_message` uses when `receive_batch_size` is greater than 1, because buffered messages would be handed
+        out ahead of messages later sent to the queues that come first. It does not support the Redis Streams backend
+        type.
+
+        :param queue_names: The names of the queues from which to receive the message, in order of precedence
+        :type queue_names: list[union(str, unicode)]
+        :param receive_timeout_in_seconds: The optional timeout, which defaults to the setting with the same name
+        :type receive_timeout_in_seconds: int
+
+        :return: A tuple of the index in `queue_names` of the queue from which the message was received, request ID,
+                 message meta-information dict, and message body dict
+        :rtype: tuple(int, int, dict, dict)
+
+        :raise: MessageReceiveError, MessageReceiveTimeout, InvalidMessageError
+        """
+        queue_keys = [self.QUEUE_NAME_PREFIX + queue_name for queue_name in queue_names]
+
+        try:
+            with self._get_timer('receive.get_redis_connection'):
+                # All the queues are popped from the same server, whichever the first queue would be popped from
+                connection = self.backend_layer.get_connection(queue_keys[0])
+
+            with self._get_timer('receive.pop_from_redis_queue'):
+                result = connection.blpop(
+                    queue_keys,
+                    timeout=receive_timeout_in_seconds or self.receive_timeout_in_seconds,
+                )
+        except Exception as e:
+            raise self._make_receive_error(e)
+
+        if not result:
+            raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+        queue_key = result[0]
+        if isinstance(queue_key, six.binary_type):
+            queue_key = queue_key.decode('utf-8')
+        return (queue_keys.index(queue_key), ) + self.deserialize_message(result[1])
+
+    def receive_queued_messages(self, queue_name, maximum_messages):
+        """
+        Receive up to `maximum_messages` messages that are already waiting in the specified queue, first from the
+        in-process buffer and then from Redis in a single round trip, without blocking. Messages that have expired or
+        that are invalid are counted and skipped. Nothing is received from queues that are streams, whose messages are
+        acknowledged one receive at a time.
+
+        :param queue_name: The name of the queue from which to receive the messages
+        :type queue_name: union(str, unicode)
+        :param maximum_messages: The maximum number of messages to receive
+        :type maximum_messages: int
+
+        :return: A list of tuples of request ID, message meta-information dict, and message body dict
+        :rtype: list[tuple(int, dict, dict)]
+
+        :raise: MessageReceiveError
+        """
+        queue_key = self.QUEUE_NAME_PREFIX + queue_name
+        if maximum_messages < 1 or self._is_stream(queue_key):
+            return []
+
+        serialized_messages = []
+        receive_buffer = self._receive_buffers.get(queue_key)
+        while receive_buffer and len(serialized_messages) < maximum_messages:
+            self.get_counter('receive.buffer_hit').increment()
+            serialized_messages.append(receive_buffer.popleft())
+
+        if len(serialized_messages) < maximum_messages:
+            try:
+                with self._get_timer('receive.get_redis_connection'):
+                    connection = self.backend_layer.get_connection(queue_key)
+                with self._get_timer('receive.pop_batch_from_redis_queue'):
+                    serialized_messages.extend(self.backend_layer.pop_messages_from_queue(
+                        queue_key=queue_key,
+                        count=maximum_messages - len(serialized_messages),
+                        connection=connection,
+                    ) or [])
+            except Exception as e:
+                raise self._make_receive_error(e)
+
+        messages = []
+        for serialized_message in serialized_messages:
+            try:
+                messages.append(self.deserialize_message(serialized_message))
+            except (InvalidMessageError, MessageReceiveTimeout):
+                # The error was counted, and the message is gone from the queue, so move on to the next one
+                pass
+        return messages
+
+    def get_queue_depths(self, queue_names):
+        """
+        Get the number of messages in each of the specified queues, summed across all the Redis servers, with one
+        pipelined round trip to each server.
+
+        :param queue_names: The names of the queues
+        :type queue_names: list[union(str, unicode)]
+
+        :return: The depth of each queue, in the same order as the queue names
+        :rtype: list[int]
+
+        :raise: MessageReceiveError
+        """
+        queue_keys = [self.QUEUE_NAME_PREFIX + queue_name for queue_name in queue_names]
+
+        depths = [0] * len(queue_keys)
+        try:
+            for index in range(self.backend_layer.ring_size):
+                pipeline = self.backend_layer.get_connection_by_index(index).pipeline(transaction=False)
+                for queue_key in queue_keys:
+                    pipeline.llen(queue_key)
+                depths = [total + (depth or 0) for total, depth in zip(depths, pipeline.execute())]
+        except Exception as e:
+            raise self._make_receive_error(e)
+
+        return depths
+
+    def return_buffered_messages(self):
+        """
+        Push any messages that have been popped from Redis but not yet returned from `receive_message` back onto the
+        front of the queues from which they came, in their original order, so that another process can receive them.
+        Call this when shutting down gracefully.
+
+        With the Redis Streams backend type, messages read from request queues cannot be returned to the streams, so
+        instead this acknowledges the messages that have been handled and leaves the rest pending, to be reclaimed by
+        another server after the visibility timeout.
+
+        :raise: MessageSendError
+        """
+        self._acknowledge_stream_messages()
+
+        for queue_key, receive_buffer in six.iteritems(self._receive_buffers):
+            if not receive_buffer:
+                continue
+
+            if self._is_stream(queue_key):
+                self.get_counter('receive.buffer_left_pending').increment(len(receive_buffer))
+                receive_buffer.clear()
+                continue
+
+            try:
+                connection = self.backend_layer.get_connection(queue_key)
+                # LPUSH pushes each argument onto the head in turn, so reverse them to preserve the original order
+                connection.lpush(queue_key, *reversed(receive_buffer))
+            except CannotGetConnectionError as e:
+                self.get_counter('receive.error.buffer_return_connection').increment()
+                raise MessageSendError('Cannot get connection: {}'.format(e.args[0]))
+            except Exception as e:
+                self.get_counter('receive.error.buffer_return_unknown').increment()
+                raise MessageSendError(
+                    'Unknown error returning buffered messages for service {}'.format(self.service_name),
+                    six.text_type(type(e).__name__),
+                    *e.args
+                )
+
+            self.get_counter('receive.buffer_returned').increment(len(receive_buffer))
+            receive_buffer.clear()
+
+    def _is_stream(self, queue_key):
+        # Only request queues are streams; response queues are always lists
+        return (
+            self.backend_type == REDIS_BACKEND_TYPE_STREAMS and
+            StreamsRedisClient.RESPONSE_QUEUE_SPECIFIER not in queue_key
+        )
+
+    def _receive_stream_message(self, queue_key, receive_timeout_in_seconds=None):
+        # The message returned by the previous call has been handled, now that the server is asking for another
+        to_acknowledge = self._stream_messages_to_acknowledge.setdefault(queue_key, {})
+        if queue_key in self._stream_messages_in_progress:
+            index, message_id = self._stream_messages_in_progress.pop(queue_key)
+            to_acknowledge.setdefault(index, []).append(message_id)
+
+        receive_buffer = self._receive_buffers.setdefault(queue_key, collections.deque())
+        if receive_buffer:
+            self.get_counter('receive.buffer_hit').increment()
+        else:
+            try:
+                with self._get_timer('receive.get_redis_connection'):
+                    index = self.backend_layer.get_connection_index(queue_key)
+                    connection = self.backend_layer.get_connection_by_index(index)
+
+                # Messages read from other servers can only be acknowledged on those servers, in a round trip of their
+                # own; those read from this server are acknowledged in the same round trip as the read
+                for other_index in [i for i in to_acknowledge if i != index]:
+                    self._acknowledge_stream_messages_on_server(queue_key, other_index, to_acknowledge[other_index])
+                    del to_acknowledge[other_index]
+                acknowledge_ids = list(to_acknowledge.get(index, []))
+
+                with self._get_timer('receive.read_from_redis_stream'):
+                    messages = self.backend_layer.read_messages_from_stream(
+                        queue_key=queue_key,
+                        count=self.receive_batch_size,
+                        timeout_in_seconds=receive_timeout_in_seconds or self.receive_timeout_in_seconds,
+                        acknowledge_ids=acknowledge_ids,
+                        connection=connection,
+                    )
+            except CannotGetConnectionError as e:
+                self.get_counter('receive.error.connection').increment()
+                raise MessageReceiveError('Cannot get connection: {}'.format(e.args[0]))
+            except Exception as e:
+                self._note_stale_master(e, 'receive')
+                self.get_counter('receive.error.unknown').increment()
+                raise MessageReceiveError(
+                    'Unknown error receiving message for service {}'.format(self.service_name),
+                    six.text_type(type(e).__name__),
+                    *e.args
+                )
+
+            if acknowledge_ids:
+                self.get_counter('receive.acknowledged').increment(len(acknowledge_ids))
+                del to_acknowledge[index]
+            receive_buffer.extend((index, message_id, message) for message_id, message in messages)
+
+            if not receive_buffer:
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+        index, message_id, serialized_message = receive_buffer.popleft()
+        # Even if the message turns out to be expired or invalid, it is acknowledged, so that it is not received again
+        self._stream_messages_in_progress[queue_key] = (index, message_id)
+        return serialized_message
+
+    def _acknowledge_stream_messages(self):
+        for queue_key, (index, message_id) in six.iteritems(self._stream_messages_in_progress):
+            self._stream_messages_to_acknowledge.setdefault(queue_key, {}).setdefault(index, []).append(message_id)
+        self._stream_messages_in_progress.clear()
+
+        for queue_key, to_acknowledge in six.iteritems(self._stream_messages_to_acknowledge):
+            for index in list(to_acknowledge):
+                try:
+                    self._acknowledge_stream_messages_on_server(queue_key, index, to_acknowledge[index])
+                except CannotGetConnectionError as e:
+                    self.get_counter('receive.error.acknowledge_connection').increment()
+                    raise MessageSendError('Cannot get connection: {}'.format(e.args[0]))
+                except Exception as e:
+                    self.get_counter('receive.error.acknowledge_unknown').increment()
+                    raise MessageSendError(
+                        'Unknown error acknowledging messages for service {}'.format(self.service_name),
+                        six.text_type(type(e).__name__),
+                        *e.args
+                    )
+                del to_acknowledge[index]
+
+    def _acknowledge_stream_messages_on_server(self, queue_key, index, message_ids):
+        if message_ids:
+            self.backend_layer.acknowledge_messages(
+                queue_key=queue_key,
+                acknowledge_ids=list(message_ids),
+                connection=self.backend_layer.get_connection_by_index(index),
+            )
+            self.get_counter('receive.acknowledged').increment(len(message_ids))
+
+    def _pop_serialized_messages(self, queue_key, maximum_messages, receive_timeout_in_seconds=None):
+        try:
+            with self._get_timer('receive.get_redis_connection'):
+                connection = self.backend_layer.get_connection(queue_key)
+
+            serialized_messages = None
+            if maximum_messages > 1:
+                # Try to pop a batch without blocking first; this only round trips once when the queue is busy
+                with self._get_timer('receive.pop_batch_from_redis_queue'):
+                    serialized_messages = self.backend_layer.pop_messages_from_queue(
+                        queue_key=queue_key,
+                        count=maximum_messages,
+                        connection=connection,
+                    )
+
+            if not serialized_messages:
+                # returns message or None if no new messages within timeout
+                with self._get_timer('receive.pop_from_redis_queue'):
+                    result = connection.blpop(
+                        [queue_key],
+                        timeout=receive_timeout_in_seconds or self.receive_timeout_in_seconds,
+                    )
+                if result:
+                    serialized_messages = [result[1]]
+        except Exception as e:
+            raise self._make_receive_error(e)
+
+        if not serialized_messages:
+            raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+        return serialized_messages
+
+    def deserialize_message(self, serialized_message, accept_request_id=None):
+        """
+        Deserialize a message as popped from a queue, in any of the formats that senders produce. A chunked message is
+        reassembled first, with blocking calls to Redis, so callers that must not block should reassemble it with
+        `read_chunk_manifest` and `copy_chunks` before calling this.
+
+        :param serialized_message: The message as popped from the queue
+        :type serialized_message: bytes
+        :param accept_request_id: An optional callable, as accepted by `receive_message`
+        :type accept_request_id: callable
+
+        :return: A tuple of request ID, message meta-information dict, and message body dict
+        :rtype: tuple(int, dict, dict)
+
+        :raise: MessageReceiveError, MessageReceiveTimeout, InvalidMessageError
+        """
+        if serialized_message[:1] == self.CHUNK_MANIFEST_MARKER:
+            serialized_message = self._fetch_chunks(serialized_message, accept_request_id)
+
+        if serialized_message[:1] == self.ENVELOPE_MARKER:
+            return self._deserialize_enveloped_message(serialized_message, accept_request_id)
+
+        if serialized_message[:1] == self.COMPRESSED_MESSAGE_MARKER:
+            serialized_message = self._decompress_message(serialized_message, 1)
+
+        with self._get_timer('receive.deserialize'):
+            message = self.serializer.blob_to_dict(serialized_message)
+
+        if self._is_message_expired(message):
+            self.get_counter('receive.error.message_expired').increment()
+            raise MessageReceiveTimeout('Message expired for service {}'.format(self.service_name))
+
+        request_id = message.get('request_id')
+        if request_id is None:
+            self.get_counter('receive.error.no_request_id').increment()
+            raise InvalidMessageError('No request ID for service {}'.format(self.service_name))
+
+        self._check_request_id_accepted(request_id, accept_request_id)
+
+        return request_id, message.get('meta', {}), message.get('body')
+
+    def _deserialize_enveloped_message(self, serialized_message, accept_request_id=None):
+        # Everything that can get a message dropped is checked against the header, before the payload is touched
+        try:
+            _, version, flags, request_id, expiry, offset = self.ENVELOPE_HEADER.unpack_from(serialized_message)
+        except struct.error:
+            self.get_counter('receive.error.invalid_envelope').increment()
+            raise InvalidMessageError('Truncated message envelope for service {}'.format(self.service_name))
+
+        if version != self.ENVELOPE_VERSION or offset < self.ENVELOPE_HEADER.size or offset > len(serialized_message):
+            self.get_counter('receive.error.invalid_envelope').increment()
+            raise InvalidMessageError('Unsupported message envelope version {} for service {}'.format(
+                version,
+                self.service_name,
+            ))
+
+        if expiry and expiry < time.time():
+            self.get_counter('receive.error.message_expired').increment()
+            raise MessageReceiveTimeout('Message expired for service {}'.format(self.service_name))
+
+        self._check_request_id_accepted(request_id, accept_request_id)
+
+        if flags & self.ENVELOPE_FLAG_COMPRESSED:
+            payload = self._decompress_message(serialized_message, offset)
+        else:
+            payload = serialized_message[offset:]
+
+        with self._get_timer('receive.deserialize'):
+            message = self.serializer.blob_to_dict(payload)
+
+        return request_id, message.get('meta', {}), message.get('body')
+
+    def _check_request_id_accepted(self, request_id, accept_request_id):
+        if accept_request_id and not accept_request_id(request_id):
+            self.get_counter('receive.error.unknown_request_id').increment()
+            raise InvalidMessageError('Unknown request ID {} for service {}'.format(request_id, self.service_name))
+
+    def _decompress_message(self, serialized_message, offset):
+        try:
+            with self._get_timer('receive.decompress'):
+                return zlib.decompress(serialized_message[offset:])
+        except zlib.error as e:
+            self.get_counter('receive.error.decompress').increment()
+            raise InvalidMessageError(
+                'Could not decompress message for service {}: {}'.format(self.service_name, e.args[0]),
+            )
+
+    def _send_serialized_message(self, queue_name, queue_key, serialized_message, redis_expiry, receive_queue_key=None):
+        # Try at least once, up to queue_full_retries times, then error
+        for i in range(-1, self.queue_full_retries):
+            if i >= 0:
+                self._back_off_queue_full(i)
+            index = None
+            start = None
+            try:
+                with self._get_timer('send.get_redis_connection'):
+                    index = self.backend_layer.get_connection_index(queue_key)
+                    connection = self.backend_layer.get_connection_by_index(index)
+
+                start = time.time()
+                if receive_queue_key:
+                    with self._get_timer('send.send_message_and_pop_from_redis_queues'):
+                        result = self.backend_layer.send_message_and_pop_messages(
+                            queue_key=queue_key,
+                            message=serialized_message,
+                            expiry=redis_expiry,
+                            capacity=self.queue_capacity,
+                            pop_queue_key=receive_queue_key,
+                            count=self.receive_batch_size,
+                            connection=connection,
+                        )
+                    queue_depth = None
+                else:
+                    result = None
+                    with self._get_timer('send.send_message_to_redis_queue'):
+                        queue_depth = self.backend_layer.send_message_to_queue(
+                            queue_key=queue_key,
+                            message=serialized_message,
+                            expiry=redis_expiry,
+                            capacity=self.queue_capacity,
+                            connection=connection,
+                        )
+            except redis.exceptions.ResponseError as e:
+                # The Lua script handles capacity checking and sends the "full" error back
+                if e.args[0] == 'queue full':
+                    self._record_send_outcome(index, start, error=True, queue_depths={queue_key: self.queue_capacity})
+                    continue
+                self._record_send_outcome(index, start, error=True)
+                raise self.make_send_error(e)
+            except Exception as e:
+                self._record_send_outcome(index, start, error=True)
+                raise self.make_send_error(e)
+
+            # The message has been sent, so recording the outcome happens outside the `try`, where any error it raised
+            # could not be mistaken for a failure to send
+            self._record_send_outcome(
+                index,
+                start,
+                queue_depths={queue_key: queue_depth} if isinstance(queue_depth, six.integer_types) else None,
+            )
+            return result
+
+        raise self.make_queue_full_error(queue_name)
+
+    def prepare_message(self, queue_name, request_id, meta, body, message_expiry_in_seconds=None, compress=False):
+        """
+        Serialize, and if necessary compress and chunk, a message to be sent, without sending it. Accepts the same
+        arguments as `send_message`.
+
+        :return: A tuple of the Redis key of the queue, the message to push onto it, and the Redis expiry in seconds
+        :rtype: tuple(union(str, unicode), bytes, int)
 
         :raise: InvalidMessageError, MessageTooLarge, MessageSendError
         """
@@ -207,10 +1000,27 @@ class RedisTransportCore(object):
 
         with self._get_timer('send.serialize'):
             serialized_message = self.serializer.dict_to_blob(message)
+        if isinstance(serialized_message, six.text_type):
+            # The JSON serializer produces text, but it deserializes UTF-8 bytes just as well, and the size limits and
+            # compression apply to the bytes that are sent
+            serialized_message = serialized_message.encode('utf-8')
 
+        compress = (
+            compress and
+            self.compression_enabled and
+            len(serialized_message) > self.compress_messages_larger_than_bytes
+        )
+        if self.use_message_envelope and self._fits_envelope(request_id):
+            serialized_message = self._envelope_message(serialized_message, request_id, message_expiry, compress)
+        elif compress:
+            serialized_message = self._compress_message(serialized_message)
+
+        # The size limit applies to the message as it is actually sent, compressed or not
         message_size_in_bytes = len(serialized_message)
-        if message_size_in_bytes > self.maximum_message_size_in_bytes:
-            self._get_counter('send.error.message_too_large').increment()
+        if message_size_in_bytes > self.maximum_message_size_in_bytes and (
+            not self.chunk_size_in_bytes or message_size_in_bytes > self.maximum_chunked_message_size_in_bytes
+        ):
+            self.get_counter('send.error.message_too_large').increment()
             raise MessageTooLarge(message_size_in_bytes)
         elif self.log_messages_larger_than_bytes and message_size_in_bytes > self.log_messages_larger_than_bytes:
             _oversized_message_logger.warning(
@@ -222,107 +1032,277 @@ class RedisTransportCore(object):
                 }},
             )
 
-        queue_key = self.QUEUE_NAME_PREFIX + queue_name
+        if message_size_in_bytes > self.maximum_message_size_in_bytes:
+            serialized_message = self._store_chunks(serialized_message, redis_expiry, request_id, message_expiry)
 
-        # Try at least once, up to queue_full_retries times, then error
-        for i in range(-1, self.queue_full_retries):
-            if i >= 0:
-                time.sleep((2 ** i + random.random()) / self.EXPONENTIAL_BACK_OFF_FACTOR)
-                self._get_counter('send.queue_full_retry').increment()
-                self._get_counter('send.queue_full_retry.retry_{}'.format(i + 1)).increment()
-            try:
-                with self._get_timer('send.get_redis_connection'):
-                    connection = self.backend_layer.get_connection(queue_key)
+        return self.QUEUE_NAME_PREFIX + queue_name, serialized_message, redis_expiry
 
-                with self._get_timer('send.send_message_to_redis_queue'):
-                    self.backend_layer.send_message_to_queue(
-                        queue_key=queue_key,
-                        message=serialized_message,
-                        expiry=redis_expiry,
-                        capacity=self.queue_capacity,
-                        connection=connection,
-                    )
-                return
-            except redis.exceptions.ResponseError as e:
-                # The Lua script handles capacity checking and sends the "full" error back
-                if e.args[0] == 'queue full':
-                    continue
-                self._get_counter('send.error.response').increment()
-                raise MessageSendError('Redis error sending message for service {}'.format(self.service_name), *e.args)
-            except CannotGetConnectionError as e:
-                self._get_counter('send.error.connection').increment()
-                raise MessageSendError('Cannot get connection: {}'.format(e.args[0]))
-            except Exception as e:
-                self._get_counter('send.error.unknown').increment()
-                raise MessageSendError(
-                    'Unknown error sending message for service {}'.format(self.service_name),
-                    six.text_type(type(e).__name__),
-                    *e.args
-                )
-
-        self._get_counter('send.error.redis_queue_full').increment()
-        raise MessageSendError(
-            'Redis queue {queue_name} was full after {retries} retries'.format(
-                queue_name=queue_name,
-                retries=self.queue_full_retries,
-            )
+    def _store_chunks(self, serialized_message, redis_expiry, request_id, message_expiry):
+        """
+        Store the message (which must be bytes, so that the chunks and the size in the manifest are measured in bytes)
+        in chunks under expiring keys, in one round trip, and return the manifest that replaces it in the queue. The
+        chunk keys contain the global queue specifier so that, like response queues, they are assigned to a Redis server
+        by consistent hashing, and the receiver can find them no matter which server the queue is on. The manifest also
+        carries the request ID and expiry of the message, so that the receiver can drop it before fetching any chunks.
+        """
+        chunk_key = '{prefix}chunks.{chunk_id}{specifier}'.format(
+            prefix=self.QUEUE_NAME_PREFIX,
+            chunk_id=uuid.uuid4().hex,
+            specifier=self.GLOBAL_QUEUE_SPECIFIER,
         )
+        chunk_count = (len(serialized_message) + self.chunk_size_in_bytes - 1) // self.chunk_size_in_bytes
 
-    def receive_message(self, queue_name, receive_timeout_in_seconds=None):
-        """
-        Receive a message from the specified queue in Redis.
+        try:
+            with self._get_timer('send.store_chunks'):
+                pipeline = self.backend_layer.get_connection(chunk_key).pipeline(transaction=False)
+                for i in range(chunk_count):
+                    pipeline.set(
+                        '{}{}'.format(chunk_key, i),
+                        serialized_message[i * self.chunk_size_in_bytes:(i + 1) * self.chunk_size_in_bytes],
+                        ex=redis_expiry,
+                    )
+                pipeline.execute()
+        except Exception as e:
+            raise self.make_send_error(e)
 
-        :param queue_name: The name of the queue to which to send the message
-        :type queue_name: union(str, unicode)
-        :param receive_timeout_in_seconds: The optional timeout, which defaults to the setting with the same name
-        :type receive_timeout_in_seconds: int
+        self.get_counter('send.chunked').increment()
+        self.get_counter('send.chunked.chunks').increment(chunk_count)
 
-        :return: A tuple of request ID, message meta-information dict, and message body dict
-        :rtype: tuple(int, dict, dict)
+        with self._get_timer('send.serialize'):
+            serialized_manifest = self.serializer.dict_to_blob({
+                'chunk_key': chunk_key,
+                'chunk_count': chunk_count,
+                'size_in_bytes': len(serialized_message),
+                'request_id': request_id,
+                'expiry': message_expiry,
+            })
+        if isinstance(serialized_manifest, six.text_type):
+            serialized_manifest = serialized_manifest.encode('utf-8')
+        return self.CHUNK_MANIFEST_MARKER + serialized_manifest
 
-        :raise: MessageReceiveError, MessageReceiveTimeout, InvalidMessageError
+    def _fetch_chunks(self, serialized_manifest, accept_request_id=None):
         """
-        queue_key = self.QUEUE_NAME_PREFIX + queue_name
+        Reassemble a chunked message from its manifest. The chunks are fetched a batch at a time and copied into a
+        buffer allocated once at the full message size, so that, at most, one batch of chunks is held in memory besides
+        the buffer. The chunks are deleted once they have all been fetched.
+        """
+        chunk_key, chunk_keys, message = self.read_chunk_manifest(serialized_manifest, accept_request_id)
+        offset = 0
 
         try:
-            with self._get_timer('receive.get_redis_connection'):
-                connection = self.backend_layer.get_connection(queue_key)
-            # returns message or None if no new messages within timeout
-            with self._get_timer('receive.pop_from_redis_queue'):
-                result = connection.blpop(
-                    [queue_key],
-                    timeout=receive_timeout_in_seconds or self.receive_timeout_in_seconds,
-                )
-            serialized_message = None
-            if result:
-                serialized_message = result[1]
+            with self._get_timer('receive.fetch_chunks'):
+                connection = self.backend_layer.get_connection(chunk_key)
+                for start in range(0, len(chunk_keys), self.CHUNK_FETCH_BATCH_SIZE):
+                    pipeline = connection.pipeline(transaction=False)
+                    for key in chunk_keys[start:start + self.CHUNK_FETCH_BATCH_SIZE]:
+                        pipeline.get(key)
+                    offset = self.copy_chunks(message, offset, pipeline.execute())
+                connection.delete(*chunk_keys)
+        except InvalidMessageError:
+            raise
         except CannotGetConnectionError as e:
-            self._get_counter('receive.error.connection').increment()
+            self.get_counter('receive.error.connection').increment()
             raise MessageReceiveError('Cannot get connection: {}'.format(e.args[0]))
         except Exception as e:
-            self._get_counter('receive.error.unknown').increment()
+            self.get_counter('receive.error.unknown').increment()
             raise MessageReceiveError(
-                'Unknown error receiving message for service {}'.format(self.service_name),
+                'Unknown error receiving chunked message for service {}'.format(self.service_name),
                 six.text_type(type(e).__name__),
                 *e.args
             )
 
-        if serialized_message is None:
-            raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+        if offset != len(message):
+            self.get_counter('receive.error.missing_chunk').increment()
+            raise InvalidMessageError('Chunked message incomplete for service {}'.format(self.service_name))
 
+        return message
+
+    def read_chunk_manifest(self, serialized_manifest, accept_request_id=None):
+        """
+        Deserialize a chunk manifest and return the chunk key, the keys of all the chunks, and the buffer into which to
+        copy them with `copy_chunks`. Like an envelope header, the manifest is checked for everything that can get the
+        message dropped before any chunk is fetched, and its size is checked against
+        `maximum_chunked_message_size_in_bytes` before the buffer is allocated. The chunks of a dropped message are left
+        to expire.
+
+        :raise: InvalidMessageError, MessageReceiveTimeout
+        """
         with self._get_timer('receive.deserialize'):
-            message = self.serializer.blob_to_dict(serialized_message)
+            manifest = self.serializer.blob_to_dict(serialized_manifest[1:])
 
-        if self._is_message_expired(message):
-            self._get_counter('receive.error.message_expired').increment()
+        try:
+            chunk_key = manifest['chunk_key']
+            chunk_count = manifest['chunk_count']
+            size_in_bytes = manifest['size_in_bytes']
+        except (KeyError, TypeError):
+            chunk_key = chunk_count = size_in_bytes = None
+        if (
+            not isinstance(chunk_key, six.string_types) or
+            not isinstance(chunk_count, six.integer_types) or
+            not isinstance(size_in_bytes, six.integer_types) or
+            # Every chunk holds at least one byte, whatever chunk size the sender used
+            not 0 < chunk_count <= size_in_bytes
+        ):
+            self.get_counter('receive.error.invalid_manifest').increment()
+            raise InvalidMessageError('Invalid chunk manifest for service {}'.format(self.service_name))
+
+        if size_in_bytes > self.maximum_chunked_message_size_in_bytes:
+            self.get_counter('receive.error.invalid_manifest').increment()
+            raise InvalidMessageError('Chunked message of {} bytes too large for service {}'.format(
+                size_in_bytes,
+                self.service_name,
+            ))
+
+        # Manifests from senders that predate these fields are checked only once the message is reassembled
+        expiry = manifest.get('expiry')
+        if expiry and expiry < time.time():
+            self.get_counter('receive.error.message_expired').increment()
             raise MessageReceiveTimeout('Message expired for service {}'.format(self.service_name))
 
-        request_id = message.get('request_id')
-        if request_id is None:
-            self._get_counter('receive.error.no_request_id').increment()
-            raise InvalidMessageError('No request ID for service {}'.format(self.service_name))
+        request_id = manifest.get('request_id')
+        if request_id is not None:
+            self._check_request_id_accepted(request_id, accept_request_id)
 
-        return request_id, message.get('meta', {}), message.get('body')
+        chunk_keys = ['{}{}'.format(chunk_key, i) for i in range(chunk_count)]
+        return chunk_key, chunk_keys, bytearray(size_in_bytes)
+
+    def copy_chunks(self, message, offset, chunks):
+        """
+        Copy a batch of fetched chunks into the message buffer at the given offset and return the offset following them.
+
+        :raise: InvalidMessageError
+        """
+        for chunk in chunks:
+            if chunk is None or offset + len(chunk) > len(message):
+                self.get_counter('receive.error.missing_chunk').increment()
+                raise InvalidMessageError(
+                    'Chunk missing or invalid for chunked message for service {}'.format(self.service_name),
+                )
+            message[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        return offset
+
+    def _fits_envelope(self, request_id):
+        # The header holds a signed 64-bit integer request ID; any other message is sent in the older format
+        return (
+            isinstance(request_id, six.integer_types) and
+            not isinstance(request_id, bool) and
+            -2 ** 63 <= request_id < 2 ** 63
+        )
+
+    def _envelope_message(self, serialized_message, request_id, message_expiry, compress):
+        flags = 0
+        if compress:
+            compressed_message = self._compress_message(serialized_message, marker=b'')
+            if compressed_message is not serialized_message:
+                serialized_message = compressed_message
+                flags |= self.ENVELOPE_FLAG_COMPRESSED
+
+        header = self.ENVELOPE_HEADER.pack(
+            self.ENVELOPE_MARKER,
+            self.ENVELOPE_VERSION,
+            flags,
+            request_id,
+            message_expiry,
+            self.ENVELOPE_HEADER.size,
+        )
+        return header + serialized_message
+
+    def _compress_message(self, serialized_message, marker=COMPRESSED_MESSAGE_MARKER):
+        with self._get_timer('send.compress'):
+            compressed_message = marker + zlib.compress(serialized_message)
+
+        if len(compressed_message) >= len(serialized_message):
+            # Incompressible data (already-compressed binary, for example) is sent as it is
+            self.get_counter('send.compress.ineffective').increment()
+            return serialized_message
+
+        # The compression ratio is the ratio of these two counters
+        self.get_counter('send.compress.bytes_before').increment(len(serialized_message))
+        self.get_counter('send.compress.bytes_after').increment(len(compressed_message))
+        return compressed_message
+
+    def _record_send_outcome(self, index, start, error=False, queue_depths=None):
+        # Feeds the request queue strategy, if it is load-aware; the start is unset if getting the connection failed
+        if start is not None:
+            self.backend_layer.record_send_outcome(index, time.time() - start, error, queue_depths)
+
+    def _back_off_queue_full(self, retry):
+        time.sleep(self.get_queue_full_back_off(retry))
+
+    def get_queue_full_back_off(self, retry):
+        """
+        Count a retry after the queue was full and return how long to back off before it.
+
+        :param retry: The zero-based number of the retry
+        :type retry: int
+
+        :return: The number of seconds to back off
+        :rtype: float
+        """
+        self.get_counter('send.queue_full_retry').increment()
+        self.get_counter('send.queue_full_retry.retry_{}'.format(retry + 1)).increment()
+        return (2 ** retry + random.random()) / self.EXPONENTIAL_BACK_OFF_FACTOR
+
+    def _note_stale_master(self, e, direction):
+        # After a failover, the old master rejects writes (and blocking pops) until connections move to the new master
+        if isinstance(e, redis.exceptions.ResponseError) and e.args and six.text_type(e.args[0]).startswith('READONLY'):
+            self.get_counter('{}.error.stale_master'.format(direction)).increment()
+            self.backend_layer.request_topology_refresh()
+        elif isinstance(e, redis.exceptions.ConnectionError):
+            self.backend_layer.request_topology_refresh()
+
+    def make_send_error(self, e):
+        """
+        Count an error raised while sending a message to Redis and return the `MessageSendError` to raise for it.
+
+        :param e: The error
+        :type e: Exception
+
+        :rtype: MessageSendError
+        """
+        self._note_stale_master(e, 'send')
+        if isinstance(e, redis.exceptions.ResponseError):
+            self.get_counter('send.error.response').increment()
+            return MessageSendError('Redis error sending message for service {}'.format(self.service_name), *e.args)
+        if isinstance(e, CannotGetConnectionError):
+            self.get_counter('send.error.connection').increment()
+            return MessageSendError('Cannot get connection: {}'.format(e.args[0]))
+        self.get_counter('send.error.unknown').increment()
+        return MessageSendError(
+            'Unknown error sending message for service {}'.format(self.service_name),
+            six.text_type(type(e).__name__),
+            *e.args
+        )
+
+    def _make_receive_error(self, e):
+        if isinstance(e, CannotGetConnectionError):
+            self.get_counter('receive.error.connection').increment()
+            return MessageReceiveError('Cannot get connection: {}'.format(e.args[0]))
+        self._note_stale_master(e, 'receive')
+        self.get_counter('receive.error.unknown').increment()
+        return MessageReceiveError(
+            'Unknown error receiving message for service {}'.format(self.service_name),
+            six.text_type(type(e).__name__),
+            *e.args
+        )
+
+    def make_queue_full_error(self, queue_name):
+        """
+        Count a message that could not be sent because the queue stayed full and return the `MessageSendError` to raise.
+
+        :param queue_name: The name of the queue
+        :type queue_name: union(str, unicode)
+
+        :rtype: MessageSendError
+        """
+        self.get_counter('send.error.redis_queue_full').increment()
+        return MessageSendError(
+            'Redis queue {queue_name} was full after {retries} retries'.format(
+                queue_name=queue_name,
+                retries=self.queue_full_retries,
+            )
+        )
 
     @staticmethod
     def _is_message_expired(message):
@@ -334,7 +1314,16 @@ class RedisTransportCore(object):
         else:
             return 'transport.redis_gateway.{}'.format(name)
 
-    def _get_counter(self, name):
+    def get_counter(self, name):
+        """
+        Return a counter for recording a Redis Gateway transport metric, such as the metrics a server transport records
+        about its priority lanes, with the same prefix as the metrics recorded by the core.
+
+        :param name: The metric name, relative to `[prefix.]transport.redis_gateway.`
+        :type name: union(str, unicode)
+
+        :rtype: Counter
+        """
         return self.metrics.counter(self._get_metric_name(name))
 
     def _get_timer(self, name):
@@ -3,13 +3,20 @@ from __future__ import (
     unicode_literals,
 )
 
+import time
+
 from pysoa.common.metrics import TimerResolution
 from pysoa.common.transport.base import ServerTransport
 from pysoa.common.transport.exceptions import (
     InvalidMessageError,
+    MessageReceiveError,
     MessageReceiveTimeout,
 )
-from pysoa.common.transport.redis_gateway.constants import DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER
+from pysoa.common.transport.redis_gateway.constants import (
+    DEFAULT_ACTION_QUEUE,
+    DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER,
+    REDIS_BACKEND_TYPE_STREAMS,
+)
 from pysoa.common.transport.redis_gateway.core import RedisTransportCore
 from pysoa.common.transport.redis_gateway.settings import RedisTransportSchema
 from pysoa.common.transport.redis_gateway.utils import make_redis_queue_name
@@ -17,6 +24,9 @@ from pysoa.common.transport.redis_gateway.utils import make_redis_queue_name
 
 class RedisServerTransport(ServerTransport):
 
+    # How often (at most) the depth of each priority lane is sampled for the metrics
+    PRIORITY_LANE_DEPTH_SAMPLE_INTERVAL_IN_SECONDS = 10
+
     def __init__(self, service_name, metrics, **kwargs):
         """
         In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
@@ -32,7 +42,53 @@ class RedisServerTransport(ServerTransport):
         if 'maximum_message_size_in_bytes' not in kwargs:
             kwargs['maximum_message_size_in_bytes'] = DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER
 
-        self._receive_queue_name = make_redis_queue_name(service_name)
+        self._pop_next_request_with_response = kwargs.pop('pop_next_request_with_response', False)
+
+        # This is a client-only setting
+        kwargs.pop('multiplex_response_queue', None)
+
+        # These are client-only backend settings: servers must pop requests from every server in turn, because if they
+        # favored the servers with shorter queues, requests on servers with longer queues would wait even longer
+        if 'backend_layer_kwargs' in kwargs:
+            kwargs['backend_layer_kwargs'] = {
+                key: value for key, value in kwargs['backend_layer_kwargs'].items()
+                if key not in ('request_queue_strategy', 'queue_depth_sample_interval_in_seconds')
+            }
+
+        self._priority_lanes = kwargs.pop('priority_lanes', 1)
+        self._priority_lane_starvation_guard = kwargs.pop('priority_lane_starvation_guard', 0)
+
+        # By default, servers receive requests from the default action queue and from all the other action queues
+        action_queues = set(kwargs.pop('action_queues', {}).values()) | {DEFAULT_ACTION_QUEUE}
+        receive_queues = kwargs.pop('receive_queues', None)
+        if receive_queues is None:
+            receive_queues = [DEFAULT_ACTION_QUEUE] + sorted(action_queues - {DEFAULT_ACTION_QUEUE})
+        elif not receive_queues or not set(receive_queues).issubset(action_queues):
+            raise ValueError('receive_queues must name one or more of the action queues {}, got {}'.format(
+                sorted(action_queues),
+                receive_queues,
+            ))
+
+        # The queues are popped in order of priority lane first, and then in the order of the receive queues
+        self._receive_queue_names_by_lane = [
+            [make_redis_queue_name(service_name, lane, action_queue) for action_queue in receive_queues]
+            for lane in range(self._priority_lanes)
+        ]
+        self._receive_queue_names = [name for names in self._receive_queue_names_by_lane for name in names]
+        self._receive_queue_name = self._receive_queue_names[0]
+        if len(self._receive_queue_names) > 1:
+            if kwargs.get('backend_type') == REDIS_BACKEND_TYPE_STREAMS:
+                raise ValueError(
+                    'A server cannot receive from more than one queue (with priority_lanes or action_queues) with the '
+                    'Redis Streams backend type',
+                )
+            # Requests popped ahead of time from one queue would be handled ahead of requests sent to queues that come
+            # before it in the meantime
+            self._pop_next_request_with_response = False
+
+        self._requests_received = 0
+        self._priority_lane_depths_sampled = 0
+        self._streams = kwargs.get('backend_type') == REDIS_BACKEND_TYPE_STREAMS
         self.core = RedisTransportCore(service_name=service_name, metrics=metrics, metrics_prefix='server', **kwargs)
 
     def receive_request_message(self):
@@ -40,6 +96,8 @@ class RedisServerTransport(ServerTransport):
         timer.start()
         stop_timer = True
         try:
+            if len(self._receive_queue_names) > 1:
+                return self._receive_request_message_from_queues()
             return self.core.receive_message(self._receive_queue_name)
         except MessageReceiveTimeout:
             stop_timer = False
@@ -48,6 +106,73 @@ class RedisServerTransport(ServerTransport):
             if stop_timer:
                 timer.stop()
 
+    def _receive_request_message_from_queues(self):
+        if self._priority_lanes < 2:
+            _, request_id, meta, body = self.core.receive_prioritized_message(self._receive_queue_names)
+            return request_id, meta, body
+
+        if self._priority_lane_depths_sampled + self.PRIORITY_LANE_DEPTH_SAMPLE_INTERVAL_IN_SECONDS < time.time():
+            self._sample_priority_lane_depths()
+
+        # All the queues are popped with one multi-key BLPOP, which pops from the first queue with a request in it, and
+        # the starvation guard reverses the lanes every so often, so that a busy high-priority lane cannot starve the
+        # lower-priority lanes forever
+        lanes = list(range(self._priority_lanes))
+        if (
+            self._priority_lane_starvation_guard and
+            (self._requests_received + 1) % self._priority_lane_starvation_guard == 0
+        ):
+            lanes.reverse()
+        queue_names = [name for lane in lanes for name in self._receive_queue_names_by_lane[lane]]
+
+        index, request_id, meta, body = self.core.receive_prioritized_message(queue_names)
+        lane = lanes[index // len(self._receive_queue_names_by_lane[0])]
+        self._requests_received += 1
+
+        # The ratio of these two counters is the average time a request waited in the lane
+        self.core.get_counter('receive.priority_lane_{}'.format(lane)).increment()
+        sent = meta.get('__sent__')
+        if sent:
+            self.core.get_counter('receive.priority_lane_{}.wait_milliseconds'.format(lane)).increment(
+                max(int((time.time() - sent) * 1000), 0),
+            )
+
+        return request_id, meta, body
+
+    def _sample_priority_lane_depths(self):
+        self._priority_lane_depths_sampled = time.time()
+        try:
+            depths = self.core.get_queue_depths(self._receive_queue_names)
+        except MessageReceiveError:
+            # The error was counted by the core, and the next receive will likely run into it, too
+            return
+
+        # The ratio of these two counters is the average depth of the lane, across the queues the server receives from
+        queues_per_lane = len(self._receive_queue_names_by_lane[0])
+        for lane in range(self._priority_lanes):
+            self.core.get_counter('receive.priority_lane_{}.depth_sample'.format(lane)).increment()
+            self.core.get_counter('receive.priority_lane_{}.depth'.format(lane)).increment(
+                sum(depths[lane * queues_per_lane:(lane + 1) * queues_per_lane]),
+            )
+
+    def receive_queued_request_messages(self, maximum_messages):
+        if len(self._receive_queue_names) > 1:
+            # Requests received ahead of time from one queue would be handled ahead of requests sent to queues that come
+            # before it in the meantime
+            return []
+        return self.core.receive_queued_messages(self._receive_queue_name, maximum_messages)
+
+    def get_request_queue_depth(self):
+        if self._streams:
+            # Requests in a stream remain in it after they are read, so its length is not the number of requests waiting
+            return None
+        return sum(self.core.get_queue_depths(self._receive_queue_names))
+
+    @property
+    def can_handle_requests_concurrently(self):
+        # Requests read from a stream are acknowledged when the next request is received
+        return not self._streams
+
     def send_response_message(self, request_id, meta, body):
         try:
             queue_name = meta['reply_to']
@@ -55,8 +180,31 @@ class RedisServerTransport(ServerTransport):
             self.metrics.counter('server.transport.redis_gateway.send.error.missing_reply_queue')
             raise InvalidMessageError('Missing reply queue name')
 
+        # The response meta is the request meta, so it tells whether the client accepts a compressed response, and then
+        # it is replaced with whether this server accepts compressed requests
+        compress = self.core.accepts_compression(meta)
+        self.core.advertise_compression(meta)
+
         with self.metrics.timer('server.transport.redis_gateway.send', resolution=TimerResolution.MICROSECONDS):
-            self.core.send_message(queue_name, request_id, meta, body)
+            if self._pop_next_request_with_response:
+                self.core.send_message_and_receive_next(
+                    queue_name,
+                    request_id,
+                    meta,
+                    body,
+                    self._receive_queue_name,
+                    compress=compress,
+                )
+            else:
+                self.core.send_message(queue_name, request_id, meta, body, compress=compress)
+
+    def close(self):
+        """
+        Returns any requests that were received in a batch but not yet handed to the server back to the request queue,
+        so that other servers can handle them (or, with the Redis Streams backend type, acknowledges the requests that
+        were handled and leaves the rest pending for other servers to reclaim).
+        """
+        self.core.return_buffered_messages()
 
 
 RedisServerTransport.settings_schema = RedisTransportSchema(RedisServerTransport)
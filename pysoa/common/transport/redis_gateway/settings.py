@@ -7,7 +7,11 @@ from conformity import fields
 
 from pysoa.common.serializer.base import Serializer as BaseSerializer
 from pysoa.common.settings import BasicClassSchema
-from pysoa.common.transport.redis_gateway.constants import REDIS_BACKEND_TYPES
+from pysoa.common.transport.redis_gateway.constants import (
+    REDIS_BACKEND_TYPES,
+    REDIS_REQUEST_QUEUE_STRATEGIES,
+    REDIS_RING_STRATEGIES,
+)
 
 
 class RedisTransportSchema(BasicClassSchema):
@@ -30,37 +34,112 @@ class RedisTransportSchema(BasicClassSchema):
                             description='The list of Redis hosts, where each is a tuple of `("address", port)` or the '
                                         'simple string address.',
                         ),
+                        'queue_depth_sample_interval_in_seconds': fields.Any(
+                            fields.Integer(gt=0),
+                            fields.Float(gt=0),
+                            description='How long the "power_of_two_choices" request queue strategy trusts the depth '
+                                        'of a request queue on a Redis server, as reported by the last send to it '
+                                        '(defaults to 1 second)',
+                        ),
                         'redis_db': fields.Integer(
                             description='The Redis database, a shortcut for putting this in `connection_kwargs`.',
                         ),
                         'redis_port': fields.Integer(
                             description='The port number, a shortcut for putting this on all hosts',
                         ),
+                        'request_queue_strategy': fields.Constant(
+                            *REDIS_REQUEST_QUEUE_STRATEGIES,
+                            description='How a client decides to which Redis server to send each request: '
+                                        '"round_robin" (the default) sends to each server in turn, while '
+                                        '"power_of_two_choices" picks two servers at random and sends to the less '
+                                        'loaded, judged by the recent latency and error rate of sends to each server '
+                                        'and the request queue depth reported by recent sends to each server. Servers '
+                                        'ignore this setting.'
+                        ),
+                        'ring_strategy': fields.Constant(
+                            *REDIS_RING_STRATEGIES,
+                            description='How to decide which Redis server holds each response queue: "crc32" (the '
+                                        'default) divides CRC32 buckets evenly across the servers, "rendezvous" uses '
+                                        'weighted rendezvous hashing, and "jump" uses jump consistent hashing. When '
+                                        'servers are added or removed, "rendezvous" moves only about 1/N of response '
+                                        'queues (as does "jump", when adding or removing the last server), while '
+                                        '"crc32" moves most of them.'
+                        ),
+                        'ring_weights': fields.List(
+                            fields.Any(fields.Integer(gt=0), fields.Float(gt=0)),
+                            description='The relative weight of each server, in the same order as `hosts` (or '
+                                        '`sentinel_services`, which are then required), for the "rendezvous" ring '
+                                        'strategy only (all servers have equal weight by default)',
+                        ),
                         'sentinel_failover_retries': fields.Integer(
                             description='How many times to retry (with a delay) getting a connection from the Sentinel '
                                         'when a master cannot be found (cluster is in the middle of a failover); '
                                         'should only be used for Sentinel backend type'
                         ),
+                        'sentinel_refresh_interval_in_seconds': fields.Any(
+                            fields.Integer(gte=0),
+                            fields.Float(gte=0),
+                            description='If greater than 0, a background thread discovers the Sentinel masters up '
+                                        'front, on `+switch-master` events, when a server turns out not to be a '
+                                        'master, and at least this often, so that getting a connection never waits on '
+                                        'Sentinel (disabled by default); should only be used for Sentinel backend type',
+                        ),
                         'sentinel_services': fields.List(
                             fields.UnicodeString(),
                             description='A list of Sentinel services (will be discovered by default); should only be '
                                         'used for Sentinel backend type',
                         ),
+                        'stream_visibility_timeout_in_seconds': fields.Integer(
+                            gt=0,
+                            description='How long a request read by one server must remain unacknowledged before '
+                                        'another server may reclaim it (defaults to 60 seconds); should only be used '
+                                        'for Redis Streams backend type',
+                        ),
                     },
                     optional_keys=[
                         'connection_kwargs',
                         'hosts',
+                        'queue_depth_sample_interval_in_seconds',
                         'redis_db',
                         'redis_port',
+                        'request_queue_strategy',
+                        'ring_strategy',
+                        'ring_weights',
                         'sentinel_failover_retries',
+                        'sentinel_refresh_interval_in_seconds',
                         'sentinel_services',
+                        'stream_visibility_timeout_in_seconds',
                     ],
                     allow_extra_keys=False,
                     description='The arguments passed to the Redis connection manager',
                 ),
+                'action_queues': fields.SchemalessDictionary(
+                    key_type=fields.UnicodeString(),
+                    value_type=fields.UnicodeString(),
+                    description='A map of action names to the names of the action queues (separate request queues) '
+                                'to which jobs with those actions are sent, so that slow actions can be handled by '
+                                'servers of their own. A job goes to the action queue of the first of its actions '
+                                'that has one, and other jobs go to the `default` action queue, which is the '
+                                "service's main request queue. Clients and servers must agree on this setting.",
+                ),
                 'backend_type': fields.Constant(
                     *REDIS_BACKEND_TYPES,
-                    description='Which backend (standard or sentinel) should be used for this Redis transport'
+                    description='Which backend (standard, sentinel, or streams) should be used for this Redis transport'
+                ),
+                'chunk_size_in_bytes': fields.Integer(
+                    gte=0,
+                    description='If greater than 0, messages larger than `maximum_message_size_in_bytes` (but no '
+                                'larger than `maximum_chunked_message_size_in_bytes`) are split into chunks of this '
+                                'many bytes, stored in Redis under expiring keys, and sent as a small manifest from '
+                                'which the receiver reassembles them (defaults to 0, which disables chunking). Chunked '
+                                'messages are always accepted, whatever this setting.',
+                ),
+                'compress_messages_larger_than_bytes': fields.Integer(
+                    gte=0,
+                    description='Serialized messages larger than this many bytes are compressed with zlib before they '
+                                'are sent, but only to a receiver that has advertised (in message meta information) '
+                                'that it accepts compressed messages (defaults to 0, which disables compression and '
+                                'the advertisement). Compressed messages are always accepted, whatever this setting.',
                 ),
                 'log_messages_larger_than_bytes': fields.Integer(
                     description='By default, messages larger than 100KB that do not trigger errors (see '
@@ -73,15 +152,59 @@ class RedisTransportSchema(BasicClassSchema):
                     description='The maximum message size, in bytes, that is permitted to be transmitted over this '
                                 'transport (defaults to 100KB on the client and 250KB on the server)',
                 ),
+                'maximum_chunked_message_size_in_bytes': fields.Integer(
+                    description='The maximum size, in bytes, of a message that is permitted to be sent in chunks when '
+                                '`chunk_size_in_bytes` is enabled (defaults to 10MB)',
+                ),
                 'message_expiry_in_seconds': fields.Integer(
                     description='How long after a message is sent that it is considered expired, dropped from queue',
                 ),
+                'multiplex_response_queue': fields.Boolean(
+                    description='Client only: Whether all threads using this transport should share one reply queue, '
+                                'popped by one background dispatcher thread that routes each response by request ID to '
+                                'the thread that sent the request (defaults to false, in which case every thread has '
+                                'its own reply queue and blocks on its own Redis connection).',
+                ),
+                'pop_next_request_with_response': fields.Boolean(
+                    description='Server only: Whether to send each response and non-blockingly pop the next request(s) '
+                                '(up to `receive_batch_size`) in a single Redis round trip (defaults to false). The '
+                                'server only blocks waiting for the next request if none was popped this way.',
+                ),
+                'priority_lanes': fields.Integer(
+                    gte=1,
+                    description='The number of priority lanes (separate request queues) for the service (defaults to '
+                                '1, which disables priority lanes). Clients send each request to the lane given by '
+                                'the `priority` in its control header, from 0 (the highest priority, and the default) '
+                                'up, and servers pop the lanes in priority order. Clients and servers must agree on '
+                                'this setting, and it cannot be used with the Redis Streams backend type.',
+                ),
+                'priority_lane_starvation_guard': fields.Integer(
+                    gte=0,
+                    description='Server only: If greater than 0, every this many requests, the server pops the lanes '
+                                'in reverse priority order, so that lower-priority requests are still handled when the '
+                                'higher-priority lanes are never empty (defaults to 0, which disables this)',
+                ),
                 'queue_capacity': fields.Integer(
                     description='The capacity of the message queue to which this transport will send messages',
                 ),
                 'queue_full_retries': fields.Integer(
                     description='How many times to retry sending a message to a full queue before giving up',
                 ),
+                'receive_batch_size': fields.Integer(
+                    gte=1,
+                    description='The maximum number of messages to pop from Redis in a single round trip (defaults to '
+                                '1). When greater than 1, messages beyond the first are kept in a bounded in-process '
+                                'buffer and handed out before Redis is consulted again, and any still in the buffer '
+                                'are returned to the queue on graceful shutdown. This is meant for servers under heavy '
+                                'load; messages are checked for expiry when they leave the buffer.',
+                ),
+                'receive_queues': fields.List(
+                    fields.UnicodeString(),
+                    min_length=1,
+                    description='Server only: The names of the action queues from which the server receives '
+                                'requests, in order of precedence, among `default` and the action queues in '
+                                '`action_queues` (defaults to all of them, `default` first)',
+                ),
                 'receive_timeout_in_seconds': fields.Integer(
                     description='How long to block waiting on a message to be received',
                 ),
@@ -89,16 +212,34 @@ class RedisTransportSchema(BasicClassSchema):
                     object_type=BaseSerializer,
                     description='The configuration for the serializer this transport should use',
                 ),
+                'use_message_envelope': fields.Boolean(
+                    description='Whether to send messages in a binary envelope, with a fixed-size header holding the '
+                                'request ID and expiry, so that receivers can discard expired or unwanted messages '
+                                'without deserializing them (defaults to false). Enveloped messages are always '
+                                'accepted, whatever this setting, so enable it only once every client and server of '
+                                'the service has been upgraded to a version that accepts them.',
+                ),
             },
             optional_keys=[
+                'action_queues',
                 'backend_layer_kwargs',
+                'chunk_size_in_bytes',
+                'compress_messages_larger_than_bytes',
                 'log_messages_larger_than_bytes',
+                'maximum_chunked_message_size_in_bytes',
                 'maximum_message_size_in_bytes',
                 'message_expiry_in_seconds',
+                'multiplex_response_queue',
+                'pop_next_request_with_response',
+                'priority_lane_starvation_guard',
+                'priority_lanes',
                 'queue_capacity',
                 'queue_full_retries',
+                'receive_batch_size',
+                'receive_queues',
                 'receive_timeout_in_seconds',
                 'serializer_config',
+                'use_message_envelope',
             ],
             allow_extra_keys=False,
         ),
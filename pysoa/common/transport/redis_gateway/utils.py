@@ -1,5 +1,14 @@
 from __future__ import unicode_literals
 
+from pysoa.common.transport.redis_gateway.constants import DEFAULT_ACTION_QUEUE
 
-def make_redis_queue_name(service_name):
-    return 'service.' + service_name
+
+def make_redis_queue_name(service_name, priority_lane=0, action_queue=None):
+    # The service's original queue is the default action queue's highest-priority lane, so that servers and clients
+    # that do not use action queues or priority lanes still share it with those that do
+    queue_name = 'service.' + service_name
+    if action_queue and action_queue != DEFAULT_ACTION_QUEUE:
+        queue_name = '{}.queue_{}'.format(queue_name, action_queue)
+    if priority_lane:
+        queue_name = '{}.priority_{}'.format(queue_name, priority_lane)
+    return queue_name
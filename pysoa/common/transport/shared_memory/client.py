@@ -0,0 +1,263 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import atexit
+import os
+import threading
+import uuid
+
+import six
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.transport.base import ClientTransport
+from pysoa.common.transport.exceptions import (
+    MessageReceiveTimeout,
+    MessageSendError,
+)
+from pysoa.common.transport.shared_memory.core import (
+    DEFAULT_REQUEST_RING_CAPACITY_BYTES,
+    DEFAULT_RESPONSE_RING_CAPACITY_BYTES,
+    REQUEST_RING_NAME,
+    SharedMemoryTransportCore,
+)
+from pysoa.common.transport.shared_memory.settings import SharedMemoryTransportSchema
+
+
+class ResponseRingPool(object):
+    """
+    Keeps the idle response rings of a process for reuse, so that clients, which are often created and discarded for
+    each job handled by a server, do not each create rings of their own. Rings are only ever used by one thread at a
+    time: a thread takes a ring from the pool when it sends a request with no responses outstanding, and returns it to
+    the pool once it has received all the responses. The rings the process created are removed when it exits.
+    After a fork, the child process forgets the rings it inherited and creates its own.
+    """
+
+    def __init__(self, core, capacity_in_bytes):
+        """
+        :param core: The core of the transport that first uses the pool, with which rings are created and removed
+        :type core: SharedMemoryTransportCore
+        :param capacity_in_bytes: The capacity of each ring
+        :type capacity_in_bytes: int
+        """
+        self.core = core
+        self.capacity_in_bytes = capacity_in_bytes
+
+        self._lock = threading.Lock()
+        self._idle_rings = []
+        self._created_ring_names = set()
+        self._pid = os.getpid()
+
+    def get_ring(self):
+        """
+        Get an idle response ring, or else create a new one.
+
+        :return: A tuple of the ring's name, the ring buffer, and its doorbell
+        :rtype: tuple(union[str, unicode], RingBuffer, Doorbell)
+
+        :raise: IOError, OSError, ValueError
+        """
+        with self._lock:
+            self._check_pid()
+            if self._idle_rings:
+                return self._idle_rings.pop()
+
+            name = 'responses.{:x}.{}'.format(os.getpid(), uuid.uuid4().hex)
+            ring, doorbell = self.core.open_ring(name, self.capacity_in_bytes)
+            self._created_ring_names.add(name)
+            return name, ring, doorbell
+
+    def release_ring(self, rings):
+        """
+        Return a ring, with no responses outstanding, to the pool.
+        """
+        with self._lock:
+            self._check_pid()
+            if rings[0] in self._created_ring_names:
+                self._idle_rings.append(rings)
+
+    def remove_ring(self, rings):
+        """
+        Remove a ring to which responses that are no longer wanted may yet be written.
+        """
+        name, ring, doorbell = rings
+        ring.close()
+        doorbell.close()
+        with self._lock:
+            if name in self._created_ring_names:
+                self._created_ring_names.discard(name)
+                self.core.remove_ring(name)
+
+    def remove_all_rings(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for name in self._created_ring_names:
+                    self.core.remove_ring(name)
+                self._created_ring_names = set()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # The parent process still uses, and will remove, the rings it created
+            self._idle_rings = []
+            self._created_ring_names = set()
+            self._pid = os.getpid()
+
+
+class SharedMemoryClientTransport(ClientTransport):
+    """
+    A client transport that sends requests to, and receives responses from, servers on the same host through ring
+    buffers in shared memory. Requests are written to the request ring of the service, and each thread takes a response
+    ring from a per-process pool, sends all its requests with that ring as their reply-to, and returns the ring to the
+    pool once it has received all the responses.
+
+    If a response does not arrive in time, the ring is removed, and the responses to all the requests sent with it are
+    abandoned, so that a late response is never mistaken for the response to a later request.
+    """
+
+    # The response ring pools are shared by all transports with the same segment and ring capacity
+    _response_ring_pools = {}
+    _response_ring_pools_lock = threading.Lock()
+
+    def __init__(
+        self,
+        service_name,
+        metrics,
+        request_ring_capacity_in_bytes=DEFAULT_REQUEST_RING_CAPACITY_BYTES,
+        response_ring_capacity_in_bytes=DEFAULT_RESPONSE_RING_CAPACITY_BYTES,
+        **kwargs
+    ):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        shared memory transport settings schema.
+
+        :param service_name: The name of the service to which this transport will send requests (and from which it will
+                             receive responses)
+        :type service_name: union[str, unicode]
+        :param metrics: The optional metrics recorder
+        :type metrics: MetricsRecorder
+        """
+        super(SharedMemoryClientTransport, self).__init__(service_name, metrics)
+
+        self.core = SharedMemoryTransportCore(
+            service_name=service_name,
+            metrics=metrics,
+            metrics_prefix='client',
+            **kwargs
+        )
+        self.request_ring_capacity_in_bytes = request_ring_capacity_in_bytes
+
+        pool_key = (self.core.segment_path, response_ring_capacity_in_bytes)
+        with self._response_ring_pools_lock:
+            if pool_key not in self._response_ring_pools:
+                self._response_ring_pools[pool_key] = ResponseRingPool(self.core, response_ring_capacity_in_bytes)
+            self._pool = self._response_ring_pools[pool_key]
+
+        self._request_rings = None
+        self._request_rings_pid = None
+        self._request_rings_lock = threading.Lock()
+        self._thread_state = threading.local()
+
+    @property
+    def requests_outstanding(self):
+        """
+        Indicates the number of requests sent by the calling thread that still need to be received. If this value is
+        less than 1, calling `receive_response_message` will result in a return value of `(None, None, None)` instead of
+        raising a `MessageReceiveTimeout`.
+        """
+        return self._get_thread_state().requests_outstanding
+
+    def send_request_message(self, request_id, meta, body, message_expiry_in_seconds=None):
+        with self.metrics.timer('client.transport.shared_memory.send', resolution=TimerResolution.MICROSECONDS):
+            state = self._get_thread_state()
+            request_ring, request_doorbell = self._get_request_rings()
+
+            if state.rings is None:
+                try:
+                    state.rings = self._pool.get_ring()
+                except (IOError, OSError, ValueError) as e:
+                    self.core._get_counter('send.error.open_ring').increment()
+                    raise MessageSendError('Cannot create a response ring for service {}: {!r}'.format(
+                        self.service_name,
+                        e,
+                    ))
+
+            meta['reply_to'] = state.rings[0]
+            try:
+                serialized_message = self.core.serialize_message(request_id, meta, body, message_expiry_in_seconds)
+                self.core.write_message(request_ring, request_doorbell, serialized_message)
+            except Exception:
+                if state.requests_outstanding < 1:
+                    self._pool.release_ring(state.rings)
+                    state.rings = None
+                raise
+            state.requests_outstanding += 1
+
+    def receive_response_message(self, receive_timeout_in_seconds=None):
+        state = self._get_thread_state()
+        if state.requests_outstanding < 1:
+            # This tells Client.get_all_responses to stop waiting for more.
+            return None, None, None
+
+        with self.metrics.timer('client.transport.shared_memory.receive', resolution=TimerResolution.MICROSECONDS):
+            _, ring, doorbell = state.rings
+            try:
+                message = self.core.read_message(
+                    ring,
+                    doorbell,
+                    receive_timeout_in_seconds or self.core.receive_timeout_in_seconds,
+                )
+            except Exception:
+                self._abandon_rings(state)
+                raise
+
+            if message is None:
+                self._abandon_rings(state)
+                self.core._get_counter('receive.error.timeout').increment()
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+            state.requests_outstanding -= 1
+            if state.requests_outstanding < 1:
+                self._pool.release_ring(state.rings)
+                state.rings = None
+
+            return message
+
+    def _abandon_rings(self, state):
+        self._pool.remove_ring(state.rings)
+        state.rings = None
+        state.requests_outstanding = 0
+
+    def _get_request_rings(self):
+        # Opening the request ring creates it, if no server has yet, so that requests can be sent before the servers
+        # start
+        with self._request_rings_lock:
+            if self._request_rings is None or self._request_rings_pid != os.getpid():
+                try:
+                    self._request_rings = self.core.open_ring(REQUEST_RING_NAME, self.request_ring_capacity_in_bytes)
+                except (IOError, OSError, ValueError) as e:
+                    self.core._get_counter('send.error.open_ring').increment()
+                    raise MessageSendError('Cannot open the request ring of service {}: {!r}'.format(
+                        self.service_name,
+                        e,
+                    ))
+                self._request_rings_pid = os.getpid()
+            return self._request_rings
+
+    def _get_thread_state(self):
+        state = self._thread_state
+        if getattr(state, 'pid', None) != os.getpid():
+            # A new thread, or a thread of a forked child, which must not use the rings of its parent
+            state.pid = os.getpid()
+            state.rings = None
+            state.requests_outstanding = 0
+        return state
+
+
+@atexit.register
+def _remove_response_rings():
+    for pool in list(six.itervalues(SharedMemoryClientTransport._response_ring_pools)):
+        pool.remove_all_rings()
+
+
+SharedMemoryClientTransport.settings_schema = SharedMemoryTransportSchema(SharedMemoryClientTransport)
@@ -0,0 +1,172 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import random
+import re
+import tempfile
+import time
+
+import attr
+
+from pysoa.common.serializer.msgpack_serializer import MsgpackSerializer
+from pysoa.common.transport.exceptions import (
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageTooLarge,
+)
+from pysoa.common.transport.shared_memory.ring import (
+    Doorbell,
+    RingBuffer,
+)
+from pysoa.common.transport.tcp.core import TCPTransportCore
+
+
+DEFAULT_MAXIMUM_MESSAGE_BYTES = 1024 * 1024
+DEFAULT_REQUEST_RING_CAPACITY_BYTES = 1024 * 1024 * 16
+DEFAULT_RESPONSE_RING_CAPACITY_BYTES = 1024 * 1024 * 4
+
+REQUEST_RING_NAME = 'requests'
+# Response rings are named for the client transport and thread that own them, and servers only open rings whose names
+# look like this, so that a request cannot make a server write to some other file
+RESPONSE_RING_NAME_RE = re.compile(r'^responses\.[0-9a-f]+\.[0-9a-f]+$')
+
+
+def get_default_directory():
+    # /dev/shm is a tmpfs on Linux, so the rings never touch a disk; elsewhere, the temporary directory will have to do
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def valid_queue_full_retries(_, __, value):
+    if value < 0:
+        raise ValueError('queue_full_retries must not be negative, got {}'.format(value))
+
+
+@attr.s()
+class SharedMemoryTransportCore(TCPTransportCore):
+    """
+    Serializes and checks messages just like the TCP transport (the message format is the same as that of the Redis
+    Gateway transport), and sends and receives them through ring buffers in a directory (the segment) shared by the
+    client and server processes of a service on the same host.
+    """
+
+    METRICS_TRANSPORT_NAME = 'shared_memory'
+    EXPONENTIAL_BACK_OFF_FACTOR = 4.0
+
+    directory = attr.ib(
+        # The directory in which the segment directories of all services are created
+        default=None,
+    )
+
+    maximum_message_size_in_bytes = attr.ib(
+        default=DEFAULT_MAXIMUM_MESSAGE_BYTES,
+        converter=int,
+    )
+
+    queue_full_retries = attr.ib(
+        # Number of times to retry when the ring to which a message is sent is full
+        default=10,
+        converter=int,
+        validator=valid_queue_full_retries,
+    )
+
+    @property
+    def segment_path(self):
+        return os.path.join(self.directory or get_default_directory(), 'pysoa-{}'.format(self.service_name))
+
+    def open_ring(self, name, capacity_in_bytes=None):
+        """
+        Open a ring buffer, and its doorbell, in the segment.
+
+        :param name: The name of the ring
+        :type name: union[str, unicode]
+        :param capacity_in_bytes: If set, the ring is created with this capacity if it does not exist
+        :type capacity_in_bytes: int
+
+        :return: A tuple of the ring buffer and its doorbell
+        :rtype: tuple(RingBuffer, Doorbell)
+
+        :raise: IOError, OSError, ValueError
+        """
+        path = os.path.join(self.segment_path, name)
+        if capacity_in_bytes:
+            try:
+                os.makedirs(self.segment_path, 0o700)
+            except OSError:
+                if not os.path.isdir(self.segment_path):
+                    raise
+            ring = RingBuffer.open_or_create(path, capacity_in_bytes)
+        else:
+            ring = RingBuffer(path)
+        try:
+            return ring, Doorbell(path + '.doorbell')
+        except Exception:
+            ring.close()
+            raise
+
+    def remove_ring(self, name):
+        for path in (os.path.join(self.segment_path, name), os.path.join(self.segment_path, name + '.doorbell')):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def write_message(self, ring, doorbell, serialized_message):
+        """
+        Write a serialized message to a ring and ring its doorbell, retrying (with an exponential back-off) while the
+        ring is full.
+
+        :raise: MessageSendError, MessageTooLarge
+        """
+        for i in range(-1, self.queue_full_retries):
+            if i >= 0:
+                self._get_counter('send.queue_full_retry').increment()
+                time.sleep((2 ** i + random.random()) / self.EXPONENTIAL_BACK_OFF_FACTOR / 100)
+            try:
+                with self._get_timer('send.write_to_ring'):
+                    written = ring.write(serialized_message)
+            except ValueError:
+                self._get_counter('send.error.message_too_large').increment()
+                raise MessageTooLarge(len(serialized_message))
+            if written:
+                doorbell.ring()
+                return
+
+        self._get_counter('send.error.ring_full').increment()
+        raise MessageSendError('Ring {} was full after {} retries'.format(ring.path, self.queue_full_retries))
+
+    def read_message(self, ring, doorbell, timeout_in_seconds):
+        """
+        Read the next message from a ring, deserializing it straight from the ring, and waiting for the doorbell if the
+        ring is empty. Expired messages are skipped.
+
+        :return: A tuple of request ID, message meta-information dict, and message body dict, or `None` if no message
+                 arrived before the timeout
+        :rtype: tuple(int, dict, dict)
+
+        :raise: InvalidMessage, InvalidMessageError (the invalid message is removed from the ring all the same)
+        """
+        deadline = time.time() + timeout_in_seconds
+        while True:
+            read, message = ring.read(self._deserialize_record)
+            if read:
+                if message is not None:
+                    return message
+                continue
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            doorbell.wait(remaining)
+
+    def _deserialize_record(self, view):
+        # The MessagePack serializer reads the record straight out of the ring; others need their own copy of it
+        if not isinstance(self.serializer, MsgpackSerializer):
+            view = bytes(view)
+        try:
+            return self.deserialize_message(view)
+        except MessageReceiveTimeout:
+            # Expired, and already counted
+            return None
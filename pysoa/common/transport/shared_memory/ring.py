@@ -0,0 +1,285 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import errno
+import fcntl
+import mmap
+import os
+import select
+import struct
+import tempfile
+import threading
+
+
+__all__ = (
+    'Doorbell',
+    'RingBuffer',
+)
+
+
+class RingBuffer(object):
+    """
+    A queue of variable-size records in a memory-mapped file (on a `tmpfs`, such as `/dev/shm`, it never touches a
+    disk), which any number of processes on the same host may open, write to, and read from. Each record is copied into
+    the ring once by its writer, and its reader is handed a `memoryview` of the record in the ring, so that it can be
+    deserialized without another copy.
+
+    The file starts with a header holding the ring's capacity and two byte counters that only ever grow: how many bytes
+    have been written (the head) and how many have been read (the tail). Each record is a 4-byte length followed by the
+    data. A record that does not fit before the end of the ring is written at its start instead, and the space skipped
+    at the end is marked with a wrap marker (if there is room for one). Writers and readers take an exclusive `flock` on
+    the file (and a lock in the process, since `flock` does not exclude threads sharing a file descriptor), which the
+    operating system releases if the process dies. A writer copies the record into the ring before it moves the head, so
+    a writer that dies part of the way through a record leaves nothing behind.
+    """
+
+    MAGIC = b'PSR1'
+    HEADER = struct.Struct(str('<4sIQQQ'))  # magic, unused, capacity, head, tail
+    HEAD_OFFSET = 16
+    TAIL_OFFSET = 24
+    COUNTER = struct.Struct(str('<Q'))
+    # The data starts on its own cache line, away from the counters
+    DATA_OFFSET = 64
+    RECORD_HEADER = struct.Struct(str('<I'))
+    WRAP_MARKER = 0xFFFFFFFF
+
+    def __init__(self, path):
+        """
+        Open an existing ring (use `open_or_create` to create one).
+
+        :param path: The path to the ring file
+        :type path: union[str, unicode]
+
+        :raise: IOError, OSError, ValueError
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR)
+        try:
+            self._mmap = mmap.mmap(self._fd, 0)
+            magic, _, self.capacity, _, _ = self.HEADER.unpack_from(self._mmap, 0)
+            if magic != self.MAGIC or len(self._mmap) != self.DATA_OFFSET + self.capacity:
+                self._mmap.close()
+                raise ValueError('{} is not a ring buffer'.format(path))
+        except Exception:
+            os.close(self._fd)
+            raise
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open_or_create(cls, path, capacity_in_bytes):
+        """
+        Open the ring, creating it first if it does not exist. The ring is created atomically, so if several processes
+        try to create it at once, they all open the same ring.
+
+        :param path: The path to the ring file
+        :type path: union[str, unicode]
+        :param capacity_in_bytes: The capacity of the ring, if it has to be created (an existing ring keeps its own)
+        :type capacity_in_bytes: int
+
+        :rtype: RingBuffer
+        """
+        if not os.path.exists(path):
+            fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.ring.')
+            try:
+                os.ftruncate(fd, cls.DATA_OFFSET + capacity_in_bytes)
+                os.write(fd, cls.HEADER.pack(cls.MAGIC, 0, capacity_in_bytes, 0, 0))
+                os.close(fd)
+                fd = None
+                try:
+                    # Linking, unlike renaming, fails if another process created the ring first
+                    os.link(temporary_path, path)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            finally:
+                if fd is not None:
+                    os.close(fd)
+                os.unlink(temporary_path)
+        return cls(path)
+
+    def write(self, data):
+        """
+        Write a record to the ring.
+
+        :param data: The record
+        :type data: bytes
+
+        :return: Whether there was room in the ring for the record
+        :rtype: bool
+
+        :raise: ValueError if the record could never fit in the ring
+        """
+        needed = self.RECORD_HEADER.size + len(data)
+        if needed > self.capacity:
+            raise ValueError('Record of {} bytes cannot fit in a ring of {} bytes'.format(len(data), self.capacity))
+
+        with self._locked():
+            head = self.COUNTER.unpack_from(self._mmap, self.HEAD_OFFSET)[0]
+            tail = self.COUNTER.unpack_from(self._mmap, self.TAIL_OFFSET)[0]
+            position = head % self.capacity
+            skip = self.capacity - position if self.capacity - position < needed else 0
+            if self.capacity - (head - tail) < skip + needed:
+                return False
+
+            if skip:
+                if skip >= self.RECORD_HEADER.size:
+                    self.RECORD_HEADER.pack_into(self._mmap, self.DATA_OFFSET + position, self.WRAP_MARKER)
+                head += skip
+                position = 0
+
+            start = self.DATA_OFFSET + position
+            self._mmap[start + self.RECORD_HEADER.size:start + needed] = data
+            self.RECORD_HEADER.pack_into(self._mmap, start, len(data))
+            self.COUNTER.pack_into(self._mmap, self.HEAD_OFFSET, head + needed)
+        return True
+
+    def read(self, handler):
+        """
+        Read the oldest record from the ring, if there is one, and pass it to the handler. The handler is called with a
+        `memoryview` of the record in the ring, while the ring is locked (so it should do no more than deserialize the
+        record or copy it), and the record is removed from the ring once the handler returns or raises.
+
+        :param handler: The callable to which the record is passed
+        :type handler: callable
+
+        :return: A tuple of whether a record was read and the value returned by the handler
+        :rtype: tuple(bool, any)
+        """
+        with self._locked():
+            head = self.COUNTER.unpack_from(self._mmap, self.HEAD_OFFSET)[0]
+            tail = self.COUNTER.unpack_from(self._mmap, self.TAIL_OFFSET)[0]
+            if head == tail:
+                return False, None
+
+            position = tail % self.capacity
+            remaining = self.capacity - position
+            if (
+                remaining < self.RECORD_HEADER.size or
+                self.RECORD_HEADER.unpack_from(self._mmap, self.DATA_OFFSET + position)[0] == self.WRAP_MARKER
+            ):
+                tail += remaining
+                position = 0
+
+            start = self.DATA_OFFSET + position + self.RECORD_HEADER.size
+            length = self.RECORD_HEADER.unpack_from(self._mmap, self.DATA_OFFSET + position)[0]
+            view = self._view(start, length)
+            try:
+                return True, handler(view)
+            finally:
+                if isinstance(view, memoryview):
+                    view.release()
+                self.COUNTER.pack_into(self._mmap, self.TAIL_OFFSET, tail + self.RECORD_HEADER.size + length)
+
+    @property
+    def used_bytes(self):
+        """
+        How many bytes of the ring hold records that have not been read, which is an indication of its depth.
+        """
+        with self._locked():
+            return (
+                self.COUNTER.unpack_from(self._mmap, self.HEAD_OFFSET)[0] -
+                self.COUNTER.unpack_from(self._mmap, self.TAIL_OFFSET)[0]
+            )
+
+    def close(self):
+        if self._fd is not None:
+            self._mmap.close()
+            os.close(self._fd)
+            self._fd = None
+
+    def _view(self, start, length):
+        try:
+            return memoryview(self._mmap)[start:start + length]
+        except TypeError:
+            # Python 2 memory maps do not support memoryview, so the record is copied
+            return self._mmap[start:start + length]
+
+    def _locked(self):
+        return _RingLock(self._lock, self._fd)
+
+
+class _RingLock(object):
+    def __init__(self, thread_lock, fd):
+        self._thread_lock = thread_lock
+        self._fd = fd
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def __exit__(self, *_):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+class Doorbell(object):
+    """
+    Wakes processes waiting for records in a ring buffer, using a named pipe (FIFO) beside the ring. Each time a writer
+    writes a record, it writes one byte to the pipe, and each waiting reader wakes when it can read a byte from the
+    pipe, so that, like a futex or semaphore, each record wakes at most one reader. A reader always reads the ring until
+    it is empty before waiting, so bytes left over from records other readers took only cause a spurious wakeup, and a
+    byte that could not be written because the pipe was full is never needed.
+    """
+
+    def __init__(self, path):
+        """
+        Open the doorbell, creating its named pipe first if it does not exist.
+
+        :param path: The path to the named pipe
+        :type path: union[str, unicode]
+        """
+        self.path = path
+        try:
+            os.mkfifo(path, 0o600)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Opening for reading and writing never blocks waiting for the other end, and keeps the pipe open even while no
+        # other process has it open
+        self._fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def ring(self):
+        try:
+            os.write(self._fd, b'\x00')
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def wait(self, timeout_in_seconds):
+        """
+        Wait until the doorbell rings or the timeout elapses.
+
+        :param timeout_in_seconds: How long to wait
+        :type timeout_in_seconds: float
+
+        :return: Whether the doorbell rang
+        :rtype: bool
+        """
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout_in_seconds)
+        except (select.error, OSError) as e:
+            if e.args and e.args[0] == errno.EINTR:
+                return False
+            raise
+        if not readable:
+            return False
+        try:
+            # Another reader may have taken the byte first, which is fine
+            return bool(os.read(self._fd, 1))
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            raise
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,144 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import collections
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.serializer.exceptions import InvalidMessage
+from pysoa.common.transport.base import ServerTransport
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveTimeout,
+    MessageSendError,
+)
+from pysoa.common.transport.shared_memory.core import (
+    DEFAULT_REQUEST_RING_CAPACITY_BYTES,
+    REQUEST_RING_NAME,
+    RESPONSE_RING_NAME_RE,
+    SharedMemoryTransportCore,
+)
+from pysoa.common.transport.shared_memory.settings import SharedMemoryTransportSchema
+
+
+class SharedMemoryServerTransport(ServerTransport):
+    """
+    A server transport that receives requests from, and sends responses to, clients on the same host through ring
+    buffers in shared memory, without a broker or a network stack in between. All the servers of a service on the host
+    (such as the processes forked by the standalone server) read from the same request ring, each taking the next
+    request when it is ready for one, and each response is written to the response ring of the client thread that sent
+    the request. If that client has gone away, the response is discarded.
+    """
+
+    MAXIMUM_OPEN_RESPONSE_RINGS = 256
+
+    def __init__(
+        self,
+        service_name,
+        metrics,
+        request_ring_capacity_in_bytes=DEFAULT_REQUEST_RING_CAPACITY_BYTES,
+        **kwargs
+    ):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        shared memory transport settings schema.
+
+        :param service_name: The name of the service for which this transport will receive requests and send responses
+        :type service_name: union[str, unicode]
+        :param metrics: The optional metrics recorder
+        :type metrics: MetricsRecorder
+        """
+        super(SharedMemoryServerTransport, self).__init__(service_name, metrics)
+
+        # This is a client-only setting
+        kwargs.pop('response_ring_capacity_in_bytes', None)
+
+        self.core = SharedMemoryTransportCore(
+            service_name=service_name,
+            metrics=metrics,
+            metrics_prefix='server',
+            **kwargs
+        )
+        self._request_ring, self._request_doorbell = self.core.open_ring(
+            REQUEST_RING_NAME,
+            request_ring_capacity_in_bytes,
+        )
+        # The response rings of the clients this server has recently responded to, least recently used first
+        self._response_rings = collections.OrderedDict()
+
+    def receive_request_message(self):
+        timer = self.metrics.timer('server.transport.shared_memory.receive', resolution=TimerResolution.MICROSECONDS)
+        timer.start()
+        stop_timer = True
+        try:
+            while True:
+                try:
+                    message = self.core.read_message(
+                        self._request_ring,
+                        self._request_doorbell,
+                        self.core.receive_timeout_in_seconds,
+                    )
+                except (InvalidMessage, InvalidMessageError):
+                    # The message has been removed from the ring, so move on to the next one
+                    self.core._get_counter('receive.error.invalid_message').increment()
+                    continue
+
+                if message is None:
+                    stop_timer = False
+                    raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+                return message
+        finally:
+            if stop_timer:
+                timer.stop()
+
+    def send_response_message(self, request_id, meta, body):
+        ring_name = meta.get('reply_to')
+        if not ring_name or not RESPONSE_RING_NAME_RE.match(ring_name):
+            self.metrics.counter('server.transport.shared_memory.send.error.missing_reply_queue').increment()
+            raise InvalidMessageError('Missing or invalid reply ring')
+
+        with self.metrics.timer('server.transport.shared_memory.send', resolution=TimerResolution.MICROSECONDS):
+            serialized_message = self.core.serialize_message(request_id, meta, body)
+
+            rings = self._get_response_rings(ring_name)
+            if rings is None:
+                # The client is no longer waiting for this response
+                self.core._get_counter('send.error.missing_response_ring').increment()
+                return
+
+            try:
+                self.core.write_message(rings[0], rings[1], serialized_message)
+            except MessageSendError:
+                # The client is not reading its responses, so it has likely gone away without removing its ring; do not
+                # let it stop the server from handling other requests
+                self._close_response_rings(ring_name)
+
+    def close(self):
+        for ring_name in list(self._response_rings):
+            self._close_response_rings(ring_name)
+        self._request_ring.close()
+        self._request_doorbell.close()
+
+    def _get_response_rings(self, ring_name):
+        rings = self._response_rings.pop(ring_name, None)
+        if rings is None:
+            try:
+                rings = self.core.open_ring(ring_name)
+            except (IOError, OSError, ValueError):
+                return None
+
+            while len(self._response_rings) >= self.MAXIMUM_OPEN_RESPONSE_RINGS:
+                self._close_response_rings(next(iter(self._response_rings)))
+
+        self._response_rings[ring_name] = rings
+        return rings
+
+    def _close_response_rings(self, ring_name):
+        rings = self._response_rings.pop(ring_name, None)
+        if rings:
+            rings[0].close()
+            rings[1].close()
+
+
+SharedMemoryServerTransport.settings_schema = SharedMemoryTransportSchema(SharedMemoryServerTransport)
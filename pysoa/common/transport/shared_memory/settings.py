@@ -0,0 +1,74 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+from conformity import fields
+
+from pysoa.common.serializer.base import Serializer as BaseSerializer
+from pysoa.common.settings import BasicClassSchema
+
+
+class SharedMemoryTransportSchema(BasicClassSchema):
+    contents = {
+        'path': fields.UnicodeString(
+            description='The path to the shared memory client or server transport, in the format '
+                        '`module.name:ClassName`',
+        ),
+        'kwargs': fields.Dictionary(
+            {
+                'directory': fields.UnicodeString(
+                    description='The directory in which the rings are created, in a sub-directory for the service, '
+                                'which must be the same for the clients and servers of the service (defaults to '
+                                '`/dev/shm` where it exists, and to the temporary directory otherwise)',
+                ),
+                'maximum_message_size_in_bytes': fields.Integer(
+                    gt=0,
+                    description='The maximum message size, in bytes, that is permitted to be transmitted over this '
+                                'transport (defaults to 1MB)',
+                ),
+                'message_expiry_in_seconds': fields.Integer(
+                    description='How long after a message is sent that it is considered expired and discarded by the '
+                                'receiver (defaults to 60 seconds)',
+                ),
+                'queue_full_retries': fields.Integer(
+                    gte=0,
+                    description='How many times to retry, with an exponential back-off, when the ring to which a '
+                                'message is sent is full (defaults to 10)',
+                ),
+                'receive_timeout_in_seconds': fields.Integer(
+                    description='How long to block waiting on a message to be received (defaults to 5 seconds)',
+                ),
+                'request_ring_capacity_in_bytes': fields.Integer(
+                    gt=0,
+                    description='The capacity of the ring that holds the requests of the service, shared by all its '
+                                'clients and servers on the host, used when the first of them creates it (defaults to '
+                                '16MB)',
+                ),
+                'response_ring_capacity_in_bytes': fields.Integer(
+                    gt=0,
+                    description='Client only: The capacity of the ring that holds the responses to each client thread '
+                                '(defaults to 4MB)',
+                ),
+                'serializer_config': BasicClassSchema(
+                    object_type=BaseSerializer,
+                    description='The configuration for the serializer this transport should use',
+                ),
+            },
+            optional_keys=[
+                'directory',
+                'maximum_message_size_in_bytes',
+                'message_expiry_in_seconds',
+                'queue_full_retries',
+                'receive_timeout_in_seconds',
+                'request_ring_capacity_in_bytes',
+                'response_ring_capacity_in_bytes',
+                'serializer_config',
+            ],
+            allow_extra_keys=False,
+        ),
+    }
+
+    optional_keys = ()
+
+    description = 'The settings for the shared memory transport'
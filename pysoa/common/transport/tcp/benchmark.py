@@ -0,0 +1,210 @@
+"""
+Measures the round-trip latency of requests over the TCP transport, the shared memory transport, and, if a Redis server
+is reachable, the Redis Gateway transport, on loopback. An echo server thread receives each request and sends it
+straight back, so the numbers are those of the transports alone (serialization included), not of a service. Run it
+with:
+
+    python -m pysoa.common.transport.tcp.benchmark --requests 10000 --pipeline 8 --redis-port 6379
+"""
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import argparse
+import shutil
+import tempfile
+import threading
+import timeit
+
+import redis
+
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.transport.redis_gateway.client import RedisClientTransport
+from pysoa.common.transport.redis_gateway.constants import REDIS_BACKEND_TYPE_STANDARD
+from pysoa.common.transport.redis_gateway.server import RedisServerTransport
+from pysoa.common.transport.shared_memory.client import SharedMemoryClientTransport
+from pysoa.common.transport.shared_memory.server import SharedMemoryServerTransport
+from pysoa.common.transport.tcp.client import TCPClientTransport
+from pysoa.common.transport.tcp.server import TCPServerTransport
+
+
+__all__ = (
+    'benchmark_transport',
+    'main',
+)
+
+
+SERVICE_NAME = 'transport_benchmark'
+
+
+class _EchoServer(threading.Thread):
+    def __init__(self, transport):
+        super(_EchoServer, self).__init__(name='pysoa-transport-benchmark-server')
+        self.daemon = True
+        self._transport = transport
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                request_id, meta, body = self._transport.receive_request_message()
+            except MessageReceiveTimeout:
+                continue
+            self._transport.send_response_message(request_id, meta, body)
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+        self._transport.close()
+
+
+def _percentile(sorted_values, percentile):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100.0))]
+
+
+def benchmark_transport(client_transport, server_transport, requests, pipeline=1, body_size=100):
+    """
+    Measure one pair of transports.
+
+    :param client_transport: The client transport
+    :type client_transport: ClientTransport
+    :param server_transport: The server transport, which must receive the requests the client transport sends
+    :type server_transport: ServerTransport
+    :param requests: How many requests to send
+    :type requests: int
+    :param pipeline: How many requests to send at once (with `send_request_messages`) before receiving their responses
+    :type pipeline: int
+    :param body_size: The size of the string in each request body, in characters
+    :type body_size: int
+
+    :return: A dict with the `p50`, `p99`, and `max` round-trip latencies in microseconds (when pipelining, the time
+             from sending a batch of requests to receiving each response), and the `throughput` in requests per second
+    :rtype: dict
+    """
+    server = _EchoServer(server_transport)
+    server.start()
+    try:
+        body = {'payload': 'x' * body_size}
+        latencies = []
+        request_id = 0
+
+        # Warm up connections (and, for Redis, script loading) before measuring
+        client_transport.send_request_message(0, {}, body)
+        client_transport.receive_response_message(5)
+
+        started = timeit.default_timer()
+        while request_id < requests:
+            batch = [(request_id + i, {}, body, None) for i in range(min(pipeline, requests - request_id))]
+            request_id += len(batch)
+
+            sent = timeit.default_timer()
+            if len(batch) == 1:
+                client_transport.send_request_message(*batch[0][:3])
+            else:
+                client_transport.send_request_messages(batch)
+            for _ in batch:
+                client_transport.receive_response_message(5)
+                latencies.append((timeit.default_timer() - sent) * 1000000)
+        elapsed = timeit.default_timer() - started
+    finally:
+        server.stop()
+
+    latencies.sort()
+    return {
+        'p50': _percentile(latencies, 50),
+        'p99': _percentile(latencies, 99),
+        'max': latencies[-1],
+        'throughput': requests / elapsed,
+    }
+
+
+def _make_tcp_transports():
+    server_transport = TCPServerTransport(
+        SERVICE_NAME,
+        NoOpMetricsRecorder(),
+        bind_address='127.0.0.1',
+        port=0,
+        receive_timeout_in_seconds=1,
+    )
+    client_transport = TCPClientTransport(
+        SERVICE_NAME,
+        NoOpMetricsRecorder(),
+        hosts=[server_transport.address],
+    )
+    return client_transport, server_transport
+
+
+def _make_shared_memory_transports(directory):
+    server_transport = SharedMemoryServerTransport(
+        SERVICE_NAME,
+        NoOpMetricsRecorder(),
+        directory=directory,
+        receive_timeout_in_seconds=1,
+    )
+    client_transport = SharedMemoryClientTransport(SERVICE_NAME, NoOpMetricsRecorder(), directory=directory)
+    return client_transport, server_transport
+
+
+def _make_redis_transports(port):
+    kwargs = {
+        'backend_type': REDIS_BACKEND_TYPE_STANDARD,
+        'backend_layer_kwargs': {'hosts': [('127.0.0.1', port)]},
+        'receive_timeout_in_seconds': 1,
+    }
+    return (
+        RedisClientTransport(SERVICE_NAME, NoOpMetricsRecorder(), **kwargs),
+        RedisServerTransport(SERVICE_NAME, NoOpMetricsRecorder(), **kwargs),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the TCP and shared memory transports against the Redis Gateway transport.',
+    )
+    parser.add_argument('--requests', type=int, default=5000, help='The number of requests to send')
+    parser.add_argument('--pipeline', type=int, default=1, help='The number of requests to send at once')
+    parser.add_argument('--body-size', type=int, default=100, help='The size of each request body, in characters')
+    parser.add_argument(
+        '--redis-port',
+        type=int,
+        default=6379,
+        help='The port of a Redis server on loopback (the Redis Gateway transport is skipped if none is reachable)',
+    )
+    args = parser.parse_args(argv)
+
+    print('{} requests with {}-character bodies, {} at a time, on loopback; latencies in microseconds'.format(
+        args.requests,
+        args.body_size,
+        args.pipeline,
+    ))
+
+    directory = tempfile.mkdtemp()
+    transports = [('tcp', _make_tcp_transports), ('shared_memory', lambda: _make_shared_memory_transports(directory))]
+    try:
+        redis.StrictRedis(port=args.redis_port, socket_connect_timeout=1).ping()
+        transports.append(('redis_gateway', lambda: _make_redis_transports(args.redis_port)))
+    except redis.exceptions.ConnectionError:
+        print('\nredis_gateway: skipped, no Redis server on port {}'.format(args.redis_port))
+
+    try:
+        for name, make_transports in transports:
+            client_transport, server_transport = make_transports()
+            result = benchmark_transport(
+                client_transport,
+                server_transport,
+                args.requests,
+                args.pipeline,
+                args.body_size,
+            )
+            print('\n{}:'.format(name))
+            print('  p50 {:.0f}, p99 {:.0f}, max {:.0f}'.format(result['p50'], result['p99'], result['max']))
+            print('  throughput: {:.0f} requests per second'.format(result['throughput']))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
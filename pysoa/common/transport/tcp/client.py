@@ -0,0 +1,383 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import collections
+import os
+import random
+import select
+import socket
+import threading
+import time
+
+import six
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.transport.base import ClientTransport
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageTooLarge,
+)
+from pysoa.common.transport.tcp.core import (
+    DEFAULT_TCP_PORT,
+    ConnectionClosed,
+    FramedConnection,
+    TCPTransportCore,
+)
+from pysoa.common.transport.tcp.settings import TCPTransportSchema
+
+
+class TCPConnectionPool(object):
+    """
+    Keeps idle connections to each server open for reuse, so that sending a request rarely has to wait for a connection
+    to be established. Connections are only ever used by one thread at a time: a thread takes a connection from the
+    pool, sends its requests and receives their responses on it, and returns it to the pool once no responses are
+    outstanding.
+    After a fork, the child process discards the connections it inherited and starts its own.
+    """
+
+    def __init__(self, connect_timeout_in_seconds, maximum_idle_connections_per_host, maximum_frame_size_in_bytes):
+        """
+        :param connect_timeout_in_seconds: How long to wait for a new connection to be established
+        :type connect_timeout_in_seconds: float
+        :param maximum_idle_connections_per_host: How many idle connections to keep for each server
+        :type maximum_idle_connections_per_host: int
+        :param maximum_frame_size_in_bytes: The largest response that connections may receive
+        :type maximum_frame_size_in_bytes: int
+        """
+        self.connect_timeout_in_seconds = connect_timeout_in_seconds
+        self.maximum_idle_connections_per_host = maximum_idle_connections_per_host
+        self.maximum_frame_size_in_bytes = maximum_frame_size_in_bytes
+
+        self._lock = threading.Lock()
+        self._idle_connections = {}
+        self._pid = os.getpid()
+
+    def get_connection(self, address):
+        """
+        Get an idle connection to the server, or else establish a new one.
+
+        :param address: The address and port of the server
+        :type address: tuple(union[str, unicode], int)
+
+        :return: A tuple of the connection and whether it was reused (and so, despite checking, may have been closed by
+                 the server while it was idle)
+        :rtype: tuple(FramedConnection, bool)
+
+        :raise: socket.error
+        """
+        with self._lock:
+            self._check_pid()
+            idle_connections = self._idle_connections.get(address, [])
+            while idle_connections:
+                connection = idle_connections.pop()
+                if not connection.is_closed_by_peer():
+                    return connection, True
+                connection.close()
+
+        return FramedConnection(
+            socket.create_connection(address, timeout=self.connect_timeout_in_seconds),
+            address,
+            self.maximum_frame_size_in_bytes,
+        ), False
+
+    def release_connection(self, connection):
+        """
+        Return a connection, with no responses outstanding, to the pool.
+
+        :param connection: The connection
+        :type connection: FramedConnection
+        """
+        if connection.closed:
+            return
+
+        with self._lock:
+            self._check_pid()
+            idle_connections = self._idle_connections.setdefault(connection.address, [])
+            if len(idle_connections) < self.maximum_idle_connections_per_host:
+                idle_connections.append(connection)
+                return
+
+        connection.close()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Closing the inherited sockets in the child does not close the parent's connections
+            for idle_connections in six.itervalues(self._idle_connections):
+                for connection in idle_connections:
+                    connection.close()
+            self._idle_connections = {}
+            self._pid = os.getpid()
+
+
+class TCPClientTransport(ClientTransport):
+    """
+    A client transport that sends requests directly to the servers of a service over persistent TCP connections, without
+    a broker in between. Each thread takes connections from a per-process pool, pipelines its requests on them without
+    waiting for responses, and returns each connection to the pool once it has received all the responses sent on it.
+
+    Since a connection is handled by one server process, which handles its requests one at a time, a thread spreads the
+    requests it has outstanding across up to `maximum_connections_per_thread` connections (each sending the requests
+    sent on it in a single write), so that the requests sent by `call_actions_parallel` and friends can be handled by
+    several server processes at once.
+
+    If a response does not arrive in time, or a connection breaks, the thread's connections are closed, and the
+    responses to all the requests sent on them are abandoned, so that a late response is never mistaken for the response
+    to a later request.
+    """
+
+    # The connection pools are shared by all transports with the same pool settings, because clients are often created
+    # and discarded for each job handled by a server, and the connections should outlive them
+    _connection_pools = {}
+    _connection_pools_lock = threading.Lock()
+
+    def __init__(
+        self,
+        service_name,
+        metrics,
+        hosts=None,
+        port=DEFAULT_TCP_PORT,
+        connect_timeout_in_seconds=5,
+        maximum_idle_connections_per_host=8,
+        maximum_connections_per_thread=8,
+        send_timeout_in_seconds=5,
+        **kwargs
+    ):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        TCP transport settings schema.
+
+        :param service_name: The name of the service to which this transport will send requests (and from which it will
+                             receive responses)
+        :type service_name: union[str, unicode]
+        :param metrics: The optional metrics recorder
+        :type metrics: MetricsRecorder
+        """
+        super(TCPClientTransport, self).__init__(service_name, metrics)
+
+        # These are server-only settings
+        for key in ('bind_address', 'listen_backlog', 'reuse_port'):
+            kwargs.pop(key, None)
+
+        self.core = TCPTransportCore(service_name=service_name, metrics=metrics, metrics_prefix='client', **kwargs)
+        self.send_timeout_in_seconds = send_timeout_in_seconds
+        if maximum_connections_per_thread < 1:
+            raise ValueError('maximum_connections_per_thread must be at least 1')
+        self.maximum_connections_per_thread = maximum_connections_per_thread
+
+        self._hosts = []
+        for host in hosts or ['localhost']:
+            if isinstance(host, (tuple, list)) and len(host) == 2:
+                self._hosts.append((host[0], int(host[1])))
+            elif isinstance(host, six.string_types):
+                self._hosts.append((host, port))
+            else:
+                raise ValueError('hosts must be a list of tuples of (host, port), or strings')
+        # Start each process at a random server, so that the processes of a client do not all pick the same servers
+        self._next_host_index = random.randrange(len(self._hosts))
+
+        pool_key = (
+            connect_timeout_in_seconds,
+            maximum_idle_connections_per_host,
+            self.core.maximum_message_size_in_bytes,
+        )
+        with self._connection_pools_lock:
+            if pool_key not in self._connection_pools:
+                self._connection_pools[pool_key] = TCPConnectionPool(*pool_key)
+            self._pool = self._connection_pools[pool_key]
+
+        self._thread_state = threading.local()
+
+    @property
+    def requests_outstanding(self):
+        """
+        Indicates the number of requests sent by the calling thread that still need to be received. If this value is
+        less than 1, calling `receive_response_message` will result in a return value of `(None, None, None)` instead of
+        raising a `MessageReceiveTimeout`.
+        """
+        return self._get_thread_state().requests_outstanding
+
+    def send_request_message(self, request_id, meta, body, message_expiry_in_seconds=None):
+        with self.metrics.timer('client.transport.tcp.send', resolution=TimerResolution.MICROSECONDS):
+            payload = self.core.serialize_message(request_id, meta, body, message_expiry_in_seconds)
+            self._send_payloads([payload])
+
+    def send_request_messages(self, messages):
+        """
+        Sends all the messages pipelined in a single write. See `ClientTransport.send_request_messages`.
+        """
+        errors = []
+        payloads = []
+        with self.metrics.timer('client.transport.tcp.send_bulk', resolution=TimerResolution.MICROSECONDS):
+            for request_id, meta, body, message_expiry_in_seconds in messages:
+                try:
+                    payloads.append(self.core.serialize_message(request_id, meta, body, message_expiry_in_seconds))
+                    errors.append(None)
+                except (InvalidMessageError, MessageTooLarge) as e:
+                    errors.append(e)
+
+            if payloads:
+                try:
+                    self._send_payloads(payloads)
+                except MessageSendError as e:
+                    errors = [error or e for error in errors]
+        return errors
+
+    def receive_response_message(self, receive_timeout_in_seconds=None):
+        state = self._get_thread_state()
+        if state.requests_outstanding < 1:
+            # This tells Client.get_all_responses to stop waiting for more.
+            return None, None, None
+
+        with self.metrics.timer('client.transport.tcp.receive', resolution=TimerResolution.MICROSECONDS):
+            if state.connection_lost:
+                # A connection broke while sending a later request, taking the outstanding responses with it
+                self._abandon_connections(state)
+                self.core._get_counter('receive.error.connection').increment()
+                raise MessageReceiveError('Connection to service {} was lost'.format(self.service_name))
+
+            try:
+                payload = self._read_payload(state, receive_timeout_in_seconds or self.core.receive_timeout_in_seconds)
+            except ConnectionClosed as e:
+                self._abandon_connections(state)
+                self.core._get_counter('receive.error.connection').increment()
+                raise MessageReceiveError(
+                    'Connection to service {} was lost'.format(self.service_name),
+                    six.text_type(e),
+                )
+
+            if payload is None:
+                self._abandon_connections(state)
+                self.core._get_counter('receive.error.timeout').increment()
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+
+            state.requests_outstanding -= 1
+            return self.core.deserialize_message(payload)
+
+    def _read_payload(self, state, timeout_in_seconds):
+        """
+        Returns the next response to arrive on any of the thread's connections, or `None` if none arrives in time.
+        """
+        if not state.payloads and len(state.connections) == 1:
+            # The common case needs no `select`
+            connection = next(iter(state.connections))
+            payload = connection.read_frame(timeout_in_seconds)
+            if payload is not None:
+                self._responses_received(state, connection, 1)
+            return payload
+
+        deadline = time.time() + timeout_in_seconds
+        while not state.payloads:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not state.connections:
+                return None
+            try:
+                readable, _, _ = select.select(list(state.connections), [], [], remaining)
+            except (select.error, OSError, ValueError) as e:
+                raise ConnectionClosed('Could not wait for responses: {!r}'.format(e))
+            for connection in readable:
+                payloads = connection.read_available_frames()
+                state.payloads.extend(payloads)
+                self._responses_received(state, connection, len(payloads))
+        return state.payloads.popleft()
+
+    def _responses_received(self, state, connection, count):
+        state.connections[connection] -= count
+        if state.connections[connection] < 1:
+            del state.connections[connection]
+            self._pool.release_connection(connection)
+
+    def _send_payloads(self, payloads):
+        state = self._get_thread_state()
+        if state.connection_lost:
+            # Responses to earlier requests were lost with a connection, which receiving will report
+            raise MessageSendError('Connection to service {} was lost'.format(self.service_name))
+
+        # Each payload goes to the connection with the fewest responses outstanding, opening new connections (up to the
+        # maximum) before sending more than one request on any connection
+        connections = list(state.connections)
+        outstanding = [state.connections[connection] for connection in connections]
+        new_connections = min(self.maximum_connections_per_thread - len(connections), len(payloads))
+        connections.extend([None] * max(new_connections, 0))
+        outstanding.extend([0] * max(new_connections, 0))
+        batches = [[] for _ in connections]
+        for payload in payloads:
+            index = outstanding.index(min(outstanding))
+            batches[index].append(payload)
+            outstanding[index] += 1
+
+        for connection, batch in zip(connections, batches):
+            if not batch:
+                continue
+            try:
+                connection = self._send_batch(state, connection, batch)
+            except MessageSendError:
+                if state.requests_outstanding:
+                    state.connection_lost = True
+                raise
+            state.connections[connection] = state.connections.get(connection, 0) + len(batch)
+            state.requests_outstanding += len(batch)
+
+    def _send_batch(self, state, connection, payloads):
+        """
+        Sends the payloads on the connection, or on a new connection if `connection` is `None`, and returns the
+        connection on which they were sent.
+        """
+        # A connection taken from the pool may have been closed by the server while it was idle, so if no responses are
+        # outstanding on it, sending is retried once on a new connection
+        for attempt in range(2):
+            reused = connection is not None
+            if connection is None:
+                address = self._hosts[self._next_host_index]
+                self._next_host_index = (self._next_host_index + 1) % len(self._hosts)
+                try:
+                    with self.core._get_timer('send.get_connection'):
+                        connection, reused = self._pool.get_connection(address)
+                except (socket.error, socket.timeout) as e:
+                    self.core._get_counter('send.error.connection').increment()
+                    raise MessageSendError('Cannot connect to {}:{}: {!r}'.format(address[0], address[1], e))
+
+            try:
+                connection.send_frames(payloads, self.send_timeout_in_seconds)
+                return connection
+            except ConnectionClosed as e:
+                retry = reused and not state.connections.get(connection) and not attempt
+                if connection in state.connections:
+                    # The responses outstanding on it are lost
+                    del state.connections[connection]
+                    state.connection_lost = True
+                connection = None
+                if retry:
+                    self.core._get_counter('send.stale_connection_retry').increment()
+                    continue
+                self.core._get_counter('send.error.connection').increment()
+                raise MessageSendError(
+                    'Connection to service {} was lost'.format(self.service_name),
+                    six.text_type(e),
+                )
+
+    def _abandon_connections(self, state):
+        for connection in state.connections:
+            connection.close()
+        state.connections.clear()
+        state.payloads.clear()
+        state.requests_outstanding = 0
+        state.connection_lost = False
+
+    def _get_thread_state(self):
+        state = self._thread_state
+        if not hasattr(state, 'connections'):
+            # The connections with responses outstanding, and how many are outstanding on each
+            state.connections = {}
+            # Responses read, but not yet returned
+            state.payloads = collections.deque()
+            state.requests_outstanding = 0
+            state.connection_lost = False
+        return state
+
+
+TCPClientTransport.settings_schema = TCPTransportSchema(TCPClientTransport)
@@ -0,0 +1,329 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import errno
+import select
+import socket
+import struct
+import time
+
+import attr
+import six
+
+from pysoa.common.metrics import (
+    MetricsRecorder,
+    NoOpMetricsRecorder,
+    TimerResolution,
+)
+from pysoa.common.serializer.msgpack_serializer import MsgpackSerializer
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveTimeout,
+    MessageTooLarge,
+)
+
+
+# Every message is framed as this 4-byte, big-endian, unsigned length, followed by that many bytes of serialized message
+FRAME_HEADER = struct.Struct(str('!I'))
+
+DEFAULT_MAXIMUM_MESSAGE_BYTES = 1024 * 1024 * 10
+DEFAULT_TCP_PORT = 9300
+
+
+class ConnectionClosed(Exception):
+    """Raised by `FramedConnection` when the other end closes the connection, or it breaks."""
+
+
+class FramedConnection(object):
+    """
+    A TCP (or Unix domain socket) connection over which complete messages (frames) are sent and received. Received bytes
+    are buffered until a whole frame has arrived, so that frames may be read from a non-blocking (`select`-driven)
+    connection as they arrive, and so that a read that times out part of the way through a frame loses nothing.
+    """
+
+    READ_SIZE = 65536
+
+    def __init__(self, sock, address, maximum_frame_size_in_bytes, connection_id=None):
+        """
+        :param sock: The connected socket
+        :type sock: socket.socket
+        :param address: The address of the other end of the connection
+        :type address: tuple
+        :param maximum_frame_size_in_bytes: The largest frame that may be received before the connection is considered
+                                            broken (a frame this large could never be a valid message)
+        :type maximum_frame_size_in_bytes: int
+        :param connection_id: An optional identifier by which the owner of the connection knows it
+        :type connection_id: int
+        """
+        self.socket = sock
+        self.address = address
+        self.connection_id = connection_id
+        self.maximum_frame_size_in_bytes = maximum_frame_size_in_bytes
+        self.closed = False
+        self._buffer = bytearray()
+
+        if self.socket.family in (socket.AF_INET, socket.AF_INET6):
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def send_frames(self, payloads, timeout_in_seconds):
+        """
+        Send one or more frames in a single write, so that pipelined messages share TCP segments and system calls.
+
+        :param payloads: The serialized messages
+        :type payloads: list[bytes]
+        :param timeout_in_seconds: How long to wait for the operating system to accept all the bytes
+        :type timeout_in_seconds: float
+
+        :raise: ConnectionClosed
+        """
+        data = b''.join(FRAME_HEADER.pack(len(payload)) + payload for payload in payloads)
+        try:
+            self.socket.settimeout(timeout_in_seconds)
+            self.socket.sendall(data)
+        except (socket.error, socket.timeout) as e:
+            # A timeout may have left part of a frame on the wire, so the connection can no longer be used
+            self.close()
+            raise ConnectionClosed('Could not send to {}: {!r}'.format(self.address, e))
+
+    def read_available_frames(self):
+        """
+        Read whatever bytes are available without blocking (call this once `select` finds the connection readable), and
+        return the frames that are now complete.
+
+        :return: The payloads of the complete frames, which is empty if none is complete yet
+        :rtype: list[bytes]
+
+        :raise: ConnectionClosed
+        """
+        self._receive(0.0)
+        return self._pop_frames()
+
+    def read_frame(self, timeout_in_seconds):
+        """
+        Block until one whole frame has arrived and return its payload.
+
+        :param timeout_in_seconds: How long to wait for the whole frame
+        :type timeout_in_seconds: float
+
+        :return: The payload of the frame, or `None` if the timeout elapsed first
+        :rtype: bytes
+
+        :raise: ConnectionClosed
+        """
+        deadline = time.time() + timeout_in_seconds
+        while True:
+            for payload in self._pop_frames(maximum=1):
+                return payload
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self._receive(remaining)
+
+    def is_closed_by_peer(self):
+        """
+        Check, without blocking, whether an idle connection has been closed by the other end. Nothing should arrive on a
+        connection with no responses outstanding, so anything to read means the connection can no longer be used.
+
+        :return: Whether the connection can no longer be used
+        :rtype: bool
+        """
+        if self.closed:
+            return True
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+        except (select.error, OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.socket.close()
+            except socket.error:
+                pass
+
+    def _receive(self, timeout_in_seconds):
+        try:
+            self.socket.settimeout(timeout_in_seconds)
+            data = self.socket.recv(self.READ_SIZE)
+        except socket.timeout:
+            return
+        except socket.error as e:
+            if e.args and e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self.close()
+            raise ConnectionClosed('Could not receive from {}: {!r}'.format(self.address, e))
+
+        if not data:
+            self.close()
+            raise ConnectionClosed('Connection closed by {}'.format(self.address))
+        self._buffer.extend(data)
+
+    def _pop_frames(self, maximum=None):
+        payloads = []
+        offset = 0
+        while len(self._buffer) - offset >= FRAME_HEADER.size and (maximum is None or len(payloads) < maximum):
+            (length, ) = FRAME_HEADER.unpack_from(self._buffer, offset)
+            if length > self.maximum_frame_size_in_bytes:
+                self.close()
+                raise ConnectionClosed('Frame of {} bytes from {} is too large'.format(length, self.address))
+            end = offset + FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            payloads.append(bytes(self._buffer[offset + FRAME_HEADER.size:end]))
+            offset = end
+        if offset:
+            del self._buffer[:offset]
+        return payloads
+
+
+def valid_maximum_message_size_in_bytes(_, __, value):
+    if value < 1 or value > 0xFFFFFFFF:
+        raise ValueError('maximum_message_size_in_bytes must be between 1 and 4294967295, got {}'.format(value))
+
+
+@attr.s()
+class TCPTransportCore(object):
+    """
+    Serializes and checks the messages sent and received by the TCP client and server transports. The message
+    format is the same as that of the Redis Gateway transport (a dict with the request ID, meta information, and body,
+    serialized with the configured serializer), and so are the metric names, except for `redis_gateway` becoming `tcp`.
+    """
+
+    METRICS_TRANSPORT_NAME = 'tcp'
+
+    maximum_message_size_in_bytes = attr.ib(
+        default=DEFAULT_MAXIMUM_MESSAGE_BYTES,
+        converter=int,
+        validator=valid_maximum_message_size_in_bytes,
+    )
+
+    message_expiry_in_seconds = attr.ib(
+        # How long after a message is sent before it's considered "expired" and not handled, unless overridden in the
+        # serialize_message argument `message_expiry_in_seconds`
+        default=60,
+        converter=int,
+    )
+
+    metrics = attr.ib(
+        default=NoOpMetricsRecorder(),
+        validator=attr.validators.instance_of(MetricsRecorder),
+    )
+
+    metrics_prefix = attr.ib(
+        default='',
+        validator=attr.validators.instance_of(six.text_type),
+    )
+
+    receive_timeout_in_seconds = attr.ib(
+        # How long to block when waiting to receive a message by default
+        default=5,
+        converter=int,
+    )
+
+    serializer_config = attr.ib(
+        # Configuration for which serializer should be used by this transport
+        default={'object': MsgpackSerializer, 'kwargs': {}},
+        converter=dict,
+    )
+
+    service_name = attr.ib(
+        # Service name used for error messages
+        default='',
+        validator=attr.validators.instance_of(six.text_type),
+    )
+
+    def __attrs_post_init__(self):
+        self._serializer = None
+
+    # noinspection PyAttributeOutsideInit
+    @property
+    def serializer(self):
+        if self._serializer is None:
+            self._serializer = self.serializer_config['object'](**self.serializer_config.get('kwargs', {}))
+
+        return self._serializer
+
+    def serialize_message(self, request_id, meta, body, message_expiry_in_seconds=None):
+        """
+        Serialize a message for sending in a frame.
+
+        :param request_id: The message's request ID
+        :type request_id: int
+        :param meta: The message meta information, if any (should be an empty dict if no metadata)
+        :type meta: dict
+        :param body: The message body (should be a dict)
+        :type body: dict
+        :param message_expiry_in_seconds: The optional message expiry, which defaults to the setting with the same name
+        :type message_expiry_in_seconds: int
+
+        :return: The serialized message
+        :rtype: bytes
+
+        :raise: InvalidMessageError, MessageTooLarge
+        """
+        if request_id is None:
+            raise InvalidMessageError('No request ID')
+
+        meta['__expiry__'] = time.time() + (message_expiry_in_seconds or self.message_expiry_in_seconds)
+
+        with self._get_timer('send.serialize'):
+            serialized_message = self.serializer.dict_to_blob({'request_id': request_id, 'meta': meta, 'body': body})
+        if isinstance(serialized_message, six.text_type):
+            # The JSON serializer produces text, but frames hold bytes (and it deserializes UTF-8 bytes just as well)
+            serialized_message = serialized_message.encode('utf-8')
+
+        if len(serialized_message) > self.maximum_message_size_in_bytes:
+            self._get_counter('send.error.message_too_large').increment()
+            raise MessageTooLarge(len(serialized_message))
+
+        return serialized_message
+
+    def deserialize_message(self, serialized_message):
+        """
+        Deserialize a message received in a frame.
+
+        :param serialized_message: The serialized message
+        :type serialized_message: bytes
+
+        :return: A tuple of request ID, message meta-information dict, and message body dict
+        :rtype: tuple(int, dict, dict)
+
+        :raise: InvalidMessageError, MessageReceiveTimeout
+        """
+        with self._get_timer('receive.deserialize'):
+            message = self.serializer.blob_to_dict(serialized_message)
+
+        meta = message.get('meta') or {}
+        if meta.get('__expiry__') and meta['__expiry__'] < time.time():
+            self._get_counter('receive.error.message_expired').increment()
+            raise MessageReceiveTimeout('Message expired for service {}'.format(self.service_name))
+
+        request_id = message.get('request_id')
+        if request_id is None:
+            self._get_counter('receive.error.no_request_id').increment()
+            raise InvalidMessageError('No request ID for service {}'.format(self.service_name))
+
+        return request_id, meta, message.get('body')
+
+    def _get_metric_name(self, name):
+        if self.metrics_prefix:
+            return '{prefix}.transport.{transport}.{name}'.format(
+                prefix=self.metrics_prefix,
+                transport=self.METRICS_TRANSPORT_NAME,
+                name=name,
+            )
+        else:
+            return 'transport.{transport}.{name}'.format(transport=self.METRICS_TRANSPORT_NAME, name=name)
+
+    def _get_counter(self, name):
+        return self.metrics.counter(self._get_metric_name(name))
+
+    def _get_timer(self, name):
+        return self.metrics.timer(self._get_metric_name(name), resolution=TimerResolution.MICROSECONDS)
@@ -0,0 +1,210 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import collections
+import errno
+import select
+import socket
+import time
+
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.serializer.exceptions import InvalidMessage
+from pysoa.common.transport.base import ServerTransport
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveTimeout,
+)
+from pysoa.common.transport.tcp.core import (
+    DEFAULT_TCP_PORT,
+    ConnectionClosed,
+    FramedConnection,
+    TCPTransportCore,
+)
+from pysoa.common.transport.tcp.settings import TCPTransportSchema
+
+
+class TCPServerTransport(ServerTransport):
+    """
+    A server transport that accepts requests directly from clients over persistent TCP connections, without a broker in
+    between. One `select` loop accepts new connections and reads the requests pipelined on all of them, so requests are
+    handled in the order they arrive. Each response is sent back on the connection on which its request arrived; if the
+    client has gone away by then, the response is discarded.
+    """
+
+    def __init__(
+        self,
+        service_name,
+        metrics,
+        bind_address='0.0.0.0',
+        port=DEFAULT_TCP_PORT,
+        listen_backlog=128,
+        reuse_port=True,
+        send_timeout_in_seconds=5,
+        **kwargs
+    ):
+        """
+        In addition to the two named positional arguments, this constructor expects keyword arguments abiding by the
+        TCP transport settings schema.
+
+        :param service_name: The name of the service for which this transport will receive requests and send responses
+        :type service_name: union[str, unicode]
+        :param metrics: The optional metrics recorder
+        :type metrics: MetricsRecorder
+        """
+        super(TCPServerTransport, self).__init__(service_name, metrics)
+
+        # These are client-only settings
+        for key in ('connect_timeout_in_seconds', 'hosts', 'maximum_idle_connections_per_host'):
+            kwargs.pop(key, None)
+
+        self.core = TCPTransportCore(service_name=service_name, metrics=metrics, metrics_prefix='server', **kwargs)
+        self.send_timeout_in_seconds = send_timeout_in_seconds
+
+        self._connections = {}
+        self._next_connection_id = 0
+        # Requests read from the connections but not yet handed to the server, as tuples of connection ID and payload
+        self._requests = collections.deque()
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port and hasattr(socket, 'SO_REUSEPORT'):
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._listener.bind((bind_address, port))
+        self._listener.listen(listen_backlog)
+        self._listener.setblocking(False)
+
+    @property
+    def address(self):
+        """
+        The address and port on which this transport is listening, which is useful when it was configured with port 0.
+        """
+        return self._listener.getsockname()
+
+    def receive_request_message(self):
+        timer = self.metrics.timer('server.transport.tcp.receive', resolution=TimerResolution.MICROSECONDS)
+        timer.start()
+        stop_timer = True
+        try:
+            return self._receive_request_message()
+        except MessageReceiveTimeout:
+            stop_timer = False
+            raise
+        finally:
+            if stop_timer:
+                timer.stop()
+
+    def send_response_message(self, request_id, meta, body):
+        connection_id = meta.get('reply_to')
+        if connection_id is None:
+            self.metrics.counter('server.transport.tcp.send.error.missing_reply_queue').increment()
+            raise InvalidMessageError('Missing reply connection')
+
+        with self.metrics.timer('server.transport.tcp.send', resolution=TimerResolution.MICROSECONDS):
+            payload = self.core.serialize_message(request_id, meta, body)
+
+            connection = self._connections.get(connection_id)
+            if connection is None:
+                # The client is no longer waiting for this response
+                self.core._get_counter('send.error.connection_closed').increment()
+                return
+
+            try:
+                connection.send_frames([payload], self.send_timeout_in_seconds)
+            except ConnectionClosed:
+                self._remove_connection(connection_id)
+                self.core._get_counter('send.error.connection_closed').increment()
+
+    def close(self):
+        """
+        Stops listening and closes all connections. Requests that were read from the connections but not yet handed to
+        the server are discarded, and their clients will time out waiting for responses.
+        """
+        if self._requests:
+            self.core._get_counter('receive.error.discarded_on_close').increment(len(self._requests))
+            self._requests.clear()
+
+        self._listener.close()
+        for connection_id in list(self._connections):
+            self._remove_connection(connection_id)
+
+    def _receive_request_message(self):
+        deadline = time.time() + self.core.receive_timeout_in_seconds
+        while True:
+            while self._requests:
+                connection_id, payload = self._requests.popleft()
+                try:
+                    request_id, meta, body = self.core.deserialize_message(payload)
+                except MessageReceiveTimeout:
+                    # Expired, and already counted, so skip it, but keep waiting for a request
+                    continue
+                except (InvalidMessage, InvalidMessageError):
+                    # The client is not speaking this protocol, so it cannot be trusted to frame the next request either
+                    self.core._get_counter('receive.error.invalid_message').increment()
+                    self._remove_connection(connection_id)
+                    continue
+
+                meta['reply_to'] = connection_id
+                return request_id, meta, body
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise MessageReceiveTimeout('No message received for service {}'.format(self.service_name))
+            self._poll(remaining)
+
+    def _poll(self, timeout_in_seconds):
+        try:
+            readable, _, _ = select.select(
+                [self._listener] + list(self._connections.values()),
+                [],
+                [],
+                timeout_in_seconds,
+            )
+        except (select.error, OSError) as e:
+            # Python 2 does not retry when a signal (such as a shutdown signal) interrupts the call
+            if e.args and e.args[0] == errno.EINTR:
+                return
+            raise
+
+        for connection in readable:
+            if connection is self._listener:
+                self._accept_connections()
+                continue
+
+            try:
+                payloads = connection.read_available_frames()
+            except ConnectionClosed:
+                self._remove_connection(connection.connection_id)
+                continue
+            self._requests.extend((connection.connection_id, payload) for payload in payloads)
+
+    def _accept_connections(self):
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except socket.error as e:
+                if e.args and e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                # Usually, the process has run out of file descriptors, so let the client wait in the backlog
+                self.core._get_counter('receive.error.accept').increment()
+                return
+
+            self._next_connection_id += 1
+            connection = FramedConnection(
+                sock,
+                address,
+                self.core.maximum_message_size_in_bytes,
+                connection_id=self._next_connection_id,
+            )
+            self._connections[connection.connection_id] = connection
+            self.core._get_counter('connection.opened').increment()
+
+    def _remove_connection(self, connection_id):
+        connection = self._connections.pop(connection_id, None)
+        if connection:
+            connection.close()
+            self.core._get_counter('connection.closed').increment()
+
+
+TCPServerTransport.settings_schema = TCPTransportSchema(TCPServerTransport)
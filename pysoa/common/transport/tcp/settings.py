@@ -0,0 +1,107 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+from conformity import fields
+
+from pysoa.common.serializer.base import Serializer as BaseSerializer
+from pysoa.common.settings import BasicClassSchema
+
+
+class TCPTransportSchema(BasicClassSchema):
+    contents = {
+        'path': fields.UnicodeString(
+            description='The path to the TCP client or server transport, in the format `module.name:ClassName`',
+        ),
+        'kwargs': fields.Dictionary(
+            {
+                'bind_address': fields.UnicodeString(
+                    description='Server only: The address on which the server listens for connections (defaults to '
+                                '"0.0.0.0", all IPv4 addresses)',
+                ),
+                'connect_timeout_in_seconds': fields.Any(
+                    fields.Integer(gt=0),
+                    fields.Float(gt=0),
+                    description='Client only: How long to wait for a connection to a server to be established '
+                                '(defaults to 5 seconds)',
+                ),
+                'hosts': fields.List(
+                    fields.Any(
+                        fields.Tuple(fields.UnicodeString(), fields.Integer()),
+                        fields.UnicodeString(),
+                    ),
+                    description='Client only: The list of servers, where each is a tuple of `("address", port)` or the '
+                                'simple string address (with `port`). Each thread picks the servers in turn when it '
+                                'needs a new connection.',
+                ),
+                'listen_backlog': fields.Integer(
+                    gt=0,
+                    description='Server only: How many connections the operating system may queue before the server '
+                                'accepts them (defaults to 128)',
+                ),
+                'maximum_idle_connections_per_host': fields.Integer(
+                    gte=0,
+                    description='Client only: How many connections to each server are kept open, per process, for '
+                                'reuse once they are idle (defaults to 8)',
+                ),
+                'maximum_connections_per_thread': fields.Integer(
+                    gt=0,
+                    description='Client only: Across how many connections each thread spreads the requests it has '
+                                'outstanding, so that several server processes can handle them at once (defaults to '
+                                '8)',
+                ),
+                'maximum_message_size_in_bytes': fields.Integer(
+                    gt=0,
+                    description='The maximum message size, in bytes, that is permitted to be transmitted over this '
+                                'transport (defaults to 10MB)',
+                ),
+                'message_expiry_in_seconds': fields.Integer(
+                    description='How long after a message is sent that it is considered expired and discarded by the '
+                                'receiver (defaults to 60 seconds)',
+                ),
+                'port': fields.Integer(
+                    description='The port on which the server listens for connections, which is also the port for '
+                                'client `hosts` given as simple string addresses (defaults to 9300)',
+                ),
+                'receive_timeout_in_seconds': fields.Integer(
+                    description='How long to block waiting on a message to be received (defaults to 5 seconds)',
+                ),
+                'reuse_port': fields.Boolean(
+                    description='Server only: Whether to listen with `SO_REUSEPORT`, where the operating system '
+                                'supports it, so that all the forked processes of a server can listen on the same '
+                                'port, and the operating system balances new connections across them (defaults to '
+                                'true)',
+                ),
+                'send_timeout_in_seconds': fields.Any(
+                    fields.Integer(gt=0),
+                    fields.Float(gt=0),
+                    description='How long to wait for the operating system to accept a message for sending before the '
+                                'connection is considered broken (defaults to 5 seconds)',
+                ),
+                'serializer_config': BasicClassSchema(
+                    object_type=BaseSerializer,
+                    description='The configuration for the serializer this transport should use',
+                ),
+            },
+            optional_keys=[
+                'bind_address',
+                'connect_timeout_in_seconds',
+                'hosts',
+                'listen_backlog',
+                'maximum_idle_connections_per_host',
+                'maximum_message_size_in_bytes',
+                'message_expiry_in_seconds',
+                'port',
+                'receive_timeout_in_seconds',
+                'reuse_port',
+                'send_timeout_in_seconds',
+                'serializer_config',
+            ],
+            allow_extra_keys=False,
+        ),
+    }
+
+    optional_keys = ()
+
+    description = 'The settings for the TCP transport'
@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+import sys
+
 from pysoa.server.action.base import (
     Action,
     ActionError,
@@ -7,8 +9,15 @@ from pysoa.server.action.base import (
 )
 
 
+if sys.version_info >= (3, 5):
+    from pysoa.server.action.async_base import AsyncAction
+else:
+    AsyncAction = None
+
+
 __all__ = (
     'Action',
     'ActionError',
     'ActionResponse',
+    'AsyncAction',
 )
@@ -0,0 +1,63 @@
+"""
+The base class for actions whose `run` is a coroutine. This module requires Python 3.5 or newer.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import abc
+
+from pysoa.server.action.base import Action
+
+
+__all__ = (
+    'AsyncAction',
+)
+
+
+class AsyncAction(Action):
+    """
+    Base class for actions whose `run()` is a coroutine, such as actions that call other services with the coroutine
+    methods of `Client`. It is used just like `Action`, except that `run()` is defined with `async def`.
+
+    When the server runs jobs as asyncio tasks (see `async_jobs` in the server settings), the server awaits these
+    actions on its event loop, so that one server can have many of them in flight at once. Otherwise, the server runs
+    each one to completion, on its event loop, as it would any other action. Async actions cannot be batchable.
+    """
+
+    run_batch = None
+
+    @abc.abstractmethod
+    async def run(self, request):
+        """
+        Override this to perform your business logic, and either return a value abiding by the `response_schema` or
+        raise an `ActionError`.
+
+        :param request: The request object
+        :type request: EnrichedActionRequest
+
+        :return: The response
+        :rtype: dict
+
+        :raise: ActionError
+        """
+        raise NotImplementedError()
+
+    async def __call__(self, action_request):
+        """
+        Main entry point for async actions from the `Server`. Validates the request and the response as
+        `Action.__call__` does, awaiting `run()` in between.
+
+        :param action_request: The request object
+        :type action_request: EnrichedActionRequest
+
+        :return: The response object
+        :rtype: ActionResponse
+
+        :raise: ActionError, ResponseValidationError
+        """
+        self._validate_request(action_request)
+        # Run the body of the action
+        response_body = await self.run(action_request)
+        return self._make_response(action_request, response_body)
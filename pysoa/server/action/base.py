@@ -29,11 +29,16 @@ class Action(object):
       introspection for the action.
     - Optionally provide `request_schema` and/or `response_schema` attributes. These should be Conformity fields.
     - Optionally provide a `validate()` method to do custom validation on the request.
+    - Optionally provide a `run_batch()` method, taking a list of requests and returning a list of responses, to let the
+      server run the action once for several queued jobs that call only this action (see `call_batch()`).
     """
 
     request_schema = None
     response_schema = None
 
+    # Override this with a method to make the action batchable; see `call_batch()`
+    run_batch = None
+
     def __init__(self, settings=None):
         """
         Construct a new action. Concrete classes can override this and define a different interface, but they must
@@ -89,7 +94,69 @@ class Action(object):
 
         :raise: ActionError, ResponseValidationError
         """
-        # Validate the request
+        self._validate_request(action_request)
+        # Run the body of the action
+        response_body = self.run(action_request)
+        return self._make_response(action_request, response_body)
+
+    def call_batch(self, action_requests):
+        """
+        Entry point for the `Server` to run a batchable action (one that provides a `run_batch()` method) for several
+        requests at once. Validates each request as `__call__` does, calls `run_batch()` once with all the valid
+        requests, in order, and validates each of the response bodies that `run_batch()` returns, one for each request,
+        in the same order. `run_batch()` may return an `ActionError` in place of the response body for a request that
+        failed, or raise an `ActionError` that applies to all the requests.
+
+        :param action_requests: The request objects
+        :type action_requests: list[EnrichedActionRequest]
+
+        :return: For each request, in order, either the response object or the error that the server should raise for
+                 that request in its place
+        :rtype: list[union[ActionResponse, ActionError, ResponseValidationError]]
+
+        :raise: ValueError
+        """
+        results = [None] * len(action_requests)
+        valid_indexes = []
+        for i, action_request in enumerate(action_requests):
+            try:
+                self._validate_request(action_request)
+                valid_indexes.append(i)
+            except ActionError as e:
+                results[i] = e
+
+        if not valid_indexes:
+            return results
+
+        try:
+            response_bodies = self.run_batch([action_requests[i] for i in valid_indexes])
+        except ActionError as e:
+            response_bodies = [e] * len(valid_indexes)
+        if len(response_bodies) != len(valid_indexes):
+            raise ValueError('run_batch returned {} responses for {} requests'.format(
+                len(response_bodies),
+                len(valid_indexes),
+            ))
+
+        for i, response_body in zip(valid_indexes, response_bodies):
+            if isinstance(response_body, ActionError):
+                results[i] = response_body
+                continue
+            try:
+                results[i] = self._make_response(action_requests[i], response_body)
+            except ResponseValidationError as e:
+                results[i] = e
+        return results
+
+    def _validate_request(self, action_request):
+        """
+        Validates that the request matches the `request_schema`, and then calls `validate()`.
+
+        :param action_request: The request object
+        :type action_request: EnrichedActionRequest
+
+        :raise: ActionError
+        """
         if self.request_schema:
             errors = [
                 Error(
@@ -103,16 +170,27 @@ class Action(object):
                 raise ActionError(errors=errors)
         # Run any custom validation
         self.validate(action_request)
-        # Run the body of the action
-        response_body = self.run(action_request)
-        # Validate the response body. Errors in a response are the problem of
-        # the service, and so we just raise a Python exception and let error
+
+    def _make_response(self, action_request, response_body):
+        """
+        Validates that the response body matches the `response_schema`, and then makes the response object.
+
+        :param action_request: The request object
+        :type action_request: EnrichedActionRequest
+        :param response_body: The response body returned by `run()` or `run_batch()`
+        :type response_body: dict
+
+        :return: The response object
+        :rtype: ActionResponse
+
+        :raise: ResponseValidationError
+        """
+        # Errors in a response are the problem of the service, and so we just raise a Python exception and let error
         # middleware catch it. The server will return a SERVER_ERROR response.
         if self.response_schema:
             errors = self.response_schema.errors(response_body)
             if errors:
                 raise ResponseValidationError(action=action_request.action, errors=errors)
-        # Make an ActionResponse and return it
         if response_body is not None:
             return ActionResponse(
                 action=action_request.action,
@@ -6,13 +6,16 @@ from __future__ import (
 import abc
 import platform
 import sys
+import time
 
+import attr
 import conformity
 from conformity import fields
 import six
 
 import pysoa
 from pysoa.server.action import Action
+from pysoa.server.scoreboard import Scoreboard
 
 
 class BaseStatusAction(Action):
@@ -48,6 +51,11 @@ class BaseStatusAction(Action):
         class MyStatusAction(BaseStatusAction):
             ...
             check_client_settings = BaseStatusAction._check_client_settings
+
+    It also comes with a disabled-by-default health check method named `_check_scoreboard`, which adds the activity of
+    each server process recorded in the scoreboard (see the `scoreboard_file` server setting) to the diagnostics, and
+    reports any server process that has not recorded a heartbeat for longer than the harakiri timeout. To enable it,
+    reference it as `check_scoreboard = BaseStatusAction._check_scoreboard`.
     """
 
     def __init__(self, *args, **kwargs):
@@ -228,6 +236,43 @@ class BaseStatusAction(Action):
 
         return problems
 
+    def _check_scoreboard(self, _request):
+        """
+        This method reads the scoreboard in which the server processes of this service record their activity, if the
+        `scoreboard_file` setting is set, adds the activity of each server process to the diagnostics under `workers`,
+        and reports any server process that has not recorded a heartbeat for longer than the harakiri timeout. To
+        include this check in your status action, define `check_scoreboard = BaseStatusAction._check_scoreboard` in your
+        status action class definition.
+        """
+        if not self.settings or not self.settings['scoreboard_file']:
+            return
+
+        try:
+            scoreboard = Scoreboard.open(self.settings['scoreboard_file'])
+        except (IOError, OSError, ValueError) as e:
+            return [(False, 'SCOREBOARD_UNAVAILABLE', six.text_type(e))]
+        try:
+            statuses = scoreboard.read()
+        finally:
+            scoreboard.close()
+
+        self.diagnostics['workers'] = [attr.asdict(status) for status in statuses]
+
+        now = time.time()
+        timeout = self.settings['harakiri']['timeout']
+        return [
+            (
+                True,
+                'WORKER_HEARTBEAT_STALE',
+                'Server process {} has not recorded a heartbeat for {:.0f}s'.format(
+                    status.name or status.pid,
+                    now - status.heartbeat,
+                ),
+            )
+            for status in statuses
+            if status.state in ('idle', 'busy') and status.heartbeat and now - status.heartbeat > timeout
+        ]
+
 
 # noinspection PyPep8Naming
 def StatusActionFactory(version, build=None, base_class=BaseStatusAction):  # noqa
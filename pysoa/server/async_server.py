@@ -0,0 +1,331 @@
+"""
+Runs the jobs of a `Server` as asyncio tasks, for servers with `async_jobs` enabled. This module requires Python 3.5 or
+newer.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import math
+import signal
+import time
+
+from pysoa.common.logging import PySOALogContextFilter
+from pysoa.common.metrics import TimerResolution
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.types import (
+    ActionResponse,
+    JobResponse,
+)
+from pysoa.server.action.async_base import AsyncAction
+from pysoa.server.errors import (
+    ActionError,
+    JobError,
+)
+from pysoa.server.internal.types import RequestSwitchSet
+from pysoa.server.middleware import ServerMiddleware
+
+
+__all__ = (
+    'AsyncJobRunner',
+)
+
+
+class AsyncJobRunner(object):
+    """
+    Runs the jobs of a server as asyncio tasks on the server's event loop, with up to `async_jobs.maximum_jobs` of them
+    in flight at once. Requests are received from the transport in a thread of their own, and responses are sent in
+    another, so the transport must allow one thread to send while another receives (the Redis Gateway transport does).
+
+    Async actions (`AsyncAction`) are awaited on the event loop, and other actions are run in a thread pool of
+    `async_jobs.sync_action_threads` threads. Middleware is applied with its `job_async` and `action_async` hooks. If
+    the job's control header has `parallel` set, its actions are run concurrently.
+
+    Harakiri applies to each job separately: it is triggered when any one job has been in flight, or the server has
+    been waiting on its transport with no job in flight, for longer than the harakiri timeout.
+    """
+
+    def __init__(self, server):
+        """
+        :param server: The server whose jobs to run
+        :type server: Server
+
+        :raise: ValueError
+        """
+        self.server = server
+        self.settings = server.settings['async_jobs']
+        self.job_middleware = [_get_async_middleware_hook(m, 'job') for m in server.middleware]
+        self.action_middleware = [_get_async_middleware_hook(m, 'action') for m in server.middleware]
+
+        self._receive_executor = None
+        self._send_executor = None
+        self._action_executor = None
+        # The time at which each job in flight started
+        self._jobs = {}
+        self._job_error = None
+        self._idle_timer = None
+
+    def run(self):
+        """
+        Receives and runs jobs until the server shuts down, and then waits for the jobs in flight to finish.
+
+        :raise: MessageReceiveError, or any unhandled error from handling a job
+        """
+        self._receive_executor = ThreadPoolExecutor(1)
+        self._send_executor = ThreadPoolExecutor(1)
+        self._action_executor = ThreadPoolExecutor(self.settings['sync_action_threads'])
+        try:
+            self.server.async_event_loop.run_until_complete(self._run())
+        finally:
+            # After harakiri, a thread could be stuck, so do not wait for the threads
+            for executor in (self._receive_executor, self._send_executor, self._action_executor):
+                executor.shutdown(wait=False)
+
+    async def _run(self):
+        job_slots = asyncio.Semaphore(self.settings['maximum_jobs'])
+        try:
+            while not self.server.shutting_down:
+                self._reset_harakiri_alarm()
+
+                if job_slots.locked():
+                    self.server.metrics.counter('server.async_jobs.saturated').increment()
+                await job_slots.acquire()
+                request = None
+                try:
+                    if not self.server.shutting_down:
+                        request = await self._receive_request()
+                finally:
+                    if not request:
+                        job_slots.release()
+                if not request:
+                    continue
+
+                task = asyncio.ensure_future(self._handle_job(*request))
+                self._jobs[task] = time.time()
+                task.add_done_callback(functools.partial(self._job_done, job_slots))
+        finally:
+            if self._jobs:
+                await asyncio.wait(list(self._jobs))
+
+        if self._job_error:
+            raise self._job_error
+
+    async def _receive_request(self):
+        if not self._jobs and not self._idle_timer:
+            self._idle_timer = self.server.metrics.timer('server.idle_time', resolution=TimerResolution.MICROSECONDS)
+            self._idle_timer.start()
+
+        try:
+            request = await self.server.async_event_loop.run_in_executor(
+                self._receive_executor,
+                self.server.transport.receive_request_message,
+            )
+        except MessageReceiveTimeout:
+            if not self._jobs:
+                self.server.perform_idle_actions()
+            self.server.metrics.commit()
+            return None
+
+        if self._idle_timer:
+            self._idle_timer.stop()
+            self._idle_timer = None
+        return request
+
+    def _reset_harakiri_alarm(self):
+        """
+        Arms the harakiri alarm to go off once the longest-running job in flight (or, with no job in flight, the wait
+        for the next request) has taken longer than the harakiri timeout. Unlike re-arming the alarm with the full
+        timeout, this lets one hung job trigger harakiri while other jobs keep arriving and finishing.
+        """
+        harakiri_timeout = self.server.settings['harakiri']['timeout']
+        if not harakiri_timeout or self.server.shutting_down:
+            # Leave the shutdown grace alarm set by harakiri alone
+            return
+
+        now = time.time()
+        started = min(self._jobs.values()) if self._jobs else now
+        signal.alarm(max(int(math.ceil(started + harakiri_timeout - now)), 1))
+
+    def _job_done(self, job_slots, task):
+        self._jobs.pop(task, None)
+        job_slots.release()
+        self._reset_harakiri_alarm()
+        if not task.cancelled() and task.exception() and not self._job_error:
+            # As in a server that handles one job at a time, an error handling a job shuts the server down
+            self._job_error = task.exception()
+            self.server.shutting_down = True
+
+    async def _handle_job(self, request_id, meta, job_request):
+        server = self.server
+
+        # Each task has its own logging context
+        PySOALogContextFilter.set_logging_request_context(request_id=request_id, **job_request['context'])
+
+        request_for_logging = server.logging_dict_wrapper_class(job_request)
+        server.job_logger.log(server.request_log_success_level, 'Job request: %s', request_for_logging)
+
+        try:
+            server.perform_pre_request_actions()
+
+            # Process and run the Job
+            job_response = await self.process_job(job_request)
+
+            await self._run_in_executor(
+                self._send_executor,
+                server._send_job_response,
+                request_id,
+                meta,
+                job_request,
+                job_response,
+                request_for_logging,
+            )
+        finally:
+            PySOALogContextFilter.clear_logging_request_context()
+            server.perform_post_request_actions()
+            server.metrics.commit()
+
+    async def process_job(self, job_request):
+        """
+        The coroutine equivalent of `Server.process_job`.
+
+        :param job_request: The job request
+        :type job_request: dict
+
+        :return: A `JobResponse` object
+        :rtype: JobResponse
+        """
+        server = self.server
+        try:
+            server._prepare_job_request(job_request)
+
+            # Build set of middleware + job handler, then run job
+            wrapper = server.make_middleware_stack(self.job_middleware, self.execute_job)
+            job_response = await wrapper(job_request)
+            if 'correlation_id' in job_request['context']:
+                job_response.context['correlation_id'] = job_request['context']['correlation_id']
+        except JobError as e:
+            server.metrics.counter('server.error.job_error').increment()
+            job_response = JobResponse(
+                errors=e.errors,
+            )
+        except Exception as e:
+            # Send an error response if no middleware caught this.
+            server.metrics.counter('server.error.unhandled_error').increment()
+            return server.handle_job_exception(e)
+
+        return job_response
+
+    async def execute_job(self, job_request):
+        """
+        The coroutine equivalent of `Server.execute_job`. If the job's control header has `parallel` set, the actions
+        are all run concurrently, and their responses are returned in the order of the action requests, ending with the
+        first one that has errors unless `continue_on_error` is set.
+
+        :param job_request: The job request
+        :type job_request: dict
+
+        :return: A `JobResponse` object
+        :rtype: JobResponse
+        """
+        job_response = JobResponse()
+        job_switches = RequestSwitchSet(job_request['context']['switches'])
+        continue_on_error = job_request['control'].get('continue_on_error', False)
+
+        if job_request['control'].get('parallel', False) and len(job_request['actions']) > 1:
+            action_responses = await asyncio.gather(*[
+                self._execute_action(job_request, job_switches, raw_action_request)
+                for raw_action_request in job_request['actions']
+            ])
+            for action_response in action_responses:
+                job_response.actions.append(action_response)
+                if action_response.errors and not continue_on_error:
+                    break
+            return job_response
+
+        for raw_action_request in job_request['actions']:
+            action_response = await self._execute_action(job_request, job_switches, raw_action_request)
+
+            job_response.actions.append(action_response)
+            if action_response.errors and not continue_on_error:
+                # Quit running Actions if an error occurred and continue_on_error is False
+                break
+
+        return job_response
+
+    async def _execute_action(self, job_request, job_switches, raw_action_request):
+        server = self.server
+        action_request = server._make_action_request(job_request, job_switches, raw_action_request)
+        action = server._get_action(action_request.action)
+        if not action:
+            return server._make_action_not_found_response(action_request.action)
+
+        if server.scoreboard_slot:
+            server.scoreboard_slot.action_started(action_request.action)
+        if not isinstance(action, AsyncAction):
+            action = functools.partial(self._run_sync_action, action)
+        # Wrap it in middleware
+        wrapper = server.make_middleware_stack(self.action_middleware, action)
+        # Execute the middleware stack
+        try:
+            return await wrapper(action_request)
+        except ActionError as e:
+            # Error: an error was thrown while running the Action (or Action middleware)
+            return ActionResponse(
+                action=action_request.action,
+                errors=e.errors,
+            )
+
+    async def _run_sync_action(self, action, action_request):
+        self.server.metrics.counter('server.async_jobs.sync_actions').increment()
+        return await self._run_in_executor(self._action_executor, self._call_sync_action, action, action_request)
+
+    def _call_sync_action(self, action, action_request):
+        try:
+            return action(action_request)
+        finally:
+            # Each thread has its own Django database connections
+            self.server._close_old_django_connections()
+
+    def _run_in_executor(self, executor, function, *args):
+        # The threads of the executor do not share the logging context of the task
+        logging_context = PySOALogContextFilter.get_logging_request_context()
+
+        def run():
+            if logging_context:
+                PySOALogContextFilter.set_logging_request_context(**logging_context)
+            try:
+                return function(*args)
+            finally:
+                if logging_context:
+                    PySOALogContextFilter.clear_logging_request_context()
+
+        return self.server.async_event_loop.run_in_executor(executor, run)
+
+
+def _get_async_middleware_hook(middleware, hook_name):
+    """
+    Returns the `job_async` or `action_async` hook of the middleware, making sure that middleware with a `job` or
+    `action` hook of its own also has the matching async hook, since it must not be skipped.
+
+    :raise: ValueError
+    """
+    async_hook_name = '{}_async'.format(hook_name)
+    if isinstance(middleware, ServerMiddleware):
+        middleware_class = type(middleware)
+        supported = (
+            getattr(middleware_class, hook_name) is getattr(ServerMiddleware, hook_name) or
+            getattr(middleware_class, async_hook_name) is not getattr(ServerMiddleware, async_hook_name)
+        )
+    else:
+        supported = hasattr(middleware, async_hook_name)
+
+    if not supported:
+        raise ValueError('Middleware {} cannot be used with async_jobs, because it has no `{}` hook'.format(
+            type(middleware).__name__,
+            async_hook_name,
+        ))
+    return getattr(middleware, async_hook_name)
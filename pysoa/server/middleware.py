@@ -40,3 +40,40 @@ class ServerMiddleware(object):
 
         # Remove ourselves from the stack
         return process_action
+
+    def job_async(self, process_job):
+        """
+        The equivalent of `job` for servers that run jobs as asyncio tasks (see `async_jobs` in the server settings),
+        used for creating a wrapper around the coroutine function `process_job`. In this simple implementation, just
+        returns `process_job`. Middleware that overrides `job` must override this, too, to be used by such servers.
+
+        :param process_job: A coroutine function that accepts a job request `dict` and returns a job response `dict`,
+                            or errors
+        :type process_job: callable(dict): awaitable(dict)
+
+        :return: A coroutine function that accepts a job request `dict` and returns a job response `dict`, or errors,
+                 by awaiting the provided `process_job` and possibly doing other things.
+        :rtype: callable(dict): awaitable(dict)
+        """
+
+        # Remove ourselves from the stack
+        return process_job
+
+    def action_async(self, process_action):
+        """
+        The equivalent of `action` for servers that run jobs as asyncio tasks (see `async_jobs` in the server
+        settings), used for creating a wrapper around the coroutine function `process_action`. In this simple
+        implementation, just returns `process_action`. Middleware that overrides `action` must override this, too, to
+        be used by such servers.
+
+        :param process_action: A coroutine function that accepts an `ActionRequest` object and returns an
+                               `ActionResponse` object, or errors
+        :type process_action: callable(ActionRequest): awaitable(ActionResponse)
+
+        :return: A coroutine function that accepts an `ActionRequest` object and returns an `ActionResponse` object, or
+                 errors, by awaiting the provided `process_action` and possibly doing other things.
+        :rtype: callable(ActionRequest): awaitable(ActionResponse)
+        """
+
+        # Remove ourselves from the stack
+        return process_action
@@ -0,0 +1,472 @@
+"""
+The supervisor with which the standalone server runs a service in several forked worker processes.
+"""
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import logging
+import multiprocessing
+import random
+import signal
+import sys
+import time
+
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.server.scoreboard import (
+    Scoreboard,
+    get_rss_in_bytes,
+)
+
+
+__all__ = (
+    'PreforkSupervisor',
+    'WorkerPool',
+    'get_recycling_server_class',
+    'get_request_queue_depth_getter',
+    'get_rss_in_bytes',
+    'run_worker',
+)
+
+
+# The exit code of a worker process whose server stopped because it was recycled, which is replaced at once
+WORKER_EXIT_CODE_RECYCLED = 0
+# The exit code of a worker process whose server stopped for any other reason, which is replaced after a delay
+WORKER_EXIT_CODE_STOPPED = 3
+
+
+def get_recycling_server_class(server_class, maximum_requests=0, maximum_rss_in_bytes=0):
+    """
+    Returns a subclass of the server class whose servers stop, so that the supervisor can replace them with fresh worker
+    processes, after handling `maximum_requests` requests (plus a random jitter of up to 10%, so that the workers are
+    not all recycled at once), or once the resident set size of the process exceeds `maximum_rss_in_bytes`.
+
+    :param server_class: The server class
+    :type server_class: type
+    :param maximum_requests: The number of requests after which to recycle a server, or 0 for no limit
+    :type maximum_requests: int
+    :param maximum_rss_in_bytes: The resident set size above which to recycle a server, or 0 for no limit
+    :type maximum_rss_in_bytes: int
+
+    :rtype: type
+    """
+    class RecyclingServer(server_class):
+        def __init__(self, settings):
+            super(RecyclingServer, self).__init__(settings)
+            self.recycling = False
+            self._requests_until_recycling = maximum_requests + random.randint(0, maximum_requests // 10)
+
+        def perform_post_request_actions(self):
+            super(RecyclingServer, self).perform_post_request_actions()
+            if self.recycling or self.shutting_down:
+                return
+
+            self._requests_until_recycling -= 1
+            if maximum_requests and self._requests_until_recycling < 1:
+                self._recycle('it has handled {} requests'.format(maximum_requests))
+            elif maximum_rss_in_bytes:
+                rss_in_bytes = get_rss_in_bytes()
+                if rss_in_bytes > maximum_rss_in_bytes:
+                    self._recycle('its resident set size of {} bytes exceeds {} bytes'.format(
+                        rss_in_bytes,
+                        maximum_rss_in_bytes,
+                    ))
+
+        def _recycle(self, reason):
+            self.logger.info('Recycling worker process because {}'.format(reason))
+            self.recycling = True
+            self.shutting_down = True
+
+    RecyclingServer.__name__ = str(server_class.__name__)
+    return RecyclingServer
+
+
+def get_request_queue_depth_getter(server_class, settings):
+    """
+    Returns a callable that returns the number of requests waiting to be received by the servers of the server class
+    (see `ServerTransport.get_request_queue_depth`), with which the supervisor scales a worker pool. The transport is
+    only created when the callable is first called, in the master process.
+
+    :param server_class: The server class, as returned by `Server.prepare_main`
+    :type server_class: type
+    :param settings: The server settings, as returned by `Server.prepare_main`
+    :type settings: dict
+
+    :rtype: callable
+    """
+    transports = []
+
+    def get_request_queue_depth():
+        if not transports:
+            transports.append(settings['transport']['object'](
+                server_class.service_name,
+                NoOpMetricsRecorder(),
+                **settings['transport'].get('kwargs', {})
+            ))
+        return transports[0].get_request_queue_depth()
+
+    return get_request_queue_depth
+
+
+def run_worker(server_class, settings, scoreboard_slot=None):
+    """
+    The target of a worker process, which instantiates and runs the server class, prepared by the master process, and
+    then exits with an exit code that tells the supervisor whether the server was recycled.
+
+    :param server_class: The server class, as returned by `Server.prepare_main`
+    :type server_class: type
+    :param settings: The server settings, as returned by `Server.prepare_main`
+    :type settings: dict
+    :param scoreboard_slot: The scoreboard slot in which the server records its activity
+    :type scoreboard_slot: ScoreboardSlot
+    """
+    server = server_class(settings)
+    server.scoreboard_slot = scoreboard_slot
+    server.run()
+    sys.exit(WORKER_EXIT_CODE_RECYCLED if getattr(server, 'recycling', False) else WORKER_EXIT_CODE_STOPPED)
+
+
+class _Worker(object):
+    def __init__(self, index, name, target):
+        self.index = index
+        self.name = name
+        self.target = target
+        self.slot = None
+        self.process = None
+        self.started = 0
+        self.start_after = 0
+        self.consecutive_failures = 0
+        self.retiring = False
+        # The busy seconds of the worker process when its pool was last sampled
+        self.busy_seconds_sampled = 0
+        self.busy_seconds_sampled_at = 0
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes that all run the same target, named `<name>-<index>`. With a `maximum` greater than its
+    `minimum`, the pool is scaled: every `SCALE_INTERVAL_IN_SECONDS`, the supervisor samples the number of requests
+    waiting in the queues and the busy ratio of the worker processes (the fraction of the time they spent handling
+    requests since the last sample). The pool grows, by a quarter of its size but at least one worker process, when
+    requests were waiting for as many samples in a row as `SCALE_UP_SAMPLES`. Requests are waiting if more are queued
+    than there are worker processes, or if any are queued while the busy ratio is at least `SCALE_UP_BUSY_RATIO`. It
+    shrinks, by one worker process, when no requests were queued and the busy ratio was at most
+    `SCALE_DOWN_BUSY_RATIO` for as many samples in a row as `SCALE_DOWN_SAMPLES`. The gap between the two ratios, and
+    the longer wait before shrinking, keep the pool from flapping.
+
+    Each sample is recorded in the following metrics, where the ratio of a counter to `scaling.samples` is its average
+    per sample, and the metrics of a named pool (`metrics_name`) are prefixed with `server.prefork.<metrics_name>.`
+    instead of `server.prefork.`:
+
+    - `scaling.samples`: A counter incremented with each sample
+    - `scaling.workers`: A counter incremented by the number of worker processes at each sample
+    - `scaling.busy_percent`: A counter incremented by the busy ratio, as a percentage, at each sample
+    - `scaling.queue_depth`: A counter incremented by the number of requests waiting at each sample
+    - `scaling.queue_depth_error`: A counter incremented when the number of requests waiting could not be sampled
+    - `scaling.scale_up`: A counter incremented by the number of worker processes forked when the pool grows
+    - `scaling.scale_down`: A counter incremented by the number of worker processes stopped when the pool shrinks
+    """
+
+    SCALE_INTERVAL_IN_SECONDS = 5
+    SCALE_UP_BUSY_RATIO = 0.8
+    SCALE_DOWN_BUSY_RATIO = 0.3
+    SCALE_UP_SAMPLES = 2
+    SCALE_DOWN_SAMPLES = 6
+
+    def __init__(self, name, target, minimum, maximum=0, get_request_queue_depth=None, metrics=None, metrics_name=None):
+        """
+        :param name: The name of the pool, which prefixes the names of its worker processes
+        :type name: union[str, unicode]
+        :param target: The target of each worker process, which is called with its `ScoreboardSlot` in the worker
+                       process (see `run_worker`)
+        :type target: callable
+        :param minimum: The number of worker processes to start with, and below which the pool does not shrink
+        :type minimum: int
+        :param maximum: The number of worker processes above which the pool does not grow (if it is not greater than
+                        the minimum, the pool is not scaled)
+        :type maximum: int
+        :param get_request_queue_depth: A callable that returns the number of requests waiting to be received by the
+                                        worker processes, or `None` if unknown (see `get_request_queue_depth_getter`)
+        :type get_request_queue_depth: callable
+        :param metrics: The metrics recorder for the scaling metrics
+        :type metrics: MetricsRecorder
+        :param metrics_name: The name of the pool in the scaling metrics
+        :type metrics_name: union[str, unicode]
+        """
+        self.name = name
+        self.target = target
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.get_request_queue_depth = get_request_queue_depth
+        self.metrics = metrics or NoOpMetricsRecorder()
+        self.metrics_prefix = 'server.prefork.{}.'.format(metrics_name) if metrics_name else 'server.prefork.'
+        self.logger = logging.getLogger('pysoa.server.prefork')
+
+        # The index of the pool's first slot in the supervisor's scoreboard
+        self.slot_offset = 0
+        self.workers = []
+        self._next_sample = 0
+        self._last_sample = 0
+        self._scale_up_samples = 0
+        self._scale_down_samples = 0
+        for _ in range(self.minimum):
+            self.add_worker()
+
+    @property
+    def size(self):
+        """
+        The number of worker processes in the pool, not counting those that are being stopped.
+        """
+        return sum(1 for worker in self.workers if not worker.retiring)
+
+    def add_worker(self):
+        indexes = {worker.index for worker in self.workers}
+        index = next(i for i in range(len(self.workers) + 1) if i not in indexes)
+        self.workers.append(_Worker(index, '{}-{}'.format(self.name, index), self.target))
+
+    def retire_worker(self):
+        """
+        Marks the worker process with the highest index for stopping, and returns it, or returns `None` if it was not
+        started, in which case it is removed from the pool at once.
+
+        :rtype: _Worker
+        """
+        worker = max((worker for worker in self.workers if not worker.retiring), key=lambda w: w.index)
+        if not worker.process:
+            self.workers.remove(worker)
+            return None
+        worker.retiring = True
+        return worker
+
+    def get_scaling_decision(self, now):
+        """
+        Samples the pool if it is scaled and it is time to, and returns the number of worker processes to add (if
+        positive) or stop (if negative).
+
+        :rtype: int
+        """
+        if self.maximum <= self.minimum or now < self._next_sample:
+            return 0
+        if any(worker.retiring for worker in self.workers):
+            # The pool is not scaled again until the worker process being stopped has exited and freed its slot
+            return 0
+        self._next_sample = now + self.SCALE_INTERVAL_IN_SECONDS
+
+        busy_seconds = 0
+        total_seconds = 0
+        running = 0
+        for worker in self.workers:
+            if not worker.process or worker.retiring:
+                continue
+            running += 1
+            worker_busy_seconds = worker.slot.get_busy_seconds(now)
+            since = max(worker.busy_seconds_sampled_at, worker.started)
+            busy_seconds += max(worker_busy_seconds - worker.busy_seconds_sampled, 0)
+            total_seconds += max(now - since, 0)
+            worker.busy_seconds_sampled = worker_busy_seconds
+            worker.busy_seconds_sampled_at = now
+        busy_ratio = min(busy_seconds / total_seconds, 1.0) if total_seconds else 0.0
+
+        queue_depth = None
+        if self.get_request_queue_depth:
+            try:
+                queue_depth = self.get_request_queue_depth()
+            except Exception:
+                self.logger.warning(
+                    'Could not sample the request queue depth of pool {}'.format(self.name),
+                    exc_info=True,
+                )
+                self._counter('scaling.queue_depth_error').increment()
+
+        self._counter('scaling.samples').increment()
+        self._counter('scaling.workers').increment(running)
+        self._counter('scaling.busy_percent').increment(int(busy_ratio * 100))
+        if queue_depth is not None:
+            self._counter('scaling.queue_depth').increment(queue_depth)
+
+        if (
+            (queue_depth is not None and queue_depth > running) or
+            (queue_depth != 0 and busy_ratio >= self.SCALE_UP_BUSY_RATIO)
+        ):
+            self._scale_up_samples += 1
+            self._scale_down_samples = 0
+        elif not queue_depth and busy_ratio <= self.SCALE_DOWN_BUSY_RATIO:
+            self._scale_down_samples += 1
+            self._scale_up_samples = 0
+        else:
+            self._scale_up_samples = 0
+            self._scale_down_samples = 0
+
+        size = self.size
+        decision = 0
+        if self._scale_up_samples >= self.SCALE_UP_SAMPLES and size < self.maximum:
+            decision = min(max(size // 4, 1), self.maximum - size)
+            self._counter('scaling.scale_up').increment(decision)
+        elif self._scale_down_samples >= self.SCALE_DOWN_SAMPLES and size > self.minimum:
+            decision = -1
+            self._counter('scaling.scale_down').increment()
+        if decision:
+            self._scale_up_samples = 0
+            self._scale_down_samples = 0
+            self.logger.info(
+                'Scaling pool {} from {} to {} worker processes (queue depth {}, busy ratio {:.2f})'.format(
+                    self.name,
+                    size,
+                    size + decision,
+                    queue_depth,
+                    busy_ratio,
+                ),
+            )
+
+        self.metrics.commit()
+        return decision
+
+    def _counter(self, name):
+        return self.metrics.counter(self.metrics_prefix + name)
+
+
+class PreforkSupervisor(object):
+    """
+    Forks the worker processes of a service and keeps them running. The server classes are initialized and warmed up
+    in the master process before forking (see `Server.prepare_main`), so that the workers share what was loaded,
+    copy-on-write, which requires the `fork` start method of `multiprocessing` (the default on Linux).
+
+    A worker process that exits after being recycled (see `get_recycling_server_class`) is replaced at once. A worker
+    process that exits for any other reason (it crashed, its server triggered harakiri, or its server stopped after a
+    transport error) is replaced after a delay that doubles with each consecutive failure, so that workers that fail
+    right away are not forked over and over. Worker pools with a maximum size are scaled as described in `WorkerPool`;
+    when a pool shrinks, the worker process with the highest index is sent SIGTERM, so that its server shuts down
+    gracefully, and it is not replaced.
+
+    Each worker process records its activity in a slot of its own in a scoreboard (see `Scoreboard`), from which the
+    supervisor reads how busy the worker processes are. The scoreboard is created in `scoreboard_file`, if given, so
+    that other processes can read it too, and is removed when the supervisor exits.
+
+    The worker processes receive SIGINT and SIGTERM directly (from the terminal, or from the process manager, which
+    signals the whole process group), so on either signal the supervisor just stops replacing them and waits for them
+    to exit. On SIGHUP (which the file watcher reloader sends), it terminates them.
+    """
+
+    MONITOR_INTERVAL_IN_SECONDS = 1
+    MINIMUM_RESPAWN_DELAY_IN_SECONDS = 1
+    MAXIMUM_RESPAWN_DELAY_IN_SECONDS = 60
+    # A worker process that exits after running for at least this long has its consecutive failures reset
+    STABLE_WORKER_RUN_TIME_IN_SECONDS = 60
+
+    def __init__(self, pools, scoreboard_file=None):
+        """
+        :param pools: The pools of worker processes
+        :type pools: iterable[WorkerPool]
+        :param scoreboard_file: The path of the file in which to create the scoreboard in which the worker processes
+                                record their activity (see `Scoreboard`), or `None` for an anonymous scoreboard
+        :type scoreboard_file: union[str, unicode]
+        """
+        self.pools = list(pools)
+        self.scoreboard_file = scoreboard_file
+        self.scoreboard = None
+        self.shutting_down = False
+        self.logger = logging.getLogger('pysoa.server.prefork')
+
+    @property
+    def workers(self):
+        return [worker for pool in self.pools for worker in pool.workers]
+
+    def run(self):
+        """
+        Forks the worker processes, and replaces them as they exit, until the supervisor is signaled to stop and all the
+        worker processes have exited.
+        """
+        signal.signal(signal.SIGINT, self.handle_shutdown_signal)
+        signal.signal(signal.SIGTERM, self.handle_shutdown_signal)
+        signal.signal(signal.SIGHUP, self.handle_hangup_signal)
+
+        # Each pool has a slot for each worker process it can grow to
+        slots = 0
+        for pool in self.pools:
+            pool.slot_offset = slots
+            slots += pool.maximum
+        self.scoreboard = Scoreboard.create(slots, self.scoreboard_file)
+
+        try:
+            while True:
+                now = time.time()
+                for pool in self.pools:
+                    for worker in list(pool.workers):
+                        if worker.process and not worker.process.is_alive():
+                            self._handle_worker_exit(pool, worker, now)
+                        if not worker.process and not worker.retiring and not self.shutting_down and \
+                                now >= worker.start_after:
+                            self._start_worker(pool, worker, now)
+
+                    if not self.shutting_down:
+                        self._scale_pool(pool, now)
+
+                if self.shutting_down and not any(worker.process for worker in self.workers):
+                    break
+                time.sleep(self.MONITOR_INTERVAL_IN_SECONDS)
+        finally:
+            self.scoreboard.close(remove=True)
+
+    def handle_shutdown_signal(self, *_):
+        if not self.shutting_down:
+            self.logger.info('Received interrupt; waiting for the worker processes to exit')
+        self.shutting_down = True
+
+    def handle_hangup_signal(self, *_):
+        self.logger.info('Received hangup; terminating the worker processes')
+        self.shutting_down = True
+        for worker in self.workers:
+            if worker.process:
+                worker.process.terminate()
+
+    def _scale_pool(self, pool, now):
+        decision = pool.get_scaling_decision(now)
+        for _ in range(decision):
+            pool.add_worker()
+            self._start_worker(pool, pool.workers[-1], now)
+        for _ in range(-decision):
+            worker = pool.retire_worker()
+            if worker:
+                worker.process.terminate()
+
+    def _start_worker(self, pool, worker, now):
+        worker.slot = self.scoreboard.slots[pool.slot_offset + worker.index]
+        worker.slot.reset(worker.name)
+        worker.process = multiprocessing.Process(target=worker.target, args=(worker.slot, ), name=worker.name)
+        worker.process.start()
+        worker.started = now
+        worker.busy_seconds_sampled = 0
+        worker.busy_seconds_sampled_at = now
+
+    def _handle_worker_exit(self, pool, worker, now):
+        worker.process.join()
+        exit_code = worker.process.exitcode
+        worker.process = None
+        worker.slot.clear()
+        if worker.retiring:
+            self.logger.info('Worker process {} stopped'.format(worker.name))
+            pool.workers.remove(worker)
+            return
+        if self.shutting_down:
+            return
+
+        if exit_code == WORKER_EXIT_CODE_RECYCLED:
+            self.logger.info('Worker process {} was recycled; replacing it'.format(worker.name))
+            worker.consecutive_failures = 0
+            worker.start_after = now
+            return
+
+        if now - worker.started >= self.STABLE_WORKER_RUN_TIME_IN_SECONDS:
+            worker.consecutive_failures = 0
+        worker.consecutive_failures += 1
+        delay = min(
+            self.MINIMUM_RESPAWN_DELAY_IN_SECONDS * 2 ** (worker.consecutive_failures - 1),
+            self.MAXIMUM_RESPAWN_DELAY_IN_SECONDS,
+        )
+        worker.start_after = now + delay
+        self.logger.warning('Worker process {} exited with code {}; replacing it in {}s'.format(
+            worker.name,
+            exit_code,
+            delay,
+        ))
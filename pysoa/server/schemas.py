@@ -24,7 +24,9 @@ ActionRequestSchema = Dictionary(
 ControlHeaderSchema = Dictionary(
     {
         'continue_on_error': Boolean(),
+        'parallel': Boolean(),
     },
+    optional_keys=['parallel'],
     allow_extra_keys=True,
 )
 
@@ -0,0 +1,474 @@
+"""
+The scoreboard in which server processes record their activity, in shared memory, so that the supervisor of forked
+server processes, the status action, and the command line tool in this module can see what each of them is doing
+without any file I/O in the servers.
+
+To see the activity of the server processes of a service with `scoreboard_file` in its server settings, run:
+
+    python -m pysoa.server.scoreboard /path/to/scoreboard/file
+"""
+from __future__ import (
+    absolute_import,
+    print_function,
+    unicode_literals,
+)
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import attr
+import six
+
+
+__all__ = (
+    'Scoreboard',
+    'ScoreboardSlot',
+    'WorkerStatus',
+    'get_rss_in_bytes',
+)
+
+
+SCOREBOARD_MAGIC = b'PYSOASB1'
+
+WORKER_STATE_FREE = 0
+WORKER_STATE_STARTING = 1
+WORKER_STATE_IDLE = 2
+WORKER_STATE_BUSY = 3
+WORKER_STATE_STOPPING = 4
+
+WORKER_STATE_NAMES = {
+    WORKER_STATE_FREE: 'free',
+    WORKER_STATE_STARTING: 'starting',
+    WORKER_STATE_IDLE: 'idle',
+    WORKER_STATE_BUSY: 'busy',
+    WORKER_STATE_STOPPING: 'stopping',
+}
+
+# The magic bytes, the number of slots, and the size of each slot
+_HEADER = struct.Struct(str('<8sII'))
+# The sequence number, the PID, the state, the number of requests in progress, the number of requests served, the time
+# the latest request started, the time spent handling requests as of the time it was last updated, that time, the time
+# of the last heartbeat, the resident set size, the current action, and the name
+_SLOT = struct.Struct(str('<IIBxHQddddQ64s48s'))
+_SEQUENCE = struct.Struct(str('<I'))
+
+SLOT_SIZE_IN_BYTES = 192
+
+_MAXIMUM_READ_ATTEMPTS = 100
+
+_STATUS_LINE = '{index:>4} {pid:>7} {name:<24} {state:<8} {requests:>9} {busy:>9} {rss:>8} {heartbeat:>9} {action}'
+
+# How often (at most) a server process samples its resident set size, which requires reading a file
+RSS_SAMPLE_INTERVAL_IN_SECONDS = 1
+
+
+def get_rss_in_bytes():
+    """
+    Returns the resident set size of the calling process or, on systems without `/proc`, its maximum resident set size
+    so far.
+
+    :rtype: int
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf(str('SC_PAGE_SIZE'))
+    except (IOError, OSError, ValueError, IndexError):
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, and other systems report kilobytes
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+@attr.s
+class WorkerStatus(object):
+    """
+    The activity of one server process, as read from a scoreboard slot.
+    """
+    index = attr.ib()
+    name = attr.ib()
+    pid = attr.ib()
+    state = attr.ib()
+    action = attr.ib()
+    request_started = attr.ib()
+    requests_in_flight = attr.ib()
+    requests_served = attr.ib()
+    busy_seconds = attr.ib()
+    rss_in_bytes = attr.ib()
+    heartbeat = attr.ib()
+
+
+class ScoreboardSlot(object):
+    """
+    One slot of a scoreboard, which one server process writes to, and any process can read from. Writes are lock-free:
+    the writer increments the slot's sequence number before and after writing the slot, and readers retry until they
+    read the same, even, sequence number before and after reading the slot.
+
+    In a server that handles several jobs at once (with `worker_threads` or `async_jobs`), the slot counts the jobs in
+    progress, records the action and start time of the job that started last, and its busy time adds up the time spent
+    handling each job. The threads of such a server write to the slot one at a time.
+    """
+
+    def __init__(self, scoreboard_mmap, index):
+        self._mmap = scoreboard_mmap
+        self.index = index
+        self._offset = _HEADER.size + index * SLOT_SIZE_IN_BYTES
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._pid = 0
+        self._state = WORKER_STATE_FREE
+        self._requests_in_flight = 0
+        self._requests_served = 0
+        self._request_started = 0.0
+        self._busy_seconds = 0.0
+        self._busy_updated = 0.0
+        self._heartbeat = 0.0
+        self._rss_in_bytes = 0
+        self._rss_sampled = 0.0
+        self._action = b''
+        self._name = b''
+
+    def reset(self, name):
+        """
+        Clears the slot and assigns it to the named server process that is about to start.
+
+        :param name: The name of the server process
+        :type name: union[str, unicode]
+        """
+        with self._lock:
+            self._resynchronize()
+            self._pid = 0
+            self._state = WORKER_STATE_STARTING
+            self._requests_in_flight = 0
+            self._requests_served = 0
+            self._request_started = 0.0
+            self._busy_seconds = 0.0
+            self._busy_updated = 0.0
+            self._heartbeat = 0.0
+            self._rss_in_bytes = 0
+            self._rss_sampled = 0.0
+            self._action = b''
+            self._name = _encode(name, 48)
+            self._write()
+
+    def clear(self):
+        """
+        Marks the slot free, after its server process has exited.
+        """
+        with self._lock:
+            self._resynchronize()
+            self._pid = 0
+            self._state = WORKER_STATE_FREE
+            self._requests_in_flight = 0
+            self._action = b''
+            self._write()
+
+    def started(self, pid, now):
+        with self._lock:
+            self._pid = pid
+            self._state = WORKER_STATE_IDLE
+            self._heartbeat = now
+            self._sample_rss(now)
+            self._write()
+
+    def request_started(self, now):
+        with self._lock:
+            self._update_busy_seconds(now)
+            self._requests_in_flight += 1
+            self._state = WORKER_STATE_BUSY
+            self._request_started = now
+            self._heartbeat = now
+            self._write()
+
+    def action_started(self, action_name):
+        with self._lock:
+            self._action = _encode(action_name, 64)
+            self._write()
+
+    def request_finished(self, now):
+        with self._lock:
+            self._update_busy_seconds(now)
+            self._requests_in_flight = max(self._requests_in_flight - 1, 0)
+            self._requests_served += 1
+            if not self._requests_in_flight:
+                self._state = WORKER_STATE_IDLE
+                self._request_started = 0.0
+                self._action = b''
+            self._heartbeat = now
+            self._sample_rss(now)
+            self._write()
+
+    def heartbeat(self, now):
+        with self._lock:
+            self._heartbeat = now
+            self._sample_rss(now)
+            self._write()
+
+    def stopping(self):
+        with self._lock:
+            self._state = WORKER_STATE_STOPPING
+            self._write()
+
+    def read(self):
+        """
+        Reads the slot.
+
+        :rtype: WorkerStatus
+        """
+        (
+            _, pid, state, requests_in_flight, requests_served, request_started, busy_seconds, _, heartbeat,
+            rss_in_bytes, action, name,
+        ) = self._read_values()
+        return WorkerStatus(
+            index=self.index,
+            name=_decode(name),
+            pid=pid,
+            state=WORKER_STATE_NAMES.get(state, 'unknown'),
+            action=_decode(action) or None,
+            request_started=request_started or None,
+            requests_in_flight=requests_in_flight,
+            requests_served=requests_served,
+            busy_seconds=busy_seconds,
+            rss_in_bytes=rss_in_bytes,
+            heartbeat=heartbeat or None,
+        )
+
+    def get_busy_seconds(self, now):
+        """
+        Returns the total time the server process has spent handling requests, including the requests in progress
+        (each of which counts separately).
+
+        :rtype: float
+        """
+        values = self._read_values()
+        requests_in_flight, busy_seconds, busy_updated = values[3], values[6], values[7]
+        return busy_seconds + requests_in_flight * max(now - busy_updated, 0)
+
+    def _read_values(self):
+        for _ in range(_MAXIMUM_READ_ATTEMPTS):
+            sequence = self._read_sequence()
+            values = _SLOT.unpack_from(self._mmap, self._offset)
+            if sequence % 2 == 0 and self._read_sequence() == sequence:
+                break
+            # The writer is in the middle of writing the slot (or, after this many attempts, it died in the middle of
+            # writing it, and the values read last are as good as any)
+            time.sleep(0)
+        return values
+
+    def _update_busy_seconds(self, now):
+        # Each request in progress adds the time since the last update
+        if self._requests_in_flight:
+            self._busy_seconds += self._requests_in_flight * max(now - self._busy_updated, 0)
+        self._busy_updated = now
+
+    def _sample_rss(self, now):
+        if now - self._rss_sampled >= RSS_SAMPLE_INTERVAL_IN_SECONDS:
+            self._rss_in_bytes = get_rss_in_bytes()
+            self._rss_sampled = now
+
+    def _resynchronize(self):
+        # Another process wrote to the slot last, and it may have died in the middle of writing it
+        self._sequence = self._read_sequence() & ~1
+
+    def _read_sequence(self):
+        return _SEQUENCE.unpack_from(self._mmap, self._offset)[0]
+
+    def _write(self):
+        # Called with the lock held
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        _SEQUENCE.pack_into(self._mmap, self._offset, self._sequence)
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        _SLOT.pack_into(
+            self._mmap,
+            self._offset,
+            self._sequence,
+            self._pid,
+            self._state,
+            self._requests_in_flight,
+            self._requests_served,
+            self._request_started,
+            self._busy_seconds,
+            self._busy_updated,
+            self._heartbeat,
+            self._rss_in_bytes,
+            self._action,
+            self._name,
+        )
+
+
+class Scoreboard(object):
+    """
+    A fixed number of slots in shared memory, one for each server process, either in a file, so that other processes
+    can open it, or anonymous, in which case only the processes forked after it is created share it.
+    """
+
+    def __init__(self, scoreboard_mmap, slots, path=None):
+        self._mmap = scoreboard_mmap
+        self.slots = [ScoreboardSlot(scoreboard_mmap, index) for index in range(slots)]
+        self.path = path
+
+    @classmethod
+    def create(cls, slots, path=None):
+        """
+        Creates a scoreboard with all its slots free.
+
+        :param slots: The number of slots
+        :type slots: int
+        :param path: The path of the file in which to create the scoreboard, replacing any file there, or `None` for an
+                     anonymous scoreboard
+        :type path: union[str, unicode]
+
+        :rtype: Scoreboard
+        """
+        size = _HEADER.size + slots * SLOT_SIZE_IN_BYTES
+        if path:
+            path = os.path.abspath(path)
+            with open(path, 'wb') as f:
+                f.write(_HEADER.pack(SCOREBOARD_MAGIC, slots, SLOT_SIZE_IN_BYTES))
+                f.write(b'\0' * (size - _HEADER.size))
+            with open(path, 'r+b') as f:
+                scoreboard_mmap = mmap.mmap(f.fileno(), size)
+        else:
+            scoreboard_mmap = mmap.mmap(-1, size)
+            _HEADER.pack_into(scoreboard_mmap, 0, SCOREBOARD_MAGIC, slots, SLOT_SIZE_IN_BYTES)
+        return cls(scoreboard_mmap, slots, path)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens the scoreboard in the file, created by another process, for reading.
+
+        :param path: The path of the scoreboard file
+        :type path: union[str, unicode]
+
+        :rtype: Scoreboard
+
+        :raise: IOError, OSError, ValueError
+        """
+        with open(path, 'rb') as f:
+            scoreboard_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(scoreboard_mmap) < _HEADER.size:
+            scoreboard_mmap.close()
+            raise ValueError('File {} is not a PySOA scoreboard'.format(path))
+        magic, slots, slot_size = _HEADER.unpack_from(scoreboard_mmap, 0)
+        if magic != SCOREBOARD_MAGIC or slot_size != SLOT_SIZE_IN_BYTES or \
+                len(scoreboard_mmap) < _HEADER.size + slots * slot_size:
+            scoreboard_mmap.close()
+            raise ValueError('File {} is not a PySOA scoreboard'.format(path))
+        return cls(scoreboard_mmap, slots, path)
+
+    def read(self):
+        """
+        Reads the slots that are in use.
+
+        :rtype: list[WorkerStatus]
+        """
+        statuses = [slot.read() for slot in self.slots]
+        return [status for status in statuses if status.state != 'free']
+
+    def close(self, remove=False):
+        """
+        Closes the scoreboard, and optionally removes its file.
+
+        :param remove: Whether to remove the scoreboard file
+        :type remove: bool
+        """
+        self._mmap.close()
+        if remove and self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _encode(value, size):
+    encoded = six.text_type(value).encode('utf-8')
+    if len(encoded) <= size:
+        return encoded
+    # Do not cut a multi-byte character in half
+    return encoded[:size].decode('utf-8', 'ignore').encode('utf-8')
+
+
+def _decode(value):
+    return value.rstrip(b'\0').decode('utf-8', 'replace')
+
+
+def _format_status(status, now):
+    return _STATUS_LINE.format(
+        index=status.index,
+        pid=status.pid or '-',
+        name=status.name,
+        state=status.state,
+        requests=status.requests_served,
+        busy='{:.1f}'.format(status.busy_seconds),
+        rss='{:.1f}'.format(status.rss_in_bytes / 1024.0 / 1024.0),
+        heartbeat='{:.1f}s'.format(now - status.heartbeat) if status.heartbeat else '-',
+        action='{} ({:.1f}s)'.format(status.action, now - status.request_started) if status.action else '',
+    )
+
+
+def main(argv=None):
+    """
+    Prints the activity of each server process in a scoreboard file and, with `--check-heartbeat SECONDS`, exits with
+    status 1 if any of them has not recorded a heartbeat for longer than that (for example, to use as a liveness probe
+    in place of a heartbeat file).
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the activity of the server processes in a PySOA scoreboard')
+    parser.add_argument('path', help='The path of the scoreboard file (the `scoreboard_file` server setting)')
+    parser.add_argument(
+        '--check-heartbeat',
+        help='Exit with status 1 if any running server process has not recorded a heartbeat for this many seconds',
+        required=False,
+        type=float,
+        default=0,
+        metavar='SECONDS',
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        scoreboard = Scoreboard.open(args.path)
+    except (IOError, OSError, ValueError) as e:
+        print('ERROR: {}'.format(e), file=sys.stderr)
+        return 2
+
+    try:
+        statuses = scoreboard.read()
+    finally:
+        scoreboard.close()
+
+    now = time.time()
+    print(_STATUS_LINE.format(
+        index='SLOT',
+        pid='PID',
+        name='NAME',
+        state='STATE',
+        requests='REQUESTS',
+        busy='BUSY (S)',
+        rss='RSS (MB)',
+        heartbeat='HEARTBEAT',
+        action='ACTION',
+    ))
+    for status in statuses:
+        print(_format_status(status, now))
+
+    if args.check_heartbeat > 0:
+        stale = [
+            status for status in statuses
+            if status.state in ('idle', 'busy') and status.heartbeat and now - status.heartbeat > args.check_heartbeat
+        ]
+        if stale:
+            print('ERROR: No heartbeat for more than {}s from {}'.format(
+                args.check_heartbeat,
+                ', '.join(status.name or six.text_type(status.pid) for status in stale),
+            ), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,12 +5,16 @@ from __future__ import (
 
 import argparse
 import codecs
+import collections
+import functools
 import importlib
 import logging
 import logging.config
+from multiprocessing.pool import ThreadPool
 import os
 import signal
 import sys
+import threading
 import time
 import traceback
 
@@ -41,12 +45,14 @@ from pysoa.common.types import (
     JobResponse,
     UnicodeKeysDict,
 )
+from pysoa.server.action.base import Action
 from pysoa.server.errors import (
     ActionError,
     JobError,
 )
 from pysoa.server.internal.types import RequestSwitchSet
 from pysoa.server.schemas import JobRequestSchema
+from pysoa.server.scoreboard import Scoreboard
 from pysoa.server.settings import PolymorphicServerSettings
 from pysoa.server.types import EnrichedActionRequest
 import pysoa.version
@@ -62,6 +68,7 @@ try:
     from django.core.cache import caches as django_caches
     from django.db import (
         close_old_connections as django_close_old_connections,
+        connections as django_connections,
         reset_queries as django_reset_queries,
     )
     from django.db.transaction import get_autocommit as django_get_autocommit
@@ -71,6 +78,7 @@ except (ImportError, ImproperlyConfigured):
     django_settings = None
     django_caches = None
     django_close_old_connections = None
+    django_connections = None
     django_reset_queries = None
     django_get_autocommit = None
 
@@ -78,6 +86,32 @@ except (ImportError, ImproperlyConfigured):
         pass
 
 
+if sys.version_info >= (3, 5):
+    from pysoa.server.action.async_base import AsyncAction
+    from pysoa.server.async_server import AsyncJobRunner
+else:
+    AsyncAction = None
+    AsyncJobRunner = None
+
+
+class _ServerThreadState(threading.local):
+    """
+    The state of the server that each thread handling requests keeps separately, so that, in threaded mode, each worker
+    thread has its own transport and its own requests in progress.
+    """
+
+    def __init__(self):
+        # The transport of a worker thread, if not the server's transport
+        self.transport = None
+        self.idle_timer = None
+        # Jobs received from the transport while gathering a batch of jobs for a different action, handled next
+        self.received_requests = collections.deque()
+        # The batch of jobs to which the job being handled by this thread belongs, and the job's index in the batch
+        self.action_batch = None
+        # The thread pool in which this thread handles the jobs of each batch, created when first needed
+        self.action_batch_thread_pool = None
+
+
 class Server(object):
     """
     The base class from which all PySOA service servers inherit, and contains the code that does all of the heavy
@@ -94,6 +128,15 @@ class Server(object):
 
     settings_class = PolymorphicServerSettings
 
+    # How often, in threaded mode, the main thread checks the worker threads for harakiri
+    WORKER_THREAD_MONITOR_INTERVAL_IN_SECONDS = 1
+    # How many times, at most, the server checks for more queued jobs during the maximum wait for a batch of jobs, at
+    # even intervals, besides the check as soon as the batch starts
+    ACTION_BATCHING_MAXIMUM_POLLS = 4
+    # How often, at most, a server with a scoreboard slot, which already records every request without file I/O, also
+    # updates its heartbeat file after handling requests
+    SCOREBOARD_HEARTBEAT_FILE_INTERVAL_IN_SECONDS = 1
+
     use_django = False
     service_name = None
     action_class_map = {}
@@ -111,14 +154,14 @@ class Server(object):
         if asyncio:
             self.async_event_loop = asyncio.get_event_loop()
 
+        self._thread_state = _ServerThreadState()
+        # The time at which each worker thread, in threaded mode, last started handling a job or waiting for one
+        self._worker_activity = {}
+
         # Store settings and extract transport
         self.settings = settings
         self.metrics = self.settings['metrics']['object'](**self.settings['metrics'].get('kwargs', {}))
-        self.transport = self.settings['transport']['object'](
-            self.service_name,
-            self.metrics,
-            **self.settings['transport'].get('kwargs', {})
-        )
+        self.transport = self._make_transport()
 
         # Set initial state
         self.shutting_down = False
@@ -147,34 +190,80 @@ class Server(object):
 
         self._default_status_action_class = None
 
-        self._idle_timer = None
-
         self._heartbeat_file = None
         self._heartbeat_file_path = None
+        self._heartbeat_file_lock = threading.Lock()
+        self._heartbeat_file_updated = 0.0
+
+        # The scoreboard slot in which the server records its activity, assigned by the supervisor of forked servers or
+        # else in a scoreboard that the server creates itself, if `scoreboard_file` is set
+        self.scoreboard_slot = None
+        self._scoreboard = None
+
+        # The thread pool in which the actions of jobs with the `parallel` control header are run, created when needed
+        self._action_thread_pool = None
+        # The thread pools in which the jobs of batches are handled, one for each thread handling requests
+        self._action_batch_thread_pools = []
+
+    @property
+    def transport(self):
+        """
+        The transport from which the calling thread receives requests and to which it sends responses. In threaded
+        mode, each worker thread has a transport of its own.
+        """
+        if self._thread_state.transport is not None:
+            return self._thread_state.transport
+        return self._transport
+
+    @transport.setter
+    def transport(self, transport):
+        self._transport = transport
+
+    def _make_transport(self):
+        return self.settings['transport']['object'](
+            self.service_name,
+            self.metrics,
+            **self.settings['transport'].get('kwargs', {})
+        )
 
     def handle_next_request(self):
         """
         Retrieves the next request from the transport, or returns if it times out (no request has been made), and then
-        processes that request, sends its response, and returns when done.
+        processes that request, sends its response, and returns when done. If the request is a job that calls only a
+        batchable action, and `action_batching` is enabled, other queued jobs that call only the same action are
+        received, too, and processed together with it (see `Action.call_batch`).
         """
-        if not self._idle_timer:
+        if not self._thread_state.idle_timer:
             # This method may be called multiple times before receiving a request, so we only create and start a timer
             # if it's the first call or if the idle timer was stopped on the last call.
-            self._idle_timer = self.metrics.timer('server.idle_time', resolution=TimerResolution.MICROSECONDS)
-            self._idle_timer.start()
+            self._thread_state.idle_timer = self.metrics.timer(
+                'server.idle_time',
+                resolution=TimerResolution.MICROSECONDS,
+            )
+            self._thread_state.idle_timer.start()
 
         # Get the next JobRequest
-        try:
-            request_id, meta, job_request = self.transport.receive_request_message()
-        except MessageReceiveTimeout:
-            # no new message, nothing to do
-            self.perform_idle_actions()
-            return
+        if self._thread_state.received_requests:
+            request_id, meta, job_request = self._thread_state.received_requests.popleft()
+        else:
+            try:
+                request_id, meta, job_request = self.transport.receive_request_message()
+            except MessageReceiveTimeout:
+                # no new message, nothing to do
+                self.perform_idle_actions()
+                return
 
         # We are no longer idle, so stop the timer and reset for the next idle period
-        self._idle_timer.stop()
-        self._idle_timer = None
+        self._thread_state.idle_timer.stop()
+        self._thread_state.idle_timer = None
 
+        batch = self._receive_job_batch(request_id, meta, job_request)
+        if len(batch) > 1:
+            self._handle_job_batch(batch)
+        else:
+            self._handle_job(request_id, meta, job_request)
+
+    def _handle_job(self, request_id, meta, job_request):
         PySOALogContextFilter.set_logging_request_context(request_id=request_id, **job_request['context'])
 
         request_for_logging = self.logging_dict_wrapper_class(job_request)
@@ -186,63 +275,200 @@ class Server(object):
             # Process and run the Job
             job_response = self.process_job(job_request)
 
-            # Prepare the JobResponse for sending by converting it to a message dict
-            try:
-                response_message = attr.asdict(job_response, dict_factory=UnicodeKeysDict)
-            except Exception as e:
-                self.metrics.counter('server.error.response_conversion_failure').increment()
-                job_response = self.handle_job_exception(e, variables={'job_response': job_response})
-                response_message = attr.asdict(job_response, dict_factory=UnicodeKeysDict)
+            self._send_job_response(request_id, meta, job_request, job_response, request_for_logging)
+        finally:
+            PySOALogContextFilter.clear_logging_request_context()
+            self.perform_post_request_actions()
+
+    def _send_job_response(self, request_id, meta, job_request, job_response, request_for_logging):
+        """
+        Sends the response to a job (unless the job suppressed it), or an error response if it cannot be sent, and logs
+        it.
+        """
+        # Prepare the JobResponse for sending by converting it to a message dict
+        try:
+            response_message = attr.asdict(job_response, dict_factory=UnicodeKeysDict)
+        except Exception as e:
+            self.metrics.counter('server.error.response_conversion_failure').increment()
+            job_response = self.handle_job_exception(e, variables={'job_response': job_response})
+            response_message = attr.asdict(job_response, dict_factory=UnicodeKeysDict)
+
+        response_for_logging = self.logging_dict_wrapper_class(response_message)
+
+        # Send the response message
+        try:
+            if not job_request['control'].get('suppress_response', False):
+                self.transport.send_response_message(request_id, meta, response_message)
+        except MessageTooLarge as e:
+            self.metrics.counter('server.error.response_too_large').increment()
+            job_response = self.handle_job_error_code(
+                ERROR_CODE_RESPONSE_TOO_LARGE,
+                'Could not send the response because it was too large',
+                request_for_logging,
+                response_for_logging,
+                extra={'serialized_length_in_bytes': e.message_size_in_bytes},
+            )
+            self.transport.send_response_message(
+                request_id,
+                meta,
+                attr.asdict(job_response, dict_factory=UnicodeKeysDict),
+            )
+        except InvalidField:
+            self.metrics.counter('server.error.response_not_serializable').increment()
+            job_response = self.handle_job_error_code(
+                ERROR_CODE_RESPONSE_NOT_SERIALIZABLE,
+                'Could not send the response because it failed to serialize',
+                request_for_logging,
+                response_for_logging,
+            )
+            self.transport.send_response_message(
+                request_id,
+                meta,
+                attr.asdict(job_response, dict_factory=UnicodeKeysDict),
+            )
+        finally:
+            if job_response.errors or any(a.errors for a in job_response.actions):
+                if (
+                    self.request_log_error_level > self.request_log_success_level and
+                    self.job_logger.getEffectiveLevel() > self.request_log_success_level
+                ):
+                    # When we originally logged the request, it may have been hidden because the effective logging
+                    # level threshold was greater than the level at which we logged the request. So re-log the
+                    # request at the error level, if set higher.
+                    self.job_logger.log(self.request_log_error_level, 'Job request: %s', request_for_logging)
+                self.job_logger.log(self.request_log_error_level, 'Job response: %s', response_for_logging)
+            else:
+                self.job_logger.log(self.request_log_success_level, 'Job response: %s', response_for_logging)
 
-            response_for_logging = self.logging_dict_wrapper_class(response_message)
+    def _receive_job_batch(self, request_id, meta, job_request):
+        """
+        Returns a list of the received request and any other queued requests for jobs that call only the same batchable
+        action, up to `action_batching.maximum_jobs`, waiting at most `action_batching.maximum_wait_in_milliseconds` for
+        them. Jobs received for other actions are kept to be handled next.
+        """
+        batch = [(request_id, meta, job_request)]
+        maximum_jobs = self.settings['action_batching']['maximum_jobs']
+        if maximum_jobs < 2 or self.shutting_down:
+            return batch
+
+        action_name = self._get_batchable_action_name(job_request)
+        if not action_name:
+            return batch
+
+        # Jobs for the action that were received while gathering an earlier batch join this one first
+        for request in list(self._thread_state.received_requests):
+            if len(batch) < maximum_jobs and self._get_batchable_action_name(request[2]) == action_name:
+                self._thread_state.received_requests.remove(request)
+                batch.append(request)
+
+        maximum_wait = self.settings['action_batching']['maximum_wait_in_milliseconds'] / 1000.0
+        poll_interval = maximum_wait / self.ACTION_BATCHING_MAXIMUM_POLLS
+        deadline = time.time() + maximum_wait
+        waits = 0
+        # The jobs kept for later count against the maximum, too, so that they are not kept waiting for too long
+        while len(batch) + len(self._thread_state.received_requests) < maximum_jobs:
+            requests = self.transport.receive_queued_request_messages(
+                maximum_jobs - len(batch) - len(self._thread_state.received_requests),
+            )
+            for request in requests:
+                if self._get_batchable_action_name(request[2]) == action_name:
+                    batch.append(request)
+                else:
+                    self._thread_state.received_requests.append(request)
 
-            # Send the response message
+            if not requests:
+                remaining = deadline - time.time()
+                if remaining <= 0 or waits >= self.ACTION_BATCHING_MAXIMUM_POLLS:
+                    break
+                waits += 1
+                time.sleep(min(remaining, poll_interval))
+
+        return batch
+
+    def _get_batchable_action_name(self, job_request):
+        if not isinstance(job_request, dict) or JobRequestSchema.errors(job_request):
+            return None
+
+        if len(job_request['actions']) != 1:
+            return None
+
+        action_name = job_request['actions'][0]['action']
+        if action_name not in self.action_class_map:
+            return None
+
+        action_class = self.action_class_map[action_name]
+        if isinstance(action_class, type) and issubclass(action_class, Action) and action_class.run_batch is not None:
+            return action_name
+        return None
+
+    def _handle_job_batch(self, batch):
+        """
+        Handles the jobs in the batch concurrently, each in a thread of the calling thread's batch thread pool and each
+        through the job and action middleware as usual, until every job has either reached the action or finished
+        without reaching it (because a middleware rejected it, for example). Then runs the action once for the requests
+        that reached it, as the middleware passed them on, hands each job the result for its request, and sends the
+        responses of the jobs in turn.
+        """
+        action_name = batch[0][2]['actions'][0]['action']
+        self.metrics.counter('server.action_batching.batches').increment()
+        self.metrics.counter('server.action_batching.jobs').increment(len(batch))
+
+        action_batch = _ActionBatch(action_name, len(batch))
+
+        def process_batched_job(i):
+            request_id, _, job_request = batch[i]
+            self._thread_state.action_batch = action_batch, i
+            PySOALogContextFilter.set_logging_request_context(request_id=request_id, **job_request['context'])
             try:
-                if not job_request['control'].get('suppress_response', False):
-                    self.transport.send_response_message(request_id, meta, response_message)
-            except MessageTooLarge as e:
-                self.metrics.counter('server.error.response_too_large').increment()
-                job_response = self.handle_job_error_code(
-                    ERROR_CODE_RESPONSE_TOO_LARGE,
-                    'Could not send the response because it was too large',
-                    request_for_logging,
-                    response_for_logging,
-                    extra={'serialized_length_in_bytes': e.message_size_in_bytes},
-                )
-                self.transport.send_response_message(
-                    request_id,
-                    meta,
-                    attr.asdict(job_response, dict_factory=UnicodeKeysDict),
-                )
-            except InvalidField:
-                self.metrics.counter('server.error.response_not_serializable').increment()
-                job_response = self.handle_job_error_code(
-                    ERROR_CODE_RESPONSE_NOT_SERIALIZABLE,
-                    'Could not send the response because it failed to serialize',
-                    request_for_logging,
-                    response_for_logging,
-                )
-                self.transport.send_response_message(
-                    request_id,
-                    meta,
-                    attr.asdict(job_response, dict_factory=UnicodeKeysDict),
-                )
+                return self.process_job(job_request)
             finally:
-                if job_response.errors or any(a.errors for a in job_response.actions):
-                    if (
-                        self.request_log_error_level > self.request_log_success_level and
-                        self.job_logger.getEffectiveLevel() > self.request_log_success_level
-                    ):
-                        # When we originally logged the request, it may have been hidden because the effective logging
-                        # level threshold was greater than the level at which we logged the request. So re-log the
-                        # request at the error level, if set higher.
-                        self.job_logger.log(self.request_log_error_level, 'Job request: %s', request_for_logging)
-                    self.job_logger.log(self.request_log_error_level, 'Job response: %s', response_for_logging)
-                else:
-                    self.job_logger.log(self.request_log_success_level, 'Job response: %s', response_for_logging)
+                self._thread_state.action_batch = None
+                action_batch.job_finished(i)
+                PySOALogContextFilter.clear_logging_request_context()
+                # Each thread has its own Django database connections
+                self._close_old_django_connections()
+
+        requests_for_logging = []
+        try:
+            for request_id, _, job_request in batch:
+                PySOALogContextFilter.set_logging_request_context(request_id=request_id, **job_request['context'])
+                try:
+                    request_for_logging = self.logging_dict_wrapper_class(job_request)
+                    self.job_logger.log(self.request_log_success_level, 'Job request: %s', request_for_logging)
+                finally:
+                    PySOALogContextFilter.clear_logging_request_context()
+                self.perform_pre_request_actions()
+                requests_for_logging.append(request_for_logging)
+
+            job_responses = self._get_action_batch_thread_pool().map_async(process_batched_job, range(len(batch)))
+            action_batch.run(self.action_class_map[action_name](self.settings), self.metrics)
+            job_responses = job_responses.get()
+
+            for (request_id, meta, job_request), job_response, request_for_logging in zip(
+                batch,
+                job_responses,
+                requests_for_logging,
+            ):
+                PySOALogContextFilter.set_logging_request_context(request_id=request_id, **job_request['context'])
+                try:
+                    self._send_job_response(request_id, meta, job_request, job_response, request_for_logging)
+                finally:
+                    PySOALogContextFilter.clear_logging_request_context()
         finally:
-            PySOALogContextFilter.clear_logging_request_context()
-            self.perform_post_request_actions()
+            # Each job that was started is finished, whether or not its response could be sent
+            for _ in requests_for_logging:
+                self.perform_post_request_actions()
+
+    def _get_action_batch_thread_pool(self):
+        """
+        Returns the calling thread's batch thread pool, which has a thread for each job in the largest possible batch.
+        Each thread handling requests has its own, because the jobs of a batch wait for each other to reach the action,
+        so the jobs of batches from different threads must never wait for threads in the same pool.
+        """
+        if not self._thread_state.action_batch_thread_pool:
+            self._thread_state.action_batch_thread_pool = ThreadPool(self.settings['action_batching']['maximum_jobs'])
+            self._action_batch_thread_pools.append(self._thread_state.action_batch_thread_pool)
+        return self._thread_state.action_batch_thread_pool
 
     def make_client(self, context):
         """
@@ -286,23 +512,7 @@ class Server(object):
         """
 
         try:
-            # Validate JobRequest message
-            validation_errors = [
-                Error(
-                    code=error.code,
-                    message=error.message,
-                    field=error.pointer,
-                )
-                for error in (JobRequestSchema.errors(job_request) or [])
-            ]
-            if validation_errors:
-                raise JobError(errors=validation_errors)
-
-            # Add the client object in case a middleware wishes to use it
-            job_request['client'] = self.make_client(job_request['context'])
-
-            # Add the async event loop in case a middleware wishes to use it
-            job_request['async_event_loop'] = self.async_event_loop
+            self._prepare_job_request(job_request)
 
             # Build set of middleware + job handler, then run job
             wrapper = self.make_middleware_stack(
@@ -325,6 +535,30 @@ class Server(object):
 
         return job_response
 
+    def _prepare_job_request(self, job_request):
+        """
+        Validates the job request, and then adds the client and the async event loop to it.
+
+        :raise: JobError
+        """
+        # Validate JobRequest message
+        validation_errors = [
+            Error(
+                code=error.code,
+                message=error.message,
+                field=error.pointer,
+            )
+            for error in (JobRequestSchema.errors(job_request) or [])
+        ]
+        if validation_errors:
+            raise JobError(errors=validation_errors)
+
+        # Add the client object in case a middleware wishes to use it
+        job_request['client'] = self.make_client(job_request['context'])
+
+        # Add the async event loop in case a middleware wishes to use it
+        job_request['async_event_loop'] = self.async_event_loop
+
     def handle_job_exception(self, exception, variables=None):
         """
         Makes and returns a last-ditch error response.
@@ -383,7 +617,10 @@ class Server(object):
 
     def execute_job(self, job_request):
         """
-        Processes and runs the action requests contained in the job and returns a `JobResponse`.
+        Processes and runs the action requests contained in the job and returns a `JobResponse`. If the job's control
+        header has `parallel` set, and the `parallel_actions` setting is enabled, the actions are run concurrently in a
+        thread pool, and their responses are returned in the order of the action requests; otherwise, they are run in
+        sequence.
 
         :param job_request: The job request
         :type job_request: dict
@@ -394,53 +631,16 @@ class Server(object):
         # Run the Job's Actions
         job_response = JobResponse()
         job_switches = RequestSwitchSet(job_request['context']['switches'])
-        for i, raw_action_request in enumerate(job_request['actions']):
-            action_request = EnrichedActionRequest(
-                action=raw_action_request['action'],
-                body=raw_action_request.get('body', None),
-                switches=job_switches,
-                context=job_request['context'],
-                control=job_request['control'],
-                client=job_request['client'],
-                async_event_loop=job_request['async_event_loop'],
-            )
-            action_in_class_map = action_request.action in self.action_class_map
-            if action_in_class_map or action_request.action in ('status', 'introspect'):
-                # Get action to run
-                if action_in_class_map:
-                    action = self.action_class_map[action_request.action](self.settings)
-                elif action_request.action == 'introspect':
-                    from pysoa.server.action.introspection import IntrospectionAction
-                    action = IntrospectionAction(server=self)
-                else:
-                    if not self._default_status_action_class:
-                        from pysoa.server.action.status import make_default_status_action_class
-                        self._default_status_action_class = make_default_status_action_class(self.__class__)
-                    action = self._default_status_action_class(self.settings)
-                # Wrap it in middleware
-                wrapper = self.make_middleware_stack(
-                    [m.action for m in self.middleware],
-                    action,
-                )
-                # Execute the middleware stack
-                try:
-                    action_response = wrapper(action_request)
-                except ActionError as e:
-                    # Error: an error was thrown while running the Action (or Action middleware)
-                    action_response = ActionResponse(
-                        action=action_request.action,
-                        errors=e.errors,
-                    )
-            else:
-                # Error: Action not found.
-                action_response = ActionResponse(
-                    action=action_request.action,
-                    errors=[Error(
-                        code=ERROR_CODE_UNKNOWN,
-                        message='The action "{}" was not found on this server.'.format(action_request.action),
-                        field='action',
-                    )],
-                )
+        if (
+            job_request['control'].get('parallel', False) and
+            len(job_request['actions']) > 1 and
+            self.settings['parallel_actions']['maximum_threads'] > 0
+        ):
+            job_response.actions.extend(self._execute_actions_in_parallel(job_request, job_switches))
+            return job_response
+
+        for raw_action_request in job_request['actions']:
+            action_response = self._execute_action(job_request, job_switches, raw_action_request)
 
             job_response.actions.append(action_response)
             if (
@@ -452,6 +652,149 @@ class Server(object):
 
         return job_response
 
+    def _execute_actions_in_parallel(self, job_request, job_switches):
+        """
+        Runs the action requests contained in the job concurrently, in the server's action thread pool, and returns
+        their responses in the order of the action requests. If `continue_on_error` is `False`, the responses end with
+        the first action response (in the order of the action requests) that has errors, as they would if the actions
+        were run in sequence. Actions after it that have not yet started when the error occurs are not run, but actions
+        that have already started run to completion, and their responses are discarded.
+
+        :param job_request: The job request
+        :type job_request: dict
+        :param job_switches: The switches of the job
+        :type job_switches: RequestSwitchSet
+
+        :return: The action responses
+        :rtype: list[ActionResponse]
+        """
+        raw_action_requests = job_request['actions']
+        continue_on_error = job_request['control'].get('continue_on_error', False)
+        logging_context = PySOALogContextFilter.get_logging_request_context() or {}
+
+        lock = threading.Lock()
+        # The index of the first action, in the order of the action requests, whose response has errors
+        first_error_index = [len(raw_action_requests)]
+
+        def execute_action(i):
+            with lock:
+                if i > first_error_index[0]:
+                    # The response would be discarded anyway
+                    return None
+
+            PySOALogContextFilter.set_logging_request_context(**logging_context)
+            try:
+                action_response = self._execute_action(job_request, job_switches, raw_action_requests[i])
+            finally:
+                PySOALogContextFilter.clear_logging_request_context()
+                # Each thread has its own Django database connections
+                self._close_old_django_connections()
+
+            if action_response.errors and not continue_on_error:
+                with lock:
+                    first_error_index[0] = min(first_error_index[0], i)
+            return action_response
+
+        self.metrics.counter('server.parallel_actions.jobs').increment()
+        with self.metrics.timer('server.parallel_actions.run', resolution=TimerResolution.MICROSECONDS):
+            action_responses = self._get_action_thread_pool().map(execute_action, range(len(raw_action_requests)))
+
+        action_responses = action_responses[:first_error_index[0] + 1]
+        skipped = sum(1 for action_response in action_responses if action_response is None)
+        if skipped:
+            self.metrics.counter('server.parallel_actions.skipped').increment(skipped)
+        return [action_response for action_response in action_responses if action_response is not None]
+
+    def _get_action_thread_pool(self):
+        if not self._action_thread_pool:
+            self._action_thread_pool = ThreadPool(self.settings['parallel_actions']['maximum_threads'])
+        return self._action_thread_pool
+
+    def _execute_action(self, job_request, job_switches, raw_action_request):
+        action_request = self._make_action_request(job_request, job_switches, raw_action_request)
+        action = self._get_action(action_request.action)
+        if not action:
+            return self._make_action_not_found_response(action_request.action)
+
+        if self.scoreboard_slot:
+            self.scoreboard_slot.action_started(action_request.action)
+        if AsyncAction and isinstance(action, AsyncAction):
+            action = functools.partial(self._run_async_action, action)
+        # Wrap it in middleware
+        wrapper = self.make_middleware_stack(
+            [m.action for m in self.middleware],
+            action,
+        )
+        # Execute the middleware stack
+        try:
+            return wrapper(action_request)
+        except ActionError as e:
+            # Error: an error was thrown while running the Action (or Action middleware)
+            return ActionResponse(
+                action=action_request.action,
+                errors=e.errors,
+            )
+
+    @staticmethod
+    def _make_action_request(job_request, job_switches, raw_action_request):
+        return EnrichedActionRequest(
+            action=raw_action_request['action'],
+            body=raw_action_request.get('body', None),
+            switches=job_switches,
+            context=job_request['context'],
+            control=job_request['control'],
+            client=job_request['client'],
+            async_event_loop=job_request['async_event_loop'],
+        )
+
+    def _get_action(self, action_name):
+        """
+        Returns the action to run for the action name, or `None` if this server has no action with that name.
+        """
+        action_in_class_map = action_name in self.action_class_map
+        if not action_in_class_map and action_name not in ('status', 'introspect'):
+            return None
+
+        action_batch = self._thread_state.action_batch
+        if action_batch and action_batch[0].action_name == action_name:
+            # The action runs for this job together with the other jobs in its batch
+            self._thread_state.action_batch = None
+            return action_batch[0].make_action(action_batch[1])
+        if action_in_class_map:
+            return self.action_class_map[action_name](self.settings)
+        if action_name == 'introspect':
+            from pysoa.server.action.introspection import IntrospectionAction
+            return IntrospectionAction(server=self)
+        if not self._default_status_action_class:
+            from pysoa.server.action.status import make_default_status_action_class
+            self._default_status_action_class = make_default_status_action_class(self.__class__)
+        return self._default_status_action_class(self.settings)
+
+    @staticmethod
+    def _make_action_not_found_response(action_name):
+        return ActionResponse(
+            action=action_name,
+            errors=[Error(
+                code=ERROR_CODE_UNKNOWN,
+                message='The action "{}" was not found on this server.'.format(action_name),
+                field='action',
+            )],
+        )
+
+    def _run_async_action(self, action, action_request):
+        """
+        Runs an async action to completion, for servers that do not run jobs as asyncio tasks: on the server's event
+        loop in the main thread, or on an event loop of its own in any other thread.
+        """
+        if self.async_event_loop and threading.current_thread() is threading.main_thread():
+            return self.async_event_loop.run_until_complete(action(action_request))
+
+        event_loop = asyncio.new_event_loop()
+        try:
+            return event_loop.run_until_complete(action(action_request))
+        finally:
+            event_loop.close()
+
     def handle_shutdown_signal(self, *_):
         """
         Handles the reception of a shutdown signal.
@@ -549,11 +892,36 @@ class Server(object):
                 except Exception:
                     self.logger.exception('Error while removing heartbeat file')
 
-    def _update_heartbeat_file(self):
+    def _update_heartbeat_file(self, minimum_interval_in_seconds=0):
         if self._heartbeat_file:
-            self._heartbeat_file.seek(0)
-            self._heartbeat_file.write(six.text_type(time.time()))
-            self._heartbeat_file.flush()
+            now = time.time()
+            if 0 <= now - self._heartbeat_file_updated < minimum_interval_in_seconds:
+                return
+            with self._heartbeat_file_lock:
+                self._heartbeat_file_updated = now
+                self._heartbeat_file.seek(0)
+                self._heartbeat_file.write(six.text_type(now))
+                self._heartbeat_file.flush()
+
+    def _start_scoreboard_slot(self):
+        if not self.scoreboard_slot and self.settings['scoreboard_file']:
+            self.logger.info('Creating scoreboard file')
+            self._scoreboard = Scoreboard.create(1, self.settings['scoreboard_file'])
+            self.scoreboard_slot = self._scoreboard.slots[0]
+            self.scoreboard_slot.reset(self.service_name)
+
+        if self.scoreboard_slot:
+            self.scoreboard_slot.started(os.getpid(), time.time())
+
+    def _stop_scoreboard_slot(self):
+        if self.scoreboard_slot:
+            self.scoreboard_slot.stopping()
+
+        if self._scoreboard:
+            self.logger.info('Closing and removing scoreboard file')
+            self.scoreboard_slot = None
+            self._scoreboard.close(remove=True)
+            self._scoreboard = None
 
     def perform_pre_request_actions(self):
         """
@@ -561,6 +929,9 @@ class Server(object):
         Be sure your purpose for overriding isn't better met with middleware. See the documentation for `Server.main`
         for full details on the chain of `Server` method calls.
         """
+        if self.scoreboard_slot:
+            self.scoreboard_slot.request_started(time.time())
+
         if self.use_django:
             if getattr(django_settings, 'DATABASES'):
                 self.logger.debug('Resetting Django query log')
@@ -579,7 +950,12 @@ class Server(object):
 
         self._close_django_caches()
 
-        self._update_heartbeat_file()
+        if self.scoreboard_slot:
+            self.scoreboard_slot.request_finished(time.time())
+            # The scoreboard already records every request, so the heartbeat file only needs to stay fresh
+            self._update_heartbeat_file(self.SCOREBOARD_HEARTBEAT_FILE_INTERVAL_IN_SECONDS)
+        else:
+            self._update_heartbeat_file()
 
     def perform_idle_actions(self):
         """
@@ -591,6 +967,9 @@ class Server(object):
 
         self._update_heartbeat_file()
 
+        if self.scoreboard_slot:
+            self.scoreboard_slot.heartbeat(time.time())
+
     def run(self):
         """
         Starts the server run loop and returns after the server shuts down due to a shutdown-request, Harakiri signal,
@@ -613,16 +992,50 @@ class Server(object):
         self.metrics.commit()
 
         self._create_heartbeat_file()
+        self._start_scoreboard_slot()
 
         signal.signal(signal.SIGINT, self.handle_shutdown_signal)
         signal.signal(signal.SIGTERM, self.handle_shutdown_signal)
-        signal.signal(signal.SIGALRM, self.harakiri)
 
+        try:
+            if self.settings['async_jobs']['maximum_jobs'] > 0:
+                signal.signal(signal.SIGALRM, self.harakiri)
+                self._run_async_jobs()
+            elif self.settings['worker_threads'] > 0:
+                self._run_worker_threads()
+            else:
+                signal.signal(signal.SIGALRM, self.harakiri)
+                self._run_request_loop()
+        finally:
+            self.metrics.commit()
+            if self._action_thread_pool:
+                # The pool's threads are daemon threads, so there is no need to wait for them, which, after harakiri,
+                # could be forever
+                self._action_thread_pool.close()
+            for pool in self._action_batch_thread_pools:
+                pool.close()
+            if self.async_event_loop:
+                self.logger.info('Stopping and closing async event loop')
+                self.async_event_loop.stop()
+                self.async_event_loop.close()
+            self._close_django_caches(shutdown=True)
+            self._delete_heartbeat_file()
+            self._stop_scoreboard_slot()
+
+    def _run_request_loop(self, worker_index=None):
+        """
+        Handles requests until the server shuts down, and then closes the calling thread's transport. Called with the
+        index of the worker thread in threaded mode, in which case the thread's activity is recorded for harakiri in
+        place of setting the process-wide alarm.
+        """
         # noinspection PyBroadException
         try:
             while not self.shutting_down:
-                # reset harakiri timeout
-                signal.alarm(self.settings['harakiri']['timeout'])
+                if worker_index is None:
+                    # reset harakiri timeout
+                    signal.alarm(self.settings['harakiri']['timeout'])
+                else:
+                    self._worker_activity[worker_index] = time.time()
                 # Get, process, and execute the next JobRequest
                 self.handle_next_request()
                 self.metrics.commit()
@@ -632,14 +1045,144 @@ class Server(object):
             self.metrics.counter('server.error.unknown').increment()
             self.logger.exception('Unhandled server error; shutting down')
         finally:
-            self.metrics.commit()
+            if worker_index is None:
+                self.logger.info('Server shutting down')
+            else:
+                # As in a single-threaded server, an error in any worker thread shuts the server down
+                self.shutting_down = True
+            self._close_transport()
+
+    def _close_transport(self):
+        """
+        Handles the jobs that were kept back while gathering a batch of jobs, and then closes the calling thread's
+        transport.
+        """
+        # noinspection PyBroadException
+        try:
+            # Jobs received while gathering a batch of jobs must still be handled before the transport is closed
+            while self._thread_state.received_requests:
+                self._handle_job(*self._thread_state.received_requests.popleft())
+                self.metrics.commit()
+        except Exception:
+            self.metrics.counter('server.error.unknown').increment()
+            self.logger.exception('Error while handling jobs received while gathering a batch')
+        # noinspection PyBroadException
+        try:
+            self.transport.close()
+        except Exception:
+            self.metrics.counter('server.error.transport_close_failure').increment()
+            self.logger.exception('Error while closing transport')
+        self.metrics.commit()
+
+    def _run_async_jobs(self):
+        """
+        Runs jobs as asyncio tasks on the server's event loop, with up to `async_jobs.maximum_jobs` of them in flight at
+        once (see `AsyncJobRunner`), until the server shuts down, and then closes the transport.
+        """
+        if not AsyncJobRunner:
+            raise ValueError('async_jobs requires Python 3.5 or newer')
+        if self.settings['worker_threads'] > 0:
+            raise ValueError('async_jobs cannot be combined with worker_threads')
+        if not self.transport.can_handle_requests_concurrently:
+            raise ValueError(
+                'async_jobs cannot be used with a transport that acknowledges each request when it receives the next '
+                '(such as the Redis Gateway transport with the Redis Streams backend type)',
+            )
+        runner = AsyncJobRunner(self)
+
+        self.logger.info('Running up to {} async jobs at once'.format(self.settings['async_jobs']['maximum_jobs']))
+        # noinspection PyBroadException
+        try:
+            runner.run()
+        except MessageReceiveError:
+            self.logger.exception('Error receiving message from transport; shutting down')
+        except Exception:
+            self.metrics.counter('server.error.unknown').increment()
+            self.logger.exception('Unhandled server error; shutting down')
+        finally:
             self.logger.info('Server shutting down')
-            if self.async_event_loop:
-                self.logger.info('Stopping and closing async event loop')
-                self.async_event_loop.stop()
-                self.async_event_loop.close()
-            self._close_django_caches(shutdown=True)
-            self._delete_heartbeat_file()
+            self._close_transport()
+
+    def _run_worker_threads(self):
+        """
+        Runs the request loop in `worker_threads` worker threads, each with its own transport, and monitors them for
+        harakiri until they have all stopped. Harakiri applies to each worker thread separately: it is triggered when
+        any one of them has been handling one job, or waiting on its transport, for longer than the harakiri timeout.
+        Since a thread cannot be killed, harakiri then shuts the whole server down, and, if the worker threads have not
+        all stopped after the shutdown grace, exits the process.
+        """
+        harakiri_timeout = self.settings['harakiri']['timeout']
+        shutdown_grace = self.settings['harakiri']['shutdown_grace']
+
+        workers = []
+        for i in range(self.settings['worker_threads']):
+            self._worker_activity[i] = time.time()
+            worker = threading.Thread(
+                target=self._run_worker_thread,
+                args=(i, ),
+                name='pysoa-server-worker-{}'.format(i),
+            )
+            # Daemon threads do not keep the process alive, so a stuck worker thread cannot stop harakiri from exiting
+            worker.daemon = True
+            workers.append(worker)
+
+        self.logger.info('Running {} worker threads'.format(len(workers)))
+        for worker in workers:
+            worker.start()
+
+        harakiri_deadline = None
+        while True:
+            alive = [worker for worker in workers if worker.is_alive()]
+            if not alive:
+                break
+            alive[0].join(self.WORKER_THREAD_MONITOR_INTERVAL_IN_SECONDS)
+
+            now = time.time()
+            if harakiri_deadline:
+                if now > harakiri_deadline:
+                    self.logger.warning('Graceful shutdown failed after {}s. Exiting now!'.format(shutdown_grace))
+                    sys.exit(1)
+                continue
+
+            if not harakiri_timeout:
+                continue
+            stuck = sorted(
+                i for i, activity in list(self._worker_activity.items()) if now - activity > harakiri_timeout
+            )
+            if not stuck:
+                continue
+            if self.shutting_down:
+                self.logger.warning('Graceful shutdown failed after {}s. Exiting now!'.format(harakiri_timeout))
+                sys.exit(1)
+
+            self.logger.warning(
+                'No activity in worker threads {} during {}s, triggering harakiri with grace {}s'.format(
+                    ', '.join(workers[i].name for i in stuck),
+                    harakiri_timeout,
+                    shutdown_grace,
+                ),
+            )
+            self.shutting_down = True
+            harakiri_deadline = now + shutdown_grace
+
+        self.logger.info('Server shutting down')
+
+    def _run_worker_thread(self, worker_index):
+        # noinspection PyBroadException
+        try:
+            if worker_index > 0:
+                # The first worker thread uses the server's transport
+                self._thread_state.transport = self._make_transport()
+            self._run_request_loop(worker_index)
+        except Exception:
+            self.metrics.counter('server.error.unknown').increment()
+            self.logger.exception('Unhandled server error in worker thread; shutting down')
+            self.shutting_down = True
+        finally:
+            self._worker_activity.pop(worker_index, None)
+            if self.use_django and django_connections:
+                # Django database connections belong to the thread that opened them
+                django_connections.close_all()
 
     # noinspection PyUnusedLocal
     @classmethod
@@ -656,6 +1199,21 @@ class Server(object):
         """
         return cls
 
+    # noinspection PyUnusedLocal
+    @classmethod
+    def warm_up(cls, settings):
+        """
+        Called once, with the settings, after `initialize` and before the `Server` class is instantiated. Override this
+        to load what every server process needs, such as modules, caches, or reference data. When the standalone server
+        forks worker processes, this is called in the master process before forking, so that what it loads is shared,
+        copy-on-write, by all the workers instead of being loaded by each of them. It must not open connections or
+        start threads, which cannot be shared with forked processes. Overriding methods must call `super`. See the
+        documentation for `Server.main` for full details on the chain of `Server` method calls.
+
+        :param settings: The server settings
+        :type settings: dict
+        """
+
     @classmethod
     def main(cls):
         """
@@ -663,7 +1221,11 @@ class Server(object):
 
             cls.main
               |
-              -> cls.initialize => new_cls
+              -> cls.prepare_main
+                  |
+                  -> cls.load_main_settings
+                  -> cls.initialize => new_cls
+                  -> new_cls.warm_up
               -> new_cls.__init__ => self
               -> self.run
                   |
@@ -678,6 +1240,49 @@ class Server(object):
                                 -> middleware(self.execute_job)
                             -> transport.send_response_message
                             -> self.perform_post_request_actions
+                  -> transport.close
+
+        When the standalone server forks worker processes, the master process calls `load_main_settings` once, and
+        then `prepare_main` with a copy of the settings for each group of worker processes, and each worker process then
+        instantiates and runs the server class that it returned.
+        """
+        server_class, settings = cls.prepare_main()
+
+        # Set up server and signal handling
+        server = server_class(settings)
+
+        # Start server event loop
+        server.run()
+
+    @classmethod
+    def prepare_main(cls, settings=None):
+        """
+        Loads the settings with `load_main_settings`, unless they are passed in, and then calls `initialize` and
+        `warm_up`.
+
+        :param settings: The settings, if already loaded with `load_main_settings`, in which case logging is not set up,
+                         and the process is not daemonized, again
+        :type settings: ServerSettings
+
+        :return: A tuple of the server class to instantiate (as returned by `initialize`) and the settings
+        :rtype: tuple(type, dict)
+        """
+        if settings is None:
+            settings = cls.load_main_settings()
+
+        server_class = cls.initialize(settings)
+        server_class.warm_up(settings)
+
+        return server_class, settings
+
+    @classmethod
+    def load_main_settings(cls):
+        """
+        Loads the settings as directed by the command line, sets up logging, and optionally daemonizes. This must only
+        be called once per process.
+
+        :return: The settings
+        :rtype: ServerSettings
         """
         parser = argparse.ArgumentParser(
             description='Server for the {} SOA service'.format(cls.service_name),
@@ -738,8 +1343,71 @@ class Server(object):
                 print('PID={}'.format(pid))
                 sys.exit()
 
-        # Set up server and signal handling
-        server = cls.initialize(settings)(settings)
+        return settings
 
-        # Start server event loop
-        server.run()
+
+class _ActionBatch(object):
+    """
+    Collects the requests of the jobs in a batch as each reaches the batched action, through its middleware, in the
+    thread handling that job, and hands each job the result for its request once the action has run for all of them.
+    """
+
+    def __init__(self, action_name, size):
+        self.action_name = action_name
+        self._condition = threading.Condition()
+        # The jobs that have neither reached the action nor finished without reaching it
+        self._waiting_for = set(range(size))
+        self._requests = {}
+        self._results = None
+
+    def make_action(self, index):
+        """
+        Returns an action that, in place of running, adds the request to the batch, and then returns the response or
+        raises the error that resulted from running the action for all the requests in the batch.
+        """
+        def batched_action(action_request):
+            with self._condition:
+                self._requests[index] = action_request
+                self._waiting_for.discard(index)
+                self._condition.notify_all()
+                while self._results is None:
+                    self._condition.wait()
+                result = self._results.get(index)
+            if result is None:
+                raise RuntimeError('The batched action did not run')
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return batched_action
+
+    def job_finished(self, index):
+        with self._condition:
+            self._waiting_for.discard(index)
+            self._condition.notify_all()
+
+    def run(self, action, metrics):
+        """
+        Waits until every job in the batch has reached the action or finished, and then runs the action once, through
+        `Action.call_batch`, for the requests that reached it.
+        """
+        results = {}
+        try:
+            with self._condition:
+                while self._waiting_for:
+                    self._condition.wait()
+                indexes = sorted(self._requests)
+
+            if indexes:
+                try:
+                    with metrics.timer('server.action_batching.run', resolution=TimerResolution.MICROSECONDS):
+                        responses = action.call_batch([self._requests[i] for i in indexes])
+                    results = dict(zip(indexes, responses))
+                except Exception as e:
+                    # Each job fails as it would have if the action had raised this error while running for that job
+                    # alone
+                    metrics.counter('server.action_batching.error').increment()
+                    results = {i: e for i in indexes}
+        finally:
+            with self._condition:
+                self._results = results
+                self._condition.notify_all()
@@ -134,13 +134,79 @@ class ServerSettings(SOASettings):
                         'update the timestamp in that file after the processing of every request or every time '
                         'idle operations are processed, and delete the file when the server shuts down. The file name '
                         'can optionally contain the specifier {{pid}}, which will be replaced with the server process '
-                        'PID.',
+                        'PID. A server that records its activity in a scoreboard (see `scoreboard_file`) updates the '
+                        'file after processing requests at most once a second.',
+        )),
+        'scoreboard_file': fields.Nullable(fields.UnicodeString(
+            description='If specified, the server records its activity (its state, the action it is running and since '
+                        'when, the number of requests it has served, its resident set size, and its last heartbeat) '
+                        'in a slot of a shared-memory scoreboard in this file, with no file I/O after startup, so that '
+                        'the `pysoa.server.scoreboard` command line tool and the status action can show it. When the '
+                        'standalone server forks processes, the master process creates the scoreboard with a slot for '
+                        'each of them, and the file must not be shared with any other server; otherwise, each server '
+                        'process creates a scoreboard of its own, so each must have a file of its own. The file is '
+                        'removed when the server (or the master process) shuts down.',
         )),
         'extra_fields_to_redact': fields.Set(
             fields.UnicodeString(),
             description='Use this field to supplement the set of fields that are automatically redacted/censored in '
                         'request and response fields with additional fields that your service needs redacted.',
         ),
+        'action_batching': fields.Dictionary(
+            {
+                'maximum_jobs': fields.Integer(
+                    gte=1,
+                    description='The maximum number of jobs to handle in one batch; 1 to disable, defaults to 1',
+                ),
+                'maximum_wait_in_milliseconds': fields.Integer(
+                    gte=0,
+                    description='How long to wait for more jobs to be queued while gathering a batch, defaults to 5',
+                ),
+            },
+            description='Instructions for running a batchable action (one that provides `run_batch`) once for several '
+                        'queued jobs that each call only that action. After receiving such a job, the server receives '
+                        'other queued jobs without blocking (if its transport supports it), and gathers those that '
+                        'call only the same action into a batch. The jobs of a batch go through the job and action '
+                        'middleware concurrently, in a thread pool, and the action runs once for the requests that '
+                        'the middleware passes on to it.',
+        ),
+        'parallel_actions': fields.Dictionary(
+            {
+                'maximum_threads': fields.Integer(
+                    gte=0,
+                    description='The number of threads in the thread pool in which the actions are run; 0 to disable, '
+                                'defaults to 0',
+                ),
+            },
+            description='Instructions for running the actions of jobs whose control header has `parallel` set '
+                        'concurrently, in a thread pool, instead of in sequence. The actions, and the action '
+                        'middleware, must be thread-safe. When this is disabled, the `parallel` control header is '
+                        'ignored.',
+        ),
+        'async_jobs': fields.Dictionary(
+            {
+                'maximum_jobs': fields.Integer(
+                    gte=0,
+                    description='The maximum number of jobs in flight at once; 0 to disable, defaults to 0',
+                ),
+                'sync_action_threads': fields.Integer(
+                    gt=0,
+                    description='The number of threads in which actions that are not async are run, defaults to 10',
+                ),
+            },
+            description='Instructions for running jobs as asyncio tasks on the server event loop (on Python 3.5 or '
+                        'newer), so that one server can have many jobs in flight at once. Async actions '
+                        '(`AsyncAction`) are awaited on the event loop, and other actions are run in a thread pool. '
+                        'Middleware is applied with its `job_async` and `action_async` hooks. This cannot be combined '
+                        'with `worker_threads`, or with a transport that acknowledges each request only when it '
+                        'receives the next (such as the Redis Gateway transport with the Redis Streams backend type).',
+        ),
+        'worker_threads': fields.Integer(
+            gte=0,
+            description='The number of threads in which to handle requests, each with its own transport; 0 to handle '
+                        'them in the main thread, defaults to 0. With worker threads, harakiri applies to each job '
+                        'separately, and the actions, the middleware, and the metrics recorder must be thread-safe.',
+        ),
     }
 
     defaults = {
@@ -193,7 +259,20 @@ class ServerSettings(SOASettings):
         'request_log_success_level': 'INFO',
         'request_log_error_level': 'INFO',
         'heartbeat_file': None,
+        'scoreboard_file': None,
         'extra_fields_to_redact': set(),
+        'action_batching': {
+            'maximum_jobs': 1,
+            'maximum_wait_in_milliseconds': 5,
+        },
+        'parallel_actions': {
+            'maximum_threads': 0,
+        },
+        'async_jobs': {
+            'maximum_jobs': 0,
+            'sync_action_threads': 10,
+        },
+        'worker_threads': 0,
     }
 
 
@@ -3,6 +3,7 @@ from __future__ import (
     unicode_literals,
 )
 
+import copy
 import importlib
 import logging
 import sys
@@ -40,6 +41,44 @@ def _get_arg_parser():
         type=int,
         default=0,
     )
+    parser.add_argument(
+        '--max-fork-processes',
+        help='The number of processes up to which to scale the forked processes, based on the number of requests '
+             'waiting and how busy the processes are, with `--fork-processes` (or 1, if it is not specified) as the '
+             'minimum (if not greater than `--fork-processes`, the number of processes is fixed)',
+        required=False,
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '-g', '--fork-group',
+        help='A group of processes to fork that receive requests only from the listed action queues of the Redis '
+             'Gateway transport, in the format `PROCESSES:QUEUE[,QUEUE...]` (for example, `4:default,fast`), where '
+             '`PROCESSES` may also be a range `MINIMUM-MAXIMUM` within which to scale the group (for example, '
+             '`2-8:default,fast`). This option may be repeated, once for each group, and replaces `--fork-processes` '
+             'and `--max-fork-processes` when specified.',
+        required=False,
+        action='append',
+        type=_parse_fork_group,
+        dest='fork_groups',
+        default=None,
+    )
+    parser.add_argument(
+        '--max-requests',
+        help='When forking processes, the number of requests after which each process is recycled (stopped gracefully '
+             'and replaced with a fresh process), plus a random jitter of up to 10%% (0 or none for no limit)',
+        required=False,
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '--max-rss',
+        help='When forking processes, the resident set size, in megabytes, above which a process is recycled after it '
+             'handles a request (0 or none for no limit)',
+        required=False,
+        type=int,
+        default=0,
+    )
     parser.add_argument(
         '--use-file-watcher',
         help='If specified, PySOA will watch service files for changes and restart the service automatically. If no '
@@ -54,52 +93,140 @@ def _get_arg_parser():
     return parser
 
 
-def _get_args(parser):
-    return parser.parse_known_args()[0]
+def _parse_fork_group(value):
+    import argparse
+    processes, _, queues = value.partition(':')
+    queues = [queue.strip() for queue in queues.split(',') if queue.strip()]
+    minimum, _, maximum = processes.partition('-')
+    try:
+        minimum = int(minimum)
+        maximum = int(maximum) if maximum else minimum
+    except ValueError:
+        minimum = maximum = 0
+    if minimum < 1 or maximum < minimum or not queues:
+        raise argparse.ArgumentTypeError(
+            'Invalid fork group `{}`; expected the format `PROCESSES:QUEUE[,QUEUE...]` or '
+            '`MINIMUM-MAXIMUM:QUEUE[,QUEUE...]`'.format(value),
+        )
+    return minimum, maximum, queues
 
 
-def _run_server(args, server_class):
-    if args.fork_processes > 1:
-        import multiprocessing
-        import signal
-        import time
-
-        cpu_count = multiprocessing.cpu_count()
-        num_processes = args.fork_processes
-        max_processes = cpu_count * 5
-        if num_processes > max_processes:
-            print(
-                'WARNING: Number of requested process forks ({forks}) is greater than five times the number of CPU '
-                'cores available ({cores} cores). Capping number of forks at {cap}.'.format(
-                    forks=args.fork_processes,
-                    cores=cpu_count,
-                    cap=max_processes,
-                )
-            )
-            num_processes = max_processes
+def _get_worker_group_server_class(server_class, receive_queues):
+    """
+    Returns a subclass of the server class that receives requests only from the given action queues.
+    """
+    class WorkerGroupServer(server_class):
+        @classmethod
+        def initialize(cls, settings):
+            settings['transport'].setdefault('kwargs', {})['receive_queues'] = list(receive_queues)
+            return super(WorkerGroupServer, cls).initialize(settings)
+
+    WorkerGroupServer.__name__ = str(server_class.__name__)
+    return WorkerGroupServer
 
-        processes = []
 
-        def _sigterm_forks(*_, **__):
-            for process in processes:
-                process.terminate()
+def _is_forking(args):
+    return bool(args.fork_groups) or max(args.fork_processes, args.max_fork_processes) > 1
 
-        # We don't want these signals to actually kill this process; just sub-processes
-        signal.signal(signal.SIGINT, signal.SIG_IGN)
-        signal.signal(signal.SIGTERM, signal.SIG_IGN)
-        signal.signal(signal.SIGHUP, _sigterm_forks)  # special signal by reloader says we actually need to propagate
 
-        processes = [
-            multiprocessing.Process(target=server_class.main, name='pysoa-worker-{}'.format(i))
-            for i in range(0, num_processes)
+def _get_worker_pools(args, server_class):
+    """
+    Returns a list of `(name, server_class, minimum, maximum)` tuples, one for each pool of processes to fork, or an
+    empty list if no process should be forked.
+    """
+    if args.fork_groups:
+        groups = [
+            (minimum, maximum, _get_worker_group_server_class(server_class, queues))
+            for minimum, maximum, queues in args.fork_groups
+        ]
+    elif _is_forking(args):
+        minimum = max(args.fork_processes, 1)
+        groups = [(minimum, max(args.max_fork_processes, minimum), server_class)]
+    else:
+        return []
+
+    import multiprocessing
+
+    cpu_count = multiprocessing.cpu_count()
+    num_processes = sum(maximum for _, maximum, _ in groups)
+    max_processes = cpu_count * 5
+    if num_processes > max_processes:
+        print(
+            'WARNING: Number of requested process forks ({forks}) is greater than five times the number of CPU '
+            'cores available ({cores} cores). Capping number of forks at {cap}.'.format(
+                forks=num_processes,
+                cores=cpu_count,
+                cap=max_processes,
+            )
+        )
+        # Each group keeps at least one process, so that none of its queues goes unserved
+        groups = [
+            (
+                max(minimum * max_processes // num_processes, 1),
+                max(maximum * max_processes // num_processes, 1),
+                group_server_class,
+            )
+            for minimum, maximum, group_server_class in groups
         ]
-        for p in processes:
-            p.start()
 
-        time.sleep(1)
+    if args.fork_groups:
+        return [
+            ('pysoa-worker-{}'.format(group), group_server_class, minimum, maximum)
+            for group, (minimum, maximum, group_server_class) in enumerate(groups)
+        ]
+    return [('pysoa-worker', groups[0][2], groups[0][0], groups[0][1])]
+
+
+def _get_args(parser):
+    return parser.parse_known_args()[0]
+
 
-        for p in processes:
-            p.join()
+def _run_server(args, server_class):
+    worker_pools = _get_worker_pools(args, server_class)
+    if worker_pools:
+        import functools
+
+        from pysoa.server.prefork import (
+            PreforkSupervisor,
+            WorkerPool,
+            get_recycling_server_class,
+            get_request_queue_depth_getter,
+            run_worker,
+        )
+
+        # The settings are loaded, logging set up, and the process daemonized just once, and then each group's server
+        # class is initialized and warmed up once, in this master process, so that the worker processes forked from it
+        # share what was loaded. Each group gets its own copy of the settings, because its server class sets the queues
+        # from which it receives in them.
+        main_settings = server_class.load_main_settings()
+        pools = []
+        scoreboard_file = None
+        for name, pool_server_class, minimum, maximum in worker_pools:
+            prepared_server_class, settings = pool_server_class.prepare_main(
+                copy.deepcopy(main_settings) if args.fork_groups else main_settings,
+            )
+            scoreboard_file = scoreboard_file or settings['scoreboard_file']
+            get_request_queue_depth = metrics = None
+            if maximum > minimum:
+                get_request_queue_depth = get_request_queue_depth_getter(prepared_server_class, settings)
+                metrics = settings['metrics']['object'](**settings['metrics'].get('kwargs', {}))
+            if args.max_requests > 0 or args.max_rss > 0:
+                prepared_server_class = get_recycling_server_class(
+                    prepared_server_class,
+                    maximum_requests=max(args.max_requests, 0),
+                    maximum_rss_in_bytes=max(args.max_rss, 0) * 1024 * 1024,
+                )
+            pools.append(WorkerPool(
+                name,
+                functools.partial(run_worker, prepared_server_class, settings),
+                minimum,
+                maximum,
+                get_request_queue_depth=get_request_queue_depth,
+                metrics=metrics,
+                metrics_name='group_{}'.format(len(pools)) if args.fork_groups else None,
+            ))
+
+        PreforkSupervisor(pools, scoreboard_file=scoreboard_file).run()
     else:
         server_class.main()
 
@@ -126,7 +253,7 @@ def _run_server_reloader_wrapper(args, server_class):
         autoreload.get_reloader(
             module_name or '',
             args.use_file_watcher,
-            signal_forks=args.fork_processes > 1
+            signal_forks=_is_forking(args)
         ).main(
             _run_server,
             (args, server_class),
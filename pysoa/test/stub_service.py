@@ -21,8 +21,13 @@ from pysoa.client.settings import ClientSettings
 from pysoa.common.metrics import NoOpMetricsRecorder
 from pysoa.common.schemas import BasicClassSchema
 from pysoa.common.transport.exceptions import (
+    ConnectionError,
+    InvalidMessageError,
     MessageReceiveError,
     MessageReceiveTimeout,
+    MessageSendError,
+    MessageSendTimeout,
+    MessageTooLarge,
 )
 from pysoa.common.transport.local import LocalClientTransport
 from pysoa.common.types import (
@@ -373,6 +378,7 @@ class stub_action(object):  # noqa
 
     def __enter__(self):
         self._wrapped_client_send_request = Client.send_request
+        self._wrapped_client_send_requests = Client.send_requests
         self._wrapped_client_get_all_responses = Client.get_all_responses
         self._services_with_calls_sent_to_wrapped_client = set()
 
@@ -475,6 +481,28 @@ class stub_action(object):  # noqa
             wrapped=getattr(Client.send_request, 'description', Client.send_request.__repr__()),
         )  # This description is a helpful debugging tool
 
+        @wraps(Client.send_requests)
+        def wrapped_send_requests(client, service_name, actions_list, **kwargs):
+            # Stubbing works on individual requests, so bulk sends are unrolled into calls to the wrapped send_request
+            results = []
+            for actions in actions_list:
+                try:
+                    results.append(client.send_request(service_name, actions, **kwargs))
+                except (
+                    ConnectionError,
+                    InvalidMessageError,
+                    MessageSendError,
+                    MessageSendTimeout,
+                    MessageTooLarge,
+                ) as e:
+                    results.append(e)
+            return results
+        wrapped_send_requests.description = '<stub {service}.{action} wrapper around {wrapped}>'.format(
+            service=self.service,
+            action=self.action,
+            wrapped=getattr(Client.send_requests, 'description', Client.send_requests.__repr__()),
+        )  # This description is a helpful debugging tool
+
         @wraps(Client.get_all_responses)
         def wrapped_get_all_responses(client, service_name, *args, **kwargs):
             if service_name in self._services_with_calls_sent_to_wrapped_client:
@@ -531,6 +559,9 @@ class stub_action(object):  # noqa
         # might be another wrapper if we have stubbed multiple actions).
         Client.send_request = wrapped_send_request
 
+        # Wrap Client.send_requests, whose original version was saved in self._wrapped_client_send_requests
+        Client.send_requests = wrapped_send_requests
+
         # Wrap Client.get_all_responses, whose original version was saved in self._wrapped_client_get_all_responses
         # (which itself might be another wrapper if we have stubbed multiple actions).
         Client.get_all_responses = wrapped_get_all_responses
@@ -542,6 +573,7 @@ class stub_action(object):  # noqa
         # Unwrap Client.send_request and Client.get_all_responses to their previous versions (which might themselves be
         # other wrappers if we have stubbed multiple actions).
         Client.send_request = self._wrapped_client_send_request
+        Client.send_requests = self._wrapped_client_send_requests
         Client.get_all_responses = self._wrapped_client_get_all_responses
         self.enabled = False
 
@@ -0,0 +1,181 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+from unittest import TestCase
+
+from pysoa.client.client import Client
+from pysoa.common.constants import ERROR_CODE_INVALID
+from pysoa.common.transport.exceptions import MessageSendError
+from pysoa.common.types import (
+    ActionResponse,
+    Error,
+    JobResponse,
+)
+
+from tests.client.test_send_receive import (
+    CatchExceptionOnRequestMiddleware,
+    MutateRequestMiddleware,
+    SendErrorTransport,
+)
+
+
+class NonBlockingSendErrorTransport(SendErrorTransport):
+    may_block = False
+
+
+class TestClientAsyncSendReceive(TestCase):
+    """
+    Test that the client coroutine methods work as expected. The stub transport has no coroutine methods, so these also
+    test the fallback to the transport's blocking methods.
+    """
+
+    def setUp(self):
+        self.client = Client({
+            'service_1': {
+                'transport': {
+                    'path': 'pysoa.test.stub_service:StubClientTransport',
+                    'kwargs': {
+                        'action_map': {
+                            'action_1': {'body': {'foo': 'bar'}},
+                            'action_2': {'body': {'baz': 3}},
+                        },
+                    },
+                },
+            },
+            'service_2': {
+                'transport': {
+                    'path': 'pysoa.test.stub_service:StubClientTransport',
+                    'kwargs': {
+                        'action_map': {
+                            'action_3': {'body': {'cat': 'dog'}},
+                            'action_with_errors': {
+                                'errors': [Error(code=ERROR_CODE_INVALID, message='Invalid input', field='foo')],
+                            },
+                        },
+                    },
+                },
+            },
+            'send_error_service': {
+                'transport': {
+                    'path': 'tests.client.test_async_send_receive:NonBlockingSendErrorTransport',
+                }
+            },
+            'blocking_service': {
+                'transport': {
+                    'path': 'tests.client.test_send_receive:SendErrorTransport',
+                }
+            },
+        })
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_call_action_async(self):
+        action_response = self.loop.run_until_complete(self.client.call_action_async('service_1', 'action_1'))
+
+        self.assertIsInstance(action_response, ActionResponse)
+        self.assertEqual('action_1', action_response.action)
+        self.assertEqual({'foo': 'bar'}, action_response.body)
+
+    def test_call_actions_async(self):
+        job_response = self.loop.run_until_complete(self.client.call_actions_async(
+            'service_1',
+            [{'action': 'action_1'}, {'action': 'action_2'}],
+        ))
+
+        self.assertIsInstance(job_response, JobResponse)
+        self.assertEqual([{'foo': 'bar'}, {'baz': 3}], [action.body for action in job_response.actions])
+
+    def test_call_actions_async_action_errors(self):
+        with self.assertRaises(Client.CallActionError) as error_context:
+            self.loop.run_until_complete(self.client.call_actions_async(
+                'service_2',
+                [{'action': 'action_with_errors'}],
+            ))
+
+        self.assertEqual(ERROR_CODE_INVALID, error_context.exception.actions[0].errors[0].code)
+
+        job_response = self.loop.run_until_complete(self.client.call_actions_async(
+            'service_2',
+            [{'action': 'action_with_errors'}],
+            raise_action_errors=False,
+        ))
+        self.assertEqual(ERROR_CODE_INVALID, job_response.actions[0].errors[0].code)
+
+    def test_call_actions_async_expansions_prohibited(self):
+        with self.assertRaises(TypeError):
+            self.loop.run_until_complete(self.client.call_actions_async(
+                'service_1',
+                [{'action': 'action_1'}],
+                expansions={'foo': ['bar']},
+            ))
+
+    def test_call_actions_parallel_async(self):
+        action_responses = self.loop.run_until_complete(self.client.call_actions_parallel_async(
+            'service_1',
+            [{'action': 'action_2'}, {'action': 'action_1'}, {'action': 'action_2'}],
+        ))
+
+        self.assertEqual([{'baz': 3}, {'foo': 'bar'}, {'baz': 3}], [action.body for action in action_responses])
+
+    def test_call_actions_parallel_async_prohibited_arguments(self):
+        with self.assertRaises(TypeError):
+            self.loop.run_until_complete(self.client.call_actions_parallel_async(
+                'service_1',
+                [{'action': 'action_1'}],
+                raise_job_errors=False,
+            ))
+
+    def test_call_jobs_parallel_async(self):
+        job_responses = self.loop.run_until_complete(self.client.call_jobs_parallel_async([
+            {'service_name': 'service_1', 'actions': [{'action': 'action_2'}, {'action': 'action_1'}]},
+            {'service_name': 'service_2', 'actions': [{'action': 'action_3'}]},
+            {'service_name': 'service_1', 'actions': [{'action': 'action_1'}]},
+        ]))
+
+        self.assertEqual(3, len(job_responses))
+        self.assertEqual([{'baz': 3}, {'foo': 'bar'}], [action.body for action in job_responses[0].actions])
+        self.assertEqual([{'cat': 'dog'}], [action.body for action in job_responses[1].actions])
+        self.assertEqual([{'foo': 'bar'}], [action.body for action in job_responses[2].actions])
+
+    def test_call_jobs_parallel_async_transport_errors(self):
+        jobs = [
+            {'service_name': 'service_1', 'actions': [{'action': 'action_1'}]},
+            {'service_name': 'send_error_service', 'actions': [{'action': 'does_not_matter'}]},
+        ]
+
+        with self.assertRaises(MessageSendError):
+            self.loop.run_until_complete(self.client.call_jobs_parallel_async(jobs))
+
+        job_responses = self.loop.run_until_complete(
+            self.client.call_jobs_parallel_async(jobs, catch_transport_errors=True),
+        )
+        self.assertEqual([{'foo': 'bar'}], [action.body for action in job_responses[0].actions])
+        self.assertIsInstance(job_responses[1], MessageSendError)
+
+    def test_blocking_transport_refused(self):
+        with self.assertRaises(TypeError):
+            self.loop.run_until_complete(self.client.call_action_async('blocking_service', 'does_not_matter'))
+
+        with self.assertRaises(TypeError):
+            self.loop.run_until_complete(self.client._get_handler('blocking_service').get_response_async(1))
+
+    def test_request_middleware(self):
+        self.client._get_handler('service_1').middleware = [
+            CatchExceptionOnRequestMiddleware(),
+            MutateRequestMiddleware(),
+        ]
+        self.client._get_handler('service_1').transport.stub_action('action_1', body={'foo': 'bar'})
+
+        self.loop.run_until_complete(self.client.call_action_async(
+            'service_1',
+            'action_1',
+            control_extra={'test_request_middleware': True},
+        ))
+
+        self.assertEqual(1, self.client.handlers['service_1'].middleware[0].request_count)
+        self.assertEqual(0, self.client.handlers['service_1'].middleware[0].error_count)
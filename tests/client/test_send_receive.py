@@ -237,6 +237,81 @@ class TestClientSendReceive(TestCase):
         responses = list(client.get_all_responses(SERVICE_NAME))
         self.assertEqual(len(responses), 0)
 
+    def test_send_request_with_priority(self):
+        """
+        Client.send_request and Client.call_action include the priority in the control header
+        """
+        client = Client(self.client_settings)
+        transport = client._get_handler(SERVICE_NAME).transport
+
+        with mock.patch.object(transport, 'send_request_message') as mock_send_request_message:
+            client.send_request(SERVICE_NAME, [{'action': 'action_1'}], priority=2)
+            client.send_request(SERVICE_NAME, [{'action': 'action_1'}])
+
+        self.assertEqual(2, mock_send_request_message.call_args_list[0][0][2]['control']['priority'])
+        self.assertNotIn('priority', mock_send_request_message.call_args_list[1][0][2]['control'])
+
+        response = client.call_action(SERVICE_NAME, 'action_1', priority=1)
+        self.assertEqual({'foo': 'bar'}, response.body)
+
+    def test_send_request_parallel(self):
+        """
+        Client.send_request includes the parallel flag in the control header only when it is set
+        """
+        client = Client(self.client_settings)
+        transport = client._get_handler(SERVICE_NAME).transport
+
+        with mock.patch.object(transport, 'send_request_message') as mock_send_request_message:
+            client.send_request(SERVICE_NAME, [{'action': 'action_1'}, {'action': 'action_2'}], parallel=True)
+            client.send_request(SERVICE_NAME, [{'action': 'action_1'}, {'action': 'action_2'}])
+
+        self.assertTrue(mock_send_request_message.call_args_list[0][0][2]['control']['parallel'])
+        self.assertNotIn('parallel', mock_send_request_message.call_args_list[1][0][2]['control'])
+
+    def test_send_requests_get_responses(self):
+        """
+        Client.send_requests sends multiple valid requests in bulk and Client.get_all_responses returns a valid
+        response for each.
+        """
+        client = Client(self.client_settings)
+        request_ids = client.send_requests(
+            SERVICE_NAME,
+            [
+                [{'action': 'action_1'}],
+                [{'action': 'action_2'}, {'action': 'action_1'}],
+            ],
+        )
+        self.assertEqual(2, len(request_ids))
+        for request_id in request_ids:
+            self.assertIsInstance(request_id, int)
+
+        responses = dict(client.get_all_responses(SERVICE_NAME))
+        self.assertEqual(set(request_ids), set(responses.keys()))
+        self.assertEqual(
+            [{'foo': 'bar'}],
+            [action_response.body for action_response in responses[request_ids[0]].actions],
+        )
+        self.assertEqual(
+            [{'baz': 3}, {'foo': 'bar'}],
+            [action_response.body for action_response in responses[request_ids[1]].actions],
+        )
+
+    def test_send_requests_returns_transport_errors(self):
+        """
+        Client.send_requests returns transport errors in place of request IDs instead of raising them.
+        """
+        self.client_settings['send_error_service'] = {
+            'transport': {'path': 'tests.client.test_send_receive:SendErrorTransport'},
+        }
+        client = Client(self.client_settings)
+
+        errors = client.send_requests('send_error_service', [[{'action': 'action_1'}], [{'action': 'action_2'}]])
+
+        self.assertEqual(2, len(errors))
+        for error in errors:
+            self.assertIsInstance(error, MessageSendError)
+            self.assertEqual('The message failed to send', error.args[0])
+
     def test_call_actions(self):
         """Client.call_actions sends a valid request and returns a valid response without errors."""
         action_request = [
@@ -652,6 +727,29 @@ class TestClientParallelSendReceive(TestCase):
         self.assertEqual(1, len(job_responses[3].actions))
         self.assertEqual({'selected': True, 'count': 7}, job_responses[3].actions[0].body)
 
+    def test_call_jobs_parallel_transport_send_errors_raised_after_discarding_responses(self):
+        """
+        Test that call_jobs_parallel raises the first transport send error, after receiving the responses to the jobs
+        that were sent, so that they do not turn up as responses to a later call.
+        """
+        with self.assertRaises(MessageSendError) as error_context:
+            self.client.call_jobs_parallel([
+                {'service_name': 'service_1', 'actions': [{'action': 'action_1'}]},
+                {'service_name': 'send_error_service', 'actions': [{'action': 'no matter'}]},
+                {'service_name': 'service_2', 'actions': [{'action': 'action_3'}]},
+            ])
+
+        self.assertEqual('The message failed to send', error_context.exception.args[0])
+        self.assertEqual(0, self.client._get_handler('service_1').transport.requests_outstanding)
+        self.assertEqual(0, self.client._get_handler('service_2').transport.requests_outstanding)
+
+        job_responses = self.client.call_jobs_parallel([
+            {'service_name': 'service_1', 'actions': [{'action': 'action_2'}]},
+            {'service_name': 'service_2', 'actions': [{'action': 'action_4'}]},
+        ])
+        self.assertEqual({'baz': 3}, job_responses[0].actions[0].body)
+        self.assertEqual({'selected': True, 'count': 7}, job_responses[1].actions[0].body)
+
     def test_call_jobs_parallel_transport_multiple_send_and_receive_errors_caught(self):
         """
         Test that call_jobs_parallel returns transport send errors instead of raising them when asked.
@@ -1081,6 +1179,31 @@ class TestClientMiddleware(TestCase):
         self.assertEqual(self.client.handlers[SERVICE_NAME].middleware[0].request_count, 1)
         self.assertEqual(self.client.handlers[SERVICE_NAME].middleware[0].error_count, 1)
 
+    def test_request_middleware_send_requests(self):
+        self.client._get_handler(SERVICE_NAME).middleware = [
+            CatchExceptionOnRequestMiddleware(),
+            MutateRequestMiddleware(),
+        ]
+        self.client._get_handler(SERVICE_NAME).transport.stub_action('action_1', body={'foo': 'bar'})
+
+        request_ids = self.client.send_requests(
+            SERVICE_NAME,
+            [[{'action': 'action_1', 'body': {}}], [{'action': 'action_1', 'body': {}}]],
+            control_extra={'test_request_middleware': True},
+        )
+        self.assertEqual(2, len(request_ids))
+        self.assertEqual(2, self.client.handlers[SERVICE_NAME].middleware[0].request_count)
+        self.assertEqual(0, self.client.handlers[SERVICE_NAME].middleware[0].error_count)
+
+        self.client._get_handler(SERVICE_NAME).middleware.append(RaiseExceptionOnRequestMiddleware())
+        with self.assertRaises(RaiseExceptionOnRequestMiddleware.MiddlewareProcessedRequest):
+            self.client.send_requests(
+                SERVICE_NAME,
+                [[{'action': 'action_1', 'body': {}}]],
+                control_extra={'test_request_middleware': True},
+            )
+        self.assertEqual(1, self.client.handlers[SERVICE_NAME].middleware[0].error_count)
+
     def test_response_single_middleware(self):
         handler = self.client._get_handler(SERVICE_NAME)
         handler.middleware = [RaiseExceptionOnResponseMiddleware()]
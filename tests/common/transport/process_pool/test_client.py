@@ -0,0 +1,206 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import threading
+import time
+import unittest
+
+from pysoa.client.client import Client
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.serializer.json_serializer import JSONSerializer
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendTimeout,
+)
+from pysoa.common.transport.process_pool.client import LocalProcessPoolClientTransport
+from pysoa.common.types import ActionRequest
+from pysoa.server.action.base import Action
+from pysoa.server.server import Server
+from pysoa.test.compatibility import mock
+
+
+class WorkAction(Action):
+    def run(self, request):
+        if request.body.get('crash'):
+            os._exit(1)
+        time.sleep(request.body.get('seconds', 0))
+        return {'pid': os.getpid(), 'text': request.body.get('text')}
+
+
+class PoolServer(Server):
+    service_name = 'pool'
+    action_class_map = {
+        'work': WorkAction,
+    }
+
+
+def _job(**body):
+    return {
+        'control': {'continue_on_error': False},
+        'context': {'switches': [], 'correlation_id': 'abc'},
+        'actions': [{'action': 'work', 'body': body}],
+    }
+
+
+class TestLocalProcessPoolClientTransport(unittest.TestCase):
+    def setUp(self):
+        self.transports = []
+
+    def tearDown(self):
+        for transport in self.transports:
+            transport.close()
+
+    def _get_transport(self, **kwargs):
+        transport = LocalProcessPoolClientTransport('pool', NoOpMetricsRecorder(), PoolServer, {}, **kwargs)
+        transport.core._get_counter = mock.MagicMock()
+        self.transports.append(transport)
+        return transport
+
+    def test_round_trip(self):
+        transport = self._get_transport(processes=2)
+
+        transport.send_request_message(1, {}, _job())
+        transport.send_request_message(2, {}, _job())
+        self.assertEqual(2, transport.requests_outstanding)
+
+        responses = sorted([transport.receive_response_message(5), transport.receive_response_message(5)])
+        self.assertEqual([1, 2], [request_id for request_id, _, _ in responses])
+        pids = {response['actions'][0]['body']['pid'] for _, _, response in responses}
+        self.assertEqual({worker.pid for worker in transport._workers}, pids)
+        self.assertNotIn(os.getpid(), pids)
+
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual((None, None, None), transport.receive_response_message())
+
+    def test_json_serializer(self):
+        transport = self._get_transport(processes=1, serializer_config={'object': JSONSerializer, 'kwargs': {}})
+
+        transport.send_request_message(1, {}, _job(text='\u00e9t\u00e9 \u2603'))
+        request_id, _, response = transport.receive_response_message(5)
+
+        self.assertEqual(1, request_id)
+        self.assertEqual('\u00e9t\u00e9 \u2603', response['actions'][0]['body']['text'])
+
+    def test_requests_handled_concurrently(self):
+        client = Client({
+            'pool': {
+                'transport': {
+                    'path': 'pysoa.common.transport.process_pool.client:LocalProcessPoolClientTransport',
+                    'kwargs': {'server_class': PoolServer, 'server_settings': {}, 'processes': 3},
+                },
+            },
+        })
+
+        start = time.time()
+        responses = list(client.call_actions_parallel(
+            'pool',
+            [ActionRequest(action='work', body={'seconds': 0.3}) for _ in range(3)],
+        ))
+        elapsed = time.time() - start
+
+        self.assertEqual(3, len({response.body['pid'] for response in responses}))
+        self.assertLess(elapsed, 0.85)
+        client._get_handler('pool').transport.close()
+
+    def test_worker_restarted_after_crash(self):
+        transport = self._get_transport(processes=1)
+        transport.send_request_message(1, {}, _job())
+        first_pid = transport.receive_response_message(5)[2]['actions'][0]['body']['pid']
+
+        transport.send_request_message(2, {}, _job(crash=True))
+        with self.assertRaises(MessageReceiveError):
+            transport.receive_response_message(5)
+        transport.core._get_counter.assert_any_call('worker.crashed')
+
+        transport.send_request_message(3, {}, _job())
+        request_id, _, response = transport.receive_response_message(5)
+        self.assertEqual(3, request_id)
+        self.assertNotEqual(first_pid, response['actions'][0]['body']['pid'])
+
+    def test_in_flight_requests_bounded(self):
+        transport = self._get_transport(
+            processes=1,
+            maximum_in_flight_requests_per_process=1,
+            send_timeout_in_seconds=0.1,
+        )
+
+        transport.send_request_message(1, {}, _job(seconds=0.5))
+        with self.assertRaises(MessageSendTimeout):
+            transport.send_request_message(2, {}, _job())
+        transport.core._get_counter.assert_called_with('send.error.pool_busy')
+
+        # Once the worker has responded, there is room again
+        self.assertEqual(1, transport.receive_response_message(5)[0])
+        transport.send_request_message(3, {}, _job())
+        self.assertEqual(3, transport.receive_response_message(5)[0])
+
+    def test_receive_timeout(self):
+        transport = self._get_transport(processes=1)
+
+        transport.send_request_message(1, {}, _job(seconds=0.3))
+        with self.assertRaises(MessageReceiveTimeout):
+            transport.receive_response_message(0.01)
+        self.assertEqual(1, transport.receive_response_message(5)[0])
+
+    def test_close_stops_workers(self):
+        transport = self._get_transport(processes=2)
+        transport.send_request_message(1, {}, _job())
+        transport.receive_response_message(5)
+        pids = [worker.pid for worker in transport._workers]
+
+        transport.close()
+        for pid in pids:
+            with self.assertRaises(OSError):
+                os.kill(pid, 0)
+
+    def test_workers_forked_by_dispatcher_without_lock(self):
+        transport = self._get_transport(processes=2)
+        real_fork = os.fork
+        forks = []
+
+        def fork():
+            forks.append((threading.current_thread().name, transport._condition._is_owned()))
+            return real_fork()
+
+        with mock.patch.object(os, 'fork', side_effect=fork):
+            transport.send_request_message(1, {}, _job())
+            self.assertEqual(1, transport.receive_response_message(5)[0])
+
+        self.assertEqual([('pysoa-process-pool-pool', False)] * 2, forks)
+
+    def test_close_waits_for_workers_without_lock(self):
+        transport = self._get_transport(processes=1)
+        transport.send_request_message(1, {}, _job())
+        transport.receive_response_message(5)
+        transport.send_request_message(2, {}, _job(seconds=0.5))
+        time.sleep(0.1)
+
+        closer = threading.Thread(target=transport.close)
+        closer.start()
+        time.sleep(0.1)
+
+        # The worker is still finishing its request, but other threads are not kept waiting for it
+        self.assertTrue(closer.is_alive())
+        start = time.time()
+        with transport._condition:
+            self.assertLess(time.time() - start, 0.1)
+        with self.assertRaises(MessageReceiveError):
+            transport.receive_response_message(5)
+
+        closer.join(5)
+        self.assertFalse(closer.is_alive())
+        self.assertEqual([], transport._exited_pids)
+
+    def test_settings(self):
+        self.assertFalse(LocalProcessPoolClientTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.process_pool.client:LocalProcessPoolClientTransport',
+            'kwargs': {'server_class': PoolServer, 'server_settings': {}, 'processes': 2},
+        }))
+        self.assertTrue(LocalProcessPoolClientTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.process_pool.client:LocalProcessPoolClientTransport',
+            'kwargs': {'server_class': PoolServer, 'server_settings': {}, 'processes': 0},
+        }))
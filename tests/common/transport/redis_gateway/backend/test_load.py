@@ -0,0 +1,124 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import collections
+import unittest
+
+import freezegun
+
+from pysoa.common.transport.redis_gateway.backend.load import PowerOfTwoChoicesBalancer
+from pysoa.common.transport.redis_gateway.backend.standard import StandardRedisClient
+from pysoa.test.compatibility import mock
+
+
+class TestPowerOfTwoChoicesBalancer(unittest.TestCase):
+    def setUp(self):
+        self.balancer = PowerOfTwoChoicesBalancer(ring_size=3, queue_depth_sample_interval_in_seconds=1)
+
+    def _choose_many(self, count=300):
+        return collections.Counter(self.balancer.choose_index('pysoa:service.test') for _ in range(count))
+
+    def test_single_server(self):
+        balancer = PowerOfTwoChoicesBalancer(ring_size=1)
+
+        self.assertEqual(0, balancer.choose_index('pysoa:service.test'))
+
+    def test_balanced(self):
+        counts = self._choose_many()
+
+        for i in range(3):
+            self.assertTrue(50 < counts[i] < 150, counts)
+
+    def test_avoids_deep_queue(self):
+        for i in range(3):
+            self.balancer.record_outcome(i, 0.001, queue_depths={'pysoa:service.test': 1000 if i == 1 else 0})
+
+        counts = self._choose_many()
+
+        self.assertEqual(0, counts[1])
+
+        # Depths are tracked per queue
+        counts = collections.Counter(self.balancer.choose_index('pysoa:service.other') for _ in range(300))
+        self.assertTrue(counts[1] > 50, counts)
+
+    def test_avoids_slow_server(self):
+        for _ in range(10):
+            self.balancer.record_outcome(0, 0.001)
+            self.balancer.record_outcome(1, 0.5)
+            self.balancer.record_outcome(2, 0.001)
+
+        counts = self._choose_many()
+
+        self.assertEqual(0, counts[1])
+
+    def test_avoids_failing_server_then_recovers(self):
+        for _ in range(10):
+            self.balancer.record_outcome(2, 0.001, error=True)
+
+        self.assertEqual(0, self._choose_many()[2])
+
+        for _ in range(20):
+            self.balancer.record_outcome(2, 0.001)
+        self.balancer.record_outcome(0, 0.01)
+
+        self.assertTrue(self.balancer.error_rates[2] < 0.001)
+        self.assertTrue(self._choose_many()[2] > 50)
+
+    def test_queue_depth_expires_after_interval(self):
+        with freezegun.freeze_time() as frozen_time:
+            self.balancer.record_outcome(0, 0.001, queue_depths={'pysoa:service.test': 1000})
+            self.assertEqual(0, self._choose_many()[0])
+
+            frozen_time.tick(0.5)
+            self.balancer.record_outcome(0, 0.001, queue_depths={'pysoa:service.test': 1000})
+
+            frozen_time.tick(0.9)
+            self.assertEqual(0, self._choose_many()[0])
+
+            # No send has reported a depth for this server recently, so it is tried again
+            frozen_time.tick(0.2)
+            self.assertTrue(self._choose_many()[0] > 50)
+
+
+@mock.patch('redis.Redis.register_script')
+class TestStandardRedisClientRequestQueueStrategy(unittest.TestCase):
+    HOSTS = [('redis-{}'.format(i), 6379) for i in range(3)]
+
+    def test_round_robin_by_default(self, _):
+        client = StandardRedisClient(hosts=self.HOSTS)
+
+        self.assertIsNone(client._balancer)
+        self.assertEqual([0, 1, 2, 0], [client.get_connection_index('pysoa:service.test') for _ in range(4)])
+
+        # Does nothing, and does not break
+        client.record_send_outcome(0, 1.0, error=True)
+
+    def test_invalid_strategy(self, _):
+        with self.assertRaises(ValueError):
+            StandardRedisClient(hosts=self.HOSTS, request_queue_strategy='least_connections')
+
+    def test_power_of_two_choices(self, _):
+        client = StandardRedisClient(hosts=self.HOSTS, request_queue_strategy='power_of_two_choices')
+        client._get_connection = mock.MagicMock()
+
+        client.record_send_outcome(0, 0.001, queue_depths={'pysoa:service.test': 0})
+        client.record_send_outcome(1, 0.001, queue_depths={'pysoa:service.test': 50})
+        for _ in range(10):
+            client.record_send_outcome(2, 0.25, error=True)
+
+        # Server 2 is failing and server 1 is backed up, so server 1 only wins when it is paired with server 2
+        counts = collections.Counter(client.get_connection_index('pysoa:service.test') for _ in range(300))
+        self.assertEqual(0, counts[2])
+        self.assertTrue(counts[0] > 150, counts)
+        self.assertTrue(client._balancer.error_rates[2] > 0.9)
+        self.assertTrue(client._balancer.latencies[2] > 0.2)
+        # Neither recording outcomes nor choosing a server needs a connection
+        self.assertFalse(client._get_connection.called)
+
+        # Response queues are still consistently hashed
+        self.assertEqual(
+            client._get_consistent_hash_index('pysoa:service.test!abc'),
+            client.get_connection_index('pysoa:service.test!abc'),
+        )
@@ -0,0 +1,121 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import binascii
+import collections
+import unittest
+
+from pysoa.common.transport.redis_gateway.backend.ring import (
+    CRC32BucketRing,
+    JumpHashRing,
+    WeightedRendezvousRing,
+    make_ring_strategy,
+)
+from pysoa.common.transport.redis_gateway.backend.ring_benchmark import benchmark_ring_strategy
+from pysoa.common.transport.redis_gateway.backend.standard import StandardRedisClient
+from pysoa.test.compatibility import mock
+
+
+KEYS = ['service.ring_test.{:032x}!'.format(i * 7919) for i in range(6000)]
+NAMES = ['redis://redis-{}:6379/0'.format(i) for i in range(6)]
+
+
+class TestRingStrategies(unittest.TestCase):
+    def test_make_ring_strategy(self):
+        self.assertIsInstance(make_ring_strategy(None, NAMES), CRC32BucketRing)
+        self.assertIsInstance(make_ring_strategy('crc32', NAMES), CRC32BucketRing)
+        self.assertIsInstance(make_ring_strategy('jump', NAMES), JumpHashRing)
+        self.assertIsInstance(make_ring_strategy('rendezvous', NAMES), WeightedRendezvousRing)
+
+        with self.assertRaises(ValueError):
+            make_ring_strategy('ketama', NAMES)
+
+    def test_invalid_weights(self):
+        with self.assertRaises(ValueError):
+            make_ring_strategy('crc32', NAMES, [1] * 6)
+        with self.assertRaises(ValueError):
+            make_ring_strategy('jump', NAMES, [1] * 6)
+        with self.assertRaises(ValueError):
+            make_ring_strategy('rendezvous', NAMES, [1] * 5)
+        with self.assertRaises(ValueError):
+            make_ring_strategy('rendezvous', NAMES, [1, 1, 1, 1, 1, 0])
+        with self.assertRaises(ValueError):
+            make_ring_strategy('rendezvous', [])
+
+    def test_crc32_matches_original_buckets(self):
+        ring = CRC32BucketRing(NAMES)
+
+        for key in KEYS[:100]:
+            self.assertEqual(
+                int((binascii.crc32(key.encode('utf8')) & 0xfff) / (4096 / 6.0)),
+                ring.get_index(key),
+            )
+
+    def test_distribution(self):
+        for strategy in ('crc32', 'jump', 'rendezvous'):
+            counts = collections.Counter(make_ring_strategy(strategy, NAMES).get_index(key) for key in KEYS)
+            self.assertEqual(set(range(6)), set(counts.keys()), strategy)
+            for count in counts.values():
+                self.assertTrue(800 < count < 1200, '{}: {}'.format(strategy, counts))
+
+    def test_weighted_distribution(self):
+        ring = WeightedRendezvousRing(NAMES[:3], [1, 2, 1])
+
+        counts = collections.Counter(ring.get_index(key) for key in KEYS)
+        self.assertTrue(2700 < counts[1] < 3300, counts)
+        self.assertTrue(1200 < counts[0] < 1800, counts)
+        self.assertTrue(1200 < counts[2] < 1800, counts)
+
+    def test_minimal_remapping(self):
+        before = WeightedRendezvousRing(NAMES[:5])
+
+        # Adding a server only moves keys to the new server
+        after = WeightedRendezvousRing(NAMES)
+        moved = [key for key in KEYS if before.get_index(key) != after.get_index(key)]
+        self.assertTrue(len(moved) < len(KEYS) / 5.0)
+        self.assertTrue(all(after.get_index(key) == 5 for key in moved))
+
+        # Removing a server from the middle only moves that server's keys
+        after = WeightedRendezvousRing(NAMES[:2] + NAMES[3:5])
+        after_names = NAMES[:2] + NAMES[3:5]
+        moved = [key for key in KEYS if NAMES[before.get_index(key)] != after_names[after.get_index(key)]]
+        self.assertTrue(all(before.get_index(key) == 2 for key in moved))
+
+        before = JumpHashRing(NAMES[:5])
+        after = JumpHashRing(NAMES)
+        moved = [key for key in KEYS if before.get_index(key) != after.get_index(key)]
+        self.assertTrue(len(moved) < len(KEYS) / 5.0)
+        self.assertTrue(all(after.get_index(key) == 5 for key in moved))
+
+    def test_benchmark(self):
+        result = benchmark_ring_strategy('rendezvous', 4, KEYS[:1000])
+
+        self.assertEqual(4, len(result['shares']))
+        self.assertTrue(result['moved']['added'] < 0.3)
+        self.assertTrue(result['moved']['first'] < 0.35)
+        self.assertTrue(result['lookup_microseconds'] > 0)
+
+        result = benchmark_ring_strategy('rendezvous', 2, KEYS[:1000], [1, 3])
+        self.assertEqual({}, result['moved'])
+
+
+@mock.patch('redis.Redis.register_script')
+class TestStandardRedisClientRing(unittest.TestCase):
+    def test_default_ring_strategy(self, _):
+        client = StandardRedisClient(hosts=[('redis-{}'.format(i), 6379) for i in range(3)])
+
+        self.assertIsInstance(client._ring, CRC32BucketRing)
+
+    def test_ring_strategy(self, _):
+        hosts = [('redis-{}'.format(i), 6379) for i in range(3)]
+        client = StandardRedisClient(hosts=hosts, ring_strategy='rendezvous', ring_weights=[1, 1, 2])
+
+        ring = WeightedRendezvousRing(
+            ['redis://redis-{}:6379/0'.format(i) for i in range(3)],
+            [1, 1, 2],
+        )
+        for key in KEYS[:100]:
+            self.assertEqual(ring.get_index(key), client.get_connection_index(key))
+            self.assertIs(client._connection_list[ring.get_index(key)], client.get_connection(key))
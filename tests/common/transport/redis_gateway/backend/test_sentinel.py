@@ -3,6 +3,7 @@ from __future__ import (
     unicode_literals,
 )
 
+import time
 import unittest
 
 import msgpack
@@ -252,3 +253,124 @@ class TestSentinelRedisChannelClient(unittest.TestCase):
 
         self.assertIsNotNone(message)
         self.assertEqual(payload3, msgpack.unpackb(message, raw=False))
+
+
+@mock.patch('pysoa.common.transport.redis_gateway.backend.sentinel.redis.StrictRedis')
+@mock.patch('redis.sentinel.Sentinel')
+class TestSentinelMasterRefresher(unittest.TestCase):
+    def setUp(self):
+        self.addresses = {'service1': ('10.0.0.1', 6379), 'service2': ('10.0.0.2', 6379)}
+        self.counters = mock.MagicMock()
+        self.client = None
+
+    def tearDown(self):
+        if self.client:
+            self.client.stop_refresher()
+
+    def _set_up_client(self, mock_sentinel, mock_strict_redis, sentinels=()):
+        mock_sentinel.return_value.discover_master.side_effect = lambda service: self.addresses[service]
+        mock_sentinel.return_value.connection_kwargs = {'socket_timeout': 3}
+        mock_sentinel.return_value.sentinels = list(sentinels)
+        mock_strict_redis.side_effect = lambda **kwargs: mock.MagicMock(address=(kwargs['host'], kwargs['port']))
+
+        self.client = SentinelRedisClient(
+            hosts=[('169.254.7.12', 26379)],
+            sentinel_services=['service1', 'service2'],
+            sentinel_refresh_interval_in_seconds=60,
+        )
+        self.client.metrics_counter_getter = self.counters
+        return self.client
+
+    @staticmethod
+    def _wait_for(condition):
+        for _ in range(200):
+            if condition():
+                return
+            time.sleep(0.01)
+        raise AssertionError('Condition never became true')
+
+    def test_masters_discovered_up_front(self, mock_sentinel, mock_strict_redis):
+        client = self._set_up_client(mock_sentinel, mock_strict_redis)
+
+        self.assertEqual(('10.0.0.1', 6379), client._get_connection(0).address)
+        self.assertEqual(('10.0.0.2', 6379), client._get_connection(1).address)
+        mock_strict_redis.assert_any_call(host='10.0.0.1', port=6379, socket_timeout=3)
+        self.assertEqual(2, mock_sentinel.return_value.discover_master.call_count)
+        self.assertFalse(mock_sentinel.return_value.master_for.called)
+
+    def test_refresh_swaps_only_changed_masters(self, mock_sentinel, mock_strict_redis):
+        client = self._set_up_client(mock_sentinel, mock_strict_redis)
+        master_1 = client._get_connection(0)
+        master_2 = client._get_connection(1)
+
+        self.addresses['service2'] = ('10.0.0.3', 6379)
+        client.refresh_masters()
+
+        self.assertIs(master_1, client._get_connection(0))
+        self.assertIsNot(master_2, client._get_connection(1))
+        self.assertEqual(('10.0.0.3', 6379), client._get_connection(1).address)
+        self.counters.assert_any_call('backend.sentinel.master_changed')
+
+        # A master that cannot be found keeps its last known client
+        del self.addresses['service1']
+        mock_sentinel.return_value.discover_master.side_effect = lambda service: (
+            self.addresses[service] if service in self.addresses else self._raise(redis.sentinel.MasterNotFoundError)
+        )
+        client.refresh_masters()
+
+        self.assertIs(master_1, client._get_connection(0))
+        self.counters.assert_any_call('backend.sentinel.discover_master_failed')
+
+    @staticmethod
+    def _raise(error):
+        raise error
+
+    def test_master_not_yet_discovered_does_not_block(self, mock_sentinel, mock_strict_redis):
+        client = self._set_up_client(mock_sentinel, mock_strict_redis)
+        client._master_clients = {}
+
+        start = time.time()
+        with self.assertRaises(CannotGetConnectionError):
+            client._get_connection(0)
+        self.assertTrue(time.time() - start < 0.5)
+        self.counters.assert_any_call('backend.sentinel.master_not_cached')
+
+        # The refresher picks up the request and discovers the master in the background
+        self._wait_for(lambda: 'service1' in client._master_clients)
+        self.counters.assert_any_call('backend.sentinel.refresh_requested')
+
+    def test_refresh_on_switch_master_event(self, mock_sentinel, mock_strict_redis):
+        events = []
+
+        def get_message(ignore_subscribe_messages, timeout):
+            if events:
+                return events.pop(0)
+            time.sleep(min(timeout, 0.01))
+            return None
+
+        sentinel = mock.MagicMock()
+        sentinel.pubsub.return_value.get_message.side_effect = get_message
+        client = self._set_up_client(mock_sentinel, mock_strict_redis, sentinels=[sentinel])
+        self.assertEqual(('10.0.0.2', 6379), client._get_connection(1).address)
+
+        self.addresses['service2'] = ('10.0.0.4', 6379)
+        events.append({
+            'type': 'message',
+            'channel': b'+switch-master',
+            'data': b'service2 10.0.0.2 6379 10.0.0.4 6379',
+        })
+
+        # Discovered once up front, and again on the event
+        self._wait_for(lambda: mock_sentinel.return_value.discover_master.call_count >= 4)
+        sentinel.pubsub.return_value.subscribe.assert_called_once_with('+switch-master')
+        self.counters.assert_any_call('backend.sentinel.switch_master_event')
+        self.assertEqual(('10.0.0.4', 6379), client._get_connection(1).address)
+
+    def test_refresher_restarted_after_fork(self, mock_sentinel, mock_strict_redis):
+        client = self._set_up_client(mock_sentinel, mock_strict_redis)
+        self.assertEqual(2, mock_sentinel.return_value.discover_master.call_count)
+
+        with mock.patch('pysoa.common.transport.redis_gateway.backend.sentinel.os.getpid', return_value=-3):
+            client._get_connection(0)
+
+        self.assertEqual(4, mock_sentinel.return_value.discover_master.call_count)
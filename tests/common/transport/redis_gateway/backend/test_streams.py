@@ -0,0 +1,216 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import unittest
+
+import freezegun
+import redis
+
+from pysoa.common.transport.redis_gateway.backend.streams import (
+    SendMessageToStreamOrQueueCommand,
+    StreamsRedisClient,
+)
+from pysoa.test.compatibility import mock
+
+
+class _FakeStreamPipeline(object):
+    def __init__(self, connection):
+        self._connection = connection
+        self._commands = []
+
+    def execute_command(self, *args):
+        self._commands.append(args)
+
+    def execute(self, raise_on_error=True):
+        results = []
+        for args in self._commands:
+            try:
+                results.append(self._connection.execute_command(*args))
+            except redis.exceptions.ResponseError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+
+class _FakeStreamConnection(object):
+    """
+    Just enough of Redis Streams with one consumer group to exercise the backend (mockredis does not support streams).
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.group_exists = False
+        self.pending = {}
+        self.reclaimable = []
+        self.commands = []
+        self._next_id = 1
+
+    def add(self, message):
+        entry_id = '{}-0'.format(self._next_id).encode('ascii')
+        self._next_id += 1
+        self.entries.append((entry_id, message))
+        return entry_id
+
+    def pipeline(self, transaction=True):
+        return _FakeStreamPipeline(self)
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        if args[0] == 'XGROUP':
+            if self.group_exists:
+                raise redis.exceptions.ResponseError('BUSYGROUP Consumer Group name already exists')
+            self.group_exists = True
+            return True
+        if not self.group_exists:
+            raise redis.exceptions.ResponseError('NOGROUP No such key or consumer group')
+        if args[0] == 'RECLAIM':
+            # Stands in for the Lua script, which mockredis cannot run
+            reclaimable, self.reclaimable = self.reclaimable, []
+            return reclaimable
+        if args[0] == 'XACK':
+            return sum(1 for entry_id in args[3:] if self.pending.pop(entry_id, None))
+        if args[0] == 'XREADGROUP':
+            count = args[5]
+            delivered = []
+            while self.entries and len(delivered) < count:
+                entry_id, message = self.entries.pop(0)
+                self.pending[entry_id] = args[3]
+                delivered.append([entry_id, [b'message', message]])
+            return [[args[-2].encode('utf-8'), delivered]] if delivered else None
+        raise AssertionError('Unexpected command {}'.format(args))
+
+
+@mock.patch('redis.Redis.register_script')
+class TestStreamsRedisClient(unittest.TestCase):
+    def setUp(self):
+        self.connection = _FakeStreamConnection()
+
+    @staticmethod
+    def _get_client(**kwargs):
+        client = StreamsRedisClient(hosts=[('redis-1', 6379)], **kwargs)
+        client.reclaim_pending_messages = mock.MagicMock(
+            side_effect=lambda connection, **_: connection.execute_command('RECLAIM'),
+        )
+        client.metrics_counter_getter = mock.MagicMock()
+        return client
+
+    def test_invalid_visibility_timeout(self, _):
+        with self.assertRaises(ValueError):
+            StreamsRedisClient(hosts=[('redis-1', 6379)], stream_visibility_timeout_in_seconds=0)
+
+    def test_send_to_stream_or_queue(self, _):
+        client = self._get_client()
+
+        self.assertIsInstance(client.send_message_to_queue, SendMessageToStreamOrQueueCommand)
+
+        client.send_message_to_queue._send_to_stream = mock.MagicMock()
+        client.send_message_to_queue._send_to_queue = mock.MagicMock()
+
+        client.send_message_to_queue('pysoa:service.test', b'request', 60, 100, self.connection)
+        client.send_message_to_queue._send_to_stream.assert_called_once_with(
+            'pysoa:service.test', b'request', 60, 100, self.connection,
+        )
+        self.assertFalse(client.send_message_to_queue._send_to_queue.called)
+
+        client.send_message_to_queue._send_to_stream.reset_mock()
+        client.send_message_to_queue('pysoa:service.test.abc!', b'response', 60, 100, self.connection)
+        client.send_message_to_queue._send_to_queue.assert_called_once_with(
+            'pysoa:service.test.abc!', b'response', 60, 100, self.connection,
+        )
+        self.assertFalse(client.send_message_to_queue._send_to_stream.called)
+
+    def test_read_creates_group_then_reads_and_acknowledges(self, _):
+        client = self._get_client()
+        first_id = self.connection.add(b'one')
+        second_id = self.connection.add(b'two')
+        self.connection.add(b'three')
+
+        self.assertEqual(
+            [(first_id, b'one'), (second_id, b'two')],
+            client.read_messages_from_stream('pysoa:service.test', 2, 5, [], self.connection),
+        )
+        self.assertTrue(self.connection.group_exists)
+        self.assertIn(
+            ('XGROUP', 'CREATE', 'pysoa:service.test', 'pysoa', '0', 'MKSTREAM'),
+            self.connection.commands,
+        )
+        self.assertEqual({first_id, second_id}, set(self.connection.pending))
+        client.metrics_counter_getter.assert_any_call('backend.streams.create_group')
+
+        self.connection.commands = []
+        self.assertEqual(
+            [(b'3-0', b'three')],
+            client.read_messages_from_stream('pysoa:service.test', 2, 5, [first_id, second_id], self.connection),
+        )
+        self.assertEqual(
+            [
+                ('XACK', 'pysoa:service.test', 'pysoa', first_id, second_id),
+                (
+                    'XREADGROUP', 'GROUP', 'pysoa', client.consumer_name, 'COUNT', 2, 'BLOCK', 5000,
+                    'STREAMS', 'pysoa:service.test', '>',
+                ),
+            ],
+            self.connection.commands,
+        )
+        self.assertEqual({b'3-0'}, set(self.connection.pending))
+
+        self.assertEqual([], client.read_messages_from_stream('pysoa:service.test', 2, 1, [], self.connection))
+
+    def test_reclaim_abandoned_messages(self, _):
+        client = self._get_client(stream_visibility_timeout_in_seconds=30)
+        self.connection.group_exists = True
+        self.connection.add(b'new')
+        self.connection.reclaimable = [[b'7-0', [b'message', b'abandoned']], [b'8-0', None]]
+        self.connection.pending[b'8-0'] = 'dead-consumer'
+
+        with freezegun.freeze_time() as frozen_time:
+            self.assertEqual(
+                [(b'7-0', b'abandoned')],
+                client.read_messages_from_stream('pysoa:service.test', 5, 5, [b'1-0'], self.connection),
+            )
+            client.reclaim_pending_messages.assert_called_once_with(
+                queue_key='pysoa:service.test',
+                group='pysoa',
+                consumer=client.consumer_name,
+                minimum_idle_milliseconds=30000,
+                count=5,
+                connection=mock.ANY,
+            )
+            # The trimmed message could only be acknowledged
+            self.assertNotIn(b'8-0', self.connection.pending)
+            client.metrics_counter_getter.assert_any_call('backend.streams.reclaimed')
+            client.metrics_counter_getter.assert_any_call('backend.streams.trimmed_while_pending')
+
+            # No reclaiming again until half the visibility timeout has passed
+            self.assertEqual(
+                [(b'1-0', b'new')],
+                client.read_messages_from_stream('pysoa:service.test', 5, 5, [], self.connection),
+            )
+            self.assertEqual(1, client.reclaim_pending_messages.call_count)
+
+            frozen_time.tick(16)
+            self.assertEqual([], client.read_messages_from_stream('pysoa:service.test', 5, 5, [], self.connection))
+            self.assertEqual(2, client.reclaim_pending_messages.call_count)
+
+    def test_acknowledge_messages(self, _):
+        client = self._get_client()
+
+        # The group is gone along with the expired stream, so there is nothing to acknowledge
+        client.acknowledge_messages('pysoa:service.test', [b'1-0'], self.connection)
+
+        self.connection.group_exists = True
+        self.connection.pending[b'1-0'] = 'me'
+        client.acknowledge_messages('pysoa:service.test', [b'1-0'], self.connection)
+        self.assertEqual({}, self.connection.pending)
+
+    def test_consumer_name_unique_per_process(self, _):
+        client = self._get_client()
+        name = client.consumer_name
+
+        self.assertEqual(name, client.consumer_name)
+        with mock.patch('pysoa.common.transport.redis_gateway.backend.streams.os.getpid', return_value=-7):
+            self.assertNotEqual(name, client.consumer_name)
+            self.assertIn('.-7.', client.consumer_name)
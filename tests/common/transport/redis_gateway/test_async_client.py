@@ -0,0 +1,364 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+import collections
+import unittest
+
+import redis
+
+from pysoa.client.client import Client
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.serializer.msgpack_serializer import MsgpackSerializer
+from pysoa.common.transport.exceptions import (
+    MessageReceiveTimeout,
+    MessageSendError,
+)
+from pysoa.common.transport.redis_gateway.async_client import AsyncRedisClientTransport
+from pysoa.common.transport.redis_gateway.backend.async_standard import (
+    AsyncRedisConnection,
+    AsyncStandardRedisClient,
+    pack_command,
+    parse_error,
+)
+from pysoa.common.transport.redis_gateway.core import RedisTransportCore
+from pysoa.test.compatibility import mock
+
+
+class FakeRedisServer(object):
+    """
+    Speaks just enough of the Redis protocol (EVALSHA, EVAL with the send script, BLPOP, GET, DEL, and SELECT) to
+    exercise the asyncio transport, storing lists and values in memory.
+    """
+
+    def __init__(self):
+        self.lists = collections.defaultdict(collections.deque)
+        self.values = {}
+        self.commands = []
+        self._list_events = collections.defaultdict(asyncio.Event)
+        self._server = None
+        self._writers = []
+        self._stopped = False
+        self.port = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        self._stopped = True
+        self._server.close()
+        for writer in self._writers:
+            writer.close()
+        for event in self._list_events.values():
+            event.set()
+
+    async def pop(self, key, timeout):
+        try:
+            await asyncio.wait_for(self._wait_for_list(key), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.lists[key].popleft() if self.lists[key] else None
+
+    def push(self, key, value):
+        self.lists[key].append(value)
+        self._list_events[key].set()
+
+    async def _wait_for_list(self, key):
+        while not self.lists[key] and not self._stopped:
+            self._list_events[key].clear()
+            await self._list_events[key].wait()
+
+    async def _handle_client(self, reader, writer):
+        self._writers.append(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                arguments = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    arguments.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(await self._handle_command(arguments))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_command(self, arguments):
+        command = arguments[0].upper()
+        self.commands.append(command)
+        if command == b'SELECT':
+            return b'+OK\r\n'
+        if command == b'EVALSHA':
+            return b'-NOSCRIPT No matching script. Please use EVAL.\r\n'
+        if command == b'EVAL':
+            # This only understands the send-message script: KEYS[1] = queue, ARGV = expiry, capacity, message
+            key = arguments[3].decode('utf-8')
+            if len(self.lists[key]) >= int(arguments[5]):
+                return b'-queue full\r\n'
+            self.push(key, arguments[6])
+            return b'$-1\r\n'
+        if command == b'BLPOP':
+            key = arguments[1].decode('utf-8')
+            value = await self.pop(key, float(arguments[2]))
+            if value is None:
+                return b'*-1\r\n'
+            return b'*2\r\n$' + str(len(key)).encode() + b'\r\n' + key.encode() + b'\r\n$' + \
+                str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+        if command == b'GET':
+            value = self.values.get(arguments[1].decode('utf-8'))
+            if value is None:
+                return b'$-1\r\n'
+            return b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+        if command == b'DEL':
+            deleted = [self.values.pop(key.decode('utf-8'), None) for key in arguments[1:]]
+            return b':' + str(len([value for value in deleted if value is not None])).encode() + b'\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+class TestAsyncRedisClientTransport(unittest.TestCase):
+    def setUp(self):
+        RedisTransportCore._backend_layer_cache = {}
+        self.loop = asyncio.new_event_loop()
+        self.redis = FakeRedisServer()
+        self.loop.run_until_complete(self.redis.start())
+        self.serializer = MsgpackSerializer()
+
+    def tearDown(self):
+        self.redis.stop()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.loop.close()
+
+    def _get_transport(self, **kwargs):
+        return AsyncRedisClientTransport(
+            'my_service',
+            NoOpMetricsRecorder(),
+            backend_type='redis.standard',
+            backend_layer_kwargs={'hosts': [('127.0.0.1', self.redis.port)], 'redis_db': 2},
+            **kwargs
+        )
+
+    async def _serve(self, count):
+        """Act as the service, handling `count` requests by echoing the request body back in the response."""
+        for _ in range(count):
+            message = self.serializer.blob_to_dict(await self.redis.pop('pysoa:service.my_service', 5))
+            body = {
+                'errors': [],
+                'context': {},
+                'actions': [
+                    {'action': action['action'], 'errors': [], 'body': action.get('body', {})}
+                    for action in message['body']['actions']
+                ],
+            }
+            self.redis.push(
+                'pysoa:' + message['meta']['reply_to'],
+                self.serializer.dict_to_blob({'request_id': message['request_id'], 'meta': {}, 'body': body}),
+            )
+
+    def test_send_and_receive(self):
+        transport = self._get_transport()
+
+        async def test():
+            await transport.send_request_message_async(17, {}, {'foo': 'bar'})
+
+            message = self.serializer.blob_to_dict(self.redis.lists['pysoa:service.my_service'].popleft())
+            self.assertEqual(17, message['request_id'])
+            self.assertEqual({'foo': 'bar'}, message['body'])
+            self.assertTrue(message['meta']['reply_to'].startswith('service.my_service.'))
+            self.assertEqual(1, transport.async_requests_outstanding)
+
+            self.redis.push(
+                'pysoa:' + message['meta']['reply_to'],
+                self.serializer.dict_to_blob({'request_id': 17, 'meta': {}, 'body': {'baz': 'qux'}}),
+            )
+
+            response = await transport.receive_response_message_async(17, 2)
+            self.assertEqual((17, {}, {'baz': 'qux'}), response)
+            self.assertEqual(0, transport.async_requests_outstanding)
+
+            transport.close_async()
+
+        self.loop.run_until_complete(test())
+
+        self.assertEqual([b'SELECT', b'EVALSHA', b'EVAL'], self.redis.commands[:3])
+
+    def test_receive_timeout(self):
+        transport = self._get_transport()
+
+        async def test():
+            await transport.send_request_message_async(18, {}, {})
+            with self.assertRaises(MessageReceiveTimeout):
+                await transport.receive_response_message_async(18, 0.1)
+            self.assertEqual(0, transport.async_requests_outstanding)
+            transport.close_async()
+
+        self.loop.run_until_complete(test())
+
+    def test_queue_full(self):
+        transport = self._get_transport(queue_capacity=1, queue_full_retries=0)
+
+        async def test():
+            await transport.send_request_message_async(19, {}, {})
+            with self.assertRaises(MessageSendError) as error_context:
+                await transport.send_request_message_async(20, {}, {})
+            self.assertTrue('full' in error_context.exception.args[0])
+            self.assertEqual(1, transport.async_requests_outstanding)
+            transport.close_async()
+
+        self.loop.run_until_complete(test())
+
+    def test_cannot_connect(self):
+        self.redis.stop()
+        transport = self._get_transport()
+        self.loop.run_until_complete(self.redis._server.wait_closed())
+
+        async def test():
+            with self.assertRaises(MessageSendError) as error_context:
+                await transport.send_request_message_async(21, {}, {})
+            self.assertTrue(error_context.exception.args[0].startswith('Cannot get connection'))
+            self.assertEqual(0, transport.async_requests_outstanding)
+
+        self.loop.run_until_complete(test())
+
+    def test_receive_chunked_response(self):
+        transport = self._get_transport()
+        response = self.serializer.dict_to_blob({'request_id': 23, 'meta': {}, 'body': {'large': 'x' * 100}})
+        chunk_key = 'pysoa:chunks.abc123!'
+        chunk_count = (len(response) + 9) // 10
+        for i in range(chunk_count):
+            self.redis.values['{}{}'.format(chunk_key, i)] = response[i * 10:(i + 1) * 10]
+
+        async def test():
+            await transport.send_request_message_async(23, {}, {})
+            message = self.serializer.blob_to_dict(self.redis.lists['pysoa:service.my_service'].popleft())
+            self.redis.push(
+                'pysoa:' + message['meta']['reply_to'],
+                RedisTransportCore.CHUNK_MANIFEST_MARKER + self.serializer.dict_to_blob({
+                    'chunk_key': chunk_key,
+                    'chunk_count': chunk_count,
+                    'size_in_bytes': len(response),
+                }),
+            )
+
+            self.assertEqual((23, {}, {'large': 'x' * 100}), await transport.receive_response_message_async(23, 2))
+            transport.close_async()
+
+        self.loop.run_until_complete(test())
+
+        self.assertEqual({}, self.redis.values)
+        self.assertEqual(chunk_count, self.redis.commands.count(b'GET'))
+
+    def test_sentinel_not_supported(self):
+        with self.assertRaises(ValueError):
+            AsyncRedisClientTransport('my_service', NoOpMetricsRecorder(), backend_type='redis.sentinel')
+
+    def test_blocking_features_not_supported(self):
+        with self.assertRaises(ValueError):
+            self._get_transport(chunk_size_in_bytes=1024)
+
+        with self.assertRaises(ValueError):
+            AsyncRedisClientTransport(
+                'my_service',
+                NoOpMetricsRecorder(),
+                backend_type='redis.standard',
+                backend_layer_kwargs={'request_queue_strategy': 'power_of_two_choices'},
+            )
+
+    def test_client_many_outstanding_requests(self):
+        client = Client({
+            'my_service': {
+                'transport': {
+                    'path': 'pysoa.common.transport.redis_gateway.async_client:AsyncRedisClientTransport',
+                    'kwargs': {
+                        'backend_type': 'redis.standard',
+                        'backend_layer_kwargs': {'hosts': [('127.0.0.1', self.redis.port)]},
+                    },
+                },
+            },
+        })
+
+        async def test():
+            server = asyncio.ensure_future(self._serve(301))
+
+            action_responses = await client.call_actions_parallel_async(
+                'my_service',
+                [{'action': 'echo', 'body': {'number': i}} for i in range(300)],
+            )
+            self.assertEqual(list(range(300)), [response.body['number'] for response in action_responses])
+
+            action_response = await client.call_action_async('my_service', 'echo', body={'hello': 'world'})
+            self.assertEqual({'hello': 'world'}, action_response.body)
+
+            await server
+            client.handlers['my_service'].transport.close_async()
+
+        self.loop.run_until_complete(test())
+
+        # The script was not cached, so every send fell back to EVAL
+        self.assertEqual(301, self.redis.commands.count(b'EVAL'))
+
+
+class TestAsyncRedisConnection(unittest.TestCase):
+    def test_execute_drains_each_write(self):
+        loop = asyncio.new_event_loop()
+
+        async def test():
+            reader = asyncio.StreamReader()
+            writer = mock.MagicMock()
+            drained_after_writes = []
+
+            async def drain():
+                drained_after_writes.append(writer.write.call_count)
+                await asyncio.sleep(0)
+
+            writer.drain = drain
+            connection = AsyncRedisConnection(reader, writer)
+
+            commands = asyncio.gather(connection.execute('SELECT', 2), connection.execute('DEL', 'foo'))
+            await asyncio.sleep(0)
+            reader.feed_data(b'+OK\r\n:1\r\n')
+            self.assertEqual([b'OK', 1], await commands)
+            # Both commands were written before either got its reply, and each write was followed by a drain
+            self.assertEqual([1, 2], drained_after_writes)
+
+            writer.drain = mock.MagicMock(side_effect=ConnectionResetError('reset'))
+            with self.assertRaises(redis.exceptions.ConnectionError):
+                await connection.execute('GET', 'foo')
+            connection.close()
+            await asyncio.sleep(0)
+
+        try:
+            loop.run_until_complete(test())
+        finally:
+            loop.close()
+
+    def test_pack_command(self):
+        self.assertEqual(
+            b'*5\r\n$4\r\nEVAL\r\n$2\r\n\xc3\xa9\r\n$1\r\n2\r\n$3\r\n1.5\r\n$3\r\n\x00\x01\x02\r\n',
+            pack_command('EVAL', '\u00e9', 2, 1.5, b'\x00\x01\x02'),
+        )
+
+    def test_parse_error(self):
+        error = parse_error('NOSCRIPT No matching script. Please use EVAL.')
+        self.assertIsInstance(error, redis.exceptions.NoScriptError)
+        self.assertEqual(('No matching script. Please use EVAL.', ), error.args)
+
+        error = parse_error('ERR unknown command')
+        self.assertEqual((redis.exceptions.ResponseError, ('unknown command', )), (type(error), error.args))
+
+        error = parse_error('queue full')
+        self.assertEqual((redis.exceptions.ResponseError, ('queue full', )), (type(error), error.args))
+
+
+class TestAsyncStandardRedisClient(unittest.TestCase):
+    def test_invalid_index(self):
+        loop = asyncio.new_event_loop()
+        try:
+            with self.assertRaises(ValueError):
+                loop.run_until_complete(AsyncStandardRedisClient().open_connection(1))
+        finally:
+            loop.close()
@@ -3,11 +3,17 @@ from __future__ import (
     unicode_literals,
 )
 
+import threading
+import time
 import unittest
 import uuid
 
 from pysoa.common.metrics import NoOpMetricsRecorder
 from pysoa.common.transport.base import get_hex_thread_id
+from pysoa.common.transport.exceptions import (
+    MessageReceiveTimeout,
+    MessageSendError,
+)
 from pysoa.common.transport.redis_gateway.client import RedisClientTransport
 from pysoa.common.transport.redis_gateway.constants import DEFAULT_MAXIMUM_MESSAGE_BYTES_CLIENT
 from pysoa.test.compatibility import mock
@@ -35,7 +41,12 @@ class TestClientTransport(unittest.TestCase):
 
         mock_core.reset_mock()
 
-        transport = self._get_transport(hello='world', goodbye='earth', maximum_message_size_in_bytes=42)
+        transport = self._get_transport(
+            hello='world',
+            goodbye='earth',
+            maximum_message_size_in_bytes=42,
+            pop_next_request_with_response=True,
+        )
 
         mock_core.assert_called_once_with(
             service_name='my_service',
@@ -69,6 +80,7 @@ class TestClientTransport(unittest.TestCase):
             },
             message,
             None,
+            compress=False,
         )
 
     def test_send_request_message_another_service(self, mock_core):
@@ -90,8 +102,33 @@ class TestClientTransport(unittest.TestCase):
             },
             message,
             25,
+            compress=False,
         )
 
+    def test_send_request_messages(self, mock_core):
+        transport = self._get_transport()
+
+        reply_to = 'service.my_service.{client_id}!{thread_id}'.format(
+            client_id=transport.client_id,
+            thread_id=get_hex_thread_id(),
+        )
+        error = Exception('Nope')
+        mock_core.return_value.send_messages.return_value = [None, error, None]
+
+        errors = transport.send_request_messages([
+            (1, {'app': 'ppa'}, {'test': 'payload'}, None),
+            (2, {}, {'another': 'message'}, 25),
+            (3, {}, {'third': 'message'}, None),
+        ])
+
+        self.assertEqual([None, error, None], errors)
+        mock_core.return_value.send_messages.assert_called_once_with([
+            ('service.my_service', 1, {'app': 'ppa', 'reply_to': reply_to}, {'test': 'payload'}, None),
+            ('service.my_service', 2, {'reply_to': reply_to}, {'another': 'message'}, 25),
+            ('service.my_service', 3, {'reply_to': reply_to}, {'third': 'message'}, None),
+        ], compress=False)
+        self.assertEqual(2, transport.requests_outstanding)
+
     def test_receive_response_message(self, mock_core):
         transport = self._get_transport()
         transport._requests_outstanding = 1
@@ -140,6 +177,28 @@ class TestClientTransport(unittest.TestCase):
             15,
         )
 
+    def test_compression_after_server_accepts(self, mock_core):
+        transport = self._get_transport()
+
+        mock_core.return_value.accepts_compression.return_value = False
+        mock_core.return_value.receive_message.return_value = 1, {}, {}
+
+        transport.send_request_message(1, {}, {})
+        mock_core.return_value.advertise_compression.assert_called_once_with(mock.ANY)
+        self.assertFalse(mock_core.return_value.send_message.call_args[1]['compress'])
+
+        transport.receive_response_message()
+        transport.send_request_message(2, {}, {})
+        self.assertFalse(mock_core.return_value.send_message.call_args[1]['compress'])
+
+        mock_core.return_value.accepts_compression.return_value = True
+        mock_core.return_value.receive_message.return_value = 2, {'__accepts_compression__': 'zlib'}, {}
+
+        transport.receive_response_message()
+        mock_core.return_value.accepts_compression.assert_called_with({'__accepts_compression__': 'zlib'})
+        transport.send_request_message(3, {}, {})
+        self.assertTrue(mock_core.return_value.send_message.call_args[1]['compress'])
+
     def test_requests_outstanding(self, mock_core):
         transport = self._get_transport('geo')
         self.assertEqual(0, transport.requests_outstanding)
@@ -160,3 +219,185 @@ class TestClientTransport(unittest.TestCase):
         self.assertEqual(0, transport.requests_outstanding)
 
         self.assertEqual((None, None, None), transport.receive_response_message())
+
+    @staticmethod
+    def _set_up_multiplexed_responses(mock_core, responses):
+        responses = list(responses)
+
+        def receive_message(*_, **__):
+            if responses:
+                return responses.pop(0)
+            time.sleep(0.01)
+            raise MessageReceiveTimeout()
+
+        mock_core.return_value.receive_message.side_effect = receive_message
+
+    def test_multiplexed_send_and_receive(self, mock_core):
+        transport = self._get_transport(multiplex_response_queue=True)
+        self._set_up_multiplexed_responses(mock_core, [])
+        mock_core.return_value.send_messages.return_value = [None]
+
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual((None, None, None), transport.receive_response_message())
+
+        transport.send_request_message(15, {}, {})
+        self.assertEqual([None], transport.send_request_messages([(16, {}, {}, None)]))
+        self.assertEqual(2, transport.requests_outstanding)
+
+        reply_to = 'service.my_service.{client_id}!'.format(client_id=transport.client_id)
+        self.assertEqual({'reply_to': reply_to}, mock_core.return_value.send_message.call_args[0][2])
+        self.assertEqual({'reply_to': reply_to}, mock_core.return_value.send_messages.call_args[0][0][0][2])
+
+        self._set_up_multiplexed_responses(mock_core, [(15, {}, {'foo': 'bar'}), (16, {}, {'baz': 'qux'})])
+
+        self.assertEqual((15, {}, {'foo': 'bar'}), transport.receive_response_message(5))
+        self.assertEqual((16, {}, {'baz': 'qux'}), transport.receive_response_message(5))
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual((None, None, None), transport.receive_response_message())
+
+        mock_core.return_value.receive_message.assert_any_call(reply_to, 1, accept_request_id=mock.ANY)
+
+    def test_multiplexed_responses_routed_to_sending_thread(self, mock_core):
+        transport = self._get_transport(multiplex_response_queue=True)
+        self._set_up_multiplexed_responses(mock_core, [])
+
+        transport.send_request_message(21, {}, {})
+
+        other_thread_results = []
+
+        def other_thread():
+            transport.send_request_message(22, {}, {})
+            other_thread_results.append(transport.requests_outstanding)
+            other_thread_results.append(transport.receive_response_message(5))
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        while not other_thread_results:
+            time.sleep(0.01)
+
+        # Each thread only counts its own requests, and the response to the other thread's request arrives first
+        self.assertEqual([1], other_thread_results)
+        self.assertEqual(1, transport.requests_outstanding)
+        self._set_up_multiplexed_responses(mock_core, [(22, {}, {'thread': 2}), (21, {}, {'thread': 1})])
+
+        self.assertEqual((21, {}, {'thread': 1}), transport.receive_response_message(5))
+        thread.join(5)
+        self.assertEqual([1, (22, {}, {'thread': 2})], other_thread_results)
+
+    def test_multiplexed_receive_timeout(self, mock_core):
+        transport = self._get_transport(multiplex_response_queue=True)
+        self._set_up_multiplexed_responses(mock_core, [(99, {}, {'unknown': 'request'})])
+
+        transport.send_request_message(31, {}, {})
+        transport.send_request_message(32, {}, {})
+        with self.assertRaises(MessageReceiveTimeout):
+            transport.receive_response_message(0.1)
+
+        mock_core.return_value.get_counter.assert_called_with('receive.error.unknown_request_id')
+
+        # The timed-out requests are abandoned, so the dispatcher stops polling for their responses
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual({}, transport._response_routes)
+        self.assertEqual((None, None, None), transport.receive_response_message())
+
+        # A response routed just before the timeout is discarded instead of being returned for a later request
+        transport._get_thread_state().responses.put((32, {}, {'late': 'response'}))
+        mock_core.return_value.get_counter.reset_mock()
+        transport.send_request_message(33, {}, {})
+        self._set_up_multiplexed_responses(mock_core, [(33, {}, {'foo': 'bar'})])
+
+        self.assertEqual((33, {}, {'foo': 'bar'}), transport.receive_response_message(5))
+        self.assertEqual(0, transport.requests_outstanding)
+        mock_core.return_value.get_counter.assert_called_once_with('receive.error.unknown_request_id')
+
+    def test_multiplexed_send_error(self, mock_core):
+        transport = self._get_transport(multiplex_response_queue=True)
+        self._set_up_multiplexed_responses(mock_core, [])
+        mock_core.return_value.send_message.side_effect = MessageSendError('Nope')
+
+        with self.assertRaises(MessageSendError):
+            transport.send_request_message(41, {}, {})
+
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual({}, transport._response_routes)
+
+    def test_send_request_message_priority_lanes(self, mock_core):
+        transport = self._get_transport(priority_lanes=3, priority_lane_starvation_guard=5)
+        self.assertNotIn('priority_lanes', mock_core.call_args[1])
+        self.assertNotIn('priority_lane_starvation_guard', mock_core.call_args[1])
+
+        for priority, queue_name in (
+            (None, 'service.my_service'),
+            (0, 'service.my_service'),
+            (1, 'service.my_service.priority_1'),
+            (2, 'service.my_service.priority_2'),
+            (7, 'service.my_service.priority_2'),
+            ('high', 'service.my_service'),
+        ):
+            meta = {}
+            control = {'continue_on_error': False}
+            if priority is not None:
+                control['priority'] = priority
+            transport.send_request_message(1, meta, {'control': control})
+
+            self.assertEqual(queue_name, mock_core.return_value.send_message.call_args[0][0])
+            self.assertTrue(time.time() - 1 < meta['__sent__'] <= time.time())
+
+        mock_core.return_value.send_messages.return_value = [None, None]
+        transport.send_request_messages([
+            (2, {}, {'control': {'priority': 1}}, None),
+            (3, {}, {'control': {}}, None),
+        ])
+        self.assertEqual(
+            ['service.my_service.priority_1', 'service.my_service'],
+            [message[0] for message in mock_core.return_value.send_messages.call_args[0][0]],
+        )
+
+    def test_send_request_message_priority_without_lanes(self, mock_core):
+        transport = self._get_transport()
+
+        meta = {}
+        transport.send_request_message(1, meta, {'control': {'priority': 2}})
+
+        self.assertEqual('service.my_service', mock_core.return_value.send_message.call_args[0][0])
+        self.assertNotIn('__sent__', meta)
+
+    def test_priority_lanes_with_streams(self, mock_core):
+        with self.assertRaises(ValueError):
+            self._get_transport(priority_lanes=2, backend_type='redis.streams')
+
+    def test_send_request_message_action_queues(self, mock_core):
+        transport = self._get_transport(
+            action_queues={'generate_report': 'reports', 'export': 'reports'},
+            receive_queues=['reports'],
+        )
+        self.assertNotIn('action_queues', mock_core.call_args[1])
+        self.assertNotIn('receive_queues', mock_core.call_args[1])
+
+        for actions, queue_name in (
+            ([], 'service.my_service'),
+            ([{'action': 'get_user'}], 'service.my_service'),
+            ([{'action': 'get_user'}, {'action': 'export'}], 'service.my_service.queue_reports'),
+            ([{'action': 'generate_report'}], 'service.my_service.queue_reports'),
+        ):
+            meta = {}
+            transport.send_request_message(1, meta, {'control': {}, 'actions': actions})
+
+            self.assertEqual(queue_name, mock_core.return_value.send_message.call_args[0][0])
+            self.assertNotIn('__sent__', meta)
+
+    def test_send_request_message_action_queues_and_priority_lanes(self, mock_core):
+        transport = self._get_transport(action_queues={'generate_report': 'reports'}, priority_lanes=2)
+
+        transport.send_request_message(1, {}, {'control': {'priority': 1}, 'actions': [{'action': 'generate_report'}]})
+        self.assertEqual(
+            'service.my_service.queue_reports.priority_1',
+            mock_core.return_value.send_message.call_args[0][0],
+        )
+
+        transport.send_request_message(2, {}, {'control': {'priority': 1}, 'actions': [{'action': 'get_user'}]})
+        self.assertEqual('service.my_service.priority_1', mock_core.return_value.send_message.call_args[0][0])
+
+    def test_action_queues_with_streams(self, mock_core):
+        with self.assertRaises(ValueError):
+            self._get_transport(action_queues={'generate_report': 'reports'}, backend_type='redis.streams')
@@ -7,10 +7,13 @@ import datetime
 import time
 import timeit
 import unittest
+import zlib
 
 import attr
 import freezegun
+import redis
 
+from pysoa.common.serializer.json_serializer import JSONSerializer
 from pysoa.common.serializer.msgpack_serializer import MsgpackSerializer
 from pysoa.common.transport.exceptions import (
     InvalidMessageError,
@@ -23,12 +26,14 @@ from pysoa.common.transport.redis_gateway.backend.base import CannotGetConnectio
 from pysoa.common.transport.redis_gateway.constants import (
     REDIS_BACKEND_TYPE_SENTINEL,
     REDIS_BACKEND_TYPE_STANDARD,
+    REDIS_BACKEND_TYPE_STREAMS,
 )
 from pysoa.common.transport.redis_gateway.core import RedisTransportCore
 from pysoa.test.compatibility import mock
 
 # To ensure all the patching over there happens over here
 from tests.common.transport.redis_gateway.backend.test_standard import mockredis
+from tests.common.transport.redis_gateway.backend.test_streams import _FakeStreamConnection
 
 
 @attr.s
@@ -37,6 +42,39 @@ class MockSerializer(object):
     kwarg2 = attr.ib(default=None)
 
 
+class _FakeChunkConnection(object):
+    """Stores plain keys and values for the chunked message tests, counting round trips."""
+
+    def __init__(self):
+        self.values = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return _FakeChunkPipeline(self)
+
+    def delete(self, *keys):
+        self.round_trips += 1
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class _FakeChunkPipeline(object):
+    def __init__(self, connection):
+        self._connection = connection
+        self._commands = []
+
+    def set(self, key, value, ex=None):
+        assert ex
+        self._commands.append(lambda: self._connection.values.__setitem__(key, value))
+
+    def get(self, key):
+        self._commands.append(lambda: self._connection.values.get(key))
+
+    def execute(self):
+        self._connection.round_trips += 1
+        return [command() for command in self._commands]
+
+
 @mock.patch('redis.Redis', new=mockredis.mock_redis_client)
 class TestRedisTransportCore(unittest.TestCase):
     def setUp(self):
@@ -140,7 +178,8 @@ class TestRedisTransportCore(unittest.TestCase):
     def test_cannot_get_connection_error_on_send(self, mock_standard, mock_sentinel):
         core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
 
-        mock_standard.return_value.get_connection.side_effect = CannotGetConnectionError('This is my error')
+        mock_standard.return_value.get_connection_index.return_value = 1
+        mock_standard.return_value.get_connection_by_index.side_effect = CannotGetConnectionError('This is my error')
 
         with self.assertRaises(MessageSendError) as error_context:
             core.send_message('my_queue', 71, {}, {})
@@ -148,7 +187,9 @@ class TestRedisTransportCore(unittest.TestCase):
         self.assertEqual('Cannot get connection: This is my error', error_context.exception.args[0])
 
         self.assertFalse(mock_sentinel.called)
-        mock_standard.return_value.get_connection.assert_called_once_with('pysoa:my_queue')
+        mock_standard.return_value.get_connection_index.assert_called_once_with('pysoa:my_queue')
+        mock_standard.return_value.get_connection_by_index.assert_called_once_with(1)
+        self.assertFalse(mock_standard.return_value.record_send_outcome.called)
 
     @mock.patch('pysoa.common.transport.redis_gateway.core.SentinelRedisClient')
     @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
@@ -165,10 +206,747 @@ class TestRedisTransportCore(unittest.TestCase):
         self.assertFalse(mock_sentinel.called)
         mock_standard.return_value.get_connection.assert_called_once_with('pysoa:your_queue')
 
+    def test_invalid_receive_batch_size(self):
+        with self.assertRaises(ValueError):
+            RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=0)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_batch_buffers_messages(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=3)
+
+        mock_standard.return_value.pop_messages_from_queue.return_value = [
+            core.serializer.dict_to_blob({'request_id': 15, 'meta': {}, 'body': {'foo': 'bar'}}),
+            core.serializer.dict_to_blob({'request_id': 16, 'meta': {}, 'body': {'baz': 'qux'}}),
+        ]
+
+        self.assertEqual((15, {}, {'foo': 'bar'}), core.receive_message('my_queue'))
+        self.assertEqual((16, {}, {'baz': 'qux'}), core.receive_message('my_queue'))
+
+        mock_standard.return_value.pop_messages_from_queue.assert_called_once_with(
+            queue_key='pysoa:my_queue',
+            count=3,
+            connection=mock_standard.return_value.get_connection.return_value,
+        )
+        self.assertFalse(mock_standard.return_value.get_connection.return_value.blpop.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_batch_falls_back_to_blocking_pop(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=5)
+
+        connection = mock_standard.return_value.get_connection.return_value
+        mock_standard.return_value.pop_messages_from_queue.return_value = []
+        connection.blpop.return_value = [
+            'pysoa:my_queue',
+            core.serializer.dict_to_blob({'request_id': 17, 'meta': {}, 'body': {}}),
+        ]
+
+        self.assertEqual((17, {}, {}), core.receive_message('my_queue', receive_timeout_in_seconds=2))
+
+        connection.blpop.assert_called_once_with(['pysoa:my_queue'], timeout=2)
+
+        connection.blpop.return_value = None
+        with self.assertRaises(MessageReceiveTimeout):
+            core.receive_message('my_queue')
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_batch_checks_expiry_when_leaving_buffer(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=2)
+
+        with freezegun.freeze_time() as frozen_time:
+            mock_standard.return_value.pop_messages_from_queue.return_value = [
+                core.serializer.dict_to_blob({'request_id': 18, 'meta': {'__expiry__': time.time() + 5}, 'body': {}}),
+                core.serializer.dict_to_blob({'request_id': 19, 'meta': {'__expiry__': time.time() + 5}, 'body': {}}),
+            ]
+
+            self.assertEqual(18, core.receive_message('my_queue')[0])
+
+            frozen_time.tick(datetime.timedelta(seconds=6))
+
+            with self.assertRaises(MessageReceiveTimeout) as error_context:
+                core.receive_message('my_queue')
+
+            self.assertTrue('expired' in error_context.exception.args[0])
+            self.assertEqual(1, mock_standard.return_value.pop_messages_from_queue.call_count)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_return_buffered_messages(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=10)
+
+        messages = [
+            core.serializer.dict_to_blob({'request_id': i, 'meta': {}, 'body': {}}) for i in range(20, 24)
+        ]
+        mock_standard.return_value.pop_messages_from_queue.return_value = list(messages)
+
+        self.assertEqual(20, core.receive_message('my_queue')[0])
+
+        core.return_buffered_messages()
+
+        mock_standard.return_value.get_connection.return_value.lpush.assert_called_once_with(
+            'pysoa:my_queue',
+            messages[3],
+            messages[2],
+            messages[1],
+        )
+
+        # Nothing left to return the second time around
+        mock_standard.return_value.get_connection.return_value.lpush.reset_mock()
+        core.return_buffered_messages()
+        self.assertFalse(mock_standard.return_value.get_connection.return_value.lpush.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_messages_pipelines_by_connection(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        connection_1 = mock.MagicMock()
+        connection_2 = mock.MagicMock()
+        mock_standard.return_value.get_connection_index.side_effect = lambda queue_key: (
+            1 if queue_key == 'pysoa:queue_1' else 2
+        )
+        mock_standard.return_value.get_connection_by_index.side_effect = lambda index: (
+            connection_1 if index == 1 else connection_2
+        )
+        connection_1.pipeline.return_value.execute.return_value = [True, True]
+        connection_2.pipeline.return_value.execute.return_value = [True]
+
+        errors = core.send_messages([
+            ('queue_1', 1, {}, {'foo': 'bar'}, None),
+            ('queue_2', 2, {}, {'baz': 'qux'}, None),
+            ('queue_1', 3, {}, {'hello': 'world'}, 30),
+        ])
+
+        self.assertEqual([None, None, None], errors)
+
+        connection_1.pipeline.assert_called_once_with(transaction=False)
+        connection_2.pipeline.assert_called_once_with(transaction=False)
+        connection_1.pipeline.return_value.execute.assert_called_once_with(raise_on_error=False)
+        connection_2.pipeline.return_value.execute.assert_called_once_with(raise_on_error=False)
+
+        calls = mock_standard.return_value.send_message_to_queue.call_args_list
+        self.assertEqual(3, len(calls))
+        self.assertEqual('pysoa:queue_1', calls[0][1]['queue_key'])
+        self.assertEqual(connection_1.pipeline.return_value, calls[0][1]['connection'])
+        self.assertEqual(60, calls[0][1]['expiry'])
+        self.assertEqual('pysoa:queue_1', calls[1][1]['queue_key'])
+        self.assertEqual(connection_1.pipeline.return_value, calls[1][1]['connection'])
+        self.assertEqual(40, calls[1][1]['expiry'])
+        self.assertEqual(3, core.serializer.blob_to_dict(calls[1][1]['message'])['request_id'])
+        self.assertEqual('pysoa:queue_2', calls[2][1]['queue_key'])
+        self.assertEqual(connection_2.pipeline.return_value, calls[2][1]['connection'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_messages_returns_individual_errors(self, mock_standard):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            maximum_message_size_in_bytes=150,
+            queue_full_retries=1,
+        )
+
+        mock_standard.return_value.get_connection_index.return_value = 0
+        pipeline = mock_standard.return_value.get_connection_by_index.return_value.pipeline.return_value
+        pipeline.execute.side_effect = [
+            [redis.exceptions.ResponseError('queue full'), True, redis.exceptions.ResponseError('oops')],
+            [redis.exceptions.ResponseError('queue full')],
+        ]
+
+        with mock.patch('pysoa.common.transport.redis_gateway.core.time.sleep'):
+            errors = core.send_messages([
+                ('my_queue', 1, {}, {}, None),
+                ('my_queue', None, {}, {}, None),
+                ('my_queue', 2, {}, {}, None),
+                ('my_queue', 3, {}, {'test': 'payload' * 30}, None),
+                ('my_queue', 4, {}, {}, None),
+            ])
+
+        self.assertEqual(2, pipeline.execute.call_count)
+        self.assertIsInstance(errors[0], MessageSendError)
+        self.assertTrue('full' in errors[0].args[0])
+        self.assertIsInstance(errors[1], InvalidMessageError)
+        self.assertIsNone(errors[2])
+        self.assertIsInstance(errors[3], MessageTooLarge)
+        self.assertIsInstance(errors[4], MessageSendError)
+        self.assertTrue('Redis error' in errors[4].args[0])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_messages_connection_error(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        mock_standard.return_value.get_connection_by_index.side_effect = CannotGetConnectionError('This is my error')
+
+        errors = core.send_messages([('my_queue', 1, {}, {}, None), ('my_queue', 2, {}, {}, None)])
+
+        self.assertEqual(2, len(errors))
+        for error in errors:
+            self.assertIsInstance(error, MessageSendError)
+            self.assertEqual('Cannot get connection: This is my error', error.args[0])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_message_and_receive_next_hit(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=2)
+
+        connection = mock_standard.return_value.get_connection_by_index.return_value
+        mock_standard.return_value.send_message_and_pop_messages.return_value = [
+            core.serializer.dict_to_blob({'request_id': 31, 'meta': {}, 'body': {'foo': 'bar'}}),
+        ]
+
+        core.send_message_and_receive_next('my_reply_queue!', 30, {}, {'hello': 'world'}, 'my_queue')
+
+        mock_standard.return_value.get_connection_index.assert_called_once_with('pysoa:my_reply_queue!')
+        call_kwargs = mock_standard.return_value.send_message_and_pop_messages.call_args[1]
+        self.assertEqual('pysoa:my_reply_queue!', call_kwargs['queue_key'])
+        self.assertEqual('pysoa:my_queue', call_kwargs['pop_queue_key'])
+        self.assertEqual(2, call_kwargs['count'])
+        self.assertEqual(connection, call_kwargs['connection'])
+        self.assertEqual(30, core.serializer.blob_to_dict(call_kwargs['message'])['request_id'])
+        self.assertFalse(mock_standard.return_value.send_message_to_queue.called)
+
+        self.assertEqual((31, {}, {'foo': 'bar'}), core.receive_message('my_queue'))
+        self.assertFalse(mock_standard.return_value.pop_messages_from_queue.called)
+        self.assertFalse(connection.blpop.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_message_and_receive_next_miss(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        connection = mock_standard.return_value.get_connection.return_value
+        mock_standard.return_value.send_message_and_pop_messages.return_value = []
+        connection.blpop.return_value = [
+            'pysoa:my_queue',
+            core.serializer.dict_to_blob({'request_id': 33, 'meta': {}, 'body': {}}),
+        ]
+
+        core.send_message_and_receive_next('my_reply_queue!', 32, {}, {}, 'my_queue')
+
+        self.assertEqual(1, mock_standard.return_value.send_message_and_pop_messages.call_args[1]['count'])
+
+        self.assertEqual((33, {}, {}), core.receive_message('my_queue'))
+        connection.blpop.assert_called_once_with(['pysoa:my_queue'], timeout=5)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_message_and_receive_next_already_buffered(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=5)
+
+        mock_standard.return_value.pop_messages_from_queue.return_value = [
+            core.serializer.dict_to_blob({'request_id': i, 'meta': {}, 'body': {}}) for i in range(34, 36)
+        ]
+        self.assertEqual(34, core.receive_message('my_queue')[0])
+
+        core.send_message_and_receive_next('my_reply_queue!', 34, {}, {}, 'my_queue')
+
+        self.assertFalse(mock_standard.return_value.send_message_and_pop_messages.called)
+        self.assertEqual(1, mock_standard.return_value.send_message_to_queue.call_count)
+        self.assertEqual(35, core.receive_message('my_queue')[0])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_message_and_receive_next_queue_full(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, queue_full_retries=1)
+
+        mock_standard.return_value.send_message_and_pop_messages.side_effect = redis.exceptions.ResponseError(
+            'queue full',
+        )
+
+        with mock.patch('pysoa.common.transport.redis_gateway.core.time.sleep'), \
+                self.assertRaises(MessageSendError) as error_context:
+            core.send_message_and_receive_next('my_reply_queue!', 36, {}, {}, 'my_queue')
+
+        self.assertTrue('full' in error_context.exception.args[0])
+        self.assertEqual(2, mock_standard.return_value.send_message_and_pop_messages.call_count)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_outcomes_recorded(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, queue_full_retries=1)
+        backend = mock_standard.return_value
+        backend.get_connection_index.return_value = 2
+        connection = backend.get_connection_by_index.return_value
+
+        backend.send_message_to_queue.return_value = 7
+        core.send_message('my_queue', 1, {}, {})
+
+        backend.record_send_outcome.assert_called_once_with(2, mock.ANY, False, {'pysoa:my_queue': 7})
+
+        backend.record_send_outcome.reset_mock()
+        backend.send_message_to_queue.side_effect = redis.exceptions.ResponseError('queue full')
+
+        with mock.patch('pysoa.common.transport.redis_gateway.core.time.sleep'), \
+                self.assertRaises(MessageSendError):
+            core.send_message('my_queue', 2, {}, {})
+
+        self.assertEqual(
+            [
+                mock.call(2, mock.ANY, True, {'pysoa:my_queue': core.queue_capacity}),
+                mock.call(2, mock.ANY, True, {'pysoa:my_queue': core.queue_capacity}),
+            ],
+            backend.record_send_outcome.call_args_list,
+        )
+
+        backend.record_send_outcome.reset_mock()
+        connection.pipeline.return_value.execute.side_effect = [
+            [3, redis.exceptions.ResponseError('queue full')],
+            [redis.exceptions.ResponseError('queue full')],
+        ]
+        backend.send_message_to_queue.side_effect = None
+
+        with mock.patch('pysoa.common.transport.redis_gateway.core.time.sleep'):
+            core.send_messages([('my_queue', 3, {}, {}, None), ('my_queue', 4, {}, {}, None)])
+
+        self.assertEqual(
+            [
+                mock.call(2, mock.ANY, True, {'pysoa:my_queue': core.queue_capacity}),
+                mock.call(2, mock.ANY, True, {'pysoa:my_queue': core.queue_capacity}),
+            ],
+            backend.record_send_outcome.call_args_list,
+        )
+
+        backend.record_send_outcome.reset_mock()
+        backend.get_connection_by_index.side_effect = CannotGetConnectionError('This is my error')
+
+        with self.assertRaises(MessageSendError):
+            core.send_message('my_queue', 5, {}, {})
+
+        self.assertFalse(backend.record_send_outcome.called)
+
+        # Once a message has been sent, an error recording the outcome is not mistaken for a failure to send it
+        backend.get_connection_by_index.side_effect = None
+        backend.send_message_to_queue.reset_mock()
+        backend.record_send_outcome.side_effect = ValueError('Bookkeeping error')
+
+        with self.assertRaises(ValueError):
+            core.send_message('my_queue', 6, {}, {})
+
+        self.assertEqual(1, backend.send_message_to_queue.call_count)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.SentinelRedisClient')
+    def test_stale_master_requests_topology_refresh(self, mock_sentinel):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_SENTINEL)
+        core.get_counter = mock.MagicMock()
+        backend = mock_sentinel.return_value
+
+        backend.send_message_to_queue.side_effect = redis.exceptions.ResponseError(
+            "READONLY You can't write against a read only replica.",
+        )
+        with self.assertRaises(MessageSendError):
+            core.send_message('my_queue', 1, {}, {})
+
+        backend.request_topology_refresh.assert_called_once_with()
+        core.get_counter.assert_any_call('send.error.stale_master')
+
+        backend.request_topology_refresh.reset_mock()
+        backend.get_connection.return_value.blpop.side_effect = redis.exceptions.ConnectionError('Connection refused')
+        with self.assertRaises(MessageReceiveError):
+            core.receive_message('my_queue')
+
+        backend.request_topology_refresh.assert_called_once_with()
+
+        backend.request_topology_refresh.reset_mock()
+        backend.send_message_to_queue.side_effect = redis.exceptions.ResponseError('oops')
+        with self.assertRaises(MessageSendError):
+            core.send_message('my_queue', 2, {}, {})
+
+        self.assertFalse(backend.request_topology_refresh.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StreamsRedisClient')
+    def test_streams_client_created(self, mock_streams):
+        mock_streams.RESPONSE_QUEUE_SPECIFIER = '!'
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STREAMS,
+            backend_layer_kwargs={'hosts': [('redis-1', 6379)], 'stream_visibility_timeout_in_seconds': 30},
+        )
+
+        self.assertEqual(mock_streams.return_value, core.backend_layer)
+        mock_streams.assert_called_once_with(hosts=[('redis-1', 6379)], stream_visibility_timeout_in_seconds=30)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StreamsRedisClient')
+    def test_streams_receive_acknowledges_handled_messages(self, mock_streams):
+        mock_streams.RESPONSE_QUEUE_SPECIFIER = '!'
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STREAMS, receive_batch_size=2)
+        backend = mock_streams.return_value
+        connection = backend.get_connection_by_index.return_value
+
+        messages = [
+            (b'1-0', core.serializer.dict_to_blob({'request_id': 31, 'meta': {}, 'body': {}})),
+            (b'2-0', core.serializer.dict_to_blob({'request_id': 32, 'meta': {}, 'body': {}})),
+            (b'3-0', core.serializer.dict_to_blob({'request_id': 33, 'meta': {'__expiry__': 1}, 'body': {}})),
+        ]
+        backend.read_messages_from_stream.side_effect = [messages[:2], messages[2:], []]
+
+        self.assertEqual(31, core.receive_message('my_queue')[0])
+        backend.read_messages_from_stream.assert_called_once_with(
+            queue_key='pysoa:my_queue',
+            count=2,
+            timeout_in_seconds=5,
+            acknowledge_ids=[],
+            connection=connection,
+        )
+
+        self.assertEqual(32, core.receive_message('my_queue')[0])
+        self.assertEqual(1, backend.read_messages_from_stream.call_count)
+
+        # The expired message is still acknowledged, so that no other server receives it
+        with self.assertRaises(MessageReceiveTimeout):
+            core.receive_message('my_queue')
+        self.assertEqual([b'1-0', b'2-0'], backend.read_messages_from_stream.call_args[1]['acknowledge_ids'])
+
+        with self.assertRaises(MessageReceiveTimeout):
+            core.receive_message('my_queue', receive_timeout_in_seconds=1)
+        self.assertEqual([b'3-0'], backend.read_messages_from_stream.call_args[1]['acknowledge_ids'])
+        self.assertEqual(1, backend.read_messages_from_stream.call_args[1]['timeout_in_seconds'])
+
+        core.return_buffered_messages()
+        self.assertFalse(backend.acknowledge_messages.called)
+        self.assertFalse(connection.lpush.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StreamsRedisClient')
+    def test_streams_return_buffered_messages(self, mock_streams):
+        mock_streams.RESPONSE_QUEUE_SPECIFIER = '!'
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STREAMS, receive_batch_size=3)
+        backend = mock_streams.return_value
+        connection = backend.get_connection_by_index.return_value
+
+        backend.read_messages_from_stream.return_value = [
+            (b'1-0', core.serializer.dict_to_blob({'request_id': 41, 'meta': {}, 'body': {}})),
+            (b'2-0', core.serializer.dict_to_blob({'request_id': 42, 'meta': {}, 'body': {}})),
+        ]
+        self.assertEqual(41, core.receive_message('my_queue')[0])
+
+        # The handled message is acknowledged, and the buffered one is left pending for another server to reclaim
+        core.return_buffered_messages()
+
+        backend.acknowledge_messages.assert_called_once_with(
+            queue_key='pysoa:my_queue',
+            acknowledge_ids=[b'1-0'],
+            connection=connection,
+        )
+        self.assertFalse(connection.lpush.called)
+        self.assertFalse(core._receive_buffers['pysoa:my_queue'])
+
+        backend.acknowledge_messages.side_effect = CannotGetConnectionError('Oops')
+        core.receive_message('my_queue')
+        with self.assertRaises(MessageSendError):
+            core.return_buffered_messages()
+
+    def test_streams_messages_acknowledged_on_server_read_from(self):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STREAMS,
+            backend_layer_kwargs={'hosts': [('redis-1', 6379), ('redis-2', 6379)]},
+            receive_batch_size=1,
+        )
+        connections = [_FakeStreamConnection(), _FakeStreamConnection()]
+        core.backend_layer._connection_list = connections
+        core.backend_layer.reclaim_pending_messages = mock.MagicMock(
+            side_effect=lambda connection, **_: connection.execute_command('RECLAIM'),
+        )
+
+        # Both servers assign the same IDs, so acknowledging a message on the wrong server would acknowledge another
+        for request_id, connection in enumerate(connections):
+            connection.group_exists = True
+            for _ in range(2):
+                connection.add(core.serializer.dict_to_blob({'request_id': request_id, 'meta': {}, 'body': {}}))
+
+        self.assertEqual(0, core.receive_message('my_queue')[0])
+        self.assertEqual({b'1-0'}, set(connections[0].pending))
+
+        self.assertEqual(1, core.receive_message('my_queue')[0])
+        self.assertEqual({}, connections[0].pending)
+        self.assertEqual({b'1-0'}, set(connections[1].pending))
+
+        self.assertEqual(0, core.receive_message('my_queue')[0])
+        self.assertEqual({b'2-0'}, set(connections[0].pending))
+        self.assertEqual({}, connections[1].pending)
+
+        self.assertEqual(1, core.receive_message('my_queue')[0])
+        core.return_buffered_messages()
+        self.assertEqual({}, connections[0].pending)
+        self.assertEqual({}, connections[1].pending)
+
+        for connection in connections:
+            self.assertEqual(
+                [[b'1-0'], [b'2-0']],
+                [list(command[3:]) for command in connection.commands if command[0] == 'XACK'],
+            )
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StreamsRedisClient')
+    def test_streams_response_queues_are_lists(self, mock_streams):
+        mock_streams.RESPONSE_QUEUE_SPECIFIER = '!'
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STREAMS)
+        backend = mock_streams.return_value
+        backend.get_connection.return_value.blpop.return_value = [
+            'pysoa:my_reply_queue!',
+            core.serializer.dict_to_blob({'request_id': 51, 'meta': {}, 'body': {}}),
+        ]
+
+        self.assertEqual(51, core.receive_message('my_reply_queue!')[0])
+        self.assertFalse(backend.read_messages_from_stream.called)
+
+        # Requests cannot be popped along with responses from a consumer group, so the response is just sent
+        core.send_message_and_receive_next('my_reply_queue!', 52, {}, {}, 'my_queue')
+        self.assertFalse(backend.send_message_and_pop_messages.called)
+        self.assertEqual(1, backend.send_message_to_queue.call_count)
+
     @staticmethod
     def _get_core(**kwargs):
         return RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, **kwargs)
 
+    def test_invalid_compress_messages_larger_than_bytes(self):
+        with self.assertRaises(ValueError):
+            RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, compress_messages_larger_than_bytes=-1)
+
+    def test_compression_negotiation(self):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+        self.assertFalse(core.compression_enabled)
+
+        meta = {'__accepts_compression__': 'zlib'}
+        self.assertTrue(core.accepts_compression(meta))
+        self.assertFalse(core.accepts_compression({}))
+        self.assertFalse(core.accepts_compression({'__accepts_compression__': 'lzma'}))
+
+        core.advertise_compression(meta)
+        self.assertEqual({}, meta)
+
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, compress_messages_larger_than_bytes=100)
+        self.assertTrue(core.compression_enabled)
+
+        core.advertise_compression(meta)
+        self.assertEqual({'__accepts_compression__': 'zlib'}, meta)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_compressed_message(self, mock_standard):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            compress_messages_larger_than_bytes=100,
+            maximum_message_size_in_bytes=500,
+        )
+
+        body = {'test': ['payload'] * 200}  # Larger than 500 bytes, but very compressible
+
+        # Compression is only used when the receiver accepts it
+        with self.assertRaises(MessageTooLarge):
+            core.send_message('my_queue', 41, {}, body)
+
+        core.send_message('my_queue', 41, {}, body, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertTrue(len(message) <= 500)
+        self.assertEqual(b'\x01', message[:1])
+        self.assertEqual(body, core.serializer.blob_to_dict(zlib.decompress(message[1:]))['body'])
+
+        # Small messages are not compressed
+        core.send_message('my_queue', 42, {}, {'small': 'body'}, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertEqual({'small': 'body'}, core.serializer.blob_to_dict(message)['body'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_and_receive_compressed_message_json(self, mock_standard):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            compress_messages_larger_than_bytes=100,
+            maximum_message_size_in_bytes=500,
+            serializer_config={'object': JSONSerializer, 'kwargs': {}},
+        )
+
+        body = {'test': ['payload \u00e9'] * 200}
+
+        core.send_message('my_queue', 45, {}, body, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertIsInstance(message, bytes)
+        self.assertTrue(len(message) <= 500)
+        self.assertEqual(b'\x01', message[:1])
+
+        mock_standard.return_value.get_connection.return_value.blpop.return_value = ['pysoa:my_queue', message]
+        self.assertEqual((45, body), core.receive_message('my_queue')[::2])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_incompressible_message(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, compress_messages_larger_than_bytes=10)
+
+        body = {'test': zlib.compress(b'x' * 100)}
+
+        core.send_message('my_queue', 43, {}, body, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertEqual(body, core.serializer.blob_to_dict(message)['body'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_compressed_message(self, mock_standard):
+        # Compressed messages are accepted even with compression disabled
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        mock_standard.return_value.get_connection.return_value.blpop.side_effect = [
+            [
+                'pysoa:my_queue',
+                b'\x01' + zlib.compress(
+                    core.serializer.dict_to_blob({'request_id': 44, 'meta': {}, 'body': {'foo': 'bar'}}),
+                ),
+            ],
+            ['pysoa:my_queue', b'\x01not compressed'],
+        ]
+
+        self.assertEqual((44, {}, {'foo': 'bar'}), core.receive_message('my_queue'))
+
+        with self.assertRaises(InvalidMessageError):
+            core.receive_message('my_queue')
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_and_receive_chunked_message(self, mock_standard):
+        connection = _FakeChunkConnection()
+        mock_standard.return_value.get_connection.return_value = connection
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            chunk_size_in_bytes=100,
+            maximum_message_size_in_bytes=200,
+        )
+
+        body = {'test': ['payload%i' % i for i in range(500)]}  # This creates a message > 5,000 bytes
+
+        core.send_message('my_queue', 51, {}, body)
+
+        manifest = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertTrue(len(manifest) <= 200)
+        self.assertEqual(b'\x02', manifest[:1])
+        self.assertEqual(1, connection.round_trips)
+        chunk_count = len(connection.values)
+        self.assertTrue(chunk_count > RedisTransportCore.CHUNK_FETCH_BATCH_SIZE)
+        self.assertTrue(all(len(chunk) <= 100 for chunk in connection.values.values()))
+        self.assertTrue(all('!' in key for key in connection.values))
+
+        connection.blpop = mock.MagicMock(return_value=['pysoa:my_queue', manifest])
+        request_id, meta, received_body = core.receive_message('my_queue')
+        self.assertEqual(51, request_id)
+        self.assertEqual(body, received_body)
+
+        # The chunks were fetched in batches, and then deleted
+        self.assertEqual({}, connection.values)
+        batch_size = RedisTransportCore.CHUNK_FETCH_BATCH_SIZE
+        batches = (chunk_count + batch_size - 1) // batch_size
+        self.assertEqual(1 + batches + 1, connection.round_trips)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_and_receive_chunked_message_json(self, mock_standard):
+        connection = _FakeChunkConnection()
+        mock_standard.return_value.get_connection.return_value = connection
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            chunk_size_in_bytes=100,
+            maximum_message_size_in_bytes=200,
+            serializer_config={'object': JSONSerializer, 'kwargs': {}},
+        )
+
+        body = {'test': ['\u00e9t\u00e9 \u2603 %i' % i for i in range(100)]}
+
+        core.send_message('my_queue', 53, {}, body)
+
+        manifest = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertIsInstance(manifest, bytes)
+        self.assertEqual(b'\x02', manifest[:1])
+        self.assertTrue(all(isinstance(chunk, bytes) and len(chunk) <= 100 for chunk in connection.values.values()))
+        self.assertEqual(
+            sum(len(chunk) for chunk in connection.values.values()),
+            core.serializer.blob_to_dict(manifest[1:])['size_in_bytes'],
+        )
+
+        connection.blpop = mock.MagicMock(return_value=['pysoa:my_queue', manifest])
+        self.assertEqual((53, body), core.receive_message('my_queue')[::2])
+        self.assertEqual({}, connection.values)
+
+    def test_chunked_message_too_large(self):
+        core = self._get_core(maximum_message_size_in_bytes=150)
+
+        message = {'test': ['payload%i' % i for i in range(100, 110)]}  # This creates a message > 150 bytes
+
+        # Chunking is disabled by default
+        with self.assertRaises(MessageTooLarge):
+            core.send_message('test_message_too_large', 1, {}, message)
+
+        core = self._get_core(
+            maximum_message_size_in_bytes=150,
+            chunk_size_in_bytes=50,
+            maximum_chunked_message_size_in_bytes=160,
+        )
+
+        with self.assertRaises(MessageTooLarge):
+            core.send_message('test_message_too_large', 1, {}, message)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_chunked_message_missing_chunk(self, mock_standard):
+        connection = _FakeChunkConnection()
+        mock_standard.return_value.get_connection.return_value = connection
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            chunk_size_in_bytes=100,
+            maximum_message_size_in_bytes=200,
+        )
+
+        core.send_message('my_queue', 52, {}, {'test': ['payload%i' % i for i in range(100)]})
+        manifest = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        connection.values.popitem()
+
+        connection.blpop = mock.MagicMock(return_value=['pysoa:my_queue', manifest])
+        with self.assertRaises(InvalidMessageError):
+            core.receive_message('my_queue')
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_chunked_message_dropped_before_fetching_chunks(self, mock_standard):
+        connection = _FakeChunkConnection()
+        mock_standard.return_value.get_connection.return_value = connection
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            chunk_size_in_bytes=100,
+            maximum_message_size_in_bytes=200,
+        )
+        core.metrics = mock.MagicMock()
+
+        with freezegun.freeze_time() as frozen_time:
+            core.send_message('my_queue', 54, {}, {'test': ['payload%i' % i for i in range(100)]})
+            manifest = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+            chunks = dict(connection.values)
+            connection.round_trips = 0
+            connection.blpop = mock.MagicMock(return_value=['pysoa:my_queue', manifest])
+
+            with self.assertRaises(InvalidMessageError):
+                core.receive_message('my_queue', accept_request_id=lambda request_id: request_id != 54)
+
+            core.metrics.counter.assert_any_call('transport.redis_gateway.receive.error.unknown_request_id')
+
+            frozen_time.tick(datetime.timedelta(seconds=core.message_expiry_in_seconds + 1))
+            with self.assertRaises(MessageReceiveTimeout):
+                core.receive_message('my_queue')
+
+            core.metrics.counter.assert_any_call('transport.redis_gateway.receive.error.message_expired')
+
+        # No chunk was fetched or deleted; they are left to expire
+        self.assertEqual(0, connection.round_trips)
+        self.assertEqual(chunks, connection.values)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_chunked_message_invalid_manifest(self, mock_standard):
+        connection = _FakeChunkConnection()
+        mock_standard.return_value.get_connection.return_value = connection
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            maximum_chunked_message_size_in_bytes=1000,
+        )
+        core.metrics = mock.MagicMock()
+
+        for manifest in (
+            {'chunk_key': 'pysoa:chunks.abc!', 'chunk_count': 1, 'size_in_bytes': 2 ** 40},
+            {'chunk_key': 'pysoa:chunks.abc!', 'chunk_count': 2 ** 40, 'size_in_bytes': 500},
+            {'chunk_key': 'pysoa:chunks.abc!', 'chunk_count': 0, 'size_in_bytes': 500},
+            {'chunk_key': 'pysoa:chunks.abc!', 'size_in_bytes': 500},
+            {'chunk_key': 'pysoa:chunks.abc!', 'chunk_count': '1', 'size_in_bytes': 500},
+        ):
+            connection.blpop = mock.MagicMock(
+                return_value=['pysoa:my_queue', b'\x02' + core.serializer.dict_to_blob(manifest)],
+            )
+            with mock.patch('pysoa.common.transport.redis_gateway.core.bytearray', create=True) as mock_bytearray:
+                with self.assertRaises(InvalidMessageError):
+                    core.receive_message('my_queue')
+
+            self.assertFalse(mock_bytearray.called)
+
+        self.assertEqual(0, connection.round_trips)
+        self.assertEqual(5, core.metrics.counter.return_value.increment.call_count)
+        core.metrics.counter.assert_called_with('transport.redis_gateway.receive.error.invalid_manifest')
+
     def test_invalid_request_id(self):
         core = self._get_core()
 
@@ -333,3 +1111,197 @@ class TestRedisTransportCore(unittest.TestCase):
 
             self.assertTrue(0 < elapsed < 0.1)
             self.assertEqual(request_id, response[0])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_enveloped_message_round_trip(self, mock_standard):
+        for serializer in (MsgpackSerializer, JSONSerializer):
+            core = RedisTransportCore(
+                backend_type=REDIS_BACKEND_TYPE_STANDARD,
+                use_message_envelope=True,
+                serializer_config={'object': serializer, 'kwargs': {}},
+            )
+
+            core.send_message('my_queue', 51, {'foo': 'bar'}, {'test': 'payload'})
+
+            message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+            self.assertEqual(b'\x03', message[:1])
+            mock_standard.return_value.get_connection.return_value.blpop.return_value = ['pysoa:my_queue', message]
+
+            request_id, meta, body = core.receive_message('my_queue')
+            self.assertEqual(51, request_id)
+            self.assertEqual('bar', meta['foo'])
+            self.assertEqual({'test': 'payload'}, body)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_send_enveloped_message(self, mock_standard):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            use_message_envelope=True,
+            compress_messages_larger_than_bytes=100,
+        )
+
+        body = {'test': ['payload'] * 200}
+        core.send_message('my_queue', 52, {}, body, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        marker, version, flags, request_id, expiry, offset = RedisTransportCore.ENVELOPE_HEADER.unpack_from(message)
+        self.assertEqual(b'\x03', marker)
+        self.assertEqual(1, version)
+        self.assertEqual(RedisTransportCore.ENVELOPE_FLAG_COMPRESSED, flags)
+        self.assertEqual(52, request_id)
+        self.assertTrue(time.time() < expiry <= time.time() + 60)
+        self.assertEqual(24, offset)
+        self.assertEqual(body, core.serializer.blob_to_dict(zlib.decompress(message[offset:]))['body'])
+
+        # Small messages are enveloped but not compressed
+        core.send_message('my_queue', 53, {}, {'small': 'body'}, compress=True)
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        _, _, flags, request_id, _, offset = RedisTransportCore.ENVELOPE_HEADER.unpack_from(message)
+        self.assertEqual(0, flags)
+        self.assertEqual(53, request_id)
+        self.assertEqual({'small': 'body'}, core.serializer.blob_to_dict(message[offset:])['body'])
+
+        # Messages with request IDs that do not fit in the header are sent in the older format
+        core.send_message('my_queue', 'not-an-integer', {}, {'small': 'body'})
+
+        message = mock_standard.return_value.send_message_to_queue.call_args[1]['message']
+        self.assertEqual('not-an-integer', core.serializer.blob_to_dict(message)['request_id'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_expired_enveloped_message_is_not_deserialized(self, mock_standard):
+        core = RedisTransportCore(
+            backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            use_message_envelope=True,
+            message_expiry_in_seconds=10,
+        )
+
+        with freezegun.freeze_time() as frozen_time:
+            message = core.prepare_message('my_queue', 54, {}, {'test': 'payload'})[1]
+            mock_standard.return_value.get_connection.return_value.blpop.return_value = ['pysoa:my_queue', message]
+
+            frozen_time.tick(datetime.timedelta(seconds=11))
+
+            with mock.patch.object(MsgpackSerializer, 'blob_to_dict') as mock_blob_to_dict, \
+                    self.assertRaises(MessageReceiveTimeout) as error_context:
+                core.receive_message('my_queue')
+
+            self.assertTrue('expired' in error_context.exception.args[0])
+            self.assertFalse(mock_blob_to_dict.called)
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_unwanted_enveloped_message_is_not_deserialized(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, use_message_envelope=True)
+
+        mock_standard.return_value.get_connection.return_value.blpop.side_effect = [
+            ['pysoa:my_queue', core.prepare_message('my_queue', 55, {}, {'test': 'payload'})[1]],
+            ['pysoa:my_queue', core.prepare_message('my_queue', 56, {}, {'test': 'payload'})[1]],
+        ]
+
+        with mock.patch.object(MsgpackSerializer, 'blob_to_dict') as mock_blob_to_dict, \
+                self.assertRaises(InvalidMessageError):
+            core.receive_message('my_queue', accept_request_id={56}.__contains__)
+        self.assertFalse(mock_blob_to_dict.called)
+
+        self.assertEqual(56, core.receive_message('my_queue', accept_request_id={56}.__contains__)[0])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_enveloped_and_older_messages(self, mock_standard):
+        # Enveloped messages are accepted even with the envelope disabled, and older messages with it enabled
+        sender = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, use_message_envelope=True)
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        enveloped_message = sender.prepare_message('my_queue', 57, {}, {'foo': 'bar'})[1]
+        header = bytearray(enveloped_message[:RedisTransportCore.ENVELOPE_HEADER.size])
+        header[1] = 2  # An unsupported envelope version
+
+        mock_standard.return_value.get_connection.return_value.blpop.side_effect = [
+            ['pysoa:my_queue', enveloped_message],
+            ['pysoa:my_queue', core.serializer.dict_to_blob({'request_id': 58, 'meta': {}, 'body': {'foo': 'baz'}})],
+            ['pysoa:my_queue', bytes(header) + enveloped_message[len(header):]],
+            ['pysoa:my_queue', enveloped_message[:10]],
+        ]
+
+        self.assertEqual((57, {'__expiry__': mock.ANY}, {'foo': 'bar'}), core.receive_message('my_queue'))
+        self.assertEqual((58, {}, {'foo': 'baz'}), core.receive_message('my_queue'))
+
+        with self.assertRaises(InvalidMessageError):
+            core.receive_message('my_queue')
+        with self.assertRaises(InvalidMessageError):
+            core.receive_message('my_queue')
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_prioritized_message(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+        connection = mock_standard.return_value.get_connection.return_value
+
+        connection.blpop.return_value = [
+            b'pysoa:my_queue.priority_1',
+            core.serializer.dict_to_blob({'request_id': 61, 'meta': {}, 'body': {'foo': 'bar'}}),
+        ]
+
+        self.assertEqual(
+            (1, 61, {}, {'foo': 'bar'}),
+            core.receive_prioritized_message(['my_queue', 'my_queue.priority_1'], receive_timeout_in_seconds=2),
+        )
+        mock_standard.return_value.get_connection.assert_called_once_with('pysoa:my_queue')
+        connection.blpop.assert_called_once_with(['pysoa:my_queue', 'pysoa:my_queue.priority_1'], timeout=2)
+
+        connection.blpop.return_value = None
+        with self.assertRaises(MessageReceiveTimeout):
+            core.receive_prioritized_message(['my_queue', 'my_queue.priority_1'])
+
+        connection.blpop.side_effect = redis.exceptions.ConnectionError()
+        with self.assertRaises(MessageReceiveError):
+            core.receive_prioritized_message(['my_queue', 'my_queue.priority_1'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_get_queue_depths(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD)
+
+        connections = [mock.MagicMock(), mock.MagicMock()]
+        connections[0].pipeline.return_value.execute.return_value = [3, 0]
+        connections[1].pipeline.return_value.execute.return_value = [1, 5]
+        mock_standard.return_value.ring_size = 2
+        mock_standard.return_value.get_connection_by_index.side_effect = lambda index: connections[index]
+
+        self.assertEqual([4, 5], core.get_queue_depths(['my_queue', 'my_queue.priority_1']))
+        connections[1].pipeline.return_value.llen.assert_has_calls([
+            mock.call('pysoa:my_queue'),
+            mock.call('pysoa:my_queue.priority_1'),
+        ])
+
+        connections[1].pipeline.return_value.execute.side_effect = redis.exceptions.ConnectionError()
+        with self.assertRaises(MessageReceiveError):
+            core.get_queue_depths(['my_queue'])
+
+    @mock.patch('pysoa.common.transport.redis_gateway.core.StandardRedisClient')
+    def test_receive_queued_messages(self, mock_standard):
+        core = RedisTransportCore(backend_type=REDIS_BACKEND_TYPE_STANDARD, receive_batch_size=3)
+
+        def blob(request_id, meta=None):
+            return core.serializer.dict_to_blob({'request_id': request_id, 'meta': meta or {}, 'body': {}})
+
+        mock_standard.return_value.pop_messages_from_queue.side_effect = [
+            [blob(1), blob(2), blob(3)],
+            [blob(4, {'__expiry__': time.time() - 10}), blob(5)],
+            [],
+        ]
+
+        self.assertEqual((1, {}, {}), core.receive_message('my_queue'))
+
+        # The buffered messages are received first, and then the rest are popped from Redis, skipping expired messages
+        self.assertEqual([(2, {}, {}), (3, {}, {}), (5, {}, {})], core.receive_queued_messages('my_queue', 4))
+        self.assertEqual(
+            2,
+            mock_standard.return_value.pop_messages_from_queue.call_args[1]['count'],
+        )
+
+        self.assertEqual([], core.receive_queued_messages('my_queue', 4))
+        self.assertEqual([], core.receive_queued_messages('my_queue', 0))
+        self.assertEqual(3, mock_standard.return_value.pop_messages_from_queue.call_count)
+        self.assertFalse(mock_standard.return_value.get_connection.return_value.blpop.called)
+
+        mock_standard.return_value.pop_messages_from_queue.side_effect = redis.exceptions.ConnectionError()
+        with self.assertRaises(MessageReceiveError):
+            core.receive_queued_messages('my_queue', 4)
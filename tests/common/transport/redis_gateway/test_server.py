@@ -3,12 +3,16 @@ from __future__ import (
     unicode_literals,
 )
 
+import time
 import unittest
 import uuid
 
 from pysoa.common.metrics import NoOpMetricsRecorder
 from pysoa.common.transport.exceptions import InvalidMessageError
-from pysoa.common.transport.redis_gateway.constants import DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER
+from pysoa.common.transport.redis_gateway.constants import (
+    DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER,
+    REDIS_BACKEND_TYPE_STREAMS,
+)
 from pysoa.common.transport.redis_gateway.server import RedisServerTransport
 from pysoa.test.compatibility import mock
 
@@ -44,6 +48,24 @@ class TestServerTransport(unittest.TestCase):
             maximum_message_size_in_bytes=79,
         )
 
+    def test_core_args_without_client_only_backend_args(self, mock_core):
+        backend_layer_kwargs = {
+            'hosts': [('redis-1', 6379), ('redis-2', 6379)],
+            'request_queue_strategy': 'power_of_two_choices',
+            'queue_depth_sample_interval_in_seconds': 2,
+        }
+
+        transport = self._get_transport(backend_layer_kwargs=backend_layer_kwargs)
+
+        mock_core.assert_called_once_with(
+            service_name='my_service',
+            backend_layer_kwargs={'hosts': [('redis-1', 6379), ('redis-2', 6379)]},
+            metrics=transport.metrics,
+            metrics_prefix='server',
+            maximum_message_size_in_bytes=DEFAULT_MAXIMUM_MESSAGE_BYTES_SERVER,
+        )
+        self.assertEqual('power_of_two_choices', backend_layer_kwargs['request_queue_strategy'])
+
     def test_receive_request_message(self, mock_core):
         transport = self._get_transport()
 
@@ -95,6 +117,7 @@ class TestServerTransport(unittest.TestCase):
             request_id,
             meta,
             message,
+            compress=mock_core.return_value.accepts_compression.return_value,
         )
 
     def test_send_response_message_another_service(self, mock_core):
@@ -111,4 +134,206 @@ class TestServerTransport(unittest.TestCase):
             request_id,
             meta,
             message,
+            compress=mock_core.return_value.accepts_compression.return_value,
+        )
+
+    def test_send_response_message_compression(self, mock_core):
+        transport = self._get_transport()
+
+        request_id = uuid.uuid4().hex
+        meta = {'reply_to': 'my_reply_to_queue', '__accepts_compression__': 'zlib'}
+        message = {'test': 'payload'}
+
+        mock_core.return_value.accepts_compression.return_value = True
+
+        transport.send_response_message(request_id, meta, message)
+
+        mock_core.return_value.accepts_compression.assert_called_once_with(meta)
+        mock_core.return_value.advertise_compression.assert_called_once_with(meta)
+        mock_core.return_value.send_message.assert_called_once_with(
+            'my_reply_to_queue',
+            request_id,
+            meta,
+            message,
+            compress=True,
+        )
+
+    def test_send_response_message_pop_next_request(self, mock_core):
+        transport = self._get_transport(pop_next_request_with_response=True)
+
+        self.assertNotIn('pop_next_request_with_response', mock_core.call_args[1])
+
+        request_id = uuid.uuid4().hex
+        meta = {'reply_to': 'my_reply_to_queue'}
+        message = {'test': 'payload'}
+
+        transport.send_response_message(request_id, meta, message)
+
+        mock_core.return_value.send_message_and_receive_next.assert_called_once_with(
+            'my_reply_to_queue',
+            request_id,
+            meta,
+            message,
+            'service.my_service',
+            compress=mock_core.return_value.accepts_compression.return_value,
         )
+        self.assertFalse(mock_core.return_value.send_message.called)
+
+    def test_close_returns_buffered_messages(self, mock_core):
+        transport = self._get_transport()
+
+        transport.close()
+
+        mock_core.return_value.return_buffered_messages.assert_called_once_with()
+
+    def test_receive_request_message_priority_lanes(self, mock_core):
+        metrics = mock.MagicMock()
+        transport = RedisServerTransport('my_service', metrics, priority_lanes=3, pop_next_request_with_response=True)
+        self.assertFalse(transport._pop_next_request_with_response)
+
+        mock_core.return_value.get_queue_depths.return_value = [0, 4, 9]
+        mock_core.return_value.receive_prioritized_message.return_value = 2, 18, {'__sent__': time.time() - 1}, {}
+
+        self.assertEqual((18, mock.ANY, {}), transport.receive_request_message())
+
+        mock_core.return_value.receive_prioritized_message.assert_called_once_with(
+            ['service.my_service', 'service.my_service.priority_1', 'service.my_service.priority_2'],
+        )
+        mock_core.return_value.get_queue_depths.assert_called_once_with(
+            ['service.my_service', 'service.my_service.priority_1', 'service.my_service.priority_2'],
+        )
+        counter = mock_core.return_value.get_counter
+        counter.assert_any_call('receive.priority_lane_2')
+        counter.assert_any_call('receive.priority_lane_2.wait_milliseconds')
+        counter.assert_any_call('receive.priority_lane_1.depth')
+        counter.assert_any_call('receive.priority_lane_2.depth_sample')
+        counter.return_value.increment.assert_any_call(9)
+        self.assertTrue(
+            any(900 <= c[0][0] < 2000 for c in counter.return_value.increment.call_args_list if c[0]),
+            counter.return_value.increment.call_args_list,
+        )
+
+        # The lane depths are only sampled once in a while
+        transport.receive_request_message()
+        self.assertEqual(1, mock_core.return_value.get_queue_depths.call_count)
+
+    def test_get_request_queue_depth(self, mock_core):
+        transport = self._get_transport(priority_lanes=2)
+
+        mock_core.return_value.get_queue_depths.return_value = [3, 4]
+
+        self.assertEqual(7, transport.get_request_queue_depth())
+        mock_core.return_value.get_queue_depths.assert_called_once_with(
+            ['service.my_service', 'service.my_service.priority_1'],
+        )
+
+    def test_get_request_queue_depth_streams(self, mock_core):
+        transport = self._get_transport(backend_type=REDIS_BACKEND_TYPE_STREAMS)
+
+        self.assertIsNone(transport.get_request_queue_depth())
+        self.assertFalse(mock_core.return_value.get_queue_depths.called)
+
+    def test_can_handle_requests_concurrently(self, _):
+        self.assertTrue(self._get_transport().can_handle_requests_concurrently)
+        self.assertFalse(self._get_transport(backend_type=REDIS_BACKEND_TYPE_STREAMS).can_handle_requests_concurrently)
+
+    def test_receive_request_message_priority_lanes_starvation_guard(self, mock_core):
+        transport = self._get_transport(priority_lanes=2, priority_lane_starvation_guard=3)
+
+        mock_core.return_value.receive_prioritized_message.return_value = 0, 18, {}, {}
+
+        for _ in range(6):
+            transport.receive_request_message()
+
+        lanes = ['service.my_service', 'service.my_service.priority_1']
+        self.assertEqual(
+            [
+                mock.call(lanes),
+                mock.call(lanes),
+                mock.call(lanes[::-1]),
+                mock.call(lanes),
+                mock.call(lanes),
+                mock.call(lanes[::-1]),
+            ],
+            mock_core.return_value.receive_prioritized_message.call_args_list,
+        )
+        # When the lanes are reversed, the first lane popped is the lowest-priority lane
+        mock_core.return_value.get_counter.assert_any_call('receive.priority_lane_1')
+
+    def test_priority_lanes_with_streams(self, mock_core):
+        with self.assertRaises(ValueError):
+            self._get_transport(priority_lanes=2, backend_type='redis.streams')
+
+    def test_receive_request_message_action_queues(self, mock_core):
+        transport = self._get_transport(
+            action_queues={'generate_report': 'reports', 'export': 'exports'},
+            pop_next_request_with_response=True,
+        )
+        self.assertFalse(transport._pop_next_request_with_response)
+        self.assertNotIn('action_queues', mock_core.call_args[1])
+
+        mock_core.return_value.receive_prioritized_message.return_value = 1, 18, {}, {}
+
+        self.assertEqual((18, {}, {}), transport.receive_request_message())
+
+        mock_core.return_value.receive_prioritized_message.assert_called_once_with(
+            ['service.my_service', 'service.my_service.queue_exports', 'service.my_service.queue_reports'],
+        )
+
+    def test_receive_request_message_receive_queues(self, mock_core):
+        transport = self._get_transport(
+            action_queues={'generate_report': 'reports'},
+            receive_queues=['reports'],
+        )
+        self.assertNotIn('receive_queues', mock_core.call_args[1])
+
+        mock_core.return_value.receive_message.return_value = 18, {}, {}
+
+        self.assertEqual((18, {}, {}), transport.receive_request_message())
+
+        mock_core.return_value.receive_message.assert_called_once_with('service.my_service.queue_reports')
+        self.assertFalse(mock_core.return_value.receive_prioritized_message.called)
+
+    def test_receive_request_message_receive_queues_and_priority_lanes(self, mock_core):
+        transport = self._get_transport(
+            action_queues={'generate_report': 'reports'},
+            receive_queues=['reports', 'default'],
+            priority_lanes=2,
+        )
+
+        mock_core.return_value.get_queue_depths.return_value = [1, 2, 3, 4]
+        mock_core.return_value.receive_prioritized_message.return_value = 3, 18, {}, {}
+
+        self.assertEqual((18, {}, {}), transport.receive_request_message())
+
+        mock_core.return_value.receive_prioritized_message.assert_called_once_with([
+            'service.my_service.queue_reports',
+            'service.my_service',
+            'service.my_service.queue_reports.priority_1',
+            'service.my_service.priority_1',
+        ])
+        counter = mock_core.return_value.get_counter
+        counter.assert_any_call('receive.priority_lane_1')
+        counter.return_value.increment.assert_any_call(3)
+        counter.return_value.increment.assert_any_call(7)
+
+    def test_receive_queued_request_messages(self, mock_core):
+        transport = self._get_transport()
+        mock_core.return_value.receive_queued_messages.return_value = [(18, {}, {})]
+
+        self.assertEqual([(18, {}, {})], transport.receive_queued_request_messages(3))
+        mock_core.return_value.receive_queued_messages.assert_called_once_with('service.my_service', 3)
+
+    def test_receive_queued_request_messages_priority_lanes(self, mock_core):
+        transport = self._get_transport(priority_lanes=2)
+
+        self.assertEqual([], transport.receive_queued_request_messages(3))
+        self.assertFalse(mock_core.return_value.receive_queued_messages.called)
+
+    def test_receive_queues_unknown_queue(self, mock_core):
+        with self.assertRaises(ValueError):
+            self._get_transport(action_queues={'generate_report': 'reports'}, receive_queues=['exports'])
+
+    def test_action_queues_with_streams(self, mock_core):
+        with self.assertRaises(ValueError):
+            self._get_transport(action_queues={'generate_report': 'reports'}, backend_type='redis.streams')
@@ -26,10 +26,19 @@ class _FakeBackend(object):
     def get_connection(self, *_):
         return self
 
+    def get_connection_index(self, *_):
+        return 0
+
+    def get_connection_by_index(self, *_):
+        return self
+
     def send_message_to_queue(self, queue_key, message, *_, **__):
         # print('\n    - send: {} / {} / {}\n'.format(queue_key, type(message), message))
         self._container.setdefault(queue_key, list()).append(message)
 
+    def record_send_outcome(self, *_, **__):
+        pass
+
     def blpop(self, keys, *_, **__):
         if self._container.get(keys[0]):
             message = self._container[keys[0]].pop(0)
@@ -67,9 +76,10 @@ class _FakeEchoingServer(threading.Thread):
 
 
 class _FakeClient(threading.Thread):
-    def __init__(self, name, client_transport, payload, receive_delay):
+    def __init__(self, name, client_transport, payload, receive_delay, request_id=0):
         self._transport = client_transport
         self._payload = payload
+        self._request_id = request_id
         self._receive_delay = receive_delay
         self.error = None
 
@@ -77,13 +87,17 @@ class _FakeClient(threading.Thread):
 
     def run(self):
         # print('  - client send')
-        self._transport.send_request_message(0, {}, self._payload)
+        self._transport.send_request_message(self._request_id, {}, self._payload)
         time.sleep(self._receive_delay)
 
         try:
             # print('  - client receive')
             request_id, _, response = self._transport.receive_response_message()
-            assert request_id == 0, 'Expected request ID to be 0, was {} (thread {})'.format(request_id, self.name)
+            assert request_id == self._request_id, 'Expected request ID to be {}, was {} (thread {})'.format(
+                self._request_id,
+                request_id,
+                self.name,
+            )
             assert response == self._payload, 'Expected payload to be {}, was {} (thread {})'.format(
                 self._payload,
                 response,
@@ -95,7 +109,7 @@ class _FakeClient(threading.Thread):
 
 class TestThreadSafety(unittest.TestCase):
     @staticmethod
-    def _test():
+    def _test(client_request_ids=(0, 0), **kwargs):
         backend = _FakeBackend()
 
         server_transport = RedisServerTransport(
@@ -109,13 +123,14 @@ class TestThreadSafety(unittest.TestCase):
             'threaded',
             NoOpMetricsRecorder(),
             backend_type=REDIS_BACKEND_TYPE_STANDARD,
+            **kwargs
         )
         client_transport.core._backend_layer = backend
 
         server = _FakeEchoingServer(server_transport)
 
-        client1 = _FakeClient('client-1', client_transport, {'key1': 'value1'}, 1.0)
-        client2 = _FakeClient('client-2', client_transport, {'key2': 'value2'}, 0.25)
+        client1 = _FakeClient('client-1', client_transport, {'key1': 'value1'}, 1.0, client_request_ids[0])
+        client2 = _FakeClient('client-2', client_transport, {'key2': 'value2'}, 0.25, client_request_ids[1])
 
         server.start()
 
@@ -165,3 +180,15 @@ class TestThreadSafety(unittest.TestCase):
 
         if client2.error:
             raise client2.error
+
+    def test_multiplexed(self):
+        server, client1, client2 = self._test(client_request_ids=(1, 2), multiplex_response_queue=True)
+
+        if server.error:
+            raise server.error
+
+        if client1.error:
+            raise client1.error
+
+        if client2.error:
+            raise client2.error
@@ -0,0 +1,173 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pysoa.common.transport.shared_memory.ring import (
+    Doorbell,
+    RingBuffer,
+)
+
+
+def _copy(view):
+    return bytes(view)
+
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'ring')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        ring = RingBuffer.open_or_create(self.path, 1024)
+        self.assertEqual((False, None), ring.read(_copy))
+
+        self.assertTrue(ring.write(b'hello'))
+        self.assertTrue(ring.write(b''))
+        self.assertTrue(ring.write(b'world'))
+        self.assertEqual(3 * 4 + 10, ring.used_bytes)
+
+        self.assertEqual((True, b'hello'), ring.read(_copy))
+        self.assertEqual((True, b''), ring.read(_copy))
+        self.assertEqual((True, b'world'), ring.read(_copy))
+        self.assertEqual((False, None), ring.read(_copy))
+        self.assertEqual(0, ring.used_bytes)
+
+    def test_opened_by_another_process(self):
+        ring = RingBuffer.open_or_create(self.path, 1024)
+        ring.write(b'hello')
+
+        # Opening an existing ring keeps its capacity and records
+        other = RingBuffer.open_or_create(self.path, 2048)
+        self.assertEqual(1024, other.capacity)
+        self.assertEqual((True, b'hello'), other.read(_copy))
+        self.assertEqual((False, None), ring.read(_copy))
+
+    def test_not_a_ring(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 128)
+
+        with self.assertRaises(ValueError):
+            RingBuffer(self.path)
+
+    def test_full(self):
+        ring = RingBuffer.open_or_create(self.path, 32)
+
+        self.assertTrue(ring.write(b'x' * 12))
+        self.assertTrue(ring.write(b'y' * 12))
+        self.assertFalse(ring.write(b'z'))
+        with self.assertRaises(ValueError):
+            ring.write(b'z' * 29)
+
+        self.assertEqual((True, b'x' * 12), ring.read(_copy))
+        self.assertTrue(ring.write(b'z' * 12))
+
+    def test_wrap_around(self):
+        ring = RingBuffer.open_or_create(self.path, 40)
+
+        for i in range(50):
+            # Records of varying sizes land at every position, wrapping with and without room for a wrap marker
+            record = (b'%d' % i) * (i % 7 + 1)
+            self.assertTrue(ring.write(record))
+            self.assertEqual((True, record), ring.read(_copy))
+
+        # Fill the ring from wherever the loop left it, then empty it
+        written = []
+        while ring.write(b'%d' % len(written) * 5):
+            written.append(b'%d' % len(written) * 5)
+        self.assertGreaterEqual(len(written), 1)
+        self.assertEqual(written, [ring.read(_copy)[1] for _ in written])
+        self.assertEqual((False, None), ring.read(_copy))
+
+    def test_record_removed_when_handler_raises(self):
+        ring = RingBuffer.open_or_create(self.path, 1024)
+        ring.write(b'bad')
+        ring.write(b'good')
+
+        def handler(view):
+            raise ValueError(bytes(view))
+
+        with self.assertRaises(ValueError):
+            ring.read(handler)
+        self.assertEqual((True, b'good'), ring.read(_copy))
+
+    def test_concurrent_writers_and_readers(self):
+        ring = RingBuffer.open_or_create(self.path, 256)
+        received = []
+        lock = threading.Lock()
+
+        def write(prefix):
+            writer = RingBuffer(self.path)
+            for i in range(200):
+                while not writer.write('{}-{}'.format(prefix, i).encode('ascii')):
+                    time.sleep(0.0001)
+
+        def read():
+            reader = RingBuffer(self.path)
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                with lock:
+                    if len(received) == 600:
+                        return
+                read, record = reader.read(_copy)
+                if read:
+                    with lock:
+                        received.append(record)
+
+        threads = [threading.Thread(target=write, args=(p, )) for p in 'abc']
+        threads.extend(threading.Thread(target=read) for _ in range(3))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(600, len(received))
+        self.assertEqual(
+            sorted('{}-{}'.format(p, i).encode('ascii') for p in 'abc' for i in range(200)),
+            sorted(received),
+        )
+        self.assertEqual(0, ring.used_bytes)
+
+
+class TestDoorbell(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'doorbell')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_wait_times_out(self):
+        doorbell = Doorbell(self.path)
+
+        start = time.time()
+        self.assertFalse(doorbell.wait(0.05))
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+    def test_rung_from_another_process(self):
+        doorbell = Doorbell(self.path)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                time.sleep(0.05)
+                Doorbell(self.path).ring()
+            finally:
+                os._exit(0)
+
+        try:
+            self.assertTrue(doorbell.wait(5))
+            # Each ring wakes one wait
+            self.assertFalse(doorbell.wait(0.01))
+        finally:
+            os.waitpid(pid, 0)
@@ -0,0 +1,226 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.serializer.json_serializer import JSONSerializer
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageTooLarge,
+)
+from pysoa.common.transport.shared_memory.client import SharedMemoryClientTransport
+from pysoa.common.transport.shared_memory.server import SharedMemoryServerTransport
+from pysoa.test.compatibility import mock
+
+
+class TestSharedMemoryTransport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = SharedMemoryServerTransport(
+            'example',
+            NoOpMetricsRecorder(),
+            directory=self.directory,
+            receive_timeout_in_seconds=1,
+        )
+        self.server.core._get_counter = mock.MagicMock()
+        # A separate pool for each test, so that rings do not leak from one test to the next
+        SharedMemoryClientTransport._response_ring_pools = {}
+        self.client = self._get_client()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def _get_client(self, **kwargs):
+        client = SharedMemoryClientTransport('example', NoOpMetricsRecorder(), directory=self.directory, **kwargs)
+        client.core._get_counter = mock.MagicMock()
+        return client
+
+    def _echo(self, count):
+        for _ in range(count):
+            request_id, meta, body = self.server.receive_request_message()
+            self.server.send_response_message(request_id, meta, body)
+
+    def _segment_files(self):
+        return sorted(os.listdir(os.path.join(self.directory, 'pysoa-example')))
+
+    def test_round_trip(self):
+        self.client.send_request_message(1, {}, {'n': 1})
+        self.client.send_request_message(2, {}, {'n': 2})
+        self.assertEqual(2, self.client.requests_outstanding)
+
+        received = [self.server.receive_request_message() for _ in range(2)]
+        self.assertEqual([1, 2], [request_id for request_id, _, _ in received])
+        self.assertEqual([{'n': 1}, {'n': 2}], [body for _, _, body in received])
+        self.assertEqual(1, len({meta['reply_to'] for _, meta, _ in received}))
+
+        for request_id, meta, body in reversed(received):
+            self.server.send_response_message(request_id, meta, dict(body, response=True))
+
+        responses = [self.client.receive_response_message() for _ in range(2)]
+        self.assertEqual([2, 1], [request_id for request_id, _, _ in responses])
+        self.assertEqual({'n': 2, 'response': True}, responses[0][2])
+
+        self.assertEqual(0, self.client.requests_outstanding)
+        self.assertEqual((None, None, None), self.client.receive_response_message())
+
+    def test_json_serializer(self):
+        self.server.close()
+        self.server = SharedMemoryServerTransport(
+            'example',
+            NoOpMetricsRecorder(),
+            directory=self.directory,
+            receive_timeout_in_seconds=1,
+            serializer_config={'object': JSONSerializer, 'kwargs': {}},
+        )
+        client = self._get_client(serializer_config={'object': JSONSerializer, 'kwargs': {}})
+
+        client.send_request_message(1, {}, {'text': '\u00e9t\u00e9 \u2603'})
+        self._echo(1)
+        self.assertEqual((1, {'text': '\u00e9t\u00e9 \u2603'}), client.receive_response_message()[::2])
+
+    def test_response_ring_reused(self):
+        reply_to = set()
+        for request_id in range(3):
+            # Transports share the pool, too
+            client = self._get_client()
+            client.send_request_message(request_id, {}, {})
+            request_id, meta, body = self.server.receive_request_message()
+            reply_to.add(meta['reply_to'])
+            self.server.send_response_message(request_id, meta, body)
+            self.assertEqual(request_id, client.receive_response_message()[0])
+
+        self.assertEqual(1, len(reply_to))
+        ring_name = reply_to.pop()
+        self.assertEqual(
+            ['requests', 'requests.doorbell', ring_name, '{}.doorbell'.format(ring_name)],
+            self._segment_files(),
+        )
+
+        # The rings the process created are removed when it exits
+        self.client._pool.remove_all_rings()
+        self.assertEqual(['requests', 'requests.doorbell'], self._segment_files())
+
+    def test_receive_timeout_abandons_ring(self):
+        self.client.send_request_message(1, {}, {})
+        request_id, meta, body = self.server.receive_request_message()
+
+        with self.assertRaises(MessageReceiveTimeout):
+            self.client.receive_response_message(0.05)
+        self.assertEqual(0, self.client.requests_outstanding)
+        self.client.core._get_counter.assert_called_with('receive.error.timeout')
+        self.assertEqual(['requests', 'requests.doorbell'], self._segment_files())
+
+        # The late response is discarded
+        self.server.send_response_message(request_id, meta, body)
+        self.server.core._get_counter.assert_called_with('send.error.missing_response_ring')
+
+        # The next request gets a new ring
+        self.client.send_request_message(2, {}, {})
+        self._echo(1)
+        self.assertEqual(2, self.client.receive_response_message()[0])
+
+    def test_server_receive_timeout(self):
+        self.server.core.receive_timeout_in_seconds = 0.05
+        with self.assertRaises(MessageReceiveTimeout):
+            self.server.receive_request_message()
+
+    def test_requests_sent_before_server_starts(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+        os.mkdir(self.directory)
+
+        client = self._get_client()
+        client.send_request_message(1, {}, {})
+        self.server = SharedMemoryServerTransport('example', NoOpMetricsRecorder(), directory=self.directory)
+        self._echo(1)
+        self.assertEqual(1, client.receive_response_message()[0])
+
+    def test_expired_request_skipped(self):
+        self.client.send_request_message(1, {}, {})
+        self.client.send_request_message(2, {}, {}, message_expiry_in_seconds=1)
+        self.client.send_request_message(3, {}, {})
+
+        with mock.patch('pysoa.common.transport.tcp.core.time.time', return_value=time.time() + 3):
+            self.assertEqual(1, self.server.receive_request_message()[0])
+            self.assertEqual(3, self.server.receive_request_message()[0])
+        self.server.core._get_counter.assert_any_call('receive.error.message_expired')
+
+    def test_invalid_message_skipped(self):
+        self.server._request_ring.write(b'\xc1\xc1\xc1')
+        self.client.send_request_message(1, {}, {})
+
+        self.assertEqual(1, self.server.receive_request_message()[0])
+        self.server.core._get_counter.assert_any_call('receive.error.invalid_message')
+
+    def test_invalid_reply_to(self):
+        with self.assertRaises(InvalidMessageError):
+            self.server.send_response_message(1, {'reply_to': '../../etc/passwd'}, {})
+        with self.assertRaises(InvalidMessageError):
+            self.server.send_response_message(1, {}, {})
+
+    def test_message_too_large(self):
+        client = self._get_client(maximum_message_size_in_bytes=100)
+
+        with self.assertRaises(MessageTooLarge):
+            client.send_request_message(1, {}, {'data': 'x' * 100})
+        self.assertEqual(0, client.requests_outstanding)
+
+    def test_request_ring_full(self):
+        server = SharedMemoryServerTransport(
+            'small',
+            NoOpMetricsRecorder(),
+            directory=self.directory,
+            request_ring_capacity_in_bytes=1024,
+        )
+        client = SharedMemoryClientTransport(
+            'small',
+            NoOpMetricsRecorder(),
+            directory=self.directory,
+            queue_full_retries=1,
+        )
+        client.core._get_counter = mock.MagicMock()
+
+        with self.assertRaises(MessageSendError):
+            for request_id in range(100):
+                client.send_request_message(request_id, {}, {'data': 'x' * 100})
+        client.core._get_counter.assert_any_call('send.queue_full_retry')
+        client.core._get_counter.assert_called_with('send.error.ring_full')
+        server.close()
+
+    def test_forked_server(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server = SharedMemoryServerTransport('example', NoOpMetricsRecorder(), directory=self.directory)
+                request_id, meta, body = server.receive_request_message()
+                server.send_response_message(request_id, meta, dict(body, pid=os.getpid()))
+            finally:
+                os._exit(0)
+
+        try:
+            self.client.send_request_message(1, {}, {'n': 1})
+            request_id, _, body = self.client.receive_response_message(5)
+        finally:
+            os.waitpid(pid, 0)
+        self.assertEqual(1, request_id)
+        self.assertEqual({'n': 1, 'pid': pid}, body)
+
+    def test_settings(self):
+        self.assertFalse(SharedMemoryClientTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.shared_memory.client:SharedMemoryClientTransport',
+            'kwargs': {'directory': '/tmp', 'response_ring_capacity_in_bytes': 1024},
+        }))
+        self.assertTrue(SharedMemoryServerTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.shared_memory.server:SharedMemoryServerTransport',
+            'kwargs': {'hosts': ['localhost']},
+        }))
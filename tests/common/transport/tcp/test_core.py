@@ -0,0 +1,115 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import socket
+import time
+import unittest
+
+from pysoa.common.transport.exceptions import (
+    InvalidMessageError,
+    MessageReceiveTimeout,
+    MessageTooLarge,
+)
+from pysoa.common.transport.tcp.core import (
+    FRAME_HEADER,
+    ConnectionClosed,
+    FramedConnection,
+    TCPTransportCore,
+)
+
+
+def _tcp_socket_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    left = socket.create_connection(listener.getsockname())
+    right, _ = listener.accept()
+    listener.close()
+    return left, right
+
+
+class TestFramedConnection(unittest.TestCase):
+    def setUp(self):
+        left, right = _tcp_socket_pair()
+        self.sender = FramedConnection(left, 'left', 1024)
+        self.receiver = FramedConnection(right, 'right', 1024)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_pipelined_frames(self):
+        self.sender.send_frames([b'one', b'', b'three'], 1)
+
+        self.assertEqual(b'one', self.receiver.read_frame(1))
+        self.assertEqual([b'', b'three'], self.receiver.read_available_frames())
+        self.assertIsNone(self.receiver.read_frame(0.01))
+
+    def test_partial_frame_is_kept(self):
+        frame = FRAME_HEADER.pack(6) + b'abcdef'
+        self.sender.socket.sendall(frame[:5])
+
+        self.assertEqual([], self.receiver.read_available_frames())
+        self.assertIsNone(self.receiver.read_frame(0.01))
+
+        self.sender.socket.sendall(frame[5:])
+        self.assertEqual(b'abcdef', self.receiver.read_frame(1))
+
+    def test_frame_too_large(self):
+        self.sender.socket.sendall(FRAME_HEADER.pack(1025))
+
+        with self.assertRaises(ConnectionClosed):
+            self.receiver.read_frame(1)
+        self.assertTrue(self.receiver.closed)
+
+    def test_closed_by_other_end(self):
+        self.sender.close()
+
+        with self.assertRaises(ConnectionClosed):
+            self.receiver.read_frame(1)
+        self.assertTrue(self.receiver.closed)
+
+        with self.assertRaises(ConnectionClosed):
+            self.receiver.send_frames([b'one'], 1)
+
+
+class TestTCPTransportCore(unittest.TestCase):
+    def test_round_trip(self):
+        core = TCPTransportCore(service_name='example')
+        meta = {'foo': 'bar'}
+
+        serialized = core.serialize_message(17, meta, {'hello': 'world'})
+
+        self.assertIn('__expiry__', meta)
+        self.assertEqual((17, meta, {'hello': 'world'}), core.deserialize_message(serialized))
+
+    def test_no_request_id(self):
+        core = TCPTransportCore(service_name='example')
+
+        with self.assertRaises(InvalidMessageError):
+            core.serialize_message(None, {}, {})
+
+        with self.assertRaises(InvalidMessageError):
+            core.deserialize_message(core.serializer.dict_to_blob({'meta': {}, 'body': {}}))
+
+    def test_expired(self):
+        core = TCPTransportCore(service_name='example')
+
+        serialized = core.serialize_message(17, {}, {}, message_expiry_in_seconds=1)
+        self.assertEqual(17, core.deserialize_message(serialized)[0])
+
+        serialized = core.serializer.dict_to_blob({'request_id': 17, 'meta': {'__expiry__': time.time() - 1}})
+        with self.assertRaises(MessageReceiveTimeout):
+            core.deserialize_message(serialized)
+
+    def test_too_large(self):
+        core = TCPTransportCore(service_name='example', maximum_message_size_in_bytes=100)
+
+        with self.assertRaises(MessageTooLarge):
+            core.serialize_message(17, {}, {'hello': 'world' * 20})
+
+    def test_invalid_maximum_message_size(self):
+        with self.assertRaises(ValueError):
+            TCPTransportCore(maximum_message_size_in_bytes=0)
@@ -0,0 +1,243 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import time
+import unittest
+
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.serializer.json_serializer import JSONSerializer
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+    MessageSendError,
+    MessageTooLarge,
+)
+from pysoa.common.transport.tcp.client import TCPClientTransport
+from pysoa.common.transport.tcp.core import FRAME_HEADER
+from pysoa.common.transport.tcp.server import TCPServerTransport
+from pysoa.test.compatibility import mock
+
+
+class TestTCPTransport(unittest.TestCase):
+    def setUp(self):
+        self.server_metrics = mock.MagicMock()
+        self.server = TCPServerTransport(
+            'example',
+            NoOpMetricsRecorder(),
+            bind_address='127.0.0.1',
+            port=0,
+            receive_timeout_in_seconds=1,
+            message_expiry_in_seconds=5,
+        )
+        self.server.core._get_counter = self.server_metrics
+        # A separate pool for each test, so that connections do not leak from one test to the next
+        TCPClientTransport._connection_pools = {}
+        self.client = self._get_client()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _get_client(self, **kwargs):
+        client = TCPClientTransport('example', NoOpMetricsRecorder(), hosts=[self.server.address], **kwargs)
+        client.core._get_counter = mock.MagicMock()
+        return client
+
+    def _echo(self, count):
+        for _ in range(count):
+            request_id, meta, body = self.server.receive_request_message()
+            self.server.send_response_message(request_id, meta, body)
+
+    def test_pipelined_requests(self):
+        self.client = self._get_client(maximum_connections_per_thread=1)
+        self.client.send_request_message(1, {}, {'n': 1})
+        self.assertEqual(
+            [None, None],
+            self.client.send_request_messages([(2, {}, {'n': 2}, None), (3, {}, {'n': 3}, 10)]),
+        )
+        self.assertEqual(3, self.client.requests_outstanding)
+
+        received = [self.server.receive_request_message() for _ in range(3)]
+        self.assertEqual([1, 2, 3], [request_id for request_id, _, _ in received])
+        self.assertEqual([{'n': 1}, {'n': 2}, {'n': 3}], [body for _, _, body in received])
+        # All three arrived on the one connection, to which the responses are sent back
+        self.assertEqual({1}, {meta['reply_to'] for _, meta, _ in received})
+
+        for request_id, meta, body in reversed(received):
+            self.server.send_response_message(request_id, meta, dict(body, response=True))
+
+        responses = [self.client.receive_response_message() for _ in range(3)]
+        self.assertEqual([3, 2, 1], [request_id for request_id, _, _ in responses])
+        self.assertEqual({'n': 3, 'response': True}, responses[0][2])
+
+        self.assertEqual(0, self.client.requests_outstanding)
+        self.assertEqual((None, None, None), self.client.receive_response_message())
+
+    def test_requests_spread_across_connections(self):
+        self.assertEqual(
+            [None] * 3,
+            self.client.send_request_messages([(i, {}, {'n': i}, None) for i in range(3)]),
+        )
+
+        received = [self.server.receive_request_message() for _ in range(3)]
+        # Each request arrived on a connection of its own, which could be handled by a different server process
+        self.assertEqual(3, len({meta['reply_to'] for _, meta, _ in received}))
+
+        for request_id, meta, body in reversed(received):
+            self.server.send_response_message(request_id, meta, body)
+        responses = [self.client.receive_response_message() for _ in range(3)]
+        self.assertEqual([0, 1, 2], sorted(request_id for request_id, _, _ in responses))
+        self.assertEqual((None, None, None), self.client.receive_response_message())
+        self.assertEqual(3, len(self.client._pool._idle_connections[self.server.address]))
+
+        # The pooled connections are reused, and no more than the maximum are used at once
+        client = self._get_client(maximum_connections_per_thread=2)
+        client.send_request_message(10, {}, {})
+        client.send_request_messages([(i, {}, {}, None) for i in range(11, 15)])
+        received = [self.server.receive_request_message() for _ in range(5)]
+        reply_to = [meta['reply_to'] for _, meta, _ in received]
+        self.assertEqual([2, 3], sorted(reply_to.count(connection_id) for connection_id in set(reply_to)))
+        for request_id, meta, body in received:
+            self.server.send_response_message(request_id, meta, body)
+        self.assertEqual(
+            list(range(10, 15)),
+            sorted(client.receive_response_message()[0] for _ in range(5)),
+        )
+        self.assertEqual(3, len(self.server._connections))
+
+        with self.assertRaises(ValueError):
+            self._get_client(maximum_connections_per_thread=0)
+
+    def test_json_serializer(self):
+        self.server.close()
+        self.server = TCPServerTransport(
+            'example',
+            NoOpMetricsRecorder(),
+            bind_address='127.0.0.1',
+            port=0,
+            receive_timeout_in_seconds=1,
+            serializer_config={'object': JSONSerializer, 'kwargs': {}},
+        )
+        client = TCPClientTransport(
+            'example',
+            NoOpMetricsRecorder(),
+            hosts=[self.server.address],
+            serializer_config={'object': JSONSerializer, 'kwargs': {}},
+        )
+
+        client.send_request_message(1, {}, {'text': '\u00e9t\u00e9 \u2603'})
+        self._echo(1)
+        self.assertEqual((1, {'text': '\u00e9t\u00e9 \u2603'}), client.receive_response_message()[::2])
+
+    def test_connection_reused(self):
+        for request_id in range(3):
+            self.client.send_request_message(request_id, {}, {})
+            self._echo(1)
+            self.assertEqual(request_id, self.client.receive_response_message()[0])
+
+        # Transports share the pool, too
+        client = self._get_client()
+        client.send_request_message(7, {}, {})
+        self._echo(1)
+        self.assertEqual(7, client.receive_response_message()[0])
+
+        self.assertEqual(1, len(self.server._connections))
+        self.assertEqual(1, self.server.core._get_counter.call_args_list.count(mock.call('connection.opened')))
+
+    def test_receive_timeout_abandons_connection(self):
+        self.client.send_request_message(1, {}, {})
+        request_id, meta, body = self.server.receive_request_message()
+
+        with self.assertRaises(MessageReceiveTimeout):
+            self.client.receive_response_message(0.05)
+        self.assertEqual(0, self.client.requests_outstanding)
+        self.client.core._get_counter.assert_called_with('receive.error.timeout')
+
+        # The server notices the connection closing, and discards the late response
+        with self.assertRaises(MessageReceiveTimeout):
+            self.server.receive_request_message()
+        self.assertEqual({}, self.server._connections)
+        self.server.send_response_message(request_id, meta, body)
+        self.server_metrics.assert_called_with('send.error.connection_closed')
+
+        # The next request goes on a new connection
+        self.client.send_request_message(2, {}, {})
+        self._echo(1)
+        self.assertEqual(2, self.client.receive_response_message()[0])
+
+    def test_connection_closed_by_server(self):
+        self.client.send_request_message(1, {}, {})
+        self.server.receive_request_message()
+        self.server.close()
+
+        with self.assertRaises(MessageReceiveError):
+            self.client.receive_response_message(1)
+        self.assertEqual(0, self.client.requests_outstanding)
+
+        with self.assertRaises(MessageSendError):
+            self.client.send_request_message(2, {}, {})
+        self.client.core._get_counter.assert_called_with('send.error.connection')
+
+    def test_idle_connection_closed_by_server(self):
+        self.client.send_request_message(1, {}, {})
+        self._echo(1)
+        self.client.receive_response_message()
+
+        for connection_id in list(self.server._connections):
+            self.server._remove_connection(connection_id)
+        time.sleep(0.05)
+
+        # The closed connection is discarded from the pool, and a new one is established
+        self.client.send_request_message(2, {}, {})
+        self._echo(1)
+        self.assertEqual(2, self.client.receive_response_message()[0])
+
+    def test_expired_request_skipped(self):
+        self.client.send_request_message(1, {}, {})
+        self.client.send_request_message(2, {}, {}, message_expiry_in_seconds=1)
+        self.client.send_request_message(3, {}, {})
+
+        with mock.patch('pysoa.common.transport.tcp.core.time.time', return_value=time.time() + 3):
+            self.assertEqual(1, self.server.receive_request_message()[0])
+            self.assertEqual(3, self.server.receive_request_message()[0])
+        self.server_metrics.assert_any_call('receive.error.message_expired')
+
+    def test_invalid_message_closes_connection(self):
+        self.client.send_request_message(1, {}, {})
+        self._echo(1)
+        self.client.receive_response_message()
+        connection = self.client._pool._idle_connections[self.server.address][0]
+        connection.socket.sendall(FRAME_HEADER.pack(3) + b'\xc1\xc1\xc1')
+
+        with self.assertRaises(MessageReceiveTimeout):
+            self.server.receive_request_message()
+        self.server_metrics.assert_any_call('receive.error.invalid_message')
+        self.assertEqual({}, self.server._connections)
+
+    def test_message_too_large(self):
+        client = self._get_client(maximum_message_size_in_bytes=100)
+
+        with self.assertRaises(MessageTooLarge):
+            client.send_request_message(1, {}, {'data': 'x' * 100})
+
+        errors = client.send_request_messages([(1, {}, {'data': 'x' * 100}, None), (2, {}, {}, None)])
+        self.assertIsInstance(errors[0], MessageTooLarge)
+        self.assertIsNone(errors[1])
+        self.assertEqual(1, client.requests_outstanding)
+
+    def test_cannot_connect(self):
+        address = self.server.address
+        self.server.close()
+        client = TCPClientTransport('example', NoOpMetricsRecorder(), hosts=[address], connect_timeout_in_seconds=1)
+
+        with self.assertRaises(MessageSendError):
+            client.send_request_message(1, {}, {})
+        self.assertEqual(0, client.requests_outstanding)
+
+    def test_settings_only_for_the_other_side_are_ignored(self):
+        client = TCPClientTransport('example', NoOpMetricsRecorder(), hosts=['127.0.0.1'], port=1, reuse_port=False)
+        self.assertEqual([('127.0.0.1', 1)], client._hosts)
+
+        server = TCPServerTransport('example', NoOpMetricsRecorder(), bind_address='127.0.0.1', port=0, hosts=['a'])
+        server.close()
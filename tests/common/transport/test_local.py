@@ -0,0 +1,134 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import threading
+import time
+import unittest
+
+from pysoa.client.client import Client
+from pysoa.common.metrics import NoOpMetricsRecorder
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+)
+from pysoa.common.transport.local import LocalClientTransport
+from pysoa.common.types import ActionRequest
+from pysoa.server.action.base import Action
+from pysoa.server.server import Server
+from pysoa.test.compatibility import mock
+
+
+class SleepAction(Action):
+    def run(self, request):
+        time.sleep(request.body.get('seconds', 0))
+        return {'thread': threading.current_thread().name}
+
+
+class LocalServer(Server):
+    service_name = 'local'
+    action_class_map = {
+        'sleep': SleepAction,
+    }
+
+
+def _job(seconds=0):
+    return {
+        'control': {'continue_on_error': False},
+        'context': {'switches': [], 'correlation_id': 'abc'},
+        'actions': [{'action': 'sleep', 'body': {'seconds': seconds}}],
+    }
+
+
+class TestLocalClientTransport(unittest.TestCase):
+    def test_serial(self):
+        transport = LocalClientTransport('local', NoOpMetricsRecorder(), LocalServer, {})
+
+        transport.send_request_message(1, {}, _job())
+        self.assertEqual(1, transport.requests_outstanding)
+
+        request_id, _, response = transport.receive_response_message()
+        self.assertEqual(1, request_id)
+        self.assertEqual(threading.current_thread().name, response['actions'][0]['body']['thread'])
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual((None, None, None), transport.receive_response_message())
+        self.assertFalse(transport.may_block)
+
+    def test_worker_threads_handle_requests_concurrently(self):
+        client = Client({
+            'local': {
+                'transport': {
+                    'path': 'pysoa.common.transport.local:LocalClientTransport',
+                    'kwargs': {'server_class': LocalServer, 'server_settings': {}, 'worker_threads': 4},
+                },
+            },
+        })
+
+        start = time.time()
+        responses = list(client.call_actions_parallel(
+            'local',
+            [ActionRequest(action='sleep', body={'seconds': 0.2}) for _ in range(4)],
+        ))
+        elapsed = time.time() - start
+
+        self.assertEqual(4, len(responses))
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(4, len({response.body['thread'] for response in responses}))
+        self.assertTrue(all(response.body['thread'].startswith('pysoa-local-local-') for response in responses))
+
+    def test_worker_threads_route_responses_to_sending_thread(self):
+        transport = LocalClientTransport('local', NoOpMetricsRecorder(), LocalServer, {}, worker_threads=2)
+        results = {}
+
+        def send_and_receive(request_id):
+            transport.send_request_message(request_id, {}, _job(0.05))
+            results[request_id] = transport.receive_response_message(5)[0]
+            results['{}-after'.format(request_id)] = transport.receive_response_message(5)
+
+        threads = [threading.Thread(target=send_and_receive, args=(i, )) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transport.close()
+
+        self.assertEqual({0: 0, 1: 1, 2: 2, 3: 3}, {i: results[i] for i in range(4)})
+        self.assertEqual({(None, None, None)}, {results['{}-after'.format(i)] for i in range(4)})
+
+    def test_worker_threads_receive_timeout(self):
+        transport = LocalClientTransport('local', NoOpMetricsRecorder(), LocalServer, {}, worker_threads=1)
+        self.assertTrue(transport.may_block)
+
+        transport.send_request_message(1, {}, _job(0.2))
+        with self.assertRaises(MessageReceiveTimeout):
+            transport.receive_response_message(0.01)
+        self.assertEqual(0, transport.requests_outstanding)
+        self.assertEqual((None, None, None), transport.receive_response_message(5))
+
+        # The late response to the abandoned request is discarded instead of being returned for the next request
+        transport.send_request_message(2, {}, _job())
+        self.assertEqual(1, transport.requests_outstanding)
+        self.assertEqual(2, transport.receive_response_message(5)[0])
+        self.assertEqual(0, transport.requests_outstanding)
+        transport.close()
+
+    def test_worker_thread_error(self):
+        transport = LocalClientTransport('local', NoOpMetricsRecorder(), LocalServer, {}, worker_threads=1)
+
+        with mock.patch.object(LocalServer, 'handle_next_request', side_effect=ValueError('broken')):
+            transport.send_request_message(1, {}, {})
+            with self.assertRaises(MessageReceiveError):
+                transport.receive_response_message(5)
+        self.assertEqual(0, transport.requests_outstanding)
+        transport.close()
+
+    def test_settings(self):
+        self.assertFalse(LocalClientTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.local:LocalClientTransport',
+            'kwargs': {'server_class': LocalServer, 'server_settings': {}, 'worker_threads': 4},
+        }))
+        self.assertTrue(LocalClientTransport.settings_schema.errors({
+            'path': 'pysoa.common.transport.local:LocalClientTransport',
+            'kwargs': {'server_class': LocalServer, 'server_settings': {}, 'worker_threads': -1},
+        }))
@@ -0,0 +1,17 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import sys
+
+
+collect_ignore = []
+
+if sys.version_info < (3, 5):
+    # These modules test coroutines, which are only available in Python 3.5 and newer
+    collect_ignore.extend([
+        'client/test_async_send_receive.py',
+        'common/transport/redis_gateway/test_async_client.py',
+        'server/test_server/test_async_jobs.py',
+    ])
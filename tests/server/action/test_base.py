@@ -7,7 +7,10 @@ import unittest
 
 from conformity import fields
 
-from pysoa.common.types import ActionResponse
+from pysoa.common.types import (
+    ActionResponse,
+    Error,
+)
 from pysoa.server.action import Action
 from pysoa.server.errors import (
     ActionError,
@@ -92,3 +95,64 @@ class TestActionValidation(unittest.TestCase):
         self.assertIsInstance(response, ActionResponse)
         self.assertEqual(self.action_request.action, response.action)
         self.assertEqual({}, response.body)
+
+
+class TestBatchAction(TestAction):
+    __test__ = False
+
+    def run_batch(self, requests):
+        self.requests = requests
+        return self._return
+
+
+class TestActionCallBatch(unittest.TestCase):
+    def setUp(self):
+        self.action = TestBatchAction()
+        self.action_requests = [
+            EnrichedActionRequest(action='test_action', body={'string_field': 'one'}, switches=None),
+            EnrichedActionRequest(action='test_action', body={'string_field': 2}, switches=None),
+            EnrichedActionRequest(action='test_action', body={'string_field': 'three'}, switches=None),
+        ]
+
+    def test_call_batch(self):
+        not_found = ActionError(errors=[Error(code='NOT_FOUND', message='Not found')])
+        self.action._return = [{'boolean_field': True}, not_found]
+
+        results = self.action.call_batch(self.action_requests)
+
+        # The invalid request is not passed to run_batch
+        self.assertEqual([self.action_requests[0], self.action_requests[2]], self.action.requests)
+
+        self.assertEqual(3, len(results))
+        self.assertIsInstance(results[0], ActionResponse)
+        self.assertEqual({'boolean_field': True}, results[0].body)
+        self.assertIsInstance(results[1], ActionError)
+        self.assertEqual('string_field', results[1].errors[0].field)
+        self.assertIs(not_found, results[2])
+
+    def test_call_batch_response_validation(self):
+        self.action._return = [{'boolean_field': True}, {}]
+
+        results = self.action.call_batch(self.action_requests)
+
+        self.assertIsInstance(results[0], ActionResponse)
+        self.assertIsInstance(results[2], ResponseValidationError)
+
+    def test_call_batch_action_error(self):
+        error = ActionError(errors=[Error(code='UNAVAILABLE', message='Unavailable')])
+
+        def run_batch(_):
+            raise error
+        self.action.run_batch = run_batch
+
+        results = self.action.call_batch(self.action_requests)
+
+        self.assertIs(error, results[0])
+        self.assertIsInstance(results[1], ActionError)
+        self.assertIs(error, results[2])
+
+    def test_call_batch_wrong_number_of_responses(self):
+        self.action._return = [{'boolean_field': True}]
+
+        with self.assertRaises(ValueError):
+            self.action.call_batch(self.action_requests)
@@ -4,7 +4,10 @@ from __future__ import (
     unicode_literals,
 )
 
+import os
 import platform
+import shutil
+import tempfile
 import unittest
 
 import conformity
@@ -24,7 +27,10 @@ from pysoa.server.action.status import (
     StatusActionFactory,
     make_default_status_action_class,
 )
+from pysoa.server.scoreboard import Scoreboard
 from pysoa.server.types import EnrichedActionRequest
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
 from pysoa.test.stub_service import stub_action
 
 
@@ -56,6 +62,12 @@ class _CheckOtherServicesAction(BaseStatusAction):
     check_client_settings = BaseStatusAction._check_client_settings
 
 
+class _CheckScoreboardAction(BaseStatusAction):
+    _version = '1.0.0'
+
+    check_scoreboard = BaseStatusAction._check_scoreboard
+
+
 class TestBaseStatusAction(unittest.TestCase):
     def test_cannot_instantiate_base_action(self):
         with self.assertRaises(TypeError):
@@ -257,3 +269,50 @@ class TestBaseStatusAction(unittest.TestCase):
             },
             response.body['healthcheck']['diagnostics'],
         )
+
+
+class TestCheckScoreboard(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scoreboard')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _call(self, scoreboard_file):
+        action = _CheckScoreboardAction(factories.ServerSettingsFactory(data={
+            'scoreboard_file': scoreboard_file,
+            'harakiri': {'timeout': 30},
+        }))
+        action_request = EnrichedActionRequest(action='status', body={}, switches=None)
+        return action(action_request).body['healthcheck']
+
+    def test_no_scoreboard_file(self):
+        self.assertEqual({'diagnostics': {}, 'errors': [], 'warnings': []}, self._call(None))
+
+    def test_scoreboard_unavailable(self):
+        healthcheck = self._call(self.path)
+
+        self.assertEqual([], healthcheck['errors'])
+        self.assertEqual(['SCOREBOARD_UNAVAILABLE'], [code for code, _ in healthcheck['warnings']])
+
+    def test_workers(self):
+        scoreboard = Scoreboard.create(3, self.path)
+        self.addCleanup(scoreboard.close)
+        scoreboard.slots[0].reset('pysoa-worker-0')
+        scoreboard.slots[0].started(1234, 1000.0)
+        scoreboard.slots[1].reset('pysoa-worker-1')
+        scoreboard.slots[1].started(1235, 1000.0)
+        scoreboard.slots[1].heartbeat(1040.0)
+
+        with mock.patch('time.time', return_value=1045.0):
+            healthcheck = self._call(self.path)
+
+        self.assertEqual(
+            [('WORKER_HEARTBEAT_STALE', 'Server process pysoa-worker-0 has not recorded a heartbeat for 45s')],
+            healthcheck['errors'],
+        )
+        self.assertEqual(
+            [('pysoa-worker-0', 1234, 'idle'), ('pysoa-worker-1', 1235, 'idle')],
+            [(w['name'], w['pid'], w['state']) for w in healthcheck['diagnostics']['workers']],
+        )
@@ -0,0 +1,376 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import signal
+import unittest
+
+from pysoa.server import prefork
+from pysoa.server.scoreboard import Scoreboard
+from pysoa.server.server import Server
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
+
+
+class ExampleServer(Server):
+    service_name = 'example'
+    action_class_map = {}
+
+
+class TestGetRecyclingServerClass(unittest.TestCase):
+    def test_recycled_after_maximum_requests(self):
+        with mock.patch('random.randint', return_value=2):
+            server = prefork.get_recycling_server_class(ExampleServer, maximum_requests=20)(
+                factories.ServerSettingsFactory(),
+            )
+
+        self.assertTrue(isinstance(server, ExampleServer))
+        self.assertEqual('ExampleServer', type(server).__name__)
+
+        for _ in range(0, 21):
+            server.perform_post_request_actions()
+            self.assertFalse(server.recycling)
+            self.assertFalse(server.shutting_down)
+
+        server.perform_post_request_actions()
+        self.assertTrue(server.recycling)
+        self.assertTrue(server.shutting_down)
+
+    @mock.patch('pysoa.server.prefork.get_rss_in_bytes')
+    def test_recycled_above_maximum_rss(self, mock_get_rss_in_bytes):
+        server = prefork.get_recycling_server_class(ExampleServer, maximum_rss_in_bytes=1024)(
+            factories.ServerSettingsFactory(),
+        )
+
+        mock_get_rss_in_bytes.return_value = 1024
+        server.perform_post_request_actions()
+        self.assertFalse(server.recycling)
+
+        mock_get_rss_in_bytes.return_value = 1025
+        server.perform_post_request_actions()
+        self.assertTrue(server.recycling)
+        self.assertTrue(server.shutting_down)
+
+    def test_get_rss_in_bytes(self):
+        self.assertGreater(prefork.get_rss_in_bytes(), 0)
+
+
+class TestRunWorker(unittest.TestCase):
+    def test_exit_code_recycled(self):
+        server_class = mock.MagicMock()
+        server_class.return_value.recycling = True
+
+        with self.assertRaises(SystemExit) as error_context:
+            prefork.run_worker(server_class, {'some': 'settings'})
+
+        self.assertEqual(prefork.WORKER_EXIT_CODE_RECYCLED, error_context.exception.code)
+        server_class.assert_called_once_with({'some': 'settings'})
+        server_class.return_value.run.assert_called_once_with()
+
+    def test_scoreboard_slot(self):
+        server_class = mock.MagicMock()
+        slot = mock.MagicMock()
+
+        with self.assertRaises(SystemExit):
+            prefork.run_worker(server_class, {'some': 'settings'}, slot)
+
+        self.assertIs(slot, server_class.return_value.scoreboard_slot)
+
+    def test_exit_code_stopped(self):
+        server_class = mock.MagicMock()
+        server_class.return_value.recycling = False
+
+        with self.assertRaises(SystemExit) as error_context:
+            prefork.run_worker(server_class, {'some': 'settings'})
+
+        self.assertEqual(prefork.WORKER_EXIT_CODE_STOPPED, error_context.exception.code)
+
+
+class FakeProcess(object):
+    def __init__(self, target, args, name):
+        self.target = target
+        self.args = args
+        self.name = name
+        self.alive = False
+        self.exitcode = None
+        self.terminated = False
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        pass
+
+    def terminate(self):
+        self.terminated = True
+        self.exit(-signal.SIGTERM)
+
+    def exit(self, exit_code):
+        self.alive = False
+        self.exitcode = exit_code
+
+
+class TestPreforkSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.processes = []
+        self.now = 1000.0
+        # Each tick of the supervisor's monitor loop is handed to the test, which returns False to stop the supervisor
+        self.ticks = []
+
+        def make_process(target, args, name):
+            process = FakeProcess(target, args, name)
+            self.processes.append(process)
+            return process
+
+        def sleep(seconds):
+            self.now += seconds
+            if not self.ticks.pop(0)():
+                self.supervisor.handle_shutdown_signal()
+
+        patchers = [
+            mock.patch('multiprocessing.Process', side_effect=make_process),
+            mock.patch('pysoa.server.prefork.time.time', side_effect=lambda: self.now),
+            mock.patch('pysoa.server.prefork.time.sleep', side_effect=sleep),
+            mock.patch('signal.signal'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.target = mock.MagicMock()
+        self.pool = prefork.WorkerPool('worker', self.target, 2)
+        self.supervisor = prefork.PreforkSupervisor([self.pool])
+
+    def test_workers_started_and_stopped(self):
+        def tick():
+            for process in self.processes:
+                process.exit(0)
+            return False
+
+        self.ticks = [tick]
+
+        self.supervisor.run()
+
+        self.assertEqual(['worker-0', 'worker-1'], [p.name for p in self.processes])
+        self.assertEqual([self.target, self.target], [p.target for p in self.processes])
+        self.assertEqual([(w.slot, ) for w in self.pool.workers], [p.args for p in self.processes])
+
+    def test_recycled_worker_replaced_at_once(self):
+        def recycle():
+            self.processes[0].exit(prefork.WORKER_EXIT_CODE_RECYCLED)
+            return True
+
+        def stop():
+            for process in self.processes:
+                process.exit(prefork.WORKER_EXIT_CODE_STOPPED)
+            return False
+
+        self.ticks = [recycle, stop]
+
+        self.supervisor.run()
+
+        self.assertEqual(['worker-0', 'worker-1', 'worker-0'], [p.name for p in self.processes])
+
+    def test_crashed_worker_replaced_with_backoff(self):
+        process_counts = []
+
+        def crash():
+            # worker-0 crashes right after each start, and worker-1 keeps running
+            process_counts.append(len(self.processes))
+            for process in self.processes:
+                if process.name == 'worker-0' and process.is_alive():
+                    process.exit(1)
+            return True
+
+        def stop():
+            self.processes[1].exit(prefork.WORKER_EXIT_CODE_STOPPED)
+            return False
+
+        self.ticks = [crash] * 8 + [stop]
+
+        with mock.patch.object(self.supervisor.logger, 'warning') as mock_warning:
+            self.supervisor.run()
+
+        # It is replaced after 1, 2, and then 4 seconds
+        self.assertEqual([2, 2, 3, 3, 3, 4, 4, 4], process_counts)
+        self.assertEqual(
+            ['worker-0 exited with code 1; replacing it in {}s'.format(delay) for delay in (1, 2, 4)],
+            [c[0][0][len('Worker process '):] for c in mock_warning.call_args_list[:3]],
+        )
+        self.assertEqual(['worker-0', 'worker-1', 'worker-0', 'worker-0'], [p.name for p in self.processes])
+
+    def test_shutdown_waits_for_workers(self):
+        def interrupt():
+            self.supervisor.handle_shutdown_signal()
+            return True
+
+        def stop():
+            for process in self.processes:
+                process.exit(prefork.WORKER_EXIT_CODE_STOPPED)
+            return True
+
+        self.ticks = [interrupt, lambda: True, stop]
+
+        self.supervisor.run()
+
+        # The workers are not terminated, nor replaced, and the supervisor waits until they exit
+        self.assertEqual(2, len(self.processes))
+        self.assertFalse(any(p.terminated for p in self.processes))
+        self.assertEqual([], self.ticks)
+
+    def test_hangup_terminates_workers(self):
+        def hangup():
+            self.supervisor.handle_hangup_signal()
+            return True
+
+        self.ticks = [hangup]
+
+        self.supervisor.run()
+
+        self.assertEqual(2, len(self.processes))
+        self.assertTrue(all(p.terminated for p in self.processes))
+        self.assertTrue(self.supervisor.shutting_down)
+
+    def test_pool_scaled_up_and_down(self):
+        depths = [5]
+        metrics = mock.MagicMock()
+        self.pool = prefork.WorkerPool('worker', self.target, 1, 3, lambda: depths[0], metrics)
+        self.pool.SCALE_INTERVAL_IN_SECONDS = 1
+        self.pool.SCALE_UP_SAMPLES = 1
+        self.pool.SCALE_DOWN_SAMPLES = 1
+        self.supervisor = prefork.PreforkSupervisor([self.pool])
+
+        def idle():
+            depths[0] = 0
+            return True
+
+        def stop():
+            for process in self.processes:
+                process.exit(prefork.WORKER_EXIT_CODE_STOPPED)
+            return True
+
+        self.ticks = [idle, lambda: False, stop]
+
+        self.supervisor.run()
+
+        # The second worker process was forked when requests were waiting, and stopped gracefully when they were not
+        self.assertEqual(['worker-0', 'worker-1'], [p.name for p in self.processes])
+        self.assertFalse(self.processes[0].terminated)
+        self.assertTrue(self.processes[1].terminated)
+        self.assertEqual(['worker-0'], [w.name for w in self.pool.workers])
+
+        metrics.counter.assert_any_call('server.prefork.scaling.scale_up')
+        metrics.counter.assert_any_call('server.prefork.scaling.scale_down')
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.depth = 0
+        self.metrics = mock.MagicMock()
+        self.pool = prefork.WorkerPool('worker', mock.MagicMock(), 2, 6, lambda: self.depth, self.metrics, 'group_0')
+        self.scoreboard = Scoreboard.create(6)
+        self.addCleanup(self.scoreboard.close)
+        for worker in self.pool.workers:
+            self._start(worker)
+        self.now = 1000.0
+
+    def _start(self, worker):
+        worker.slot = self.scoreboard.slots[worker.index]
+        worker.slot.reset(worker.name)
+        worker.process = mock.MagicMock()
+        worker.started = worker.busy_seconds_sampled_at = 1000.0
+
+    def _sample(self, busy_seconds=0):
+        self.now += self.pool.SCALE_INTERVAL_IN_SECONDS
+        for worker in self.pool.workers:
+            worker.slot.request_started(self.now - busy_seconds)
+            worker.slot.request_finished(self.now)
+        return self.pool.get_scaling_decision(self.now)
+
+    def test_not_scaled_without_maximum(self):
+        pool = prefork.WorkerPool('worker', mock.MagicMock(), 2, 0, mock.MagicMock(), self.metrics)
+
+        self.assertEqual(2, pool.maximum)
+        self.assertEqual(0, pool.get_scaling_decision(1000.0))
+        self.assertFalse(pool.get_request_queue_depth.called)
+        self.assertFalse(self.metrics.counter.called)
+
+    def test_scaled_up_when_requests_waiting(self):
+        self.depth = 3
+
+        self.assertEqual(0, self._sample())
+        self.assertEqual(1, self._sample())
+
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.samples')
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.queue_depth')
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.scale_up')
+        self.metrics.counter.return_value.increment.assert_any_call(3)
+        self.assertTrue(self.metrics.commit.called)
+
+        # Samples are only taken once per interval
+        self.assertEqual(0, self.pool.get_scaling_decision(self.now + 1))
+
+    def test_scaled_up_when_busy(self):
+        self.depth = 1
+
+        self.assertEqual(0, self._sample(busy_seconds=4.5))
+        self.assertEqual(1, self._sample(busy_seconds=4.5))
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.busy_percent')
+        self.metrics.counter.return_value.increment.assert_any_call(90)
+
+    def test_not_scaled_up_when_busy_without_requests_waiting(self):
+        for _ in range(0, 4):
+            self.assertEqual(0, self._sample(busy_seconds=5))
+
+    def test_scaled_down_when_idle(self):
+        for _ in range(0, 4):
+            self.pool.add_worker()
+            self._start(self.pool.workers[-1])
+        self.assertEqual(6, self.pool.size)
+        self.assertEqual(0, self._sample(busy_seconds=5))
+
+        for _ in range(0, self.pool.SCALE_DOWN_SAMPLES - 1):
+            self.assertEqual(0, self._sample(busy_seconds=1))
+        self.assertEqual(-1, self._sample(busy_seconds=1))
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.scale_down')
+
+        # The worker process with the highest index is stopped, and the pool is not scaled until it has exited
+        worker = self.pool.retire_worker()
+        self.assertEqual('worker-5', worker.name)
+        self.assertTrue(worker.retiring)
+        self.assertEqual(5, self.pool.size)
+        self.assertEqual(0, self._sample(busy_seconds=5))
+        self.pool.workers.remove(worker)
+
+        # A worker process that was not started is removed at once
+        self.pool.add_worker()
+        self.assertEqual('worker-5', self.pool.workers[-1].name)
+        self.assertIsNone(self.pool.retire_worker())
+        self.assertEqual(['worker-{}'.format(i) for i in range(0, 5)], [w.name for w in self.pool.workers])
+
+    def test_not_scaled_down_below_minimum(self):
+        for _ in range(0, self.pool.SCALE_DOWN_SAMPLES * 2):
+            self.assertEqual(0, self._sample())
+
+    def test_hysteresis(self):
+        self.depth = 3
+        self.assertEqual(0, self._sample())
+        # Between the low and high busy ratios, with no requests waiting, the samples in a row start over
+        self.depth = 0
+        self.assertEqual(0, self._sample(busy_seconds=2.5))
+        self.depth = 3
+        self.assertEqual(0, self._sample())
+        self.assertEqual(1, self._sample())
+
+    def test_queue_depth_error(self):
+        self.pool.get_request_queue_depth = mock.MagicMock(side_effect=ValueError('Oops'))
+
+        with mock.patch.object(self.pool.logger, 'warning'):
+            self.assertEqual(0, self._sample(busy_seconds=5))
+            self.assertEqual(1, self._sample(busy_seconds=5))
+
+        self.metrics.counter.assert_any_call('server.prefork.group_0.scaling.queue_depth_error')
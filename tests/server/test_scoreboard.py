@@ -0,0 +1,256 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import six
+
+from pysoa.server import scoreboard
+from pysoa.server.scoreboard import (
+    Scoreboard,
+    WorkerStatus,
+)
+from pysoa.test.compatibility import mock
+
+
+class TestScoreboardSlot(unittest.TestCase):
+    def setUp(self):
+        self.scoreboard = Scoreboard.create(2)
+        self.addCleanup(self.scoreboard.close)
+        self.slot = self.scoreboard.slots[1]
+
+    def test_request_lifecycle(self):
+        self.assertEqual([], self.scoreboard.read())
+
+        self.slot.reset('pysoa-worker-1')
+        self.assertEqual(
+            WorkerStatus(
+                index=1,
+                name='pysoa-worker-1',
+                pid=0,
+                state='starting',
+                action=None,
+                request_started=None,
+                requests_in_flight=0,
+                requests_served=0,
+                busy_seconds=0.0,
+                rss_in_bytes=0,
+                heartbeat=None,
+            ),
+            self.slot.read(),
+        )
+
+        self.slot.started(1234, 1000.0)
+        status = self.slot.read()
+        self.assertEqual((1234, 'idle', 1000.0), (status.pid, status.state, status.heartbeat))
+        self.assertGreater(status.rss_in_bytes, 0)
+
+        self.slot.request_started(1001.0)
+        self.slot.action_started('do_something')
+        self.assertEqual(3.0, self.slot.get_busy_seconds(1004.0))
+        status = self.slot.read()
+        self.assertEqual(('busy', 'do_something', 1001.0), (status.state, status.action, status.request_started))
+
+        self.slot.request_finished(1005.0)
+        self.slot.heartbeat(1010.0)
+        status = self.slot.read()
+        self.assertEqual(('idle', None, None), (status.state, status.action, status.request_started))
+        self.assertEqual((1, 4.0, 1010.0), (status.requests_served, status.busy_seconds, status.heartbeat))
+        self.assertEqual(4.0, self.slot.get_busy_seconds(1020.0))
+
+        self.slot.stopping()
+        self.assertEqual(['stopping'], [s.state for s in self.scoreboard.read()])
+
+        self.slot.clear()
+        self.assertEqual([], self.scoreboard.read())
+
+    def test_concurrent_requests(self):
+        self.slot.reset('pysoa-worker-1')
+        self.slot.started(1234, 0.0)
+
+        self.slot.request_started(0.0)
+        self.slot.action_started('first')
+        self.slot.request_started(1.0)
+        self.slot.action_started('second')
+        self.assertEqual(5.0, self.slot.get_busy_seconds(3.0))
+        status = self.slot.read()
+        self.assertEqual(
+            ('busy', 2, 'second', 1.0),
+            (status.state, status.requests_in_flight, status.action, status.request_started),
+        )
+
+        self.slot.request_finished(10.0)
+        status = self.slot.read()
+        self.assertEqual(('busy', 1, 'second'), (status.state, status.requests_in_flight, status.action))
+        self.assertEqual(19.0, self.slot.get_busy_seconds(10.0))
+
+        self.slot.request_finished(10.0)
+        status = self.slot.read()
+        self.assertEqual(('idle', 0, None), (status.state, status.requests_in_flight, status.action))
+        self.assertEqual((2, 19.0), (status.requests_served, status.busy_seconds))
+        self.assertEqual(19.0, self.slot.get_busy_seconds(20.0))
+
+    def test_writes_from_threads(self):
+        self.slot.reset('pysoa-worker-1')
+        self.slot.started(1234, 0.0)
+        requests_per_thread = 500
+
+        def handle_requests():
+            for _ in range(requests_per_thread):
+                self.slot.request_started(1.0)
+                self.slot.action_started('do_something')
+                self.slot.request_finished(3.0)
+
+        threads = [threading.Thread(target=handle_requests) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        status = self.slot.read()
+        self.assertEqual(0, self.slot._read_sequence() % 2)
+        self.assertEqual(('idle', 0, None), (status.state, status.requests_in_flight, status.action))
+        self.assertEqual(4 * requests_per_thread, status.requests_served)
+        self.assertEqual('pysoa-worker-1', status.name)
+
+    def test_rss_sampled_at_most_once_a_second(self):
+        self.slot.reset('pysoa-worker-1')
+        with mock.patch.object(scoreboard, 'get_rss_in_bytes') as mock_get_rss_in_bytes:
+            mock_get_rss_in_bytes.side_effect = [1024, 2048]
+            self.slot.started(1234, 1000.0)
+            self.slot.request_started(1000.1)
+            self.slot.request_finished(1000.5)
+            self.assertEqual(1024, self.slot.read().rss_in_bytes)
+
+            self.slot.heartbeat(1001.0)
+            self.assertEqual(2048, self.slot.read().rss_in_bytes)
+
+    def test_long_names_truncated(self):
+        self.slot.reset('w' * 47 + '\u00e9')
+        self.slot.action_started('a' * 100)
+
+        status = self.slot.read()
+        self.assertEqual('w' * 47, status.name)
+        self.assertEqual('a' * 64, status.action)
+
+    def test_read_retried_during_write(self):
+        self.slot.reset('pysoa-worker-1')
+        self.slot.started(1234, 1000.0)
+
+        # A write in progress has an odd sequence number
+        real_read_sequence = self.slot._read_sequence
+        sequences = [1, 1, 2, 2]
+        with mock.patch.object(self.slot, '_read_sequence', side_effect=lambda: sequences.pop(0)):
+            self.assertEqual(1234, self.slot.read().pid)
+        self.assertEqual([], sequences)
+
+        # A writer that died in the middle of a write does not block readers, and the next writer starts over
+        scoreboard._SEQUENCE.pack_into(self.scoreboard._mmap, self.slot._offset, 7)
+        self.assertEqual(1234, self.slot.read().pid)
+        self.slot.clear()
+        self.assertEqual(8, real_read_sequence())
+        self.assertEqual('free', self.slot.read().state)
+
+    def test_slots_independent(self):
+        self.scoreboard.slots[0].reset('a')
+        self.slot.reset('b')
+        self.scoreboard.slots[0].request_started(1000.0)
+
+        self.assertEqual([('a', 'busy'), ('b', 'starting')], [(s.name, s.state) for s in self.scoreboard.read()])
+
+
+class TestScoreboardFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scoreboard')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_open_reads_writes_of_other_process(self):
+        writer = Scoreboard.create(3, self.path)
+        self.assertEqual(os.path.abspath(self.path), writer.path)
+        writer.slots[2].reset('pysoa-worker-2')
+        writer.slots[2].started(1234, 1000.0)
+
+        reader = Scoreboard.open(self.path)
+        try:
+            self.assertEqual(3, len(reader.slots))
+            self.assertEqual([(2, 'pysoa-worker-2', 'idle')], [(s.index, s.name, s.state) for s in reader.read()])
+
+            writer.slots[2].request_started(1001.0)
+            self.assertEqual('busy', reader.slots[2].read().state)
+        finally:
+            reader.close()
+
+        writer.close(remove=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_open_not_a_scoreboard(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'This is not a scoreboard, but it is long enough to have a header')
+        with self.assertRaises(ValueError):
+            Scoreboard.open(self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write(b'PYSOA')
+        with self.assertRaises(ValueError):
+            Scoreboard.open(self.path)
+
+        with self.assertRaises((IOError, OSError)):
+            Scoreboard.open(os.path.join(self.directory, 'missing'))
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scoreboard')
+        self.scoreboard = Scoreboard.create(2, self.path)
+
+        slot = self.scoreboard.slots[0]
+        slot.reset('pysoa-worker-0')
+        slot.started(1234, 1000.0)
+        slot.request_started(1000.0)
+        slot.action_started('do_something')
+
+    def tearDown(self):
+        self.scoreboard.close()
+        shutil.rmtree(self.directory)
+
+    def _main(self, *argv):
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout, \
+                mock.patch('sys.stderr', new_callable=six.StringIO) as stderr, \
+                mock.patch('time.time', return_value=1002.5):
+            code = scoreboard.main(list(argv))
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_print_activity(self):
+        code, output, _ = self._main(self.path)
+
+        self.assertEqual(0, code)
+        lines = output.splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['SLOT', 'PID', 'NAME', 'STATE'], lines[0].split()[:4])
+        self.assertEqual(['0', '1234', 'pysoa-worker-0', 'busy', '0', '0.0'], lines[1].split()[:6])
+        self.assertTrue(lines[1].endswith('2.5s do_something (2.5s)'))
+
+    def test_check_heartbeat(self):
+        code, _, errors = self._main(self.path, '--check-heartbeat', '5')
+        self.assertEqual(0, code)
+        self.assertEqual('', errors)
+
+        code, _, errors = self._main(self.path, '--check-heartbeat', '2')
+        self.assertEqual(1, code)
+        self.assertIn('pysoa-worker-0', errors)
+
+    def test_not_a_scoreboard(self):
+        code, _, errors = self._main(os.path.join(self.directory, 'missing'))
+
+        self.assertEqual(2, code)
+        self.assertTrue(errors.startswith('ERROR: '))
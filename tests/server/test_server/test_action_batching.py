@@ -0,0 +1,290 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+from unittest import TestCase
+
+from conformity import fields
+
+from pysoa.common.constants import (
+    ERROR_CODE_INVALID,
+    ERROR_CODE_SERVER_ERROR,
+)
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.logging import PySOALogContextFilter
+from pysoa.common.types import Error
+from pysoa.server.action import Action
+from pysoa.server.errors import (
+    ActionError,
+    JobError,
+)
+from pysoa.server.middleware import ServerMiddleware
+from pysoa.server.scoreboard import Scoreboard
+from pysoa.server.server import Server
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
+
+
+class GetUserAction(Action):
+    request_schema = fields.Dictionary({'id': fields.Integer()})
+
+    batches = []
+
+    def run(self, request):
+        return {'id': request.body['id'], 'batched': False}
+
+    def run_batch(self, requests):
+        self.batches.append([request.body['id'] for request in requests])
+        if any(request.body['id'] == 666 for request in requests):
+            raise ValueError('Bad ID')
+        return [
+            ActionError(errors=[Error(code=ERROR_CODE_INVALID, message='Not found', field='id')])
+            if request.body['id'] == 404 else {'id': request.body['id'], 'batched': True}
+            for request in requests
+        ]
+
+
+class CheckingMiddleware(ServerMiddleware):
+    """
+    Rejects jobs for user 13, adds 100 to every user ID, and records the request ID logged while each action runs.
+    """
+    logged_request_ids = []
+
+    def job(self, process_job):
+        def handler(job_request):
+            if job_request['actions'][0]['body'].get('id') == 13:
+                raise JobError(errors=[Error(code=ERROR_CODE_INVALID, message='Forbidden')])
+            return process_job(job_request)
+        return handler
+
+    def action(self, process_action):
+        def handler(action_request):
+            self.logged_request_ids.append(PySOALogContextFilter.get_logging_request_context()['request_id'])
+            action_request.body['id'] += 100
+            return process_action(action_request)
+        return handler
+
+
+class BatchingServer(Server):
+    service_name = 'test_service'
+    action_class_map = {
+        'get_user': GetUserAction,
+        'respond_empty': factories.ActionFactory(),
+    }
+
+
+def _make_job(action, body):
+    return {
+        'control': {'continue_on_error': False},
+        'context': {'switches': [], 'correlation_id': '1'},
+        'actions': [{'action': action, 'body': body}],
+    }
+
+
+class TestActionBatching(TestCase):
+    def setUp(self):
+        GetUserAction.batches = []
+
+        settings = factories.ServerSettingsFactory(
+            data={'action_batching': {'maximum_jobs': 4, 'maximum_wait_in_milliseconds': 0}},
+        )
+        self.server = BatchingServer(settings=settings)
+        self.server.transport = mock.MagicMock()
+
+    def tearDown(self):
+        for pool in self.server._action_batch_thread_pools:
+            pool.close()
+            pool.join()
+
+    def _get_responses(self):
+        return {
+            call[0][0]: (call[0][1], call[0][2])
+            for call in self.server.transport.send_response_message.call_args_list
+        }
+
+    def test_batch_of_queued_jobs(self):
+        self.server.transport.receive_request_message.return_value = (
+            1,
+            {'reply_to': 'a'},
+            _make_job('get_user', {'id': 5}),
+        )
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [
+                (2, {'reply_to': 'b'}, _make_job('respond_empty', {})),
+                (3, {'reply_to': 'c'}, _make_job('get_user', {'id': 6})),
+            ],
+            [(4, {'reply_to': 'd'}, _make_job('get_user', {'id': 404}))],
+        ]
+
+        self.server.handle_next_request()
+
+        self.assertEqual([[5, 6, 404]], GetUserAction.batches)
+        self.assertEqual(
+            [mock.call(3), mock.call(1)],
+            self.server.transport.receive_queued_request_messages.call_args_list,
+        )
+
+        responses = self._get_responses()
+        self.assertEqual({1, 3, 4}, set(responses))
+        self.assertEqual({'reply_to': 'a'}, responses[1][0])
+        self.assertEqual({'id': 5, 'batched': True}, responses[1][1]['actions'][0]['body'])
+        self.assertEqual({'reply_to': 'c'}, responses[3][0])
+        self.assertEqual({'id': 6, 'batched': True}, responses[3][1]['actions'][0]['body'])
+        self.assertEqual('Not found', responses[4][1]['actions'][0]['errors'][0]['message'])
+
+        # The job for the other action was kept, and is handled next, without receiving from the transport
+        self.server.handle_next_request()
+
+        self.assertEqual(1, self.server.transport.receive_request_message.call_count)
+        self.assertEqual({'reply_to': 'b'}, self._get_responses()[2][0])
+
+    def test_batch_through_middleware(self):
+        CheckingMiddleware.logged_request_ids = []
+        self.server.middleware = [CheckingMiddleware()]
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 5})
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('get_user', {'id': 13})), (3, {}, _make_job('get_user', {'id': 6}))],
+            [],
+        ]
+
+        self.server.handle_next_request()
+
+        # The rejected job never reaches the action, and the others reach it as the middleware passed them on
+        self.assertEqual([[105, 106]], GetUserAction.batches)
+        self.assertEqual([1, 3], sorted(CheckingMiddleware.logged_request_ids))
+
+        responses = self._get_responses()
+        self.assertEqual({'id': 105, 'batched': True}, responses[1][1]['actions'][0]['body'])
+        self.assertEqual('Forbidden', responses[2][1]['errors'][0]['message'])
+        self.assertEqual([], responses[2][1]['actions'])
+        self.assertEqual({'id': 106, 'batched': True}, responses[3][1]['actions'][0]['body'])
+
+    def test_batch_all_rejected_by_middleware(self):
+        self.server.middleware = [CheckingMiddleware()]
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 13})
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('get_user', {'id': 13}))],
+            [],
+        ]
+
+        self.server.handle_next_request()
+
+        self.assertEqual([], GetUserAction.batches)
+        responses = self._get_responses()
+        self.assertEqual('Forbidden', responses[1][1]['errors'][0]['message'])
+        self.assertEqual('Forbidden', responses[2][1]['errors'][0]['message'])
+
+    def test_batch_requests_recorded_in_scoreboard(self):
+        scoreboard = Scoreboard.create(1)
+        self.addCleanup(scoreboard.close)
+        scoreboard.slots[0].reset('pysoa-worker-0')
+        self.server.scoreboard_slot = scoreboard.slots[0]
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 5})
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('get_user', {'id': 6}))],
+            [],
+        ]
+
+        self.server.handle_next_request()
+
+        self.assertEqual([[5, 6]], GetUserAction.batches)
+        status = scoreboard.slots[0].read()
+        self.assertEqual(('idle', 0, 2), (status.state, status.requests_in_flight, status.requests_served))
+
+    def test_bounded_polls_while_waiting_for_batch(self):
+        self.server.settings['action_batching']['maximum_wait_in_milliseconds'] = 100
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 5})
+        self.server.transport.receive_queued_request_messages.return_value = []
+
+        with mock.patch('time.sleep') as mock_sleep:
+            mock_sleep.side_effect = lambda seconds: time_values.append(time_values[-1] + seconds)
+            time_values = [1000.0]
+            with mock.patch('time.time', side_effect=lambda: time_values[-1]):
+                self.server.handle_next_request()
+
+        # One check as soon as the batch starts, and then one after each of the evenly spaced waits
+        self.assertEqual(
+            self.server.ACTION_BATCHING_MAXIMUM_POLLS + 1,
+            self.server.transport.receive_queued_request_messages.call_count,
+        )
+        self.assertEqual(self.server.ACTION_BATCHING_MAXIMUM_POLLS, mock_sleep.call_count)
+        self.assertAlmostEqual(0.1, time_values[-1] - time_values[0])
+        self.assertEqual({'id': 5, 'batched': False}, self._get_responses()[1][1]['actions'][0]['body'])
+
+    def test_batch_invalid_request(self):
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 'five'})
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('get_user', {'id': 6}))],
+            [],
+        ]
+
+        self.server.handle_next_request()
+
+        self.assertEqual([[6]], GetUserAction.batches)
+
+        responses = self._get_responses()
+        self.assertEqual('id', responses[1][1]['actions'][0]['errors'][0]['field'])
+        self.assertEqual({'id': 6, 'batched': True}, responses[2][1]['actions'][0]['body'])
+
+    def test_batch_error(self):
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 666})
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('get_user', {'id': 6}))],
+            [],
+        ]
+
+        self.server.handle_next_request()
+
+        responses = self._get_responses()
+        self.assertEqual(ERROR_CODE_SERVER_ERROR, responses[1][1]['errors'][0]['code'])
+        self.assertEqual(ERROR_CODE_SERVER_ERROR, responses[2][1]['errors'][0]['code'])
+
+    def test_single_job_is_not_batched(self):
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 5})
+        self.server.transport.receive_queued_request_messages.return_value = []
+
+        self.server.handle_next_request()
+
+        self.assertEqual([], GetUserAction.batches)
+        self.assertEqual({'id': 5, 'batched': False}, self._get_responses()[1][1]['actions'][0]['body'])
+
+    def test_batching_disabled(self):
+        self.server.settings['action_batching']['maximum_jobs'] = 1
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('get_user', {'id': 5})
+
+        self.server.handle_next_request()
+
+        self.assertFalse(self.server.transport.receive_queued_request_messages.called)
+        self.assertEqual({'id': 5, 'batched': False}, self._get_responses()[1][1]['actions'][0]['body'])
+
+    def test_action_not_batchable(self):
+        self.server.transport.receive_request_message.return_value = 1, {}, _make_job('respond_empty', {})
+
+        self.server.handle_next_request()
+
+        self.assertFalse(self.server.transport.receive_queued_request_messages.called)
+        self.assertIn(1, self._get_responses())
+
+    def test_kept_jobs_handled_on_shutdown(self):
+        self.server.transport.receive_request_message.side_effect = [
+            (1, {}, _make_job('get_user', {'id': 5})),
+            MessageReceiveTimeout(),
+        ]
+        self.server.transport.receive_queued_request_messages.side_effect = [
+            [(2, {}, _make_job('respond_empty', {})), (3, {}, _make_job('respond_empty', {}))],
+            [],
+        ]
+
+        self.server.async_event_loop = None
+
+        def handle_next_request():
+            Server.handle_next_request(self.server)
+            self.server.shutting_down = True
+
+        with mock.patch.object(self.server, 'handle_next_request', side_effect=handle_next_request), \
+                mock.patch('signal.signal'), mock.patch('signal.alarm'):
+            self.server.run()
+
+        self.assertEqual({1, 2, 3}, set(self._get_responses()))
+        self.assertTrue(self.server.transport.close.called)
@@ -0,0 +1,264 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import asyncio
+import threading
+from unittest import TestCase
+
+from pysoa.common.constants import ERROR_CODE_INVALID
+from pysoa.common.logging import PySOALogContextFilter
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.common.types import Error
+from pysoa.server.async_server import AsyncJobRunner
+from pysoa.server.action import (
+    Action,
+    AsyncAction,
+)
+from pysoa.server.errors import ActionError
+from pysoa.server.middleware import ServerMiddleware
+from pysoa.server.server import Server
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
+
+
+class WaitAction(AsyncAction):
+    """
+    Waits for the event named in the request body, after setting its own, so that two jobs only both finish in time if
+    they are in flight at once.
+    """
+    events = {}
+
+    async def run(self, request):
+        self.events[request.body['name']].set()
+        if request.body.get('fail'):
+            raise ActionError(errors=[Error(code=ERROR_CODE_INVALID, message='Failed')])
+        concurrent = None
+        if request.body.get('wait_for'):
+            try:
+                await asyncio.wait_for(self.events[request.body['wait_for']].wait(), 0.5)
+                concurrent = True
+            except asyncio.TimeoutError:
+                concurrent = False
+        return {
+            'concurrent': concurrent,
+            'request_id': PySOALogContextFilter.get_logging_request_context()['request_id'],
+        }
+
+
+class ThreadNameAction(Action):
+    def run(self, request):
+        return {
+            'thread': threading.current_thread().name,
+            'request_id': PySOALogContextFilter.get_logging_request_context()['request_id'],
+        }
+
+
+class AsyncServer(Server):
+    service_name = 'test_service'
+    action_class_map = {
+        'wait': WaitAction,
+        'thread_name': ThreadNameAction,
+    }
+
+
+class RecordingMiddleware(ServerMiddleware):
+    def __init__(self):
+        self.calls = []
+
+    def job(self, process_job):
+        return process_job
+
+    def job_async(self, process_job):
+        async def handler(job_request):
+            self.calls.append('job')
+            return await process_job(job_request)
+        return handler
+
+    def action_async(self, process_action):
+        async def handler(action_request):
+            self.calls.append(action_request.action)
+            return await process_action(action_request)
+        return handler
+
+
+class SyncOnlyMiddleware(ServerMiddleware):
+    def action(self, process_action):
+        return process_action
+
+
+def _make_job(actions, **control):
+    control.setdefault('continue_on_error', False)
+    return {
+        'control': control,
+        'context': {'switches': [], 'correlation_id': '1'},
+        'actions': [{'action': action, 'body': body} for action, body in actions],
+    }
+
+
+class TestAsyncJobs(TestCase):
+    def setUp(self):
+        WaitAction.events = {}
+        self.addCleanup(asyncio.set_event_loop, asyncio.get_event_loop())
+
+        self.server = AsyncServer(settings=factories.ServerSettingsFactory(data={'async_jobs': {'maximum_jobs': 4}}))
+        self.server.async_event_loop = asyncio.new_event_loop()
+        self.server.transport = mock.MagicMock()
+        self.responses = {}
+
+    def _run(self, requests):
+        """
+        Runs the server until it has sent a response to each of the requests.
+        """
+        # The events must be created on the server's event loop with older versions of Python
+        asyncio.set_event_loop(self.server.async_event_loop)
+        WaitAction.events = {name: asyncio.Event() for name in ('a', 'b', 'c')}
+        requests = list(requests)
+
+        def receive_request_message():
+            if requests:
+                return requests.pop(0)
+            threading.Event().wait(0.01)
+            raise MessageReceiveTimeout()
+
+        def send_response_message(request_id, _, response):
+            self.responses[request_id] = response
+            if len(self.responses) == expected_responses:
+                self.server.shutting_down = True
+
+        expected_responses = len(requests)
+        self.server.transport.receive_request_message.side_effect = receive_request_message
+        self.server.transport.send_response_message.side_effect = send_response_message
+
+        with mock.patch('signal.signal'), mock.patch('signal.alarm'):
+            self.server.run()
+
+    def test_jobs_in_flight_at_once(self):
+        self._run([
+            (1, {}, _make_job([('wait', {'name': 'a', 'wait_for': 'b'})])),
+            (2, {}, _make_job([('wait', {'name': 'b', 'wait_for': 'a'})])),
+            (3, {}, _make_job([('thread_name', {})])),
+        ])
+
+        self.assertEqual({1, 2, 3}, set(self.responses))
+        for request_id in (1, 2):
+            self.assertEqual([], self.responses[request_id]['errors'])
+            self.assertEqual(
+                {'concurrent': True, 'request_id': request_id},
+                self.responses[request_id]['actions'][0]['body'],
+            )
+        # Actions that are not async are run in a thread pool, not on the event loop
+        self.assertNotEqual(threading.current_thread().name, self.responses[3]['actions'][0]['body']['thread'])
+        self.assertEqual(3, self.responses[3]['actions'][0]['body']['request_id'])
+        self.assertTrue(self.server.transport.close.called)
+
+    def test_maximum_jobs(self):
+        self.server.settings['async_jobs']['maximum_jobs'] = 1
+
+        self._run([
+            (1, {}, _make_job([('wait', {'name': 'a', 'wait_for': 'b'})])),
+            (2, {}, _make_job([('wait', {'name': 'b', 'wait_for': 'a'})])),
+        ])
+
+        self.assertFalse(self.responses[1]['actions'][0]['body']['concurrent'])
+        self.assertTrue(self.responses[2]['actions'][0]['body']['concurrent'])
+
+    def test_parallel_actions(self):
+        self._run([
+            (1, {}, _make_job(
+                [('wait', {'name': 'a', 'wait_for': 'b'}), ('wait', {'name': 'b', 'wait_for': 'a'})],
+                parallel=True,
+            )),
+            (2, {}, _make_job(
+                [('wait', {'name': 'c', 'fail': True}), ('thread_name', {})],
+                parallel=True,
+            )),
+        ])
+
+        self.assertEqual([True, True], [a['body']['concurrent'] for a in self.responses[1]['actions']])
+        self.assertEqual(1, len(self.responses[2]['actions']))
+        self.assertEqual('Failed', self.responses[2]['actions'][0]['errors'][0]['message'])
+
+    def test_async_middleware(self):
+        middleware = RecordingMiddleware()
+        self.server.middleware = [middleware]
+
+        self._run([(1, {}, _make_job([('thread_name', {}), ('unknown', {})], continue_on_error=True))])
+
+        self.assertEqual(['job', 'thread_name'], middleware.calls)
+        self.assertEqual('action', self.responses[1]['actions'][1]['errors'][0]['field'])
+
+    def test_sync_only_middleware_not_supported(self):
+        self.server.middleware = [SyncOnlyMiddleware()]
+
+        with self.assertRaises(ValueError) as error_context:
+            self._run([])
+
+        self.assertIn('action_async', str(error_context.exception))
+
+    def test_cannot_combine_with_worker_threads(self):
+        self.server = AsyncServer(settings=factories.ServerSettingsFactory(
+            data={'async_jobs': {'maximum_jobs': 4}, 'worker_threads': 2},
+        ))
+        self.server.async_event_loop = asyncio.new_event_loop()
+        self.server.transport = mock.MagicMock()
+
+        with self.assertRaises(ValueError):
+            self._run([])
+
+    def test_cannot_use_transport_that_acknowledges_on_next_receive(self):
+        self.server.transport.can_handle_requests_concurrently = False
+
+        with self.assertRaises(ValueError) as error_context:
+            self._run([(1, {}, _make_job([('thread_name', {})]))])
+
+        self.assertIn('acknowledges', str(error_context.exception))
+        self.assertFalse(self.server.transport.receive_request_message.called)
+
+    def test_harakiri_alarm_follows_longest_running_job(self):
+        self.server.settings['harakiri']['timeout'] = 10
+        runner = AsyncJobRunner(self.server)
+
+        with mock.patch('signal.alarm') as mock_alarm, mock.patch('time.time', return_value=1004.5):
+            # With no job in flight, the wait for the next request gets the whole timeout
+            runner._reset_harakiri_alarm()
+            mock_alarm.assert_called_once_with(10)
+
+            # Otherwise, the alarm goes off when the oldest job has been in flight for the timeout, however recently
+            # other jobs started
+            mock_alarm.reset_mock()
+            runner._jobs = {'old_job': 1000.0, 'new_job': 1004.0}
+            runner._reset_harakiri_alarm()
+            mock_alarm.assert_called_once_with(6)
+
+            mock_alarm.reset_mock()
+            runner._jobs = {'hung_job': 990.0}
+            runner._reset_harakiri_alarm()
+            mock_alarm.assert_called_once_with(1)
+
+            # Harakiri sets the alarm for the shutdown grace, which must not be replaced
+            mock_alarm.reset_mock()
+            self.server.shutting_down = True
+            runner._reset_harakiri_alarm()
+            self.assertFalse(mock_alarm.called)
+
+
+class TestAsyncActionWithoutAsyncJobs(TestCase):
+    def test_async_action_run_to_completion(self):
+        self.addCleanup(asyncio.set_event_loop, asyncio.get_event_loop())
+
+        server = AsyncServer(settings=factories.ServerSettingsFactory())
+        server.async_event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(server.async_event_loop)
+        WaitAction.events = {'a': asyncio.Event()}
+
+        PySOALogContextFilter.set_logging_request_context(request_id=5)
+        try:
+            job_response = server.process_job(_make_job([('wait', {'name': 'a'})]))
+        finally:
+            PySOALogContextFilter.clear_logging_request_context()
+            server.async_event_loop.close()
+
+        self.assertEqual([], job_response.errors)
+        self.assertEqual({'concurrent': None, 'request_id': 5}, job_response.actions[0].body)
@@ -0,0 +1,124 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import threading
+from unittest import TestCase
+
+from pysoa.common.constants import ERROR_CODE_INVALID
+from pysoa.common.types import Error
+from pysoa.server.action import Action
+from pysoa.server.errors import ActionError
+from pysoa.server.server import Server
+from pysoa.test import factories
+
+
+class WaitAction(Action):
+    """
+    Waits for the action named in the request body to start, which only happens in time if the actions run
+    concurrently.
+    """
+    started = {}
+
+    def run(self, request):
+        self.started[request.body['name']].set()
+        if request.body.get('fail'):
+            raise ActionError(errors=[Error(code=ERROR_CODE_INVALID, message='Failed')])
+        if request.body.get('wait_for'):
+            concurrent = self.started[request.body['wait_for']].wait(2)
+        else:
+            concurrent = None
+        return {'name': request.body['name'], 'concurrent': concurrent, 'thread': threading.current_thread().name}
+
+
+class ParallelServer(Server):
+    service_name = 'test_service'
+    action_class_map = {
+        'wait': WaitAction,
+    }
+
+
+class TestParallelActions(TestCase):
+    def setUp(self):
+        WaitAction.started = {name: threading.Event() for name in ('a', 'b', 'c')}
+
+        settings = factories.ServerSettingsFactory(data={'parallel_actions': {'maximum_threads': 3}})
+        self.server = ParallelServer(settings=settings)
+
+    def tearDown(self):
+        if self.server._action_thread_pool:
+            self.server._action_thread_pool.close()
+            self.server._action_thread_pool.join()
+
+    @staticmethod
+    def _make_job(bodies, parallel=True, continue_on_error=False):
+        return {
+            'control': {'continue_on_error': continue_on_error, 'parallel': parallel},
+            'context': {'switches': [], 'correlation_id': '1'},
+            'actions': [{'action': 'wait', 'body': body} for body in bodies],
+        }
+
+    def test_actions_run_concurrently_in_order(self):
+        job_response = self.server.process_job(self._make_job([
+            {'name': 'a', 'wait_for': 'c'},
+            {'name': 'b', 'wait_for': 'a'},
+            {'name': 'c'},
+        ]))
+
+        self.assertEqual([], job_response.errors)
+        self.assertEqual(['a', 'b', 'c'], [action.body['name'] for action in job_response.actions])
+        self.assertTrue(job_response.actions[0].body['concurrent'])
+        self.assertTrue(job_response.actions[1].body['concurrent'])
+        self.assertNotEqual(threading.current_thread().name, job_response.actions[2].body['thread'])
+
+    def test_error_without_continue_on_error(self):
+        job_response = self.server.process_job(self._make_job([
+            {'name': 'a', 'wait_for': 'b'},
+            {'name': 'b', 'fail': True},
+            {'name': 'c'},
+        ]))
+
+        self.assertEqual(2, len(job_response.actions))
+        self.assertEqual('a', job_response.actions[0].body['name'])
+        self.assertEqual('Failed', job_response.actions[1].errors[0].message)
+
+    def test_error_with_continue_on_error(self):
+        job_response = self.server.process_job(self._make_job(
+            [
+                {'name': 'a'},
+                {'name': 'b', 'fail': True},
+                {'name': 'c'},
+            ],
+            continue_on_error=True,
+        ))
+
+        self.assertEqual(3, len(job_response.actions))
+        self.assertEqual('Failed', job_response.actions[1].errors[0].message)
+        self.assertEqual('c', job_response.actions[2].body['name'])
+
+    def test_not_parallel(self):
+        job_response = self.server.process_job(self._make_job([{'name': 'a'}, {'name': 'b'}], parallel=False))
+
+        self.assertEqual(['a', 'b'], [action.body['name'] for action in job_response.actions])
+        self.assertEqual(
+            [threading.current_thread().name] * 2,
+            [action.body['thread'] for action in job_response.actions],
+        )
+        self.assertIsNone(self.server._action_thread_pool)
+
+    def test_parallel_actions_disabled(self):
+        self.server.settings['parallel_actions']['maximum_threads'] = 0
+
+        job_response = self.server.process_job(self._make_job([{'name': 'a'}, {'name': 'b'}]))
+
+        self.assertEqual(
+            [threading.current_thread().name] * 2,
+            [action.body['thread'] for action in job_response.actions],
+        )
+        self.assertIsNone(self.server._action_thread_pool)
+
+    def test_invalid_parallel_flag(self):
+        job_response = self.server.process_job(self._make_job([{'name': 'a'}], parallel='yes'))
+
+        self.assertEqual('control.parallel', job_response.errors[0].field)
@@ -0,0 +1,129 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+import six
+
+from pysoa.common.transport.exceptions import MessageReceiveTimeout
+from pysoa.server.action import Action
+from pysoa.server.scoreboard import Scoreboard
+from pysoa.server.server import Server
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
+
+
+class ScoreboardAction(Action):
+    """
+    Returns the activity recorded in the scoreboard while the action runs.
+    """
+    def run(self, request):
+        scoreboard = Scoreboard.open(request.body['path'])
+        try:
+            status = scoreboard.slots[0].read()
+        finally:
+            scoreboard.close()
+        return {'name': status.name, 'pid': status.pid, 'state': status.state, 'action': status.action}
+
+
+class ScoreboardServer(Server):
+    service_name = 'test_service'
+    action_class_map = {
+        'scoreboard': ScoreboardAction,
+    }
+
+
+class TestServerScoreboard(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scoreboard')
+        self.responses = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, server):
+        requests = [(
+            1,
+            {},
+            {
+                'control': {'continue_on_error': False},
+                'context': {'switches': [], 'correlation_id': '1'},
+                'actions': [{'action': 'scoreboard', 'body': {'path': self.path}}],
+            },
+        )]
+
+        def receive_request_message():
+            if requests:
+                return requests.pop(0)
+            server.shutting_down = True
+            raise MessageReceiveTimeout()
+
+        server.transport = mock.MagicMock()
+        server.transport.receive_request_message.side_effect = receive_request_message
+        server.transport.send_response_message.side_effect = lambda *args: self.responses.append(args[2])
+        with mock.patch('signal.signal'), mock.patch('signal.alarm'):
+            server.run()
+
+    def test_scoreboard_file(self):
+        server = ScoreboardServer(settings=factories.ServerSettingsFactory(data={'scoreboard_file': self.path}))
+
+        self._run(server)
+
+        self.assertEqual(
+            {'name': 'test_service', 'pid': os.getpid(), 'state': 'busy', 'action': 'scoreboard'},
+            self.responses[0]['actions'][0]['body'],
+        )
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(server.scoreboard_slot)
+
+    def test_scoreboard_slot_of_supervisor(self):
+        scoreboard = Scoreboard.create(1, self.path)
+        self.addCleanup(scoreboard.close)
+        scoreboard.slots[0].reset('pysoa-worker-0')
+        server = ScoreboardServer(settings=factories.ServerSettingsFactory())
+        server.scoreboard_slot = scoreboard.slots[0]
+
+        self._run(server)
+
+        self.assertEqual(
+            {'name': 'pysoa-worker-0', 'pid': os.getpid(), 'state': 'busy', 'action': 'scoreboard'},
+            self.responses[0]['actions'][0]['body'],
+        )
+        # The supervisor owns the scoreboard, so the server leaves it in place
+        self.assertTrue(os.path.exists(self.path))
+        status = scoreboard.slots[0].read()
+        self.assertEqual(('stopping', 1, None), (status.state, status.requests_served, status.action))
+
+    def test_heartbeat_file_throttled_with_scoreboard(self):
+        start = time.time() + 10
+        for scoreboard_file, expected_writes in ((None, [0, 0.5, 1.5]), (self.path, [0, 1.5])):
+            server = ScoreboardServer(settings=factories.ServerSettingsFactory(data={
+                'heartbeat_file': os.path.join(self.directory, 'heartbeat'),
+                'scoreboard_file': scoreboard_file,
+            }))
+            server._create_heartbeat_file()
+            server._start_scoreboard_slot()
+            try:
+                heartbeat_file = server._heartbeat_file
+                server._heartbeat_file = mock.MagicMock()
+                with mock.patch('pysoa.server.server.time') as mock_time:
+                    for seconds in (0, 0.5, 1.5):
+                        mock_time.time.return_value = start + seconds
+                        server.perform_pre_request_actions()
+                        server.perform_post_request_actions()
+
+                self.assertEqual(
+                    [six.text_type(start + seconds) for seconds in expected_writes],
+                    [call[0][0] for call in server._heartbeat_file.write.call_args_list],
+                )
+                server._heartbeat_file = heartbeat_file
+            finally:
+                server._delete_heartbeat_file()
+                server._stop_scoreboard_slot()
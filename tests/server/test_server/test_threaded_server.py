@@ -0,0 +1,145 @@
+from __future__ import (
+    absolute_import,
+    unicode_literals,
+)
+
+import threading
+from unittest import TestCase
+
+from pysoa.common.transport.exceptions import (
+    MessageReceiveError,
+    MessageReceiveTimeout,
+)
+from pysoa.server.action import Action
+from pysoa.server.server import Server
+from pysoa.test import factories
+from pysoa.test.compatibility import mock
+
+
+class WaitAction(Action):
+    """
+    Waits for the event named in the request body, after setting its own, so that two jobs only both finish if they are
+    handled concurrently.
+    """
+    events = {}
+
+    def run(self, request):
+        self.events[request.body['name']].set()
+        return {
+            'concurrent': self.events[request.body['wait_for']].wait(request.body.get('timeout', 2)),
+            'thread': threading.current_thread().name,
+        }
+
+
+class ThreadedServer(Server):
+    service_name = 'test_service'
+    action_class_map = {
+        'wait': WaitAction,
+    }
+
+    WORKER_THREAD_MONITOR_INTERVAL_IN_SECONDS = 0.05
+
+
+def _make_transport(request_id, body):
+    """
+    Makes a transport that receives one job, and then times out until the server shuts down.
+    """
+    transport = mock.MagicMock()
+
+    def receive_request_message():
+        if not transport.received:
+            transport.received = True
+            return (
+                request_id,
+                {},
+                {
+                    'control': {'continue_on_error': False},
+                    'context': {'switches': [], 'correlation_id': '1'},
+                    'actions': [{'action': 'wait', 'body': body}],
+                },
+            )
+        threading.Event().wait(0.01)
+        raise MessageReceiveTimeout()
+
+    transport.received = False
+    transport.receive_request_message.side_effect = receive_request_message
+    transport.receive_queued_request_messages.return_value = []
+    return transport
+
+
+class TestThreadedServer(TestCase):
+    def setUp(self):
+        WaitAction.events = {name: threading.Event() for name in ('a', 'b', 'stuck')}
+
+        self.server = ThreadedServer(settings=factories.ServerSettingsFactory(data={'worker_threads': 2}))
+        self.server.async_event_loop = None
+
+    def _run(self, transports):
+        self.server.transport = transports[0]
+        with mock.patch.object(self.server, '_make_transport', side_effect=transports[1:]), \
+                mock.patch('signal.signal') as mock_signal, mock.patch('signal.alarm') as mock_alarm:
+            self.server.run()
+
+        self.assertFalse(mock_alarm.called)
+        self.assertEqual(2, mock_signal.call_count)
+
+    def test_jobs_handled_concurrently_in_worker_threads(self):
+        transports = [
+            _make_transport(1, {'name': 'a', 'wait_for': 'b'}),
+            _make_transport(2, {'name': 'b', 'wait_for': 'a'}),
+        ]
+
+        def send_response_message(*_):
+            if all(transport.send_response_message.called for transport in transports):
+                self.server.shutting_down = True
+
+        for transport in transports:
+            transport.send_response_message.side_effect = send_response_message
+
+        self._run(transports)
+
+        threads = set()
+        for request_id, transport in enumerate(transports, 1):
+            self.assertEqual(1, transport.send_response_message.call_count)
+            response_request_id, _, response = transport.send_response_message.call_args[0]
+            self.assertEqual(request_id, response_request_id)
+            self.assertTrue(response['actions'][0]['body']['concurrent'])
+            threads.add(response['actions'][0]['body']['thread'])
+            self.assertTrue(transport.close.called)
+
+        self.assertEqual({'pysoa-server-worker-0', 'pysoa-server-worker-1'}, threads)
+
+    def test_error_in_one_worker_thread_shuts_down_server(self):
+        transports = [_make_transport(1, {}), _make_transport(2, {})]
+        transports[1].receive_request_message.side_effect = MessageReceiveError('Oops')
+
+        self._run(transports)
+
+        self.assertTrue(self.server.shutting_down)
+        self.assertTrue(transports[0].close.called)
+        self.assertTrue(transports[1].close.called)
+
+    def test_harakiri_per_job(self):
+        self.server.settings['harakiri']['timeout'] = 1
+        self.server.settings['harakiri']['shutdown_grace'] = 1
+
+        transports = [
+            _make_transport(1, {'name': 'a', 'wait_for': 'stuck', 'timeout': 10}),
+            _make_transport(2, {}),
+        ]
+
+        try:
+            with mock.patch.object(self.server.logger, 'warning') as mock_warning, \
+                    self.assertRaises(SystemExit):
+                self._run(transports)
+        finally:
+            WaitAction.events['stuck'].set()
+
+        self.assertTrue(self.server.shutting_down)
+        self.assertIn('pysoa-server-worker-0', mock_warning.call_args_list[0][0][0])
+        self.assertNotIn('pysoa-server-worker-1', mock_warning.call_args_list[0][0][0])
+        self.assertIn('Graceful shutdown failed', mock_warning.call_args_list[1][0][0])
+
+        # The idle worker thread shut down gracefully
+        self.assertTrue(transports[1].close.called)
+        self.assertFalse(transports[0].close.called)
@@ -3,11 +3,10 @@ from __future__ import (
     unicode_literals,
 )
 
-import os
-import signal
 import sys
 import unittest
 
+from pysoa.server import prefork
 from pysoa.test.compatibility import mock
 
 
@@ -134,98 +133,177 @@ class TestSimpleMain(unittest.TestCase):
             mock_get_reloader.return_value.main.call_args_list[0][0][1][1],
         )
 
-    @mock.patch('multiprocessing.Process')
+    @mock.patch('pysoa.server.prefork.PreforkSupervisor')
     @mock.patch('multiprocessing.cpu_count')
-    def test_only_forking_not_limited(self, mock_cpu_count, mock_process):
+    def test_only_forking_not_limited(self, mock_cpu_count, mock_supervisor):
         server_getter = mock.MagicMock()
+        server_class = server_getter.return_value
+        server_class.prepare_main.return_value = (mock.MagicMock(), {'scoreboard_file': None})
 
         mock_cpu_count.return_value = 2
 
         sys.argv = ['/path/to/example_service/standalone.py', '-f', '10']
 
-        prev_sigint = prev_sigterm = prev_sighup = False
-        try:
-            prev_sigint = signal.signal(signal.SIGINT, signal.SIG_IGN)
-            prev_sigterm = signal.signal(signal.SIGTERM, signal.SIG_IGN)
-            prev_sighup = signal.signal(signal.SIGHUP, signal.SIG_IGN)
-
-            processes = [mock.MagicMock() for _ in range(0, 10)]
-            mock_process.side_effect = processes
-
-            standalone.simple_main(server_getter)
-
-            server_getter.assert_called_once_with()
-            self.assertFalse(server_getter.return_value.main.called)
-
-            self.assertEqual(10, mock_process.call_count)
-            i = 0
-            for i, call in enumerate(mock_process.call_args_list):
-                self.assertEqual(server_getter.return_value.main, call[1]['target'])
-                self.assertEqual('pysoa-worker-{}'.format(i), call[1]['name'])
-                i += 1
-            self.assertEqual(10, i)
-
-            for i, process in enumerate(processes):
-                self.assertTrue(process.start.called, 'Process {} was not started'.format(i))
-                self.assertTrue(process.join.called, 'Process {} was not joined'.format(i))
-                self.assertFalse(process.terminate.called, 'Process {} should not have been terminated'.format(i))
-
-            os.kill(os.getpid(), signal.SIGHUP)
-
-            for i, process in enumerate(processes):
-                self.assertTrue(process.terminate.called, 'Process {} was terminated'.format(i))
-        finally:
-            if prev_sigint is not False:
-                signal.signal(signal.SIGINT, prev_sigint or signal.SIG_IGN)
-            if prev_sigterm is not False:
-                signal.signal(signal.SIGTERM, prev_sigterm or signal.SIG_IGN)
-            if prev_sighup is not False:
-                signal.signal(signal.SIGHUP, prev_sighup or signal.SIG_IGN)
-
-    @mock.patch('multiprocessing.Process')
+        standalone.simple_main(server_getter)
+
+        server_getter.assert_called_once_with()
+        self.assertFalse(server_class.main.called)
+
+        # The settings are loaded, and the server class is prepared and warmed up, once in the master process
+        server_class.load_main_settings.assert_called_once_with()
+        server_class.prepare_main.assert_called_once_with(server_class.load_main_settings.return_value)
+
+        self.assertEqual(1, mock_supervisor.call_count)
+        mock_supervisor.return_value.run.assert_called_once_with()
+        pools = mock_supervisor.call_args[0][0]
+        self.assertEqual(1, len(pools))
+        self.assertEqual(['pysoa-worker-{}'.format(i) for i in range(0, 10)], [w.name for w in pools[0].workers])
+        self.assertEqual(10, pools[0].maximum)
+        self.assertIsNone(pools[0].get_request_queue_depth)
+        self.assertEqual(prefork.run_worker, pools[0].target.func)
+        self.assertEqual((server_class.prepare_main.return_value[0], {'scoreboard_file': None}), pools[0].target.args)
+
+    @mock.patch('pysoa.server.prefork.PreforkSupervisor')
     @mock.patch('multiprocessing.cpu_count')
-    def test_only_forking_limited(self, mock_cpu_count, mock_process):
+    def test_only_forking_limited(self, mock_cpu_count, mock_supervisor):
         server_getter = mock.MagicMock()
+        server_class = server_getter.return_value
+        server_class.prepare_main.return_value = (mock.MagicMock(), {'scoreboard_file': None})
 
         mock_cpu_count.return_value = 1
 
         sys.argv = ['/path/to/example_service/standalone.py', '-f', '10']
 
-        prev_sigint = prev_sigterm = prev_sighup = False
-        try:
-            prev_sigint = signal.signal(signal.SIGINT, signal.SIG_IGN)
-            prev_sigterm = signal.signal(signal.SIGTERM, signal.SIG_IGN)
-            prev_sighup = signal.signal(signal.SIGHUP, signal.SIG_IGN)
-
-            processes = [mock.MagicMock() for _ in range(0, 5)]
-            mock_process.side_effect = processes
-
-            standalone.simple_main(server_getter)
-
-            server_getter.assert_called_once_with()
-            self.assertFalse(server_getter.return_value.main.called)
-
-            self.assertEqual(5, mock_process.call_count)
-            i = 0
-            for i, call in enumerate(mock_process.call_args_list):
-                self.assertEqual(server_getter.return_value.main, call[1]['target'])
-                self.assertEqual('pysoa-worker-{}'.format(i), call[1]['name'])
-                i += 1
-            self.assertEqual(5, i)
-
-            for i, process in enumerate(processes):
-                self.assertTrue(process.start.called, 'Process {} was not started'.format(i))
-                self.assertTrue(process.join.called, 'Process {} was not joined'.format(i))
-                self.assertFalse(process.terminate.called, 'Process {} should not have been terminated'.format(i))
-
-            os.kill(os.getpid(), signal.SIGHUP)
-
-            for i, process in enumerate(processes):
-                self.assertTrue(process.terminate.called, 'Process {} was terminated'.format(i))
-        finally:
-            if prev_sigint is not False:
-                signal.signal(signal.SIGINT, prev_sigint or signal.SIG_IGN)
-            if prev_sigterm is not False:
-                signal.signal(signal.SIGTERM, prev_sigterm or signal.SIG_IGN)
-            if prev_sighup is not False:
-                signal.signal(signal.SIGHUP, prev_sighup or signal.SIG_IGN)
+        standalone.simple_main(server_getter)
+
+        server_getter.assert_called_once_with()
+        self.assertFalse(server_class.main.called)
+        server_class.load_main_settings.assert_called_once_with()
+        server_class.prepare_main.assert_called_once_with(server_class.load_main_settings.return_value)
+
+        pools = mock_supervisor.call_args[0][0]
+        self.assertEqual(['pysoa-worker-{}'.format(i) for i in range(0, 5)], [w.name for w in pools[0].workers])
+        mock_supervisor.return_value.run.assert_called_once_with()
+
+    @mock.patch('pysoa.server.prefork.PreforkSupervisor')
+    @mock.patch('multiprocessing.cpu_count')
+    def test_forking_scaled(self, mock_cpu_count, mock_supervisor):
+        server_getter = mock.MagicMock()
+        server_class = server_getter.return_value
+        settings = {
+            'metrics': {'object': mock.MagicMock()},
+            'transport': {'object': mock.MagicMock()},
+            'scoreboard_file': None,
+        }
+        server_class.prepare_main.return_value = (mock.MagicMock(), settings)
+
+        mock_cpu_count.return_value = 2
+
+        sys.argv = ['/path/to/example_service/standalone.py', '-f', '2', '--max-fork-processes', '20']
+
+        standalone.simple_main(server_getter)
+
+        pools = mock_supervisor.call_args[0][0]
+        self.assertEqual(['pysoa-worker-0'], [w.name for w in pools[0].workers])
+        self.assertEqual(1, pools[0].minimum)
+        self.assertEqual(10, pools[0].maximum)
+        self.assertEqual('server.prefork.', pools[0].metrics_prefix)
+        self.assertIs(settings['metrics']['object'].return_value, pools[0].metrics)
+
+        settings['transport']['object'].return_value.get_request_queue_depth.return_value = 12
+        self.assertEqual(12, pools[0].get_request_queue_depth())
+
+    @mock.patch('pysoa.server.prefork.PreforkSupervisor')
+    @mock.patch('multiprocessing.cpu_count')
+    def test_forking_with_recycling(self, mock_cpu_count, mock_supervisor):
+        class Server(object):
+            load_main_settings = classmethod(lambda cls: {'scoreboard_file': None})
+            prepare_main = classmethod(lambda cls, settings: (cls, settings))
+            main = mock.MagicMock()
+
+            def __init__(self, settings):
+                self.settings = settings
+
+        mock_cpu_count.return_value = 2
+
+        sys.argv = ['/path/to/example_service/standalone.py', '-f', '2', '--max-requests', '1000', '--max-rss', '512']
+
+        standalone.simple_main(lambda: Server)
+
+        self.assertFalse(Server.main.called)
+
+        pools = mock_supervisor.call_args[0][0]
+        self.assertEqual(['pysoa-worker-0', 'pysoa-worker-1'], [w.name for w in pools[0].workers])
+        recycling_server_class = pools[0].target.args[0]
+        self.assertTrue(issubclass(recycling_server_class, Server))
+        self.assertIsNot(Server, recycling_server_class)
+        self.assertEqual('Server', recycling_server_class.__name__)
+
+    @mock.patch('pysoa.server.prefork.PreforkSupervisor')
+    @mock.patch('multiprocessing.cpu_count')
+    def test_forking_groups(self, mock_cpu_count, mock_supervisor):
+        server_class = mock.MagicMock()
+
+        class Server(object):
+            initialize = classmethod(server_class.initialize)
+            main = classmethod(server_class.main)
+
+            @classmethod
+            def load_main_settings(cls):
+                server_class.load_main_settings(cls)
+                return {
+                    'metrics': {'object': mock.MagicMock()},
+                    'transport': {'object': mock.MagicMock()},
+                    'scoreboard_file': '/path/to/scoreboard',
+                }
+
+            @classmethod
+            def prepare_main(cls, settings):
+                server_class.prepare_main(cls, settings)
+                return cls, settings
+
+        mock_cpu_count.return_value = 2
+
+        sys.argv = ['/path/to/example_service/standalone.py', '-g', '2:default,fast', '--fork-group', '1-3:reports']
+
+        standalone.simple_main(lambda: Server)
+
+        self.assertFalse(server_class.main.called)
+
+        pools = mock_supervisor.call_args[0][0]
+        self.assertEqual(
+            [['pysoa-worker-0-0', 'pysoa-worker-0-1'], ['pysoa-worker-1-0']],
+            [[w.name for w in pool.workers] for pool in pools],
+        )
+        self.assertEqual([2, 3], [pool.maximum for pool in pools])
+        self.assertEqual('server.prefork.group_1.', pools[1].metrics_prefix)
+        self.assertIsNone(pools[0].get_request_queue_depth)
+        self.assertIsNotNone(pools[1].get_request_queue_depth)
+        self.assertEqual('/path/to/scoreboard', mock_supervisor.call_args[1]['scoreboard_file'])
+        mock_supervisor.return_value.run.assert_called_once_with()
+
+        # The settings are loaded (and the process daemonized, if requested) only once, and then each group's server
+        # class is prepared once, with its own copy of the settings, and receives from the group's action queues
+        self.assertEqual(1, server_class.load_main_settings.call_count)
+        self.assertEqual(2, server_class.prepare_main.call_count)
+        self.assertIsNot(pools[0].target.args[1], pools[1].target.args[1])
+        for pool, receive_queues in zip(pools, (['default', 'fast'], ['reports'])):
+            group_server_class = pool.target.args[0]
+            self.assertTrue(issubclass(group_server_class, Server))
+            self.assertEqual('Server', group_server_class.__name__)
+
+            settings = {'transport': {'path': 'pysoa.common.transport.redis_gateway.server:RedisServerTransport'}}
+            group_server_class.initialize(settings)
+            self.assertEqual(receive_queues, settings['transport']['kwargs']['receive_queues'])
+            server_class.initialize.assert_called_with(group_server_class, settings)
+
+    def test_forking_groups_invalid(self):
+        sys.argv = ['/path/to/example_service/standalone.py', '-g', 'default,fast']
+
+        with self.assertRaises(SystemExit):
+            standalone.simple_main(mock.MagicMock())
+
+        sys.argv = ['/path/to/example_service/standalone.py', '-g', '4-2:default']
+
+        with self.assertRaises(SystemExit):
+            standalone.simple_main(mock.MagicMock())